@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+S. suis Multi-Antigen Hit Aggregation
+=====================================
+
+Shared aggregation engine for complete_analysis_pipeline.py,
+analyze_highlight_sequences.py and parse_prevalence.py.
+
+All per-antigen statistics (raw hits, filtered hits, unique genomes,
+prevalence, identity/coverage) are computed in a single grouped pass over the
+hit table instead of re-masking the DataFrame once per antigen, so the cost
+stays O(hits) whether 5 or 500 antigens are screened.
+
+Coverage is per HSP by default; coverage_mode='merged' uses the union of the
+HSP query intervals per (antigen, genome) instead (see hsp_coverage.py).
+"""
+
+from pathlib import Path
+
+import pandas as pd
+
+from genome_index import assign_genomes
+from hit_store import BLAST_COLUMNS, HitStore, find_store, table_columns
+from hsp_coverage import INTERVAL_COLUMNS, add_merged_coverage, check_coverage_mode
+
+SUMMARY_COLUMNS = ['antigen', 'protein_length', 'raw_hits', 'filtered_hits', 'hit_genomes',
+                   'total_genomes', 'prevalence_percent', 'max_identity', 'mean_identity',
+                   'mean_coverage_percent']
+
+
+def summary_columns(coverage_mode='hsp'):
+    """Hit columns needed by annotate_hits() and summarize_antigens()"""
+    columns = ['qseqid', 'sseqid', 'pident', 'length']
+    if check_coverage_mode(coverage_mode) == 'merged':
+        columns += INTERVAL_COLUMNS
+    return columns
+
+
+def load_hits(blast_file, columns=None, min_identity=None, max_evalue=None):
+    """
+    Read BLAST tabular output (fmt 6); an empty file gives an empty table.
+
+    A current columnar store (hit_store.py) of the file, or a store directory
+    passed directly, is memory-mapped instead of reparsing the text. Only
+    ``columns`` are loaded, and ``min_identity`` / ``max_evalue`` drop hits
+    while reading (raw hit counts then cover the remaining hits only).
+    Tables with an extended column set (a ``.columns`` sidecar, see
+    blast_archive.py) are read by name; columns outside the 12 standard ones
+    come from the text.
+    """
+    store = find_store(blast_file)
+    names = BLAST_COLUMNS if store == Path(blast_file) else table_columns(blast_file)
+    if store is not None and set(columns or names) <= set(BLAST_COLUMNS):
+        return HitStore(store).read(columns, min_identity, max_evalue)
+    missing = [name for name in columns or () if name not in names]
+    if missing:
+        raise ValueError(f"{blast_file} has no column {', '.join(missing)} (columns: {' '.join(names)})")
+    try:
+        df = pd.read_csv(blast_file, sep='\t', names=names, header=None,
+                         usecols=columns)
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame(columns=columns or names)
+    if columns:
+        df = df[list(columns)]
+    if min_identity is not None:
+        df = df[df['pident'] >= min_identity]
+    if max_evalue is not None:
+        df = df[df['evalue'] <= max_evalue]
+    return df
+
+
+def annotate_hits(df, query_lengths, contig_index=None, coverage_mode='hsp', min_identity=None):
+    """
+    Add genome_accession, query_length and coverage columns.
+
+    query_length comes from query_lengths, or from a 'qlen' column (see
+    blast_archive.py) for queries missing there.
+
+    genome_accession is a categorical resolved through the contig -> assembly
+    index (see genome_index.py) once per distinct sseqid. Hits whose qseqid is
+    missing from query_lengths get a NaN coverage and therefore never pass a
+    coverage filter.
+
+    With coverage_mode='merged' (needs qstart/qend), 'coverage' is the union
+    coverage of the hit's (antigen, genome) pair over the HSPs at or above
+    ``min_identity`` (NaN below it), and the per-HSP value is kept as
+    'hsp_coverage'.
+    """
+    df['genome_accession'] = assign_genomes(df['sseqid'], contig_index)
+    df['query_length'] = df['qseqid'].map(query_lengths).astype(float)
+    if 'qlen' in df:
+        # Re-formatted archive tables carry the query length of every hit
+        df['query_length'] = df['query_length'].fillna(df['qlen'].astype(float))
+    df['coverage'] = df['length'] / df['query_length']
+    if check_coverage_mode(coverage_mode) == 'merged':
+        if min_identity is None:
+            raise ValueError("coverage_mode='merged' needs min_identity")
+        df = add_merged_coverage(df, min_identity)
+        df['hsp_coverage'] = df['coverage']
+        df['coverage'] = df.pop('merged_coverage')
+    return df
+
+
+def passing_mask(df, min_identity, min_coverage):
+    """Boolean mask of hits passing the identity and coverage thresholds"""
+    return (df['pident'] >= min_identity) & (df['coverage'] >= min_coverage)
+
+
+def summarize_antigens(df, query_lengths, total_genomes, min_identity, min_coverage):
+    """
+    Per-antigen prevalence statistics in one grouped pass.
+
+    Args:
+        df (pd.DataFrame): Hits annotated by annotate_hits().
+        query_lengths (dict): Query ID -> protein length; defines row order.
+        total_genomes (int): Denominator for prevalence.
+        min_identity (float): Minimum percent identity.
+        min_coverage (float): Minimum query coverage (fraction).
+
+    Returns:
+        pd.DataFrame: One row per antigen with SUMMARY_COLUMNS.  In merged
+                      coverage mode mean_coverage_percent averages the pair
+                      coverage over the passing HSPs.
+    """
+    antigens = list(query_lengths)
+    if df.empty:
+        grouped = pd.DataFrame(index=pd.Index(antigens, name='qseqid'))
+    else:
+        # Non-passing hits are blanked out so that one groupby yields both the
+        # raw and the filtered statistics (NaN is skipped by count/max/mean/nunique)
+        mask = passing_mask(df, min_identity, min_coverage)
+        work = pd.DataFrame({
+            'qseqid': df['qseqid'],
+            'pident': df['pident'].where(mask),
+            'coverage': df['coverage'].where(mask),
+            'genome': df['genome_accession'].where(mask)
+        })
+        grouped = work.groupby('qseqid', sort=False, observed=True).agg(
+            raw_hits=('qseqid', 'size'),
+            filtered_hits=('pident', 'count'),
+            hit_genomes=('genome', 'nunique'),
+            max_identity=('pident', 'max'),
+            mean_identity=('pident', 'mean'),
+            mean_coverage=('coverage', 'mean')
+        )
+
+    grouped = grouped.reindex(antigens)
+    results = pd.DataFrame({
+        'antigen': antigens,
+        'protein_length': [query_lengths.get(a, 0) for a in antigens],
+        'raw_hits': _int_column(grouped, 'raw_hits'),
+        'filtered_hits': _int_column(grouped, 'filtered_hits'),
+        'hit_genomes': _int_column(grouped, 'hit_genomes'),
+        'total_genomes': total_genomes,
+    })
+    results['prevalence_percent'] = (results['hit_genomes'] / total_genomes * 100) if total_genomes else 0.0
+    results['max_identity'] = _float_column(grouped, 'max_identity')
+    results['mean_identity'] = _float_column(grouped, 'mean_identity')
+    results['mean_coverage_percent'] = _float_column(grouped, 'mean_coverage') * 100
+    return results[SUMMARY_COLUMNS]
+
+
+def _int_column(grouped, name):
+    if name not in grouped:
+        return [0] * len(grouped)
+    return grouped[name].fillna(0).astype(int).to_numpy()
+
+
+def _float_column(grouped, name):
+    if name not in grouped:
+        return pd.Series(0.0, index=range(len(grouped)))
+    return pd.Series(grouped[name].fillna(0.0).astype(float).to_numpy())
+
+
+def genome_stats(filtered, by=('genome_accession',)):
+    """
+    Per-genome statistics of hits that passed the filters.
+
+    Returns:
+        pd.DataFrame: ``by`` columns plus hit_count, max_identity (%) and
+                      mean_coverage (%), both rounded to one decimal.
+    """
+    grp = filtered.groupby(list(by), observed=True)
+    stats = pd.DataFrame({
+        'hit_count': grp.size(),
+        'max_identity': grp['pident'].max(),
+        'mean_coverage': grp['coverage'].mean()
+    }).reset_index()
+    stats['max_identity'] = stats['max_identity'].round(1)
+    stats['mean_coverage'] = (stats['mean_coverage'] * 100).round(1)
+    return stats
+
+
+def print_raw_distribution(summary, indent='    '):
+    """Print the raw hit count of every antigen that has hits"""
+    for row in summary[summary['raw_hits'] > 0].itertuples():
+        print(f"{indent}{row.antigen}: {row.raw_hits} hits")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+S. suis Antigen Allele Catalogue
+================================
+
+Prevalence says how many genomes carry an antigen, not how many variants of
+it circulate.  This module reads the subject region of every passing hit
+through the merged-FASTA index (fasta_index.py), translates it and interns
+the protein: each distinct sequence is stored once, keyed by a 128-bit
+BLAKE2b digest, and every hit only keeps the integer ID of its allele.
+
+Nucleotide regions are interned first, so a region seen before (the common
+case in a clonal collection) costs one hash lookup and no translation;
+synonymous nucleotide variants collapse into one protein allele and are
+counted as its nucleotide_variants.  Identity to the reference is computed
+once per allele (local alignment to the query protein, BLOSUM62), never
+between hits or alleles, so the work grows with the number of distinct
+alleles rather than with the square of the hit count.
+
+Per antigen, alleles are numbered by the number of genomes carrying them
+(<antigen>_1 is the most common).  Outputs (allele_catalogue/):
+
+* <antigen>.tsv: allele_id, hits, genomes, genome_percent (of all genomes),
+  frequency_percent (of the genomes carrying the antigen; a genome with two
+  copies counts for both alleles), length, identity_percent,
+  reference_coverage_percent, is_reference, nucleotide_variants, sequence_hash;
+* <antigen>.faa: every allele sequence once;
+* genome_alleles.tsv: antigen, genome, allele_id of every carrying genome.
+
+Usage:
+    python allele_catalogue.py -i blast_results.tsv -q query_antigens.fasta \\
+        -f all_suis_genomes.fna -t 388 [--contig_index contig_index.tsv] [-o allele_catalogue]
+"""
+
+import argparse
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from blast_search import read_query_records
+from conservation_profile import _aligner
+from fasta_index import FastaIndex, _file_stem, locate_hits, passing_hits, translate
+from genome_index import load_contig_index
+from genome_redundancy import propagate_hits
+
+ALLELE_DIR_NAME = 'allele_catalogue'
+GENOME_ALLELES_NAME = 'genome_alleles.tsv'
+ALLELE_COLUMNS = ['allele_id', 'hits', 'genomes', 'genome_percent', 'frequency_percent', 'length',
+                  'identity_percent', 'reference_coverage_percent', 'is_reference', 'nucleotide_variants',
+                  'sequence_hash']
+DIGEST_SIZE = 16
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class AlleleCatalogue:
+    """Interned protein alleles: every distinct sequence is stored once, hits refer to it by index"""
+
+    def __init__(self):
+        self.sequences = []
+        self.digests = []
+        self.nucleotide_variants = []
+        self._proteins = {}
+        self._regions = {}
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def intern_protein(self, protein):
+        """Index of a protein sequence, adding it if it is new"""
+        protein = protein.rstrip('*')
+        digest = _digest(protein.encode())
+        index = self._proteins.get(digest)
+        if index is None:
+            index = self._proteins[digest] = len(self.sequences)
+            self.sequences.append(protein)
+            self.digests.append(digest)
+            self.nucleotide_variants.append(0)
+        return index
+
+    def intern_region(self, region):
+        """Allele index of an oriented nucleotide region (translated only the first time it is seen)"""
+        digest = _digest(region)
+        index = self._regions.get(digest)
+        if index is None:
+            index = self._regions[digest] = self.intern_protein(translate(region))
+            self.nucleotide_variants[index] += 1
+        return index
+
+
+def hit_alleles(hits, fasta, catalogue):
+    """Allele index of every located hit (see fasta_index.locate_hits()); -1 if its region is empty"""
+    alleles = np.empty(len(hits), dtype=np.int64)
+    for i, (sseqid, lo, hi, minus) in enumerate(zip(hits['sseqid'], hits['lo'], hits['hi'], hits['minus'])):
+        region = fasta.fetch(sseqid, lo, hi, minus)
+        # Coordinates past the record end mean the FASTA is not the one searched
+        alleles[i] = catalogue.intern_region(region) if region else -1
+    return alleles
+
+
+def reference_identity(sequence, reference, aligner=None):
+    """Percent identity (over the alignment columns) and percent of the reference covered"""
+    if not sequence or not reference:
+        return 0.0, 0.0
+    alignment = (aligner or _aligner()).align(reference, sequence)[0]
+    identities = alignment.counts().identities
+    target_blocks = alignment.aligned[0]
+    span = int(target_blocks[-1][1] - target_blocks[0][0]) if len(target_blocks) else 0
+    return identities / alignment.length * 100, span / len(reference) * 100
+
+
+def allele_tables(df, catalogue, query_sequences, total_genomes):
+    """
+    Per-antigen allele frequency tables.
+
+    Args:
+        df (pd.DataFrame): Hits with qseqid, genome_accession and allele (index
+                           into the catalogue).
+        catalogue (AlleleCatalogue): Interned sequences.
+        query_sequences (dict): Antigen -> reference protein; defines order.
+        total_genomes (int): Genomes in the collection.
+
+    Returns:
+        tuple: (dict antigen -> allele table, genome_alleles DataFrame).
+    """
+    aligner = _aligner()
+    tables = {}
+    assignments = []
+    groups = dict(tuple(df.groupby('qseqid', sort=False, observed=True)))
+    for antigen, reference in query_sequences.items():
+        hits = groups.get(antigen, df.iloc[:0])
+        carriers = hits['genome_accession'].nunique()
+        pairs = hits[['allele', 'genome_accession']].drop_duplicates()
+        counts = pd.DataFrame({
+            'hits': hits.groupby('allele').size(),
+            'genomes': pairs.groupby('allele').size(),
+        })
+        counts['sequence_hash'] = [catalogue.digests[a].hex() for a in counts.index]
+        counts = counts.sort_values(['genomes', 'hits', 'sequence_hash'], ascending=[False, False, True])
+        names = {allele: f"{antigen.split('|')[0]}_{rank}" for rank, allele in enumerate(counts.index, 1)}
+
+        rows = []
+        for allele, row in counts.iterrows():
+            sequence = catalogue.sequences[allele]
+            identity, covered = reference_identity(sequence, reference, aligner)
+            rows.append({
+                'allele_id': names[allele],
+                'hits': int(row['hits']),
+                'genomes': int(row['genomes']),
+                'genome_percent': row['genomes'] / total_genomes * 100 if total_genomes else 0.0,
+                'frequency_percent': row['genomes'] / carriers * 100,
+                'length': len(sequence),
+                'identity_percent': round(identity, 2),
+                'reference_coverage_percent': round(covered, 2),
+                'is_reference': sequence == reference.rstrip('*'),
+                'nucleotide_variants': catalogue.nucleotide_variants[allele],
+                'sequence_hash': row['sequence_hash'],
+                'sequence': sequence,
+            })
+        tables[antigen] = pd.DataFrame(rows, columns=ALLELE_COLUMNS + ['sequence'])
+        assignments.append(pd.DataFrame({'antigen': antigen,
+                                         'genome': pairs['genome_accession'].astype(str).to_numpy(),
+                                         'allele_id': pairs['allele'].map(names).to_numpy()}))
+    genome_alleles = (pd.concat(assignments, ignore_index=True) if assignments
+                      else pd.DataFrame(columns=['antigen', 'genome', 'allele_id']))
+    return tables, genome_alleles.sort_values(['antigen', 'genome', 'allele_id'], kind='stable')
+
+
+def build_catalogue(blast_file, query_fasta, fasta_path, total_genomes, min_identity, min_coverage,
+                    output_dir, contig_index=None, coverage_mode='hsp', clusters=None):
+    """
+    Intern the translated hit regions and write the allele tables.
+
+    With ``clusters`` (genome_redundancy.py) members inherit the alleles of
+    their representative's hits.
+
+    Returns:
+        dict: 'tables' (antigen -> DataFrame), 'genome_alleles', 'alleles'
+              (distinct sequences interned), 'hits', 'missing' (hits on
+              subjects absent from the FASTA or outside them) and 'output_dir'.
+    """
+    query_sequences = dict(read_query_records(query_fasta))
+    query_lengths = {name: len(sequence) for name, sequence in query_sequences.items()}
+    df = passing_hits(blast_file, query_lengths, min_identity, min_coverage, contig_index, coverage_mode)
+
+    catalogue = AlleleCatalogue()
+    with FastaIndex(fasta_path) as fasta:
+        hits, missing = locate_hits(df, fasta, list(query_sequences))
+        hits = hits.assign(allele=hit_alleles(hits, fasta, catalogue))
+    outside = hits['allele'] < 0
+    hits = hits[~outside]
+    if clusters is not None:
+        hits = propagate_hits(hits, clusters)
+    tables, genome_alleles = allele_tables(hits, catalogue, query_sequences, total_genomes)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for antigen, table in tables.items():
+        stem = _file_stem(antigen)
+        table[ALLELE_COLUMNS].to_csv(output_dir / f'{stem}.tsv', sep='\t', index=False, float_format='%.4f')
+        with open(output_dir / f'{stem}.faa', 'w') as fh:
+            for row in table.itertuples():
+                fh.write(f">{row.allele_id} genomes={row.genomes} identity={row.identity_percent:.2f}\n"
+                         f"{row.sequence}\n")
+    genome_alleles.to_csv(output_dir / GENOME_ALLELES_NAME, sep='\t', index=False)
+    return {'tables': tables, 'genome_alleles': genome_alleles, 'alleles': len(catalogue),
+            'hits': len(hits), 'missing': int(missing.sum() + outside.sum()), 'output_dir': output_dir}
+
+
+def print_catalogue(result, indent='  '):
+    """Allele count, reference allele carriers and the most common allele per antigen"""
+    for antigen, table in result['tables'].items():
+        name = antigen.split('|')[0]
+        if table.empty:
+            print(f"{indent}{name}: no passing hits")
+            continue
+        reference = int(table.loc[table['is_reference'], 'genomes'].sum())
+        top = table.iloc[0]
+        print(f"{indent}{name}: {len(table)} alleles, reference sequence in {reference} genomes, "
+              f"most common {top['allele_id']} ({top['genomes']} genomes, {top['identity_percent']:.1f}% identity)")
+    if result['missing']:
+        print(f"{indent}{result['missing']} hits outside the sequences of the FASTA were skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-antigen allele frequencies of the translated hit regions.")
+    parser.add_argument("-i", "--input", required=True, help="Full-length BLAST output (fmt 6) or its hit store.")
+    parser.add_argument("-q", "--query_fasta", required=True, help="Query FASTA of the search (the reference alleles).")
+    parser.add_argument("-f", "--fasta", required=True, help="Indexed merged genome FASTA (see fasta_index.py).")
+    parser.add_argument("-t", "--total_genomes", required=True, type=int, help="Total number of genomes.")
+    parser.add_argument("-o", "--output_dir", default=ALLELE_DIR_NAME,
+                        help=f"Output directory (default: {ALLELE_DIR_NAME}).")
+    parser.add_argument("--contig_index", help="Optional contig_index.tsv (contig -> assembly).")
+    parser.add_argument("--min_identity", type=float, default=60.0, help="Minimum percent identity (default: 60.0).")
+    parser.add_argument("--min_coverage", type=float, default=0.8, help="Minimum query coverage (default: 0.8).")
+    parser.add_argument("--coverage_mode", choices=['hsp', 'merged'], default='hsp',
+                        help="Per-HSP coverage or the union of HSPs per antigen/genome (default: hsp).")
+    args = parser.parse_args()
+
+    contig_index = load_contig_index(args.contig_index) if args.contig_index else None
+    result = build_catalogue(args.input, args.query_fasta, args.fasta, args.total_genomes, args.min_identity,
+                             args.min_coverage, args.output_dir, contig_index, args.coverage_mode)
+    print_catalogue(result)
+    print(f"Allele catalogue: {result['output_dir']} ({result['alleles']} distinct sequences)")
+
+
+if __name__ == "__main__":
+    main()
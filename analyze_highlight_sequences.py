@@ -10,165 +10,95 @@ Author: [Principal Investigator]
 Date: May 26, 2025
 """
 
-import os
-import subprocess
 import pandas as pd
-import numpy as np
 from Bio import SeqIO
-import re
 from pathlib import Path
 
-def extract_accession(sseqid):
-    """Extract genome accession from BLAST subject ID"""
-    match = re.search(r'([A-Z]{2}_\d+\.\d+)', sseqid)
-    return match.group(1) if match else sseqid
+from aggregation import annotate_hits, load_hits, print_raw_distribution, summarize_antigens, summary_columns
+from blast_search import cached_tblastn
+from genome_index import INDEX_NAME, load_contig_index
+from genome_redundancy import cluster_prevalence, propagate_hits
+from hit_store import write_hit_store
+from instrumentation import METRICS_NAME, PROFILE_DIR_NAME, RunMetrics, count_rows
+from kmer_prefilter import print_report
 
-def analyze_highlight_sequences():
-    """Highlight 시퀀스들을 분석하는 메인 함수"""
-    
-    # 설정
-    query_fasta = "query_antigens_highlight.fasta"
-    output_dir = "suis_highlight_analysis"
-    blast_output = f"{output_dir}/blast_results_highlight.tsv"
-    db_name = "suis_prevalence_analysis/suis_db"  # 기존 DB 재사용
-    total_genomes = 388
-    
-    # 분석 파라미터
-    min_identity = 60.0
-    min_coverage = 0.5  # highlight 시퀀스는 더 관대한 coverage 기준 적용
-    
-    print("🔬 S. suis Highlight Sequence Analysis 시작")
-    print("=" * 60)
-    
-    # 출력 디렉토리 생성
-    Path(output_dir).mkdir(exist_ok=True)
-    
-    # Step 1: Highlight 시퀀스 길이 확인
-    print("📏 Highlight 시퀀스 정보 수집...")
+def classify_highlight(prevalence):
+    """Prevalence 등급 분류"""
+    if prevalence >= 80:
+        return "High"
+    elif prevalence >= 50:
+        return "Medium"
+    else:
+        return "Low"
+
+def assess_highlight(prevalence):
+    """Highlight 영역 평가"""
+    if prevalence >= 80:
+        return "Excellent highlight region - broad coverage"
+    elif prevalence >= 60:
+        return "Good highlight region - moderate coverage"
+    elif prevalence >= 40:
+        return "Moderate highlight region - limited coverage"
+    else:
+        return "Poor highlight region - very limited"
+
+def read_highlight_lengths(query_fasta):
+    """Highlight 시퀀스 길이 (query ID -> aa)"""
     query_lengths = {}
     for seq_record in SeqIO.parse(query_fasta, 'fasta'):
         query_lengths[seq_record.id] = len(seq_record.seq)
         print(f"  {seq_record.id}: {len(seq_record.seq)} aa")
-    
-    # Step 2: tBLASTn 검색 실행
-    print("\n🔍 tBLASTn 검색 실행...")
-    cmd = [
-        'tblastn',
-        '-query', query_fasta,
-        '-db', db_name,
-        '-evalue', '1e-5',
-        '-outfmt', '6',
-        '-out', blast_output,
-        '-num_threads', '4'
-    ]
-    
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"❌ tBLASTn 실패: {result.stderr}")
-        return
-    
+    return query_lengths
+
+def search_highlight(query_fasta, db_name, blast_output, evalue='1e-5', threads=4,
+                     runner=None, cache_params=None, extra_args=()):
+    """tBLASTn 검색 (캐시에 없는 시퀀스만) 후 columnar hit store 작성"""
+    counts = cached_tblastn(query_fasta, db_name, blast_output, evalue, threads,
+                            runner=runner, extra_args=extra_args, cache_params=cache_params)
+    print(f"  캐시 사용: {counts['cached']}개, 신규 검색: {counts['searched']}개")
+    if getattr(runner, 'report', None):
+        print_report(runner.report)
     print(f"  BLAST 완료: {blast_output}")
-    
-    # Step 3: 결과 분석
-    print("\n📊 BLAST 결과 분석...")
-    
-    # BLAST 결과 읽기
-    cols = ['qseqid','sseqid','pident','length','mismatch','gapopen',
-            'qstart','qend','sstart','send','evalue','bitscore']
-    
-    try:
-        df = pd.read_csv(blast_output, sep='\t', names=cols, header=None)
-    except pd.errors.EmptyDataError:
-        print("❌ BLAST 결과 파일이 비어있습니다.")
-        return
+    write_hit_store(blast_output)
+    return counts
+
+def summarize_highlight(blast_output, query_lengths, total_genomes, min_identity, min_coverage,
+                        contig_index=None, coverage_mode='hsp', clusters=None):
+    """Highlight 항원별 prevalence 집계; hit이 없으면 빈 DataFrame"""
+    df = load_hits(blast_output, columns=summary_columns(coverage_mode))
     
     if df.empty:
         print("❌ BLAST hit이 없습니다.")
-        return
+        return pd.DataFrame()
     
     print(f"  총 BLAST hit 수: {len(df)}")
     
-    # 게놈 accession 추가
-    df['genome_accession'] = df['sseqid'].apply(extract_accession)
+    # 게놈 accession 및 coverage 계산
+    # 게놈 병합 시 생성된 contig → assembly 인덱스 사용 (없으면 accession 추출)
+    # coverage_mode='merged': 항원-게놈별 HSP query 구간 합집합으로 coverage 계산
+    df = annotate_hits(df, query_lengths, contig_index, coverage_mode, min_identity)
     
-    # Coverage 계산
-    df['query_length'] = df['qseqid'].map(query_lengths)
-    df['coverage'] = df['length'] / df['query_length']
-    
-    print(f"\n  Raw hit 분포:")
-    for antigen in df['qseqid'].unique():
-        count = len(df[df['qseqid'] == antigen])
-        print(f"    {antigen}: {count} hits")
-    
-    # 필터링 적용
-    filt = df[(df['pident'] >= min_identity) & (df['coverage'] >= min_coverage)]
-    print(f"\n  필터링 후 (≥{min_identity}% identity, ≥{min_coverage*100}% coverage): {len(filt)} hits")
-    
-    # 항원별 분석
-    results = []
-    
-    for qseqid in query_lengths.keys():
-        antigen_hits = df[df['qseqid'] == qseqid]
-        antigen_filt = filt[filt['qseqid'] == qseqid]
-        
-        if len(antigen_filt) > 0:
-            unique_genomes = antigen_filt['genome_accession'].nunique()
-            prevalence = (unique_genomes / total_genomes) * 100
-            max_identity = antigen_filt['pident'].max()
-            mean_identity = antigen_filt['pident'].mean()
-            mean_coverage = antigen_filt['coverage'].mean() * 100
-        else:
-            unique_genomes = 0
-            prevalence = 0.0
-            max_identity = 0.0
-            mean_identity = 0.0
-            mean_coverage = 0.0
-        
-        # 분류
-        if prevalence >= 80:
-            classification = "High"
-        elif prevalence >= 50:
-            classification = "Medium"
-        else:
-            classification = "Low"
-        
-        # 평가
-        if prevalence >= 80:
-            assessment = "Excellent highlight region - broad coverage"
-        elif prevalence >= 60:
-            assessment = "Good highlight region - moderate coverage"
-        elif prevalence >= 40:
-            assessment = "Moderate highlight region - limited coverage"
-        else:
-            assessment = "Poor highlight region - very limited"
-        
-        results.append({
-            'antigen': qseqid,
-            'highlight_length': query_lengths[qseqid],
-            'raw_hits': len(antigen_hits),
-            'filtered_hits': len(antigen_filt),
-            'hit_genomes': unique_genomes,
-            'total_genomes': total_genomes,
-            'prevalence_percent': prevalence,
-            'max_identity': max_identity,
-            'mean_identity': mean_identity,
-            'mean_coverage_percent': mean_coverage,
-            'classification': classification,
-            'assessment': assessment
-        })
-    
-    results_df = pd.DataFrame(results)
+    # 대표 게놈만 검색한 경우 (genome_redundancy.py): 클러스터 구성원에 hit 전파
+    if clusters is not None:
+        df = propagate_hits(df, clusters)
     
-    # Step 4: 결과 저장
-    print("\n💾 결과 저장...")
+    # 항원별 분석 (모든 항원을 한 번의 groupby로 집계)
+    results_df = summarize_antigens(df, query_lengths, total_genomes, min_identity, min_coverage)
+    if clusters is not None:
+        results_df = results_df.merge(cluster_prevalence(df, list(query_lengths), clusters,
+                                                         min_identity, min_coverage), on='antigen')
+    results_df = results_df.rename(columns={'protein_length': 'highlight_length'})
     
-    # TSV 파일 저장
-    output_file = f"{output_dir}/highlight_prevalence_stats.tsv"
-    results_df.to_csv(output_file, sep='\t', index=False)
-    print(f"  결과 저장: {output_file}")
+    print(f"\n  Raw hit 분포:")
+    print_raw_distribution(results_df)
+    print(f"\n  필터링 후 (≥{min_identity}% identity, ≥{min_coverage*100}% coverage): {results_df['filtered_hits'].sum()} hits")
     
-    # 요약 보고서 저장
-    summary_file = f"{output_dir}/highlight_analysis_summary.txt"
+    results_df['classification'] = results_df['prevalence_percent'].map(classify_highlight)
+    results_df['assessment'] = results_df['prevalence_percent'].map(assess_highlight)
+    return results_df
+
+def write_highlight_summary(results_df, summary_file, min_identity, min_coverage, total_genomes):
+    """요약 보고서 저장"""
     with open(summary_file, 'w', encoding='utf-8') as f:
         f.write("S. suis Highlight Sequence Prevalence Analysis\n")
         f.write("=" * 50 + "\n\n")
@@ -192,6 +122,90 @@ def analyze_highlight_sequences():
             f.write(f"  Assessment: {row['assessment']}\n")
     
     print(f"  요약 저장: {summary_file}")
+    return summary_file
+
+def _run_highlight_stages(run_metrics, query_fasta, output_dir, db_name, blast_output,
+                          total_genomes, min_identity, min_coverage, evalue, threads, coverage_mode):
+    """Step 1-4 (각 단계를 run_metrics에 기록); hit이 없거나 검색 실패 시 None"""
+    # Step 1: Highlight 시퀀스 길이 확인
+    print("📏 Highlight 시퀀스 정보 수집...")
+    with run_metrics.stage('read_highlight_lengths') as stage:
+        query_lengths = read_highlight_lengths(query_fasta)
+        stage['rows'] = len(query_lengths)
+    
+    # Step 2: tBLASTn 검색 실행
+    print("\n🔍 tBLASTn 검색 실행...")
+    # 캐시에 없는 (새로 추가되거나 수정된) 시퀀스만 tBLASTn 실행
+    try:
+        with run_metrics.stage('search_highlight') as stage:
+            search_highlight(query_fasta, db_name, blast_output, evalue, threads)
+            stage['rows'] = count_rows(blast_output)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"❌ tBLASTn 실패: {e}")
+        return None
+    
+    # Step 3: 결과 분석
+    print("\n📊 BLAST 결과 분석...")
+    with run_metrics.stage('summarize_highlight') as stage:
+        index_path = Path(db_name).parent / INDEX_NAME
+        contig_index = load_contig_index(index_path) if index_path.exists() else None
+        results_df = summarize_highlight(blast_output, query_lengths, total_genomes,
+                                         min_identity, min_coverage, contig_index, coverage_mode)
+        stage['rows'] = int(results_df['raw_hits'].sum()) if not results_df.empty else 0
+    if results_df.empty:
+        return None
+    
+    # Step 4: 결과 저장
+    print("\n💾 결과 저장...")
+    with run_metrics.stage('write_results') as stage:
+        # TSV 파일 저장
+        output_file = f"{output_dir}/highlight_prevalence_stats.tsv"
+        results_df.to_csv(output_file, sep='\t', index=False)
+        print(f"  결과 저장: {output_file}")
+        
+        write_highlight_summary(results_df, f"{output_dir}/highlight_analysis_summary.txt",
+                                min_identity, min_coverage, total_genomes)
+        stage['rows'] = len(results_df)
+    return results_df
+
+def analyze_highlight_sequences(query_fasta="query_antigens_highlight.fasta",
+                                output_dir="suis_highlight_analysis",
+                                db_name="suis_prevalence_analysis/suis_db",  # 기존 DB 재사용
+                                total_genomes=388,
+                                min_identity=60.0,
+                                min_coverage=0.5,  # highlight 시퀀스는 더 관대한 coverage 기준 적용
+                                evalue='1e-5',
+                                threads=4,
+                                coverage_mode='hsp',  # 'merged': 분할된 HSP 구간 합집합 coverage
+                                metrics=True,    # stage별 시간/CPU/메모리/I-O → run_metrics.json
+                                profile=False):  # True: stage별 cProfile (output_dir/profiles/)
+    """Highlight 시퀀스들을 분석하는 메인 함수"""
+    
+    blast_output = f"{output_dir}/blast_results_highlight.tsv"
+    
+    print("🔬 S. suis Highlight Sequence Analysis 시작")
+    print("=" * 60)
+    
+    # 출력 디렉토리 생성
+    Path(output_dir).mkdir(exist_ok=True)
+    
+    run_metrics = RunMetrics('analyze_highlight_sequences',
+                             Path(output_dir) / PROFILE_DIR_NAME if profile else None,
+                             {'query_fasta': query_fasta, 'db_name': str(db_name), 'total_genomes': total_genomes,
+                              'min_identity': min_identity, 'min_coverage': min_coverage,
+                              'evalue': evalue, 'threads': threads, 'coverage_mode': coverage_mode})
+    try:
+        results_df = _run_highlight_stages(run_metrics, query_fasta, output_dir, db_name, blast_output,
+                                           total_genomes, min_identity, min_coverage, evalue, threads,
+                                           coverage_mode)
+    finally:
+        if metrics:
+            metrics_file = run_metrics.write(Path(output_dir) / METRICS_NAME)
+            print(f"\n⏱️ Stage metrics: {metrics_file}")
+            for line in run_metrics.summary_lines():
+                print(f"  {line}")
+    if results_df is None:
+        return
     
     # Step 5: 결과 출력
     print("\n📋 HIGHLIGHT SEQUENCE ANALYSIS 결과:")
@@ -206,4 +220,4 @@ def analyze_highlight_sequences():
     return results_df
 
 if __name__ == "__main__":
-    analyze_highlight_sequences() 
\ No newline at end of file
+    analyze_highlight_sequences()
@@ -0,0 +1,89 @@
+"""Shared helpers of the offline BLAST+ stand-ins (databases written by the fake makeblastdb)"""
+
+import os
+import shlex
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from synthetic import DEFAULT_ANTIGENS, SyntheticCollection
+
+DEFAULT_CARRIAGE = 0.5
+
+
+def read_database(db_name):
+    """(contig ID, length) pairs of a fake database or alias database"""
+    alias = Path(f'{db_name}.nal')
+    volumes = [str(db_name)]
+    if alias.exists():
+        with open(alias) as fh:
+            for line in fh:
+                if line.startswith('DBLIST'):
+                    volumes = [str(alias.parent / v) if not os.path.isabs(v) else v
+                               for v in shlex.split(line[len('DBLIST'):])]
+    contigs = []
+    for volume in volumes:
+        with open(f'{volume}.nsq') as fh:
+            for line in fh:
+                contig, _, length = line.rstrip('\n').partition('\t')
+                contigs.append((contig, int(length or 0)))
+    return contigs
+
+
+def read_queries(query_fasta):
+    """(ID, sequence) pairs of a FASTA file"""
+    records = []
+    with open(query_fasta) as fh:
+        for line in fh:
+            if line.startswith('>'):
+                records.append([line[1:].split()[0], ''])
+            elif records:
+                records[-1][1] += line.strip()
+    return [tuple(r) for r in records]
+
+
+def read_subject(fasta):
+    """(contig ID, length) pairs of a -subject FASTA file"""
+    contigs = []
+    with open(fasta) as fh:
+        for line in fh:
+            if line.startswith('>'):
+                contigs.append([line[1:].split()[0], 0])
+            elif contigs:
+                contigs[-1][1] += len(line.strip())
+    return [tuple(c) for c in contigs]
+
+
+def subject_collection(fasta, queries, seed=0):
+    """A one-genome SyntheticCollection over the contigs of a -subject FASTA file"""
+    contigs = read_subject(fasta)
+    carriage = {qseqid: rate for qseqid, _, rate in DEFAULT_ANTIGENS}
+    antigens = [(qseqid, len(seq), carriage.get(qseqid, DEFAULT_CARRIAGE)) for qseqid, seq in queries]
+    return SyntheticCollection([Path(fasta).name], [[c for c, _ in contigs]],
+                               [max(length, 500_000) for _, length in contigs], antigens, seed)
+
+
+def collection_for(db_name, queries, seed=0, seqids=None):
+    """A SyntheticCollection over the contigs of a fake database (or only ``seqids``)"""
+    index = {}
+    index_path = Path(db_name).parent / 'contig_index.tsv'
+    if index_path.exists():
+        with open(index_path) as fh:
+            next(fh, None)
+            for line in fh:
+                contig, _, assembly = line.rstrip('\n').partition('\t')
+                index[contig] = assembly
+
+    groups = {}
+    lengths = {}
+    for contig, length in read_database(db_name):
+        if seqids is not None and contig not in seqids:
+            continue
+        groups.setdefault(index.get(contig, contig), []).append(contig)
+        # Real contigs are long; the benchmark genomes only hold short stubs
+        lengths[contig] = max(length, 500_000)
+
+    carriage = {qseqid: rate for qseqid, _, rate in DEFAULT_ANTIGENS}
+    antigens = [(qseqid, len(seq), carriage.get(qseqid, DEFAULT_CARRIAGE)) for qseqid, seq in queries]
+    contig_lengths = [lengths[c] for group in groups.values() for c in group]
+    return SyntheticCollection(list(groups), list(groups.values()), contig_lengths, antigens, seed)
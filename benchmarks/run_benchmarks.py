@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+S. suis Benchmark Suite
+=======================
+
+Measures parsing and aggregation on seeded synthetic hit tables of increasing
+size, the complete SsuisAntiGenAnalyzer pipeline offline (against the
+BLAST+ stand-ins in benchmarks/fake_blast/), the k-mer prefilter on
+synthetic genomes carrying known antigen copies (recall and tblastn work
+saved) and MinHash redundancy reduction on a synthetic clonal collection
+(clusters, purity and search time saved), and the cold-start latency of a
+small parse_prevalence.py run (interpreter start-up and imports included)
+with and without its pandas-free fast path.  Every stage runs in a fresh
+forked process so its peak RSS is not hidden by an earlier, larger stage.
+
+For each stage the wall time, peak RSS and rows/sec are recorded and compared
+with a stored baseline (benchmarks/baseline.json); stages slower or larger
+than the baseline by more than the tolerance are reported as regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sizes 1e4,1e5,1e6
+    python benchmarks/run_benchmarks.py --sizes 1e4,1e5 --update_baseline
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+from synthetic import SyntheticCollection, generate_hits
+
+FAKE_BLAST_DIR = BENCH_DIR / 'fake_blast'
+DEFAULT_BASELINE = BENCH_DIR / 'baseline.json'
+DEFAULT_SIZES = '1e4,1e5,1e6'
+SWEEP_GRID = 20
+COLD_START_HITS = 500
+
+
+def _peak_rss_mb():
+    # Largest of this process and the subprocesses it waited for (ru_maxrss is in KiB on Linux)
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def _child(queue, func, args):
+    try:
+        rows, wall = func(*args)
+        queue.put({'rows': rows, 'wall_s': wall, 'peak_rss_mb': _peak_rss_mb()})
+    except BaseException as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def measure(func, *args):
+    """
+    Run func(*args) in a forked process.
+
+    func returns (rows processed, wall seconds of the timed part); set-up work
+    such as loading the input is excluded from the time but not from the RSS.
+    """
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_child, args=(queue, func, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    result['rows_per_s'] = result['rows'] / result['wall_s'] if result['wall_s'] else 0.0
+    return result
+
+
+# --- Hit-table stages -------------------------------------------------------
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - start
+
+
+def stage_generate(path, rows, collection):
+    _, wall = _timed(generate_hits, path, rows, len(collection.assemblies), 0, 1_000_000, collection)
+    return rows, wall
+
+
+def stage_load_text(path):
+    from aggregation import load_hits
+    df, wall = _timed(lambda: load_hits(path))
+    return len(df), wall
+
+
+def stage_write_store(path):
+    from hit_store import HitStore, write_hit_store
+    store, wall = _timed(write_hit_store, path)
+    return HitStore(store).rows, wall
+
+
+def stage_load_store(path):
+    from aggregation import load_hits
+    df, wall = _timed(lambda: load_hits(path, columns=['qseqid', 'sseqid', 'pident', 'length']))
+    return len(df), wall
+
+
+def _loaded(path, query_lengths, index_path):
+    from aggregation import load_hits
+    from genome_index import load_contig_index
+    df = load_hits(path, columns=['qseqid', 'sseqid', 'pident', 'length', 'evalue'])
+    return df, load_contig_index(index_path)
+
+
+def stage_annotate(path, query_lengths, index_path):
+    from aggregation import annotate_hits
+    df, contig_index = _loaded(path, query_lengths, index_path)
+    _, wall = _timed(annotate_hits, df, query_lengths, contig_index)
+    return len(df), wall
+
+
+def stage_summarize(path, query_lengths, index_path, total_genomes):
+    from aggregation import annotate_hits, summarize_antigens
+    df, contig_index = _loaded(path, query_lengths, index_path)
+    df = annotate_hits(df, query_lengths, contig_index)
+    _, wall = _timed(summarize_antigens, df, query_lengths, total_genomes, 70.0, 0.8)
+    return len(df), wall
+
+
+def stage_genome_stats(path, query_lengths, index_path):
+    from aggregation import annotate_hits, genome_stats, passing_mask
+    df, contig_index = _loaded(path, query_lengths, index_path)
+    df = annotate_hits(df, query_lengths, contig_index)
+    _, wall = _timed(lambda: genome_stats(df[passing_mask(df, 70.0, 0.8)], by=('qseqid', 'genome_accession')))
+    return len(df), wall
+
+
+def stage_sweep(path, query_lengths, index_path, total_genomes):
+    import numpy as np
+    from aggregation import annotate_hits
+    from threshold_sweep import sweep_prevalence
+    df, contig_index = _loaded(path, query_lengths, index_path)
+    df = annotate_hits(df, query_lengths, contig_index)
+    identity_grid = np.linspace(50, 100, SWEEP_GRID)
+    coverage_grid = np.linspace(0.3, 1.0, SWEEP_GRID)
+    _, wall = _timed(sweep_prevalence, df, total_genomes, identity_grid, coverage_grid, None,
+                     list(query_lengths))
+    return len(df), wall
+
+
+def stage_parse_prevalence(path, query_fasta, index_path, total_genomes, out_path):
+    # End to end, as run_suis_prevalence.sh calls it
+    cmd = [sys.executable, str(ROOT / 'parse_prevalence.py'), '-i', str(path), '-t', str(total_genomes),
+           '-q', str(query_fasta), '--contig_index', str(index_path), '-o', str(out_path)]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, capture_output=True)
+    wall = time.perf_counter() - start
+    rows = sum(1 for _ in open(path))
+    return rows, wall
+
+
+def bench_hit_table(rows, work_dir, n_genomes=388):
+    """All hit-table stages for one table size"""
+    collection = SyntheticCollection.random(n_genomes)
+    path = Path(work_dir) / f'hits_{rows}.tsv'
+    index_path = Path(work_dir) / 'contig_index.tsv'
+    query_fasta = Path(work_dir) / 'query.fasta'
+    collection.write_contig_index(index_path)
+    collection.write_query_fasta(query_fasta)
+    query_lengths = collection.query_lengths
+
+    stages = {}
+    stages['generate'] = measure(stage_generate, path, rows, collection)
+    stages['load_text'] = measure(stage_load_text, path)
+    stages['parse_prevalence_text'] = measure(stage_parse_prevalence, path, query_fasta, index_path,
+                                              n_genomes, Path(work_dir) / 'stats.tsv')
+    stages['write_hit_store'] = measure(stage_write_store, path)
+    stages['load_hit_store'] = measure(stage_load_store, path)
+    stages['annotate'] = measure(stage_annotate, path, query_lengths, index_path)
+    stages['summarize_antigens'] = measure(stage_summarize, path, query_lengths, index_path, n_genomes)
+    stages['genome_stats'] = measure(stage_genome_stats, path, query_lengths, index_path)
+    stages['threshold_sweep'] = measure(stage_sweep, path, query_lengths, index_path, n_genomes)
+    stages['parse_prevalence_store'] = measure(stage_parse_prevalence, path, query_fasta, index_path,
+                                               n_genomes, Path(work_dir) / 'stats.tsv')
+    path.unlink()
+    shutil.rmtree(f'{path}.hits')
+    return stages
+
+
+# --- k-mer prefilter --------------------------------------------------------
+
+def stage_build_prefilter(merged_fasta, contig_index, index_dir):
+    from kmer_prefilter import KmerIndex, build_kmer_index
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            _, wall = _timed(build_kmer_index, merged_fasta, index_dir, contig_index)
+        finally:
+            sys.stdout = stdout
+    return KmerIndex(index_dir).kmers.size, wall
+
+
+def stage_query_prefilter(index_dir, query_fasta):
+    from blast_search import read_query_records
+    from kmer_prefilter import KmerIndex
+    index = KmerIndex(index_dir)
+    records = read_query_records(query_fasta)
+    _, wall = _timed(lambda: [index.candidates(sequence) for _, sequence in records])
+    return len(records) * len(index.genomes), wall
+
+
+def bench_prefilter(work_dir, n_genomes=100, contig_bases=2000, min_identity=0.6):
+    """
+    Build and query the k-mer prefilter on synthetic genomes carrying mutated
+    copies of the antigens (identity >= min_identity); the 'query' stage also
+    reports the recall against the known carriers and the tblastn work saved.
+    """
+    from blast_search import read_query_records
+    from genome_merge import discover_genomes, merge_genomes
+    from kmer_prefilter import DEFAULT_MIN_SEEDS, KmerIndex, work_report
+
+    work_dir = Path(work_dir)
+    collection = SyntheticCollection.random(n_genomes)
+    query_fasta = work_dir / 'prefilter_query.fasta'
+    collection.write_query_fasta(query_fasta)
+    records = read_query_records(query_fasta)
+    collection.write_genomes(work_dir / 'prefilter_genomes', contig_bases, proteins=dict(records),
+                             min_identity=min_identity)
+    merged, contig_index = work_dir / 'prefilter_genomes.fna', work_dir / 'prefilter_contig_index.tsv'
+    merge_genomes(discover_genomes(work_dir / 'prefilter_genomes'), merged, contig_index)
+    index_dir = work_dir / 'kmer_index'
+
+    stages = {'build_index': measure(stage_build_prefilter, merged, contig_index, index_dir),
+              'query': measure(stage_query_prefilter, index_dir, query_fasta)}
+
+    index = KmerIndex(index_dir)
+    candidates = {qseqid: index.candidates(sequence, DEFAULT_MIN_SEEDS) for qseqid, sequence in records}
+    kept = {(qseqid, index.genomes[g]) for qseqid, genomes in candidates.items() for g in genomes}
+    truth = {(qseqid, collection.assemblies[g])
+             for (qseqid, _, _), carriers in zip(collection.antigens, collection.carriers) for g in carriers}
+    stages['query']['recall'] = len(truth & kept) / len(truth) if truth else 1.0
+    stages['query']['work_saved'] = work_report(index, records, candidates)['work_saved']
+    stages['build_index']['index_mb'] = sum(p.stat().st_size for p in index_dir.iterdir()) / 2 ** 20
+    shutil.rmtree(work_dir / 'prefilter_genomes')
+    return stages
+
+
+# --- Genome redundancy reduction -------------------------------------------
+
+def write_clonal_genomes(genome_dir, n_genomes, genome_bases, mutation_rate, seed=0):
+    """
+    Random lineages with geometric clone counts; clones differ from their
+    lineage by point mutations at ``mutation_rate``.
+
+    Returns:
+        np.ndarray: Lineage of every genome (in file name order).
+    """
+    rng = np.random.default_rng(seed)
+    genome_dir = Path(genome_dir)
+    genome_dir.mkdir(parents=True, exist_ok=True)
+    bases = np.frombuffer(b'ACGT', dtype=np.uint8)
+    lineage_of, lineage = [], None
+    for g in range(n_genomes):
+        if lineage is None or rng.random() < 0.35:
+            lineage = bases[rng.integers(0, 4, genome_bases)]
+            lineage_id = len(set(lineage_of))
+            genome = lineage
+        else:
+            genome = lineage.copy()
+            at = np.flatnonzero(rng.random(genome_bases) < mutation_rate)
+            genome[at] = bases[(np.searchsorted(bases, genome[at]) + rng.integers(1, 4, at.size)) % 4]
+        lineage_of.append(lineage_id)
+        with open(genome_dir / f'GCF_{900000000 + g:09d}.1_ASM{g}v1_genomic.fna', 'wb') as fh:
+            fh.write(f'>NZ_CL{g:06d}.1 synthetic clone\n'.encode() + genome.tobytes() + b'\n')
+    return np.array(lineage_of)
+
+
+def stage_sketch(genome_dir, scaled, workers):
+    from genome_merge import discover_genomes
+    from genome_redundancy import DEFAULT_K, sketch_genomes
+    sources = discover_genomes(genome_dir)
+    _, wall = _timed(sketch_genomes, sources, DEFAULT_K, scaled, workers)
+    return len(sources), wall
+
+
+def stage_cluster(genome_dir, scaled, workers, output):
+    from genome_merge import discover_genomes
+    from genome_redundancy import DEFAULT_K, DEFAULT_MIN_ANI, reduce_redundancy
+    sources = discover_genomes(genome_dir)
+    _, wall = _timed(reduce_redundancy, sources, output, DEFAULT_K, scaled, DEFAULT_MIN_ANI, workers)
+    return len(sources), wall
+
+
+def bench_redundancy(work_dir, n_genomes=100, genome_bases=200_000, mutation_rate=1e-4, scaled=200, workers=4):
+    """
+    Sketch and cluster a synthetic clonal collection.  The 'cluster' stage
+    (sketching included) reports the clusters found against the true
+    lineages, the lineage purity of the clusters and the share of the
+    database, and so of the tblastn search time, that is no longer searched.
+    """
+    from genome_redundancy import read_clusters, redundancy_report
+
+    work_dir = Path(work_dir)
+    genome_dir = work_dir / 'clonal_genomes'
+    lineage_of = write_clonal_genomes(genome_dir, n_genomes, genome_bases, mutation_rate)
+    output = work_dir / 'genome_clusters.tsv'
+    stages = {'sketch': measure(stage_sketch, genome_dir, scaled, workers),
+              'cluster': measure(stage_cluster, genome_dir, scaled, workers, output)}
+
+    clusters = read_clusters(output)
+    index = {genome: i for i, genome in enumerate(clusters['genome'])}
+    representative = clusters['representative'].map(index).to_numpy()
+    report = redundancy_report(clusters)
+    stages['cluster'].update({
+        'lineages': int(len(set(lineage_of))),
+        'clusters': report['clusters'],
+        'purity': float((lineage_of[representative] == lineage_of).mean()),
+        'work_saved': report['work_saved'],
+    })
+    shutil.rmtree(genome_dir)
+    return stages
+
+
+# --- Cold start -------------------------------------------------------------
+
+def stage_cold_start(cmd, rows, runs):
+    # Median wall time of a fresh interpreter running cmd: start-up and imports dominate small runs
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        walls.append(time.perf_counter() - start)
+    return rows, statistics.median(walls)
+
+
+def bench_cold_start(work_dir, runs=10, rows=COLD_START_HITS, n_genomes=388):
+    """parse_prevalence.py on a small table: bare interpreter, stdlib fast path and pandas path"""
+    work_dir = Path(work_dir)
+    path = work_dir / 'cold_start_hits.tsv'
+    query_fasta = work_dir / 'cold_start_query.fasta'
+    index_path = work_dir / 'cold_start_contig_index.tsv'
+    collection = generate_hits(path, rows, n_genomes=n_genomes, seed=0)
+    collection.write_query_fasta(query_fasta)
+    collection.write_contig_index(index_path)
+    cmd = [sys.executable, str(ROOT / 'parse_prevalence.py'), '-i', str(path), '-t', str(n_genomes),
+           '-q', str(query_fasta), '--contig_index', str(index_path), '-o', str(work_dir / 'cold_start_stats.tsv')]
+
+    stages = {}
+    stages['interpreter'] = measure(stage_cold_start, [sys.executable, '-c', 'pass'], rows, runs)
+    stages['parse_prevalence_fast'] = measure(stage_cold_start, cmd, rows, runs)
+    stages['parse_prevalence_pandas'] = measure(stage_cold_start, cmd + ['--no_fast_path'], rows, runs)
+    return stages
+
+
+# --- Offline pipeline -------------------------------------------------------
+
+PIPELINE_STAGES = ['validate_inputs', 'merge_genomes', 'create_blast_database', 'run_tblastn_search',
+                   'load_query_lengths', 'analyze_blast_results', 'save_results']
+
+
+def _pipeline_child(queue, work_dir, n_genomes, hits_per_query):
+    """Run SsuisAntiGenAnalyzer.run_complete_analysis with per-method timers"""
+    try:
+        os.environ['PATH'] = f"{FAKE_BLAST_DIR}{os.pathsep}{os.environ['PATH']}"
+        os.environ['SUIS_FAKE_HITS_PER_QUERY'] = str(hits_per_query)
+        os.chdir(work_dir)
+        from complete_analysis_pipeline import SsuisAntiGenAnalyzer
+
+        collection = SyntheticCollection.random(n_genomes)
+        collection.write_genomes('genomes')
+        collection.write_query_fasta('query.fasta')
+        analyzer = SsuisAntiGenAnalyzer({
+            'query_fasta': 'query.fasta', 'genome_dir': 'genomes', 'output_dir': 'output',
+            'evalue': '1e-5', 'min_identity': 70.0, 'min_coverage': 0.8, 'threads': 2,
+            'use_blast_cache': False,
+        })
+        rows = len(collection.antigens) * hits_per_query
+        stages = {}
+        for name in PIPELINE_STAGES:
+            method = getattr(analyzer, name)
+
+            def timed(*args, _name=name, _method=method, **kwargs):
+                start = time.perf_counter()
+                value = _method(*args, **kwargs)
+                wall = time.perf_counter() - start
+                stages[_name] = {'rows': rows, 'wall_s': wall, 'peak_rss_mb': _peak_rss_mb(),
+                                 'rows_per_s': rows / wall if wall else 0.0}
+                return value
+            setattr(analyzer, name, timed)
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                analyzer.run_complete_analysis()
+            finally:
+                sys.stdout = stdout
+        wall = time.perf_counter() - start
+        stages['total'] = {'rows': rows, 'wall_s': wall, 'peak_rss_mb': _peak_rss_mb(),
+                           'rows_per_s': rows / wall if wall else 0.0}
+        queue.put(stages)
+    except BaseException as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def bench_pipeline(work_dir, n_genomes=388, hits_per_query=20000):
+    """
+    The complete analysis offline.  peak_rss_mb of a pipeline stage is the
+    process peak up to the end of that stage (stages share one process).
+    """
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_pipeline_child, args=(queue, work_dir, n_genomes, hits_per_query))
+    process.start()
+    stages = queue.get()
+    process.join()
+    if 'error' in stages:
+        raise RuntimeError(stages['error'])
+    return stages
+
+
+# --- Baseline comparison ----------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """Lines of the report table and the list of regressions"""
+    lines = [f"{'benchmark':<12} {'stage':<24} {'rows':>11} {'wall s':>9} {'rows/s':>12} "
+             f"{'peak MB':>9} {'vs base':>14}"]
+    regressions = []
+    for bench, stages in results.items():
+        for stage, m in stages.items():
+            base = baseline.get(bench, {}).get(stage)
+            note = ''
+            if base:
+                wall_ratio = m['wall_s'] / base['wall_s'] if base['wall_s'] else 1.0
+                rss_ratio = m['peak_rss_mb'] / base['peak_rss_mb'] if base['peak_rss_mb'] else 1.0
+                note = f"x{wall_ratio:.2f} t x{rss_ratio:.2f} m"
+                if wall_ratio > 1 + tolerance or rss_ratio > 1 + tolerance:
+                    regressions.append((bench, stage, wall_ratio, rss_ratio))
+                    note += ' !'
+            lines.append(f"{bench:<12} {stage:<24} {m['rows']:>11,} {m['wall_s']:>9.3f} "
+                         f"{m['rows_per_s']:>12,.0f} {m['peak_rss_mb']:>9.1f} {note:>14}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark hit parsing/aggregation on synthetic data and the offline pipeline."
+    )
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Comma-separated hit-table sizes, 1e4 to 1e8 (default: {DEFAULT_SIZES}).")
+    parser.add_argument("--genomes", type=int, default=388, help="Synthetic assemblies (default: 388).")
+    parser.add_argument("--pipeline_hits", type=float, default=2e4,
+                        help="Hits per query in the offline pipeline run (0 skips it; default: 2e4).")
+    parser.add_argument("--prefilter_genomes", type=int, default=100,
+                        help="Synthetic genomes for the k-mer prefilter benchmark (0 skips it; default: 100).")
+    parser.add_argument("--redundancy_genomes", type=int, default=100,
+                        help="Synthetic clonal genomes for the redundancy-reduction benchmark (0 skips it; default: 100).")
+    parser.add_argument("--cold_start_runs", type=int, default=10,
+                        help="parse_prevalence.py runs per cold-start stage (0 skips it; default: 10).")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON to compare against.")
+    parser.add_argument("--update_baseline", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slow-down / growth before a stage is flagged (default: 0.25).")
+    parser.add_argument("-o", "--output", help="Also write the results JSON here.")
+    parser.add_argument("--work_dir", help="Scratch directory (default: a temporary directory).")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        for size in args.sizes.split(','):
+            rows = int(float(size))
+            print(f"Benchmarking {rows:,} hits...", flush=True)
+            results[f'hits_{size.strip()}'] = bench_hit_table(rows, work_dir, args.genomes)
+        if args.pipeline_hits:
+            print(f"Benchmarking the offline pipeline ({int(args.pipeline_hits):,} hits per query)...",
+                  flush=True)
+            pipeline_dir = Path(work_dir) / 'pipeline'
+            pipeline_dir.mkdir()
+            results['pipeline'] = bench_pipeline(pipeline_dir, args.genomes, int(args.pipeline_hits))
+        if args.prefilter_genomes:
+            print(f"Benchmarking the k-mer prefilter ({args.prefilter_genomes} genomes)...", flush=True)
+            results['prefilter'] = bench_prefilter(work_dir, args.prefilter_genomes)
+        if args.redundancy_genomes:
+            print(f"Benchmarking redundancy reduction ({args.redundancy_genomes} genomes)...", flush=True)
+            results['redundancy'] = bench_redundancy(work_dir, args.redundancy_genomes)
+        if args.cold_start_runs:
+            print(f"Benchmarking parse_prevalence.py cold start ({args.cold_start_runs} runs)...", flush=True)
+            results['cold_start'] = bench_cold_start(work_dir, args.cold_start_runs)
+
+    baseline = {}
+    if Path(args.baseline).exists():
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+    lines, regressions = compare(results, baseline, args.tolerance)
+    print('\n'.join(lines))
+    if 'prefilter' in results:
+        query = results['prefilter']['query']
+        print(f"\nk-mer prefilter: recall {query['recall']:.1%} of carrier pairs, "
+              f"{query['work_saved']:.1%} of the tblastn work saved, "
+              f"index {results['prefilter']['build_index']['index_mb']:.1f} MB")
+    if 'redundancy' in results:
+        cluster = results['redundancy']['cluster']
+        print(f"Redundancy reduction: {cluster['clusters']} clusters for {cluster['lineages']} lineages "
+              f"(purity {cluster['purity']:.1%}), {cluster['work_saved']:.1%} of the tblastn search time saved")
+    if 'cold_start' in results:
+        cold = results['cold_start']
+        print(f"Cold start ({COLD_START_HITS} hits): fast path {cold['parse_prevalence_fast']['wall_s'] * 1000:.0f} ms, "
+              f"pandas {cold['parse_prevalence_pandas']['wall_s'] * 1000:.0f} ms, "
+              f"bare interpreter {cold['interpreter']['wall_s'] * 1000:.0f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=1)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as fh:
+            json.dump(baseline, fh, indent=1, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} stage(s) regressed beyond {args.tolerance:.0%} of the baseline:")
+        for bench, stage, wall_ratio, rss_ratio in regressions:
+            print(f"  {bench}/{stage}: time x{wall_ratio:.2f}, peak RSS x{rss_ratio:.2f}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
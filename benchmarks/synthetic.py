@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic data for the benchmark suite
+=============================================
+
+Generates tblastn fmt 6 hit tables with realistic structure: a genome
+collection with complete (one chromosome + plasmids) and draft (tens to
+hundreds of contigs) assemblies, antigens with the carriage rates of the
+published analysis, near-identical true hits and a long tail of low-identity
+partial hits.  Tables are written in chunks, so 10^8 rows need no more memory
+than 10^6.
+
+Usage:
+    python benchmarks/synthetic.py -n 1000000 -o /tmp/hits_1e6.tsv
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# (qseqid, protein length, fraction of genomes carrying a full-length copy);
+# HP0197 only ever gives partial hits, as in the published analysis
+DEFAULT_ANTIGENS = [
+    ('HP0197|WP_277937340.1', 671, 0.0),
+    ('Fnb|WP_014636551.1', 577, 0.25),
+    ('SAO|WP_211840080.1', 407, 0.68),
+    ('C5a|WP_240208248.1', 492, 0.90),
+    ('Suilysin|AIG43067.1', 475, 0.51),
+]
+TRUE_HIT_FRACTION = 0.02
+CHUNK_ROWS = 1_000_000
+
+
+class SyntheticCollection:
+    """Genome assemblies, their contigs and which antigens each genome carries"""
+
+    def __init__(self, assemblies, contigs, contig_lengths, antigens=DEFAULT_ANTIGENS, seed=0):
+        """
+        Args:
+            assemblies (list): Assembly IDs.
+            contigs (list): Per assembly, the list of its contig IDs.
+            contig_lengths (array): Length of every contig, in the flattened contig order.
+            antigens (list): (qseqid, protein length, carriage rate) tuples.
+            seed (int): Seed for the carrier assignment.
+        """
+        rng = np.random.default_rng(seed)
+        self.antigens = list(antigens)
+        self.assemblies = list(assemblies)
+        self.n_contigs = np.array([len(c) for c in contigs])
+        self.contig_offsets = np.concatenate([[0], np.cumsum(self.n_contigs)]).astype(int)
+        self.contigs = [contig for group in contigs for contig in group]
+        self.contig_lengths = np.asarray(contig_lengths)
+        # carriers[a] = genome indices with a full-length copy of antigen a
+        self.carriers = [np.flatnonzero(rng.random(len(self.assemblies)) < prevalence)
+                         for _, _, prevalence in self.antigens]
+
+    @classmethod
+    def random(cls, n_genomes=388, antigens=DEFAULT_ANTIGENS, seed=0):
+        """A collection of 25% complete and 75% draft assemblies"""
+        rng = np.random.default_rng(seed)
+        complete = rng.random(n_genomes) < 0.25
+        n_contigs = np.where(complete, 1 + rng.integers(0, 3, n_genomes),
+                             np.clip(rng.lognormal(4.0, 0.6, n_genomes), 5, 400).astype(int))
+        assemblies = [f'GCF_{900000000 + g:09d}.1' for g in range(n_genomes)]
+        contigs, lengths = [], []
+        for g in range(n_genomes):
+            if complete[g]:
+                group = [f'NZ_CP{100000 + g:06d}.1'] + [f'NZ_CP{100000 + g:06d}{p}.1'
+                                                        for p in range(1, n_contigs[g])]
+                lengths.append(int(rng.integers(1_900_000, 2_300_000)))
+                lengths.extend(int(x) for x in rng.integers(3_000, 60_000, n_contigs[g] - 1))
+            else:
+                group = [f'NZ_JA{g:06d}01{c + 1:06d}.1' for c in range(n_contigs[g])]
+                lengths.extend(int(x) for x in rng.integers(1_000, 2_100_000 // n_contigs[g] + 1_001,
+                                                            n_contigs[g]))
+            contigs.append(group)
+        return cls(assemblies, contigs, lengths, antigens, seed)
+
+    @property
+    def query_lengths(self):
+        return {qseqid: length for qseqid, length, _ in self.antigens}
+
+    def contig_index(self):
+        """(contig ID, assembly) pairs in genome_index.write_contig_index order"""
+        return [(contig, self.assemblies[g])
+                for g in range(len(self.assemblies))
+                for contig in self.contigs[self.contig_offsets[g]:self.contig_offsets[g + 1]]]
+
+    def write_contig_index(self, path):
+        with open(path, 'w') as fh:
+            fh.write("contig_id\tassembly\n")
+            for contig, assembly in self.contig_index():
+                fh.write(f"{contig}\t{assembly}\n")
+
+    def write_query_fasta(self, path, seed=0):
+        rng = np.random.default_rng(seed)
+        residues = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+        with open(path, 'w') as fh:
+            for qseqid, length, _ in self.antigens:
+                fh.write(f">{qseqid}\n{''.join(rng.choice(residues, length))}\n")
+
+    def write_genomes(self, genome_dir, contig_bases=60, seed=0, proteins=None, min_identity=0.85):
+        """
+        Small per-assembly FASTA files (short contigs) for offline pipeline runs.
+
+        With ``proteins`` ({qseqid: sequence}), every carrier of an antigen gets
+        a back-translated copy of it (identity drawn from [min_identity, 1],
+        random strand) in one of its contigs, so sequence-level tools such as
+        the k-mer prefilter can be checked against ``self.carriers``.
+        """
+        rng = np.random.default_rng(seed)
+        genome_dir = Path(genome_dir)
+        genome_dir.mkdir(parents=True, exist_ok=True)
+        bases = np.array(list('ACGT'))
+        genes = [[] for _ in self.assemblies]
+        if proteins:
+            for (qseqid, _, _), carriers in zip(self.antigens, self.carriers):
+                for g in carriers:
+                    genes[g].append(_back_translate(proteins[qseqid], rng, rng.uniform(min_identity, 1.0)))
+        for g, assembly in enumerate(self.assemblies):
+            contigs = self.contigs[self.contig_offsets[g]:self.contig_offsets[g + 1]]
+            sequences = [''.join(rng.choice(bases, contig_bases)) for _ in contigs]
+            for gene in genes[g]:
+                c = rng.integers(len(contigs))
+                at = rng.integers(len(sequences[c]) + 1)
+                sequences[c] = sequences[c][:at] + gene + sequences[c][at:]
+            with open(genome_dir / f'{assembly}_ASM{g}v1_genomic.fna', 'w') as fh:
+                for contig, sequence in zip(contigs, sequences):
+                    fh.write(f">{contig} synthetic\n{sequence}\n")
+
+    def hit_chunk(self, rows, rng, antigen_weights=None):
+        """
+        One chunk of hits as a DataFrame in fmt 6 column order.
+
+        Args:
+            rows (int): Number of hits.
+            rng (np.random.Generator): Random source.
+            antigen_weights (array): Relative hit share per antigen (default: uniform).
+        """
+        n_antigens = len(self.antigens)
+        weights = np.ones(n_antigens) if antigen_weights is None else np.asarray(antigen_weights, float)
+        antigen = rng.choice(n_antigens, rows, p=weights / weights.sum())
+        qlen = np.array([length for _, length, _ in self.antigens])[antigen]
+
+        is_true = rng.random(rows) < TRUE_HIT_FRACTION
+        genome = rng.integers(0, len(self.assemblies), rows)
+        for a, carriers in enumerate(self.carriers):
+            rows_a = np.flatnonzero(is_true & (antigen == a))
+            if carriers.size:
+                genome[rows_a] = carriers[rng.integers(0, carriers.size, rows_a.size)]
+            else:
+                is_true[rows_a] = False
+        contig = self.contig_offsets[genome] + (rng.random(rows) * self.n_contigs[genome]).astype(int)
+
+        # True hits: near-identical, (almost) full length.  Noise: partial, low identity
+        pident = np.where(is_true, 100 - rng.gamma(1.0, 1.5, rows), rng.uniform(25, 65, rows))
+        pident = np.clip(pident, 20, 100).round(3)
+        cover = np.where(is_true, rng.beta(20, 1, rows), rng.uniform(0.05, 0.45, rows))
+        length = np.maximum(10, (qlen * cover).astype(int))
+        qstart = 1 + (rng.random(rows) * (qlen - length + 1)).astype(int)
+        qend = qstart + length - 1
+        contig_len = self.contig_lengths[contig]
+        sstart = 1 + (rng.random(rows) * np.maximum(1, contig_len - 3 * length)).astype(int)
+        reverse = rng.random(rows) < 0.5
+        send = np.where(reverse, sstart, sstart + 3 * length - 1)
+        sstart = np.where(reverse, sstart + 3 * length - 1, sstart)
+        bitscore = (length * pident / 100 * 2.0).round(1)
+        log_evalue = np.where(is_true, -rng.uniform(50, 180, rows), -rng.uniform(5, 10, rows))
+
+        return pd.DataFrame({
+            'qseqid': np.array([q for q, _, _ in self.antigens], dtype=object)[antigen],
+            'sseqid': np.array(self.contigs, dtype=object)[contig],
+            'pident': pident,
+            'length': length,
+            'mismatch': np.round(length * (100 - pident) / 100).astype(int),
+            'gapopen': rng.poisson(0.3, rows),
+            'qstart': qstart,
+            'qend': qend,
+            'sstart': sstart,
+            'send': send,
+            'evalue': np.char.mod('%.2e', 10.0 ** log_evalue),
+            'bitscore': bitscore,
+        })
+
+
+CODONS = {
+    'A': ['GCT', 'GCC', 'GCA', 'GCG'], 'C': ['TGT', 'TGC'], 'D': ['GAT', 'GAC'], 'E': ['GAA', 'GAG'],
+    'F': ['TTT', 'TTC'], 'G': ['GGT', 'GGC', 'GGA', 'GGG'], 'H': ['CAT', 'CAC'],
+    'I': ['ATT', 'ATC', 'ATA'], 'K': ['AAA', 'AAG'], 'L': ['TTA', 'TTG', 'CTT', 'CTC', 'CTA', 'CTG'],
+    'M': ['ATG'], 'N': ['AAT', 'AAC'], 'P': ['CCT', 'CCC', 'CCA', 'CCG'], 'Q': ['CAA', 'CAG'],
+    'R': ['CGT', 'CGC', 'CGA', 'CGG', 'AGA', 'AGG'], 'S': ['TCT', 'TCC', 'TCA', 'TCG', 'AGT', 'AGC'],
+    'T': ['ACT', 'ACC', 'ACA', 'ACG'], 'V': ['GTT', 'GTC', 'GTA', 'GTG'], 'W': ['TGG'], 'Y': ['TAT', 'TAC'],
+}
+RESIDUES = sorted(CODONS)
+
+
+def _back_translate(protein, rng, identity):
+    """Random coding sequence for a protein with (1 - identity) of its residues substituted"""
+    residues = [RESIDUES[rng.integers(len(RESIDUES))] if rng.random() > identity else r
+                for r in protein]
+    gene = ''.join(CODONS[r][rng.integers(len(CODONS[r]))] for r in residues)
+    if rng.random() < 0.5:
+        gene = gene[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+    return gene
+
+
+def generate_hits(path, rows, n_genomes=388, seed=0, chunk_rows=CHUNK_ROWS, collection=None):
+    """
+    Write a seeded synthetic fmt 6 table of ``rows`` hits.
+
+    Returns:
+        SyntheticCollection: The genome collection the hits refer to.
+    """
+    collection = collection or SyntheticCollection.random(n_genomes, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    with open(path, 'w') as fh:
+        written = 0
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            collection.hit_chunk(n, rng).to_csv(fh, sep='\t', header=False, index=False)
+            written += n
+    return collection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic tblastn fmt 6 hit table.")
+    parser.add_argument("-n", "--rows", type=float, required=True, help="Number of hits (e.g. 1e6).")
+    parser.add_argument("-o", "--output", required=True, help="Output TSV path.")
+    parser.add_argument("-g", "--genomes", type=int, default=388, help="Number of assemblies (default: 388).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument("--contig_index", help="Also write the matching contig_index.tsv here.")
+    parser.add_argument("--query_fasta", help="Also write a matching query FASTA here.")
+    args = parser.parse_args()
+
+    collection = generate_hits(args.output, int(args.rows), args.genomes, args.seed)
+    if args.contig_index:
+        collection.write_contig_index(args.contig_index)
+    if args.query_fasta:
+        collection.write_query_fasta(args.query_fasta, args.seed)
+    print(f"Wrote {int(args.rows)} hits over {len(collection.assemblies)} genomes "
+          f"({len(collection.contigs)} contigs) to {args.output}")
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+S. suis BLAST Archive and Threshold-Free Re-formatting
+======================================================
+
+The fmt 6 table of a search fixes its columns: looking at query/subject
+lengths, query coverage per HSP or the aligned sequences later means running
+tblastn again.  This module keeps the search result as BLAST archives
+(``-outfmt 11``, ASN.1) instead, and formats them into any tabular column set
+with ``blast_formatter``, which takes seconds where the search takes hours:
+
+* the queries are split into contiguous, length-balanced shards (at most
+  one per thread) and every shard is searched by one tblastn writing its own
+  archive (``blast_archive/shard_<i>.asn``, listed in ``archive.json``); the
+  thread budget is divided over the shards, so a run with fewer queries than
+  threads still uses every thread through ``-num_threads``;
+* ``format_archive`` runs one blast_formatter per shard in parallel and
+  concatenates the outputs in shard order, so the table keeps the query order
+  of a single tblastn run;
+* the regular fmt 6 table (blast_results.tsv) is formatted from the archive
+  right after the search, so the rest of the pipeline is unchanged;
+* tables with other columns get a ``<table>.columns`` sidecar (see
+  hit_store.table_columns()) so aggregation.load_hits() reads them by name.
+
+The e-value cut-off is the one of the search; identity and coverage filters
+are applied later anyway, so no threshold needs a new search.
+
+Usage:
+    python blast_archive.py search -q query_antigens.fasta \\
+        -d suis_prevalence_analysis/suis_db -o blast_results.tsv --threads 8
+    python blast_archive.py format -a suis_prevalence_analysis/blast_archive \\
+        -o blast_results_extended.tsv --columns "std qlen slen qcovhsp"
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from blast_search import read_query_records
+from hit_store import BLAST_COLUMNS, columns_path, write_table_columns
+
+ARCHIVE_DIR_NAME = 'blast_archive'
+ARCHIVE_MANIFEST = 'archive.json'
+ARCHIVE_VERSION = 1
+EXTENDED_NAME = 'blast_results_extended.tsv'
+
+
+def parse_columns(columns=None):
+    """
+    Tabular column names from a list or a space/comma-separated string.
+
+    'std' stands for the 12 fmt 6 columns; qseqid is required (tables are
+    grouped by antigen).  None gives the 12 fmt 6 columns.
+    """
+    if columns is None:
+        return list(BLAST_COLUMNS)
+    if isinstance(columns, str):
+        columns = re.split(r'[\s,]+', columns.strip())
+    names = []
+    for name in columns:
+        if not name:
+            continue
+        for column in (BLAST_COLUMNS if name == 'std' else [name]):
+            if column not in names:
+                names.append(column)
+    if 'qseqid' not in names:
+        raise ValueError(f"Column set '{' '.join(names)}' lacks qseqid")
+    return names
+
+
+def contiguous_shards(records, n_shards):
+    """Split (id, sequence) records into at most n_shards length-balanced groups, keeping their order"""
+    n_shards = max(1, min(n_shards, len(records)))
+    total = sum(len(sequence) for _, sequence in records) or 1
+    shards = [[] for _ in range(n_shards)]
+    done = 0
+    for record in records:
+        # A record goes to the shard its midpoint (in cumulative residues) falls into
+        shard = min(int((done + len(record[1]) / 2) * n_shards / total), n_shards - 1)
+        shards[shard].append(record)
+        done += len(record[1])
+    return [shard for shard in shards if shard]
+
+
+def _run_commands(commands, workers, max_retries, tool):
+    """Run every command (threads: the work is in the subprocesses), resubmitting failures; returns the retries"""
+    pending = dict(enumerate(commands))
+    retries = 0
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(commands) or 1))) as pool:
+        for attempt in range(max_retries + 1):
+            results = pool.map(lambda cmd: subprocess.run(cmd, capture_output=True, text=True),
+                               list(pending.values()))
+            errors = {}
+            for i, result in zip(list(pending), results):
+                if result.returncode == 0:
+                    del pending[i]
+                else:
+                    errors[i] = result.stderr or f"exit code {result.returncode}"
+            if not pending:
+                return retries
+            retries += len(pending)
+            print(f"  Retrying {len(pending)} failed {tool} shard(s) (attempt {attempt + 2})")
+    i, error = next(iter(errors.items()))
+    raise RuntimeError(f"{tool} shard {i} failed after {max_retries + 1} attempts: {error}")
+
+
+def read_archive_manifest(archive_dir):
+    """The manifest of an archive directory (search parameters and shards)"""
+    path = Path(archive_dir) / ARCHIVE_MANIFEST
+    if not path.exists():
+        raise FileNotFoundError(f"BLAST archive not found: {path}")
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if manifest.get('version') != ARCHIVE_VERSION:
+        raise ValueError(f"{path}: unsupported archive version {manifest.get('version')}")
+    return manifest
+
+
+def archive_tblastn(query_fasta, db_name, blast_output, evalue, threads, extra_args=(),
+                    archive_dir=None, max_retries=1):
+    """
+    Run tblastn into per-shard BLAST archives and format the fmt 6 table from them.
+
+    Has the same leading signature as blast_search.run_tblastn.  The hit
+    cache is not used: the archive has to hold every query.
+
+    Args:
+        query_fasta (str): Protein query FASTA file.
+        db_name (str): BLAST nucleotide database (or alias) path.
+        blast_output (str): fmt 6 output path.
+        evalue (str): E-value cut-off.
+        threads (int): Total CPU budget: shards (at most one per query) x -num_threads each;
+            also the concurrent blast_formatter processes.
+        extra_args (tuple): Additional tblastn arguments (e.g. -dbsize).
+        archive_dir (str): Archive directory (default: blast_archive next to blast_output).
+        max_retries (int): Extra attempts for each failed shard.
+
+    Returns:
+        dict: Number of 'shards', 'threads_per_shard', 'retries' needed and the 'archive_dir'.
+    """
+    blast_output = Path(blast_output)
+    archive_dir = Path(archive_dir) if archive_dir else blast_output.parent / ARCHIVE_DIR_NAME
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    # A failed search must not leave the manifest of an earlier one behind
+    (archive_dir / ARCHIVE_MANIFEST).unlink(missing_ok=True)
+    for stale in archive_dir.glob('shard_*.asn'):
+        stale.unlink()
+
+    workers = max(1, int(threads))
+    groups = contiguous_shards(read_query_records(query_fasta), workers)
+    # Fewer queries than threads: the leftover threads go to each shard's tblastn
+    threads_per_shard = max(1, workers // max(1, len(groups)))
+    shards = [{'file': f'shard_{i}.asn', 'queries': [qseqid for qseqid, _ in group]}
+              for i, group in enumerate(groups)]
+    with tempfile.TemporaryDirectory(dir=archive_dir) as tmp_dir:
+        commands = []
+        for shard, group in zip(shards, groups):
+            shard_query = Path(tmp_dir) / f"{Path(shard['file']).stem}.fasta"
+            with open(shard_query, 'w') as fh:
+                for qseqid, sequence in group:
+                    fh.write(f">{qseqid}\n{sequence}\n")
+            commands.append([
+                'tblastn',
+                '-query', str(shard_query),
+                '-db', str(db_name),
+                '-evalue', str(evalue),
+                '-outfmt', '11',
+                '-out', str(archive_dir / shard['file']),
+                '-num_threads', str(threads_per_shard)
+            ] + list(extra_args))
+        retries = _run_commands(commands, workers, max_retries, 'tblastn') if commands else 0
+
+    manifest = {'version': ARCHIVE_VERSION, 'db': str(db_name), 'evalue': str(evalue),
+                'extra_args': list(extra_args), 'shards': shards}
+    with open(archive_dir / ARCHIVE_MANIFEST, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    summary = format_archive(archive_dir, blast_output, workers=workers, max_retries=max_retries)
+    return {'shards': len(shards), 'threads_per_shard': threads_per_shard,
+            'retries': retries + summary['retries'], 'archive_dir': archive_dir}
+
+
+def format_archive(archive_dir, output, columns=None, workers=None, max_retries=1):
+    """
+    Format every archive shard with blast_formatter in parallel into one tabular file.
+
+    Args:
+        archive_dir (str): Archive directory written by archive_tblastn().
+        output (str): Tabular output path.
+        columns (list or str): Column names (see parse_columns(); default: the 12 fmt 6 columns).
+        workers (int): Concurrent blast_formatter processes (default: all cores).
+        max_retries (int): Extra attempts for each failed shard.
+
+    Returns:
+        dict: Number of 'shards', 'rows' written, the 'columns' and 'retries' needed.
+    """
+    archive_dir = Path(archive_dir)
+    output = Path(output)
+    names = parse_columns(columns)
+    shards = read_archive_manifest(archive_dir)['shards']
+    outfmt = '6 ' + ' '.join(names)
+    rows = 0
+
+    with tempfile.TemporaryDirectory(dir=output.parent) as tmp_dir:
+        parts = [Path(tmp_dir) / f"{Path(shard['file']).stem}.tsv" for shard in shards]
+        commands = [['blast_formatter', '-archive', str(archive_dir / shard['file']),
+                     '-outfmt', outfmt, '-out', str(part)]
+                    for shard, part in zip(shards, parts)]
+        retries = _run_commands(commands, workers or os.cpu_count() or 1, max_retries,
+                                'blast_formatter') if commands else 0
+        # Shards are contiguous query groups: concatenating them keeps the query order
+        with open(output, 'w') as out:
+            for part in parts:
+                with open(part) as fh:
+                    for line in fh:
+                        if line.strip():
+                            out.write(line if line.endswith('\n') else line + '\n')
+                            rows += 1
+
+    if names == BLAST_COLUMNS:
+        columns_path(output).unlink(missing_ok=True)
+    else:
+        write_table_columns(output, names)
+    return {'shards': len(shards), 'rows': rows, 'columns': names, 'retries': retries}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search into BLAST archives (-outfmt 11) and re-format them with any column set in parallel."
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search', help="Run tblastn into per-shard archives and write the fmt 6 table.")
+    search.add_argument("-q", "--query_fasta", required=True, help="Path to the query protein FASTA file.")
+    search.add_argument("-d", "--db", required=True, help="BLAST nucleotide database.")
+    search.add_argument("-o", "--output", required=True, help="Tabular (fmt 6) output path.")
+    search.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    search.add_argument("--threads", type=int, default=os.cpu_count(), help="Total tblastn threads over all shards (default: all cores).")
+    search.add_argument("-a", "--archive", help=f"Archive directory (default: {ARCHIVE_DIR_NAME} next to the output).")
+    fmt = commands.add_parser('format', help="Format an archive with blast_formatter.")
+    fmt.add_argument("-a", "--archive", required=True, help="Archive directory.")
+    fmt.add_argument("-o", "--output", required=True, help="Tabular output path.")
+    fmt.add_argument("--columns", default="std", help="Space/comma-separated fmt 6 fields (default: std).")
+    fmt.add_argument("--workers", type=int, default=os.cpu_count(), help="Concurrent blast_formatter processes.")
+    args = parser.parse_args()
+
+    if args.command == 'search':
+        summary = archive_tblastn(args.query_fasta, args.db, args.output, args.evalue, args.threads,
+                                  archive_dir=args.archive)
+        print(f"Archive: {summary['archive_dir']} ({summary['shards']} shards, {summary['retries']} retries)")
+        print(f"Tabular results: {args.output}")
+    else:
+        summary = format_archive(args.archive, args.output, args.columns, args.workers)
+        print(f"Formatted {summary['shards']} shards ({summary['rows']} hits): {args.output}")
+        print(f"Columns: {' '.join(summary['columns'])}")
+
+
+if __name__ == "__main__":
+    main()
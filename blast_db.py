@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+S. suis Incremental BLAST Database
+==================================
+
+Manifest-driven alternative to "concatenate every genome, then makeblastdb".
+Each genome FASTA is content-hashed (SHA-256) and built into its own BLAST
+volume under ``<output_dir>/volumes/``.  The collection is exposed as a single
+alias database (``suis_db.nal``) so tblastn can keep using ``-db suis_db``.
+Contig IDs are recorded per genome so contig_index.tsv stays current too.
+Re-running after adding 10 genomes only runs makeblastdb on those 10 files.
+
+Usage:
+    python blast_db.py -g suis_selected -o suis_prevalence_analysis
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+
+from genome_index import INDEX_NAME, assembly_from_filename, write_contig_index
+from genome_merge import scan_contigs
+
+MANIFEST_NAME = 'db_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IncrementalBlastDatabase:
+    """Per-genome BLAST volumes tracked by a JSON manifest and one alias DB"""
+
+    def __init__(self, db_dir, db_name='suis_db', title='S.suis_DB'):
+        self.db_dir = Path(db_dir)
+        self.db_name = db_name
+        self.title = title
+        self.volume_dir = self.db_dir / 'volumes'
+        self.manifest_path = self.db_dir / MANIFEST_NAME
+        self.alias_path = self.db_dir / f'{db_name}.nal'
+
+    @property
+    def db_path(self):
+        """Path passed to ``tblastn -db``"""
+        return self.db_dir / self.db_name
+
+    def load_manifest(self):
+        """Load the manifest, returning an empty one if missing or outdated"""
+        if not self.manifest_path.exists():
+            return {'version': MANIFEST_VERSION, 'genomes': {}}
+        with open(self.manifest_path) as fh:
+            manifest = json.load(fh)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {'version': MANIFEST_VERSION, 'genomes': {}}
+        return manifest
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as fh:
+            json.dump(manifest, fh, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _fingerprint(self, path, previous):
+        """Hash a genome file, reusing the previous hash when size/mtime match"""
+        stat = path.stat()
+        if (previous and previous.get('size') == stat.st_size
+                and previous.get('mtime_ns') == stat.st_mtime_ns):
+            return previous['sha256'], stat
+        return hash_file(path), stat
+
+    def _build_volume(self, genome_file, volume):
+        cmd = [
+            'makeblastdb',
+            '-in', str(genome_file),
+            '-dbtype', 'nucl',
+            '-out', str(self.volume_dir / volume),
+            '-parse_seqids',
+            '-title', genome_file.name
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"makeblastdb failed for {genome_file}: {result.stderr}")
+
+    def _remove_volume(self, volume):
+        for path in self.volume_dir.glob(f'{volume}.*'):
+            path.unlink()
+
+    def _write_alias(self, volumes):
+        """Write the nucleotide alias file listing every volume"""
+        dblist = ' '.join(f'"volumes/{volume}"' for volume in volumes)
+        tmp_path = self.alias_path.with_suffix('.nal.tmp')
+        with open(tmp_path, 'w') as fh:
+            fh.write("#\n# Alias file created by blast_db.py\n#\n")
+            fh.write(f"TITLE {self.title}\n")
+            fh.write(f"DBLIST {dblist}\n")
+        os.replace(tmp_path, self.alias_path)
+
+    def update(self, genome_files):
+        """
+        Bring the database in line with the given genome files.
+
+        Args:
+            genome_files (iterable): Paths of genome FASTA files to include.
+
+        Returns:
+            dict: Lists of 'added', 'changed', 'removed' and 'unchanged'
+                  genome file names, plus the alias 'db_path'.
+        """
+        self.volume_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self.load_manifest()
+        previous = manifest['genomes']
+        genomes = {}
+        summary = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+
+        for genome_file in sorted(Path(p) for p in genome_files):
+            name = genome_file.name
+            sha256, stat = self._fingerprint(genome_file, previous.get(name))
+            volume = sha256[:20]
+            entry = {'sha256': sha256, 'volume': volume,
+                     'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+            old = previous.get(name)
+            if old and old['sha256'] == sha256 and 'contigs' in old:
+                entry['contigs'] = old['contigs']
+            else:
+                entry['contigs'] = scan_contigs(genome_file)
+
+            if old and old['sha256'] == sha256 and self._volume_exists(volume):
+                summary['unchanged'].append(name)
+            else:
+                if not self._volume_exists(volume):
+                    self._build_volume(genome_file, volume)
+                summary['changed' if old else 'added'].append(name)
+            genomes[name] = entry
+
+        summary['removed'] = sorted(set(previous) - set(genomes))
+
+        # Drop volumes no longer referenced by any genome (removed or changed)
+        live_volumes = {entry['volume'] for entry in genomes.values()}
+        for entry in previous.values():
+            if entry['volume'] not in live_volumes:
+                self._remove_volume(entry['volume'])
+
+        self._write_alias(sorted(live_volumes))
+        write_contig_index(
+            ((contig, assembly_from_filename(name))
+             for name, entry in sorted(genomes.items()) for contig in entry['contigs']),
+            self.db_dir / INDEX_NAME)
+        manifest['genomes'] = genomes
+        self._save_manifest(manifest)
+
+        summary['db_path'] = self.db_path
+        return summary
+
+    def _volume_exists(self, volume):
+        return any(self.volume_dir.glob(f'{volume}.n*'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incrementally build a BLAST nucleotide alias database from a genome directory."
+    )
+    parser.add_argument("-g", "--genome_dir", required=True, help="Directory containing genome FASTA (*.fna) files.")
+    parser.add_argument("-o", "--output_dir", default="suis_prevalence_analysis", help="Directory holding the manifest, volumes and alias DB.")
+    parser.add_argument("-n", "--db_name", default="suis_db", help="Alias database name (default: suis_db).")
+    args = parser.parse_args()
+
+    genome_files = sorted(Path(args.genome_dir).glob('*.fna'))
+    if not genome_files:
+        print(f"Error: no *.fna files found in {args.genome_dir}")
+        exit(1)
+
+    database = IncrementalBlastDatabase(args.output_dir, args.db_name)
+    summary = database.update(genome_files)
+    print(f"Genomes added: {len(summary['added'])}, changed: {len(summary['changed'])}, "
+          f"removed: {len(summary['removed'])}, unchanged: {len(summary['unchanged'])}")
+    print(f"Alias database: {summary['db_path']}")
+
+
+if __name__ == "__main__":
+    main()
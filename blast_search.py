@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+S. suis tBLASTn Search with Per-Query Hit Cache
+===============================================
+
+Shared tblastn runner used by the full-length and highlight analyses.
+
+Hits are cached on disk per query sequence.  A cache entry is keyed by the
+SHA-256 of the (upper-cased) amino-acid sequence plus the search parameters,
+and lives under a directory named after the database fingerprint, which
+lists the database paths using it (``databases.json``).  When a database
+changes, it leaves the directory of its old contents; a directory no
+database uses any more is evicted, so databases sharing a cache directory
+(the pipeline, the highlight search, the service) keep each other's
+entries.  Only new or
+edited queries are sent to tblastn; the others are filled in from the cache,
+so changing min_identity/min_coverage never triggers another search.
+
+The content hash of a plain database is remembered per database path in
+``<cache_dir>/db_fingerprints.json`` together with the size and mtime of
+its files, so later runs (and the DAG or the prevalence service starting
+up) only stat the database instead of reading it again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+from Bio import SeqIO
+
+from blast_db import MANIFEST_NAME
+from file_stamps import file_stamp
+
+CONTENT_SUFFIXES = ('.nsq', '.nhr')
+FINGERPRINT_MEMO = 'db_fingerprints.json'
+DATABASES_NAME = 'databases.json'
+
+
+def run_tblastn(query_fasta, db_name, blast_output, evalue, threads, extra_args=()):
+    """Run a single tblastn search writing tabular (fmt 6) output"""
+    cmd = [
+        'tblastn',
+        '-query', str(query_fasta),
+        '-db', str(db_name),
+        '-evalue', str(evalue),
+        '-outfmt', '6',
+        '-out', str(blast_output),
+        '-num_threads', str(threads)
+    ] + list(extra_args)
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"tblastn failed: {result.stderr}")
+    return blast_output
+
+
+def read_query_records(query_fasta):
+    """Return (id, sequence) pairs for every record in a protein FASTA"""
+    return [(rec.id, str(rec.seq)) for rec in SeqIO.parse(str(query_fasta), 'fasta')]
+
+
+def database_fingerprint(db_name, memo_path=None):
+    """
+    Fingerprint a BLAST database by content.
+
+    Incremental databases (see blast_db.py) are identified by the sorted
+    volume hashes in their manifest. Otherwise the sequence (.nsq) and header
+    (.nhr) files are hashed, with file sizes used for the remaining files;
+    with ``memo_path`` the hash is reused while every file keeps its size and
+    mtime (see file_stamps.file_stamp()).
+    """
+    db_path = Path(db_name)
+    digest = hashlib.sha256()
+
+    manifest_path = db_path.parent / MANIFEST_NAME
+    if Path(f'{db_path}.nal').exists() and manifest_path.exists():
+        with open(manifest_path) as fh:
+            genomes = json.load(fh)['genomes']
+        for name in sorted(genomes):
+            digest.update(f"{name}\t{genomes[name]['sha256']}\n".encode())
+        return digest.hexdigest()
+
+    files = sorted(db_path.parent.glob(f'{db_path.name}.*'))
+    if not files:
+        raise FileNotFoundError(f"BLAST database not found: {db_name}")
+    stamps = {path.name: file_stamp(path) for path in files}
+    memo, key = {}, str(db_path.resolve())
+    if memo_path is not None:
+        try:
+            with open(memo_path) as fh:
+                memo = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            memo = {}
+        entry = memo.get(key)
+        if entry and entry.get('stamps') == stamps:
+            return entry['fingerprint']
+
+    for path in files:
+        digest.update(path.name.encode())
+        if path.suffix in CONTENT_SUFFIXES:
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(1 << 20), b''):
+                    digest.update(chunk)
+        else:
+            digest.update(str(path.stat().st_size).encode())
+    fingerprint = digest.hexdigest()
+
+    if memo_path is not None:
+        memo[key] = {'stamps': stamps, 'fingerprint': fingerprint}
+        Path(memo_path).parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=Path(memo_path).parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(memo, fh, indent=2)
+        os.replace(tmp_path, memo_path)
+    return fingerprint
+
+
+class TblastnCache:
+    """On-disk tblastn hit cache for one database fingerprint"""
+
+    def __init__(self, cache_dir, db_name, evalue, extra_args=(), cache_params=None):
+        self.cache_root = Path(cache_dir)
+        self.db_path = str(Path(db_name).resolve())
+        self.db_fingerprint = database_fingerprint(db_name, self.cache_root / FINGERPRINT_MEMO)
+        self.entry_dir = self.cache_root / self.db_fingerprint[:20]
+        self.params = json.dumps({'evalue': str(evalue), 'outfmt': '6',
+                                  'extra_args': list(extra_args), **(cache_params or {})},
+                                 sort_keys=True)
+        self._evict_stale()
+        self.entry_dir.mkdir(parents=True, exist_ok=True)
+        databases = _read_databases(self.entry_dir)
+        if self.db_path not in databases:
+            _write_databases(self.entry_dir, databases + [self.db_path])
+
+    def _evict_stale(self):
+        """Leave the entries of this database's earlier contents; remove those no database uses any more"""
+        if not self.cache_root.exists():
+            return
+        for path in self.cache_root.iterdir():
+            if not path.is_dir() or path == self.entry_dir:
+                continue
+            databases = _read_databases(path)
+            if self.db_path not in databases:
+                continue
+            databases.remove(self.db_path)
+            if databases:
+                _write_databases(path, databases)
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def key(self, sequence):
+        digest = hashlib.sha256()
+        digest.update(self.params.encode())
+        digest.update(b'\0')
+        digest.update(sequence.upper().encode())
+        return digest.hexdigest()
+
+    def lookup(self, sequence):
+        """Return cached hit rows (without qseqid) or None on a miss"""
+        path = self.entry_dir / f'{self.key(sequence)}.tsv'
+        if not path.exists():
+            return None
+        with open(path) as fh:
+            return fh.read().splitlines()
+
+    def store(self, sequence, rows):
+        with self.writer(sequence) as fh:
+            for row in rows:
+                fh.write(row + '\n')
+
+    def writer(self, sequence):
+        """Open an entry for incremental writing; it is published on close"""
+        return _EntryWriter(self.entry_dir / f'{self.key(sequence)}.tsv')
+
+
+def _read_databases(entry_dir):
+    """Database paths using a fingerprint directory (empty if it records none)"""
+    try:
+        with open(Path(entry_dir) / DATABASES_NAME) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _write_databases(entry_dir, databases):
+    fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(sorted(databases), fh, indent=2)
+    os.replace(tmp_path, Path(entry_dir) / DATABASES_NAME)
+
+
+class _EntryWriter:
+    """File handle that atomically moves a cache entry into place on close"""
+
+    def __init__(self, path):
+        self.path = path
+        # Unique per thread too: DAG stages searching the same sequence share the cache
+        self.tmp_path = path.with_suffix(f'.tmp{os.getpid()}_{threading.get_ident()}')
+        self._fh = open(self.tmp_path, 'w')
+
+    def write(self, text):
+        self._fh.write(text)
+
+    def close(self):
+        self._fh.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self._fh.close()
+        self.tmp_path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def cached_tblastn(query_fasta, db_name, blast_output, evalue, threads,
+                   cache_dir=None, runner=None, extra_args=(), cache_params=None):
+    """
+    tblastn search that only runs queries missing from the hit cache.
+
+    Args:
+        query_fasta (str): Protein query FASTA file.
+        db_name (str): BLAST nucleotide database (or alias) path.
+        blast_output (str): Tabular (fmt 6) output path, written in query order.
+        evalue (str): E-value cut-off passed to tblastn.
+        threads (int): Number of tblastn threads.
+        cache_dir (str): Cache directory (default: ``<db dir>/blast_cache``).
+        runner (callable): Replacement for run_tblastn with the same signature.
+        extra_args (tuple): Additional tblastn arguments (part of the cache key).
+        cache_params (dict): Other settings of the runner that change its hits
+            (part of the cache key), e.g. kmer_prefilter.PrefilteredSearch.cache_params.
+
+    Returns:
+        dict: Counts of 'cached' and 'searched' query sequences.
+    """
+    runner = runner or run_tblastn
+    cache_dir = cache_dir or Path(db_name).parent / 'blast_cache'
+    cache = TblastnCache(cache_dir, db_name, evalue, extra_args, cache_params)
+
+    records = read_query_records(query_fasta)
+    hits = {}
+    missing = []
+    for qseqid, sequence in records:
+        rows = cache.lookup(sequence)
+        if rows is None:
+            missing.append((qseqid, sequence))
+        else:
+            hits[qseqid] = rows
+
+    if missing:
+        with tempfile.TemporaryDirectory(dir=Path(blast_output).parent) as tmp_dir:
+            tmp_query = Path(tmp_dir) / 'uncached_queries.fasta'
+            tmp_output = Path(tmp_dir) / 'uncached_hits.tsv'
+            with open(tmp_query, 'w') as fh:
+                for qseqid, sequence in missing:
+                    fh.write(f">{qseqid}\n{sequence}\n")
+            runner(tmp_query, db_name, tmp_output, evalue, threads, extra_args)
+
+            new_rows = {qseqid: [] for qseqid, _ in missing}
+            with open(tmp_output) as fh:
+                for line in fh:
+                    qseqid, _, rest = line.rstrip('\n').partition('\t')
+                    if qseqid in new_rows:
+                        new_rows[qseqid].append(rest)
+        for qseqid, sequence in missing:
+            cache.store(sequence, new_rows[qseqid])
+            hits[qseqid] = new_rows[qseqid]
+
+    with open(blast_output, 'w') as out:
+        for qseqid, _ in records:
+            for rest in hits[qseqid]:
+                out.write(f"{qseqid}\t{rest}\n")
+
+    return {'cached': len(records) - len(missing), 'searched': len(missing)}
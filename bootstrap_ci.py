@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+S. suis Prevalence Bootstrap Confidence Intervals
+=================================================
+
+prevalence_percent is a point estimate over the assemblies at hand, and the
+collection over-represents some clonal lineages.  This module adds
+percentile bootstrap intervals for every antigen and for the multi-antigen
+k-of-n coverage, computed from the presence matrix of analyze_blast_results().
+
+Every measure is the (weighted) mean of a 0/1 genome feature: presence of
+an antigen, or "carries >= k antigens".  A bootstrap replicate is therefore
+fully described by how often each genome is drawn, and a whole chunk of
+replicates is one multinomial draw (replicates x genomes) followed by one
+matrix product with the feature matrix (genomes x measures).  Chunks bound
+the memory of the draw matrix and are seeded from a SeedSequence spawned per
+chunk, so the result does not depend on the number of worker processes.
+
+Two resampling schemes are reported:
+
+* bootstrap: n genomes drawn uniformly with replacement;
+* weighted: genomes weighted 1 / (size of their clonal cluster), taken from
+  a genome -> cluster table (e.g. sequence type or PopPUNK cluster), and as
+  many genomes drawn as there are clusters.  Its point estimate is the
+  cluster-weighted prevalence; genomes missing from the table are singletons.
+
+Usage:
+    python bootstrap_ci.py -m suis_prevalence_analysis/presence_matrix \\
+        [--clusters genome_clusters.tsv] [--replicates 10000] [--workers 4]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from presence_matrix import PresenceMatrix
+
+CI_NAME = 'prevalence_ci.tsv'
+DEFAULT_REPLICATES = 2000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+MAX_DRAW_CELLS = 1 << 24
+
+
+def read_clusters(path):
+    """Genome -> cluster mapping from a TSV whose first two columns are genome and cluster"""
+    table = pd.read_csv(path, sep='\t', dtype=str, usecols=[0, 1]).dropna()
+    return dict(zip(table.iloc[:, 0], table.iloc[:, 1]))
+
+
+def cluster_weights(genomes, n_genomes, clusters):
+    """
+    Resampling weights 1 / cluster size for every matrix column.
+
+    Args:
+        genomes (list): Named genomes (the first matrix columns).
+        n_genomes (int): Matrix columns; the unnamed rest are singletons.
+        clusters (dict): Genome -> cluster.
+
+    Returns:
+        tuple: (weights summing to 1, number of clusters).
+    """
+    labels = [clusters.get(genome, f'\0{i}') for i, genome in enumerate(genomes)]
+    labels += [f'\0{i}' for i in range(len(genomes), n_genomes)]
+    codes, sizes = np.unique(labels, return_inverse=True, return_counts=True)[1:]
+    weights = 1.0 / sizes[codes]
+    return weights / weights.sum(), len(sizes)
+
+
+def presence_features(matrix):
+    """
+    0/1 genome features of every measure.
+
+    Returns:
+        tuple: (features float array genomes x measures, measures DataFrame
+                with measure and kind).
+    """
+    dense = matrix.dense()
+    counts = matrix.genome_counts()
+    n = len(matrix.antigens)
+    at_least = counts[:, None] >= np.arange(1, n + 1)
+    features = np.hstack([dense.T, at_least]).astype(np.float64)
+    measures = pd.DataFrame({
+        'measure': list(matrix.antigens) + [f'>={k} antigens' for k in range(1, n + 1)],
+        'kind': ['antigen'] * n + ['k_of_n'] * n,
+    })
+    return features, measures
+
+
+def _replicate_chunk(features, weights, draws, seed, size):
+    """Measure means of ``size`` replicates drawing ``draws`` genomes with probabilities ``weights``"""
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(draws, weights, size=size)
+    return counts @ features / draws
+
+
+def bootstrap_replicates(features, weights=None, draws=None, replicates=DEFAULT_REPLICATES,
+                         seed=DEFAULT_SEED, workers=1):
+    """
+    Bootstrap replicates of the (weighted) feature means.
+
+    Args:
+        features (np.ndarray): Genomes x measures 0/1 features.
+        weights (np.ndarray): Draw probability per genome (None: uniform).
+        draws (int): Genomes drawn per replicate (None: all genomes).
+        replicates (int): Number of replicates.
+        seed (int): Seed of the SeedSequence the chunk seeds are spawned from.
+        workers (int): Processes sharing the chunks (1: in this process).
+
+    Returns:
+        np.ndarray: Replicates x measures means.
+    """
+    n_genomes, n_measures = features.shape
+    if weights is None:
+        weights = np.full(n_genomes, 1.0 / n_genomes)
+    draws = draws or n_genomes
+    chunk = max(1, min(replicates, MAX_DRAW_CELLS // max(n_genomes, 1)))
+    sizes = [min(chunk, replicates - start) for start in range(0, replicates, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(features, weights, draws, s, size) for s, size in zip(seeds, sizes)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(_replicate_chunk, *zip(*tasks)))
+    else:
+        parts = [_replicate_chunk(*task) for task in tasks]
+    return np.vstack(parts) if parts else np.empty((0, n_measures))
+
+
+def _intervals(estimate, reps, confidence):
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(reps, [tail, 1 - tail], axis=0) if len(reps) else (estimate, estimate)
+    return {
+        'estimate_percent': estimate * 100,
+        'ci_low': low * 100,
+        'ci_high': high * 100,
+        'std_error': reps.std(axis=0, ddof=1) * 100 if len(reps) > 1 else np.zeros_like(estimate),
+    }
+
+
+def prevalence_intervals(matrix, clusters=None, replicates=DEFAULT_REPLICATES,
+                         confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED, workers=1):
+    """
+    Percentile bootstrap intervals of every antigen and k-of-n coverage.
+
+    Args:
+        matrix (PresenceMatrix): Presence matrix of the run.
+        clusters (dict): Genome -> clonal cluster; adds the 'weighted' method.
+        replicates (int): Replicates per method.
+        confidence (float): Interval coverage (e.g. 0.95).
+        seed (int): Random seed.
+        workers (int): Worker processes.
+
+    Returns:
+        pd.DataFrame: measure, kind, method, genomes, clusters, replicates,
+                      estimate_percent, ci_low, ci_high and std_error.
+    """
+    features, measures = presence_features(matrix)
+    n_genomes = features.shape[0]
+    genomes = features.sum(axis=0).astype(np.int64)
+    schemes = [('bootstrap', None, n_genomes)]
+    if clusters is not None:
+        weights, n_clusters = cluster_weights(matrix.genomes, n_genomes, clusters)
+        schemes.append(('weighted', weights, n_clusters))
+
+    frames = []
+    for method, weights, draws in schemes:
+        estimate = features.mean(axis=0) if weights is None else weights @ features
+        reps = (bootstrap_replicates(features, weights, draws, replicates, seed, workers)
+                if n_genomes else np.empty((0, len(measures))))
+        frames.append(measures.assign(method=method, genomes=genomes, clusters=draws, replicates=replicates,
+                                      **_intervals(estimate, reps, confidence)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_intervals(matrix_dir, output_file, clusters_file=None, replicates=DEFAULT_REPLICATES,
+                    confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED, workers=1):
+    """Compute the intervals of a presence matrix directory and write them as TSV"""
+    matrix = PresenceMatrix(matrix_dir)
+    clusters = read_clusters(clusters_file) if clusters_file else None
+    if clusters is not None and not set(matrix.genomes) & set(clusters):
+        print(f"  Warning: no genome of the presence matrix is listed in {clusters_file}")
+    intervals = prevalence_intervals(matrix, clusters, replicates, confidence, seed, workers)
+    intervals.to_csv(output_file, sep='\t', index=False, float_format='%.4f')
+    return intervals
+
+
+def print_intervals(intervals, confidence=DEFAULT_CONFIDENCE):
+    for row in intervals.itertuples():
+        name = row.measure.split('|')[0]
+        print(f"    {name:16} {row.method:9}: {row.estimate_percent:6.2f}% "
+              f"({confidence * 100:g}% CI {row.ci_low:6.2f}-{row.ci_high:6.2f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals of antigen prevalence and k-of-n coverage.")
+    parser.add_argument("-m", "--matrix", required=True, help="Presence matrix directory.")
+    parser.add_argument("-o", "--output", help=f"Output TSV (default: {CI_NAME} next to the matrix directory).")
+    parser.add_argument("--clusters", help="TSV of genome -> clonal cluster (first two columns) for weighted resampling.")
+    parser.add_argument("--replicates", type=int, default=DEFAULT_REPLICATES,
+                        help=f"Bootstrap replicates (default: {DEFAULT_REPLICATES}).")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                        help=f"Interval coverage (default: {DEFAULT_CONFIDENCE}).")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help=f"Random seed (default: {DEFAULT_SEED}).")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1).")
+    args = parser.parse_args()
+
+    output = args.output or Path(args.matrix).resolve().parent / CI_NAME
+    intervals = write_intervals(args.matrix, output, args.clusters, args.replicates,
+                                args.confidence, args.seed, args.workers)
+    print_intervals(intervals, args.confidence)
+    print(f"Intervals: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,12 +20,38 @@ Date: May 26, 2025
 
 import os
 import subprocess
+from contextlib import nullcontext
 import pandas as pd
 import numpy as np
 from Bio import SeqIO
-import re
 from pathlib import Path
 
+import analyze_highlight_sequences as highlight
+from allele_catalogue import ALLELE_DIR_NAME, GENOME_ALLELES_NAME, build_catalogue, print_catalogue
+from blast_archive import ARCHIVE_DIR_NAME, ARCHIVE_MANIFEST, EXTENDED_NAME, archive_tblastn, format_archive
+from aggregation import annotate_hits, load_hits, print_raw_distribution, summarize_antigens, summary_columns
+from blast_db import IncrementalBlastDatabase
+from blast_search import TblastnCache, cached_tblastn, run_tblastn
+from bootstrap_ci import CI_NAME, print_intervals, write_intervals
+from conservation_profile import (CONSERVATION_DIR_NAME, PROFILE_NAME, WINDOWS_NAME, conservation_analysis,
+                                  print_conservation)
+from fasta_index import HIT_SEQUENCES_DIR_NAME, MANIFEST_NAME, extract_hit_regions, fai_path, print_extraction
+from genome_index import INDEX_NAME, extract_accession, load_contig_index
+from genome_merge import discover_genomes, merge_genomes
+from genome_redundancy import (REDUNDANCY_NAME, cluster_prevalence, print_redundancy_report, propagate_hits,
+                               read_clusters, reduce_redundancy, redundancy_report, representative_sources)
+from hit_store import write_hit_store
+from instrumentation import METRICS_NAME, PROFILE_DIR_NAME, RunMetrics, count_rows
+from kmer_prefilter import INDEX_DIR_NAME, PrefilteredSearch, ensure_kmer_index, print_report
+from per_genome_search import collection_bases, per_genome_tblastn
+from pipeline_dag import PipelineDAG, Stage
+from presence_matrix import BITS_NAME, MATRIX_DIR_NAME, PresenceMatrix, write_presence_matrix
+from presence_matrix import META_NAME as MATRIX_META_NAME
+from sharded_search import sharded_tblastn
+from stratified_prevalence import STRATIFIED_NAME, print_stratified, write_stratified
+from streaming_prevalence import PrevalenceAggregator, stream_tblastn
+from threshold_sweep import sweep_prevalence, write_sweep
+
 class SsuisAntiGenAnalyzer:
     def __init__(self, config=None):
         """Initialize analyzer with configuration parameters"""
@@ -36,12 +62,47 @@ class SsuisAntiGenAnalyzer:
             'evalue': '1e-5',
             'min_identity': 60.0,
             'min_coverage': 0.8,
-            'threads': 4
+            'coverage_mode': 'hsp',
+            'threads': 4,
+            'incremental_db': False,
+            'use_blast_cache': True,
+            'streaming': False,
+            'keep_raw_tsv': True,
+            'sharded': False,
+            'per_genome': False,
+            'watch_genomes': 0,
+            'blast_archive': False,
+            'archive_columns': None,
+            'hit_store': True,
+            'dedup': False,
+            'dedup_min_ani': 0.999,
+            'sketch_k': 21,
+            'sketch_scaled': 1000,
+            'presence_matrix': True,
+            'bootstrap_replicates': 2000,
+            'genome_clusters': None,
+            'genome_metadata': None,
+            'strata': None,
+            'conservation_profile': False,
+            'extract_hits': False,
+            'allele_catalogue': False,
+            'prefilter': False,
+            'prefilter_k': 7,
+            'prefilter_min_seeds': 3,
+            'dag': False,
+            'metrics': True,
+            'profile': False,
+            'highlight_fasta': 'query_antigens_highlight.fasta',
+            'highlight_output_dir': 'suis_highlight_analysis',
+            'highlight_min_identity': 60.0,
+            'highlight_min_coverage': 0.5
         }
         
         # Create output directory
         Path(self.config['output_dir']).mkdir(exist_ok=True)
         
+        self.metrics = None
+        
         # Expected antigen information (from analysis)
         self.antigen_info = {
             'HP0197|WP_277937340.1': {'length': 671, 'function': 'Hypothetical protein'},
@@ -53,8 +114,15 @@ class SsuisAntiGenAnalyzer:
     
     def extract_accession(self, sseqid):
         """Extract genome accession from BLAST subject ID"""
-        match = re.search(r'([A-Z]{2}_\d+\.\d+)', sseqid)
-        return match.group(1) if match else sseqid
+        return extract_accession(sseqid)
+    
+    def load_contig_index(self):
+        """Load the contig -> assembly index written at merge time, if present"""
+        index_path = Path(self.config['output_dir']) / INDEX_NAME
+        if not index_path.exists():
+            print("  Contig index not found - falling back to accession parsing")
+            return None
+        return load_contig_index(index_path)
     
     def validate_inputs(self):
         """Validate required input files and tools"""
@@ -64,13 +132,51 @@ class SsuisAntiGenAnalyzer:
         if not os.path.exists(self.config['query_fasta']):
             raise FileNotFoundError(f"Query FASTA not found: {self.config['query_fasta']}")
         
-        # Check genome directory
+        if self.config.get('prefilter', False) and self.config.get('incremental_db', False):
+            raise ValueError("The k-mer prefilter is built from the merged genome FASTA; "
+                             "it cannot be combined with incremental_db")
+        if self.config.get('dedup', False) and (self.config.get('incremental_db', False)
+                                                or self.config.get('streaming', False)):
+            raise ValueError("Redundancy reduction merges representatives and propagates their hits "
+                             "afterwards; it cannot be combined with incremental_db or streaming")
+        if self.config.get('streaming', False):
+            combined = [key for key in ('sharded', 'prefilter') if self.config.get(key, False)]
+            if combined:
+                raise ValueError(f"Streaming mode aggregates the stdout of one tblastn run over the whole "
+                                 f"database; it cannot be combined with {', '.join(combined)}")
+        if self.config.get('per_genome', False):
+            combined = [key for key in ('incremental_db', 'streaming', 'sharded', 'prefilter', 'dedup',
+                                        'extract_hits', 'allele_catalogue', 'dag')
+                        if self.config.get(key, False)]
+            if combined:
+                raise ValueError(f"The per-genome search runs without a merged FASTA or database; "
+                                 f"it cannot be combined with {', '.join(combined)}")
+        if self.config.get('blast_archive', False):
+            combined = [key for key in ('streaming', 'sharded', 'per_genome', 'prefilter')
+                        if self.config.get(key, False)]
+            if combined:
+                raise ValueError(f"The BLAST archive is written by its own sharded tblastn run over the whole "
+                                 f"database; it cannot be combined with {', '.join(combined)}")
+        elif self.config.get('archive_columns'):
+            raise ValueError("archive_columns re-formats the BLAST archive; it needs blast_archive")
+        if ((self.config.get('extract_hits', False) or self.config.get('allele_catalogue', False))
+                and (self.config.get('incremental_db', False) or self.config.get('streaming', False))):
+            raise ValueError("Hit extraction and the allele catalogue read the merged genome FASTA and the "
+                             "BLAST hit table; they cannot be combined with incremental_db or streaming")
+        if self.config.get('genome_metadata'):
+            if not self.config.get('presence_matrix', True):
+                raise ValueError("Stratified prevalence is computed from the presence matrix; "
+                                 "genome_metadata needs presence_matrix")
+            if not os.path.exists(self.config['genome_metadata']):
+                raise FileNotFoundError(f"Genome metadata not found: {self.config['genome_metadata']}")
+        
+        # Check genome directory (or NCBI Datasets zip)
         genome_dir = Path(self.config['genome_dir'])
         if not genome_dir.exists():
             raise FileNotFoundError(f"Genome directory not found: {genome_dir}")
         
-        # Count genome files
-        genome_files = list(genome_dir.glob('*.fna'))
+        # Count genome files (.fna, .fna.gz or zip members)
+        genome_files = discover_genomes(genome_dir)
         print(f"  Found {len(genome_files)} genome files")
         
         # Check BLAST tools
@@ -83,21 +189,40 @@ class SsuisAntiGenAnalyzer:
         
         return len(genome_files)
     
+    def reduce_redundancy(self):
+        """Sketch every genome and cluster near-identical ones (MinHash ANI estimate)"""
+        print("🧮 Sketching genomes for redundancy reduction...")
+        
+        clusters_path = Path(self.config['output_dir']) / REDUNDANCY_NAME
+        clusters = reduce_redundancy(discover_genomes(self.config['genome_dir']), clusters_path,
+                                     self.config.get('sketch_k', 21), self.config.get('sketch_scaled', 1000),
+                                     self.config.get('dedup_min_ani', 0.999), self.config['threads'])
+        print_redundancy_report(redundancy_report(clusters))
+        print(f"  Genome clusters: {clusters_path}")
+        return clusters_path
+    
+    def load_genome_clusters(self):
+        """The genome cluster table of a redundancy-reduced run, else None"""
+        if not self.config.get('dedup', False):
+            return None
+        return read_clusters(Path(self.config['output_dir']) / REDUNDANCY_NAME)
+    
     def merge_genomes(self):
         """Merge all genome files into single FASTA"""
         print("🧬 Merging genome files...")
         
         merged_file = Path(self.config['output_dir']) / 'all_suis_genomes.fna'
-        genome_dir = Path(self.config['genome_dir'])
+        genome_files = discover_genomes(self.config['genome_dir'])
+        clusters = self.load_genome_clusters()
+        if clusters is not None:
+            genome_files = representative_sources(genome_files, clusters)
+            print(f"  Cluster representatives only: {len(genome_files)} of {len(clusters)} genomes")
         
-        # Use system command for efficiency (works on both Windows/Linux)
-        if os.name == 'nt':  # Windows
-            cmd = f'type "{genome_dir}\\*.fna" > "{merged_file}"'
-            subprocess.run(cmd, shell=True, check=True)
-        else:  # Unix/Linux
-            cmd = f'cat "{genome_dir}"/*.fna > "{merged_file}"'
-            subprocess.run(cmd, shell=True, check=True)
+        # Stream files in Python (cross-platform) and index contigs on the way;
+        # gzipped files and zip members are decompressed in memory
+        summary = merge_genomes(genome_files, merged_file)
         
+        print(f"  Contig index: {summary['index_path']} ({summary['contigs']} contigs)")
         print(f"  Merged file created: {merged_file}")
         return merged_file
     
@@ -123,29 +248,148 @@ class SsuisAntiGenAnalyzer:
         print(f"  Database created: {db_name}")
         return db_name
     
-    def run_tblastn_search(self, db_name):
+    def update_incremental_database(self):
+        """Add new/changed genomes as BLAST volumes behind the suis_db alias"""
+        print("🗃️ Updating incremental BLAST database...")
+        
+        genome_files = sorted(Path(self.config['genome_dir']).glob('*.fna'))
+        database = IncrementalBlastDatabase(self.config['output_dir'])
+        summary = database.update(genome_files)
+        
+        print(f"  Added: {len(summary['added'])}, changed: {len(summary['changed'])}, "
+              f"removed: {len(summary['removed'])}, unchanged: {len(summary['unchanged'])}")
+        print(f"  Alias database: {summary['db_path']}")
+        return summary['db_path']
+    
+    def build_prefilter_index(self, merged_fasta):
+        """Build (or reuse) the translated k-mer index of the merged genomes"""
+        print("🧩 Building k-mer prefilter index...")
+        
+        output_dir = Path(self.config['output_dir'])
+        index_dir = ensure_kmer_index(merged_fasta, output_dir / INDEX_DIR_NAME, output_dir / INDEX_NAME,
+                                      self.config.get('prefilter_k', 7))
+        print(f"  Prefilter index: {index_dir}")
+        return index_dir
+    
+    def search_runner(self):
+        """tblastn runner and its cache parameters (sharded and/or k-mer prefiltered)"""
+        runner = sharded_tblastn if self.config.get('sharded', False) else run_tblastn
+        if not self.config.get('prefilter', False):
+            return runner, None
+        prefiltered = PrefilteredSearch(Path(self.config['output_dir']) / INDEX_DIR_NAME,
+                                        self.config.get('prefilter_min_seeds', 3), runner)
+        return prefiltered, prefiltered.cache_params
+    
+    def search_args(self):
+        """Extra tblastn arguments: a redundancy-reduced database keeps the e-values of the whole collection"""
+        clusters = self.load_genome_clusters()
+        if clusters is None:
+            return []
+        return ['-dbsize', str(int(clusters['bases'].sum()))]
+    
+    def run_tblastn_search(self, db_name, threads=None):
         """Run tBLASTn search against database"""
         print("🔬 Running tBLASTn search...")
         
         blast_output = Path(self.config['output_dir']) / 'blast_results.tsv'
-        
-        cmd = [
-            'tblastn',
-            '-query', self.config['query_fasta'],
-            '-db', str(db_name),
-            '-evalue', self.config['evalue'],
-            '-outfmt', '6',  # Tabular format
-            '-out', str(blast_output),
-            '-num_threads', str(self.config['threads'])
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(f"tblastn failed: {result.stderr}")
+        threads = threads or self.config['threads']
+        
+        runner, cache_params = self.search_runner()
+        
+        if self.config.get('blast_archive', False):
+            # The archive must hold every query, so the hit cache is bypassed
+            summary = archive_tblastn(self.config['query_fasta'], db_name, blast_output, self.config['evalue'],
+                                      threads, self.search_args(),
+                                      Path(self.config['output_dir']) / ARCHIVE_DIR_NAME)
+            print(f"  BLAST archive: {summary['archive_dir']} ({summary['shards']} shards x "
+                  f"{summary['threads_per_shard']} threads, hit cache not used)")
+        elif self.config.get('use_blast_cache', True):
+            counts = cached_tblastn(self.config['query_fasta'], db_name, blast_output,
+                                    self.config['evalue'], threads, runner=runner,
+                                    extra_args=self.search_args(), cache_params=cache_params)
+            print(f"  Queries from cache: {counts['cached']}, searched: {counts['searched']}")
+        else:
+            runner(self.config['query_fasta'], db_name, blast_output,
+                   self.config['evalue'], threads, self.search_args())
+        if getattr(runner, 'report', None):
+            print_report(runner.report)
         
         print(f"  BLAST completed: {blast_output}")
+        
+        if self.config.get('hit_store', True):
+            # Columnar copy so later analyses memory-map instead of reparsing text
+            store = write_hit_store(blast_output)
+            print(f"  Hit store: {store}")
         return blast_output
     
+    def reformat_archive(self):
+        """Format the BLAST archive with archive_columns in parallel (no new search)"""
+        print("🗂️ Re-formatting BLAST archive...")
+        
+        output_dir = Path(self.config['output_dir'])
+        extended_output = output_dir / EXTENDED_NAME
+        summary = format_archive(output_dir / ARCHIVE_DIR_NAME, extended_output, self.config['archive_columns'],
+                                 self.config['threads'])
+        print(f"  Columns: {' '.join(summary['columns'])}")
+        print(f"  Re-formatted hits: {extended_output} ({summary['rows']} hits, {summary['shards']} shards)")
+        return extended_output
+    
+    def run_per_genome_search(self, query_lengths):
+        """Run tBLASTn -subject on every genome file in a process pool (no merge, no database)"""
+        print("🔬 Running per-genome tBLASTn search (no database)...")
+        
+        output_dir = Path(self.config['output_dir'])
+        blast_output = output_dir / 'blast_results.tsv'
+        aggregator = PrevalenceAggregator(query_lengths, 0, self.config['min_identity'], self.config['min_coverage'])
+        # E-values against the whole collection, as in a search of the merged database
+        dbsize = collection_bases(self.config['genome_dir'])
+        print(f"  Search space: {dbsize} bases (-dbsize)")
+        summary = per_genome_tblastn(self.config['query_fasta'], self.config['genome_dir'], blast_output,
+                                     self.config['evalue'], self.config['threads'], aggregator,
+                                     ['-dbsize', str(dbsize)], index_path=output_dir / INDEX_NAME,
+                                     watch=self.config.get('watch_genomes', 0))
+        print(f"  Genomes searched: {summary['genomes']} ({summary['contigs']} contigs), "
+              f"first result after {summary['first_result'] or 0:.1f} s")
+        print(f"  BLAST completed: {blast_output}")
+        
+        if self.config.get('hit_store', True):
+            store = write_hit_store(blast_output)
+            print(f"  Hit store: {store}")
+        return blast_output, summary['genomes']
+    
+    def run_streaming_search(self, db_name, total_genomes, query_lengths):
+        """Run tBLASTn and aggregate prevalence directly from its output stream"""
+        print("🔬 Running streaming tBLASTn search...")
+        
+        raw_output = None
+        if self.config.get('keep_raw_tsv', True):
+            raw_output = Path(self.config['output_dir']) / 'blast_results.tsv'
+        
+        cache = None
+        if self.config.get('use_blast_cache', True):
+            cache = TblastnCache(Path(db_name).parent / 'blast_cache', db_name, self.config['evalue'])
+        
+        contig_index = self.load_contig_index()
+        aggregator = PrevalenceAggregator(query_lengths, total_genomes,
+                                          self.config['min_identity'], self.config['min_coverage'],
+                                          contig_index)
+        counts = stream_tblastn(self.config['query_fasta'], db_name, self.config['evalue'],
+                                self.config['threads'], aggregator,
+                                raw_output=raw_output, cache=cache)
+        print(f"  Queries from cache: {counts['cached']}, searched: {counts['searched']}")
+        print(f"  Total BLAST hits: {aggregator.rows_seen}")
+        
+        results = aggregator.summary()
+        if self.config.get('presence_matrix', True):
+            # The aggregator keeps every passing (antigen, genome) pair: enough for the matrix
+            self.presence_outputs(aggregator.passing_hits(), query_lengths, total_genomes, contig_index)
+        results['classification'] = results['prevalence_percent'].map(self._classify_prevalence)
+        results['assessment'] = [
+            self._assess_vaccine_potential(row.antigen, row.prevalence_percent, row.raw_hits)
+            for row in results.itertuples()
+        ]
+        return results
+    
     def load_query_lengths(self):
         """Load query protein lengths from FASTA file"""
         print("📏 Loading query protein lengths...")
@@ -161,15 +405,10 @@ class SsuisAntiGenAnalyzer:
         """Analyze BLAST results and calculate prevalence"""
         print("📊 Analyzing BLAST results...")
         
-        # Load BLAST results
-        cols = ['qseqid','sseqid','pident','length','mismatch','gapopen',
-                'qstart','qend','sstart','send','evalue','bitscore']
+        coverage_mode = self.config.get('coverage_mode', 'hsp')
         
-        try:
-            df = pd.read_csv(blast_file, sep='\t', names=cols, header=None)
-        except pd.errors.EmptyDataError:
-            print("  Warning: BLAST results file is empty")
-            return pd.DataFrame()
+        # Load BLAST results (from the columnar hit store when present)
+        df = load_hits(blast_file, columns=summary_columns(coverage_mode))
         
         if df.empty:
             print("  Warning: No BLAST hits found")
@@ -177,61 +416,147 @@ class SsuisAntiGenAnalyzer:
         
         print(f"  Total BLAST hits: {len(df)}")
         
-        # Add genome accession
-        df['genome_accession'] = df['sseqid'].apply(self.extract_accession)
-        
-        # Calculate coverage
-        df['query_length'] = df['qseqid'].map(query_lengths)
-        df['coverage'] = df['length'] / df['query_length']
-        
-        print(f"  Raw hit distribution:")
-        for antigen in df['qseqid'].unique():
-            count = len(df[df['qseqid'] == antigen])
-            print(f"    {antigen}: {count} hits")
-        
-        # Apply filters
         min_identity = self.config['min_identity']
         min_coverage = self.config['min_coverage']
         
-        filt = df[(df['pident'] >= min_identity) & (df['coverage'] >= min_coverage)]
-        print(f"  Hits after filtering (≥{min_identity}% identity, ≥{min_coverage*100}% coverage): {len(filt)}")
+        # Add genome accession and coverage (per HSP, or merged per antigen/genome)
+        contig_index = self.load_contig_index()
+        df = annotate_hits(df, query_lengths, contig_index, coverage_mode, min_identity)
         
-        # Analyze by antigen
-        results = []
+        # Redundancy-reduced search: members inherit their representative's hits
+        clusters = self.load_genome_clusters()
+        if clusters is not None:
+            df = propagate_hits(df, clusters)
         
-        for qseqid in query_lengths.keys():
-            antigen_hits = df[df['qseqid'] == qseqid]
-            antigen_filt = filt[filt['qseqid'] == qseqid]
-            
-            if len(antigen_filt) > 0:
-                unique_genomes = antigen_filt['genome_accession'].nunique()
-                prevalence = (unique_genomes / total_genomes) * 100
-                max_identity = antigen_filt['pident'].max()
-                mean_identity = antigen_filt['pident'].mean()
-                mean_coverage = antigen_filt['coverage'].mean() * 100
-            else:
-                unique_genomes = 0
-                prevalence = 0.0
-                max_identity = 0.0
-                mean_identity = 0.0
-                mean_coverage = 0.0
-            
-            results.append({
-                'antigen': qseqid,
-                'protein_length': query_lengths[qseqid],
-                'raw_hits': len(antigen_hits),
-                'filtered_hits': len(antigen_filt),
-                'hit_genomes': unique_genomes,
-                'total_genomes': total_genomes,
-                'prevalence_percent': prevalence,
-                'max_identity': max_identity,
-                'mean_identity': mean_identity,
-                'mean_coverage_percent': mean_coverage,
-                'classification': self._classify_prevalence(prevalence),
-                'assessment': self._assess_vaccine_potential(qseqid, prevalence, len(antigen_hits))
-            })
-        
-        return pd.DataFrame(results)
+        # All antigens in one grouped pass
+        results = summarize_antigens(df, query_lengths, total_genomes, min_identity, min_coverage)
+        if clusters is not None:
+            results = results.merge(cluster_prevalence(df, list(query_lengths), clusters,
+                                                       min_identity, min_coverage), on='antigen')
+        
+        if self.config.get('presence_matrix', True):
+            self.presence_outputs(df, query_lengths, total_genomes, contig_index)
+        
+        print(f"  Coverage mode: {coverage_mode}")
+        print(f"  Raw hit distribution:")
+        print_raw_distribution(results)
+        print(f"  Hits after filtering (≥{min_identity}% identity, ≥{min_coverage*100}% coverage): {results['filtered_hits'].sum()}")
+        
+        if clusters is not None:
+            for row in results.itertuples():
+                print(f"    {row.antigen.split('|')[0]}: {row.prevalence_percent:.2f}% of genomes "
+                      f"({row.propagated_genomes} propagated), {row.cluster_prevalence_percent:.2f}% of clusters")
+        
+        results['classification'] = results['prevalence_percent'].map(self._classify_prevalence)
+        results['assessment'] = [
+            self._assess_vaccine_potential(row.antigen, row.prevalence_percent, row.raw_hits)
+            for row in results.itertuples()
+        ]
+        return results
+    
+    def presence_outputs(self, df, query_lengths, total_genomes, contig_index=None):
+        """Presence matrix of the passing hits, then its bootstrap intervals and stratified prevalence"""
+        matrix_dir = self.write_presence_matrix(df, query_lengths, total_genomes, contig_index)
+        if self.config.get('bootstrap_replicates', 0):
+            self.prevalence_intervals(matrix_dir)
+        if self.config.get('genome_metadata'):
+            self.stratified_prevalence(matrix_dir)
+        return matrix_dir
+    
+    def write_presence_matrix(self, df, query_lengths, total_genomes, contig_index=None):
+        """Persist the bit-packed antigen x genome matrix of passing hits and print k-of-n coverage"""
+        matrix_dir = write_presence_matrix(Path(self.config['output_dir']) / MATRIX_DIR_NAME, df,
+                                           list(query_lengths), total_genomes,
+                                           self.config['min_identity'], self.config['min_coverage'],
+                                           contig_index, self.config.get('coverage_mode', 'hsp'))
+        matrix = PresenceMatrix(matrix_dir)
+        print(f"  Presence matrix: {matrix_dir} ({len(matrix.antigens)} antigens x {matrix.total_genomes} genomes)")
+        for row in matrix.k_of_n().itertuples():
+            print(f"    Genomes with ≥{row.k} antigens: {row.genomes} ({row.percent:.2f}%)")
+        return matrix_dir
+    
+    def prevalence_intervals(self, matrix_dir):
+        """Bootstrap (and cluster-weighted) confidence intervals next to detailed_antigen_stats.tsv"""
+        output_file = Path(self.config['output_dir']) / CI_NAME
+        clusters_file = self.config.get('genome_clusters')
+        if not clusters_file and self.config.get('dedup', False):
+            clusters_file = Path(self.config['output_dir']) / REDUNDANCY_NAME
+        intervals = write_intervals(matrix_dir, output_file, clusters_file,
+                                    self.config['bootstrap_replicates'])
+        print(f"  Bootstrap intervals ({self.config['bootstrap_replicates']} replicates): {output_file}")
+        print_intervals(intervals)
+        return output_file
+    
+    def stratified_prevalence(self, matrix_dir):
+        """Prevalence and k-of-n coverage per genome metadata stratum (serotype, country, year, host, ...)"""
+        output_file = Path(self.config['output_dir']) / STRATIFIED_NAME
+        result = write_stratified(matrix_dir, self.config['genome_metadata'], output_file, self.config.get('strata'))
+        print(f"  Stratified prevalence ({result['strata'].nunique()} stratifications): {output_file}")
+        print_stratified(result)
+        return output_file
+    
+    def conservation_profile(self, blast_file, total_genomes):
+        """Per-residue conservation, ranked conserved windows and highlight estimates from the full-length hits"""
+        print("🧭 Profiling per-residue conservation...")
+        
+        highlight_fasta = self.config.get('highlight_fasta')
+        result = conservation_analysis(blast_file, self.config['query_fasta'], total_genomes,
+                                       self.config.get('highlight_min_identity', 60.0),
+                                       self.config.get('highlight_min_coverage', 0.5),
+                                       Path(self.config['output_dir']) / CONSERVATION_DIR_NAME,
+                                       self.load_contig_index(),
+                                       highlight_fasta if highlight_fasta and os.path.exists(highlight_fasta) else None,
+                                       clusters=self.load_genome_clusters())
+        print_conservation(result)
+        print(f"  Profile: {result['profile']}")
+        print(f"  Windows: {result['windows_tsv']}, {result['windows_fasta']}")
+        return result
+    
+    def extract_hit_sequences(self, blast_file):
+        """Per-antigen nucleotide/protein FASTA of every passing hit, read through the merged FASTA index"""
+        print("✂️ Extracting hit regions...")
+        
+        output_dir = Path(self.config['output_dir'])
+        manifest = extract_hit_regions(blast_file, output_dir / 'all_suis_genomes.fna',
+                                       output_dir / HIT_SEQUENCES_DIR_NAME, self.load_query_lengths(),
+                                       self.config['min_identity'], self.config['min_coverage'],
+                                       self.load_contig_index(), coverage_mode=self.config.get('coverage_mode', 'hsp'))
+        print_extraction(manifest)
+        print(f"  Hit sequences: {output_dir / HIT_SEQUENCES_DIR_NAME}")
+        return manifest
+    
+    def allele_catalogue(self, blast_file, total_genomes):
+        """Per-antigen allele frequencies of the translated hit regions (each distinct sequence interned once)"""
+        print("🧾 Cataloguing antigen alleles...")
+        
+        output_dir = Path(self.config['output_dir'])
+        result = build_catalogue(blast_file, self.config['query_fasta'], output_dir / 'all_suis_genomes.fna',
+                                 total_genomes, self.config['min_identity'], self.config['min_coverage'],
+                                 output_dir / ALLELE_DIR_NAME, self.load_contig_index(),
+                                 self.config.get('coverage_mode', 'hsp'), self.load_genome_clusters())
+        print_catalogue(result)
+        print(f"  Allele catalogue: {result['output_dir']} ({result['alleles']} distinct sequences)")
+        return result
+    
+    def sweep_thresholds(self, blast_file, total_genomes, query_lengths,
+                         identity_grid, coverage_grid, evalue_grid=None):
+        """Prevalence of every antigen over a grid of identity/coverage(/e-value) thresholds"""
+        print("📈 Sweeping identity/coverage thresholds...")
+        
+        df = load_hits(blast_file, columns=['qseqid', 'sseqid', 'pident', 'length', 'evalue'],
+                       min_identity=min(identity_grid),
+                       max_evalue=max(evalue_grid) if evalue_grid is not None else None)
+        df = annotate_hits(df, query_lengths, self.load_contig_index())
+        clusters = self.load_genome_clusters()
+        if clusters is not None:
+            df = propagate_hits(df, clusters)
+        result = sweep_prevalence(df, total_genomes, identity_grid, coverage_grid, evalue_grid,
+                                  antigens=list(query_lengths))
+        
+        tsv_path, npz_path = write_sweep(result, Path(self.config['output_dir']) / 'threshold_sweep')
+        print(f"  Grid points per antigen: {result.counts[0].size if result.antigens else 0}")
+        print(f"  Sweep saved: {tsv_path}, {npz_path}")
+        return result.to_frame()
     
     def _classify_prevalence(self, prevalence):
         """Classify prevalence level"""
@@ -264,6 +589,11 @@ class SsuisAntiGenAnalyzer:
         print(f"  Results saved: {output_file}")
         
         # Also save formatted summary
+        self.write_summary(results_df)
+        return output_file
+    
+    def write_summary(self, results_df):
+        """Write the formatted analysis_summary.txt"""
         summary_file = Path(self.config['output_dir']) / 'analysis_summary.txt'
         with open(summary_file, 'w') as f:
             f.write("S. suis 5-Antigen Prevalence Analysis Summary\n")
@@ -276,38 +606,343 @@ class SsuisAntiGenAnalyzer:
             for _, row in results_df.iterrows():
                 f.write(f"{row['antigen']}:\n")
                 f.write(f"  Prevalence: {row['prevalence_percent']:.2f}% ({row['hit_genomes']}/{row['total_genomes']})\n")
+                if 'cluster_prevalence_percent' in row:
+                    f.write(f"  Cluster prevalence: {row['cluster_prevalence_percent']:.2f}% "
+                            f"({row['hit_clusters']}/{row['clusters']} clusters; "
+                            f"{row['propagated_genomes']} genomes propagated from representatives)\n")
                 f.write(f"  Classification: {row['classification']}\n")
                 f.write(f"  Assessment: {row['assessment']}\n\n")
         
         print(f"  Summary saved: {summary_file}")
-        return output_file
+        return summary_file
+    
+    def _start_metrics(self):
+        """Fresh per-run metrics (stage time, CPU, memory, I/O, rows)"""
+        profile_dir = None
+        if self.config.get('profile', False):
+            profile_dir = Path(self.config['output_dir']) / PROFILE_DIR_NAME
+        params = {key: value for key, value in self.config.items() if not isinstance(value, (dict, list))}
+        self.metrics = RunMetrics('complete_analysis_pipeline', profile_dir, params)
+        return self.metrics
+    
+    def _stage(self, name):
+        """Measure a pipeline stage (a no-op when metrics are switched off)"""
+        if not self.config.get('metrics', True):
+            return nullcontext({})
+        return self.metrics.stage(name)
+    
+    def _finish_metrics(self):
+        """Export the run metrics next to the results"""
+        if not self.config.get('metrics', True):
+            return
+        metrics_file = self.metrics.write(Path(self.config['output_dir']) / METRICS_NAME)
+        print("⏱️ Stage metrics:")
+        for line in self.metrics.summary_lines():
+            print(f"  {line}")
+        print(f"  Metrics saved: {metrics_file}")
+    
+    @staticmethod
+    def _read_stats(path):
+        """Read a stats TSV written by a DAG stage (empty when there were no hits)"""
+        try:
+            return pd.read_csv(path, sep='\t')
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+    
+    def build_dag(self):
+        """
+        Model the analysis as a stage DAG:
+        validate -> merge -> makeblastdb -> {full-length search, highlight search}
+        -> aggregate -> report.
+        
+        The full-length and highlight searches share the database and run
+        concurrently (each with half of the thread budget).  The highlight
+        branch is only added when 'highlight_fasta' is configured; with 'dedup'
+        a sketching stage before merge limits the database to cluster
+        representatives.
+        """
+        config = self.config
+        output_dir = Path(config['output_dir'])
+        full_output = output_dir / 'blast_results.tsv'
+        stats_file = output_dir / 'detailed_antigen_stats.tsv'
+        contig_index = output_dir / INDEX_NAME
+        merged_fasta = output_dir / 'all_suis_genomes.fna'
+        highlight_fasta = config.get('highlight_fasta')
+        highlight_dir = Path(config.get('highlight_output_dir', 'suis_highlight_analysis'))
+        highlight_output = highlight_dir / 'blast_results_highlight.tsv'
+        highlight_stats = highlight_dir / 'highlight_prevalence_stats.tsv'
+        matrix_files = []
+        if config.get('presence_matrix', True):
+            matrix_files = [output_dir / MATRIX_DIR_NAME / name for name in (MATRIX_META_NAME, BITS_NAME)]
+            if config.get('bootstrap_replicates', 0):
+                matrix_files.append(output_dir / CI_NAME)
+            if config.get('genome_metadata'):
+                matrix_files.append(output_dir / STRATIFIED_NAME)
+        clusters_file = config.get('genome_clusters')
+        metadata_file = config.get('genome_metadata')
+        redundancy_file = output_dir / REDUNDANCY_NAME
+        dedup_inputs = [redundancy_file] if config.get('dedup', False) else []
+        n_searches = 2 if highlight_fasta else 1
+        search_threads = max(1, config['threads'] // n_searches)
+        
+        def genome_inputs(_):
+            return sorted({str(source.path) for source in discover_genomes(config['genome_dir'])})
+        
+        def db_files(_):
+            # Plain database files, or the alias plus the manifest of the incremental volumes
+            files = sorted(str(p) for p in output_dir.glob('suis_db.*'))
+            manifest = output_dir / 'db_manifest.json'
+            return files + [str(manifest)] if manifest.exists() else files
+        
+        def aggregate(results):
+            query_lengths = self.load_query_lengths()
+            results_df = self.analyze_blast_results(full_output, results['validate'], query_lengths)
+            results_df.to_csv(stats_file, sep='\t', index=False)
+            print(f"  Results saved: {stats_file}")
+            return str(stats_file)
+        
+        def report(results):
+            summaries = [str(self.write_summary(self._read_stats(results['aggregate'])))]
+            if highlight_fasta:
+                summaries.append(str(highlight.write_highlight_summary(
+                    self._read_stats(results['aggregate_highlight']), summary_files[1],
+                    config['highlight_min_identity'], config['highlight_min_coverage'],
+                    results['validate'])))
+            return summaries
+        
+        dag = PipelineDAG(output_dir, self.metrics if config.get('metrics', True) else None)
+        dag.add(Stage('validate', lambda _: self.validate_inputs(), always_run=True, rows=int))
+        if config.get('incremental_db', False):
+            dag.add(Stage('database', lambda _: str(self.update_incremental_database()),
+                          deps=['validate'], inputs=genome_inputs,
+                          outputs=lambda _: [output_dir / 'suis_db.nal', contig_index]))
+        else:
+            merge_deps = ['validate']
+            if config.get('dedup', False):
+                dag.add(Stage('dedup', lambda _: str(self.reduce_redundancy()),
+                              deps=['validate'], inputs=genome_inputs, outputs=[redundancy_file],
+                              params={'min_ani': config.get('dedup_min_ani', 0.999),
+                                      'k': config.get('sketch_k', 21),
+                                      'scaled': config.get('sketch_scaled', 1000)}))
+                merge_deps.append('dedup')
+            dag.add(Stage('merge', lambda _: str(self.merge_genomes()),
+                          deps=merge_deps, inputs=lambda _: genome_inputs(_) + [str(p) for p in dedup_inputs],
+                          outputs=[merged_fasta, fai_path(merged_fasta), contig_index]))
+            dag.add(Stage('database', lambda results: str(self.create_blast_database(results['merge'])),
+                          deps=['merge'], inputs=lambda results: [results['merge']],
+                          outputs=db_files))
+        
+        search_deps = ['database']
+        prefilter_params = {}
+        if config.get('prefilter', False):
+            index_dir = output_dir / INDEX_DIR_NAME
+            dag.add(Stage('kmer_index', lambda results: str(self.build_prefilter_index(results['merge'])),
+                          deps=['merge'], inputs=lambda results: [results['merge'], contig_index],
+                          outputs=[index_dir / name for name in
+                                   ('meta.json', 'kmers.npy', 'colors.npy', 'color_sets.npy')],
+                          params={'k': config.get('prefilter_k', 7)}))
+            search_deps.append('kmer_index')
+            prefilter_params = {'prefilter_min_seeds': config.get('prefilter_min_seeds', 3)}
+        
+        search_params = {'evalue': config['evalue'], 'sharded': config.get('sharded', False),
+                         'blast_archive': config.get('blast_archive', False), **prefilter_params}
+        archive_manifest = output_dir / ARCHIVE_DIR_NAME / ARCHIVE_MANIFEST
+        dag.add(Stage('search', lambda results: str(self.run_tblastn_search(results['database'], search_threads)),
+                      deps=search_deps, inputs=lambda _: [config['query_fasta']] + db_files(_) + dedup_inputs,
+                      outputs=[full_output] + ([archive_manifest] if config.get('blast_archive', False) else []),
+                      params=search_params, rows=count_rows))
+        if config.get('blast_archive', False) and config.get('archive_columns'):
+            extended_output = output_dir / EXTENDED_NAME
+            dag.add(Stage('reformat', lambda _: str(self.reformat_archive()), deps=['search'],
+                          inputs=[archive_manifest], outputs=[extended_output],
+                          params={'columns': config['archive_columns']}, rows=count_rows))
+        dag.add(Stage('aggregate', aggregate, deps=['validate', 'search'],
+                      inputs=[config['query_fasta'], full_output, contig_index] + dedup_inputs
+                             + ([clusters_file] if clusters_file else [])
+                             + ([metadata_file] if metadata_file else []),
+                      outputs=[stats_file] + matrix_files,
+                      params={'min_identity': config['min_identity'], 'min_coverage': config['min_coverage'],
+                              'coverage_mode': config.get('coverage_mode', 'hsp'),
+                              'presence_matrix': config.get('presence_matrix', True),
+                              'bootstrap_replicates': config.get('bootstrap_replicates', 0),
+                              'strata': config.get('strata')}))
+        report_deps = ['validate', 'aggregate']
+        
+        if config.get('conservation_profile', False):
+            conservation_dir = output_dir / CONSERVATION_DIR_NAME
+            dag.add(Stage('conservation', lambda results: str(
+                              self.conservation_profile(full_output, results['validate'])['windows_tsv']),
+                          deps=['validate', 'search'],
+                          inputs=[config['query_fasta'], full_output, contig_index] + dedup_inputs
+                                 + ([highlight_fasta] if highlight_fasta else []),
+                          outputs=[conservation_dir / PROFILE_NAME, conservation_dir / WINDOWS_NAME],
+                          params={'min_identity': config.get('highlight_min_identity', 60.0),
+                                  'min_coverage': config.get('highlight_min_coverage', 0.5)}))
+        
+        if config.get('extract_hits', False):
+            def extract(results):
+                self.extract_hit_sequences(results['search'])
+                return str(output_dir / HIT_SEQUENCES_DIR_NAME / MANIFEST_NAME)
+            
+            dag.add(Stage('extract', extract, deps=['merge', 'search'],
+                          inputs=[config['query_fasta'], full_output, merged_fasta, fai_path(merged_fasta),
+                                  contig_index],
+                          outputs=[output_dir / HIT_SEQUENCES_DIR_NAME / MANIFEST_NAME],
+                          params={'min_identity': config['min_identity'], 'min_coverage': config['min_coverage'],
+                                  'coverage_mode': config.get('coverage_mode', 'hsp')}))
+        
+        if config.get('allele_catalogue', False):
+            def alleles(results):
+                self.allele_catalogue(results['search'], results['validate'])
+                return str(output_dir / ALLELE_DIR_NAME / GENOME_ALLELES_NAME)
+            
+            dag.add(Stage('alleles', alleles, deps=['validate', 'merge', 'search'],
+                          inputs=[config['query_fasta'], full_output, merged_fasta, fai_path(merged_fasta),
+                                  contig_index] + dedup_inputs,
+                          outputs=[output_dir / ALLELE_DIR_NAME / GENOME_ALLELES_NAME],
+                          params={'min_identity': config['min_identity'], 'min_coverage': config['min_coverage'],
+                                  'coverage_mode': config.get('coverage_mode', 'hsp')}))
+        
+        if highlight_fasta:
+            def search_highlight(results):
+                highlight_dir.mkdir(exist_ok=True)
+                runner, cache_params = self.search_runner()
+                highlight.search_highlight(highlight_fasta, results['database'], highlight_output,
+                                           config['evalue'], search_threads, runner, cache_params,
+                                           self.search_args())
+                return str(highlight_output)
+            
+            def aggregate_highlight(results):
+                results_df = highlight.summarize_highlight(
+                    highlight_output, highlight.read_highlight_lengths(highlight_fasta),
+                    results['validate'], config['highlight_min_identity'],
+                    config['highlight_min_coverage'], self.load_contig_index(),
+                    config.get('coverage_mode', 'hsp'), self.load_genome_clusters())
+                results_df.to_csv(highlight_stats, sep='\t', index=False)
+                print(f"  Highlight results saved: {highlight_stats}")
+                return str(highlight_stats)
+            
+            dag.add(Stage('search_highlight', search_highlight, deps=search_deps,
+                          inputs=lambda _: [highlight_fasta] + db_files(_) + dedup_inputs,
+                          outputs=[highlight_output], params={'evalue': config['evalue'], **prefilter_params},
+                          rows=count_rows))
+            dag.add(Stage('aggregate_highlight', aggregate_highlight, deps=['validate', 'search_highlight'],
+                          inputs=[highlight_fasta, highlight_output, contig_index] + dedup_inputs,
+                          outputs=[highlight_stats],
+                          params={'min_identity': config['highlight_min_identity'],
+                                  'min_coverage': config['highlight_min_coverage'],
+                                  'coverage_mode': config.get('coverage_mode', 'hsp')}))
+            report_deps.append('aggregate_highlight')
+        
+        summary_files = [output_dir / 'analysis_summary.txt']
+        if highlight_fasta:
+            summary_files.append(highlight_dir / 'highlight_analysis_summary.txt')
+        dag.add(Stage('report', report, deps=report_deps, outputs=summary_files))
+        return dag
+    
+    def run_dag_analysis(self):
+        """Run the analysis as a DAG, skipping stages whose inputs are unchanged"""
+        print("🚀 Starting S. suis antigen prevalence analysis (stage DAG)...")
+        print("=" * 60)
+        
+        self._start_metrics()
+        dag = self.build_dag()
+        try:
+            results = dag.run(max_workers=2)
+        finally:
+            self._finish_metrics()
+        skipped = [name for name, status in dag.status.items() if status == 'skipped']
+        if skipped:
+            print(f"  Up to date (skipped): {', '.join(skipped)}")
+        
+        results_df = self._read_stats(results['aggregate'])
+        print("✅ Analysis completed successfully!")
+        print(f"📊 Results available in: {self.config['output_dir']}")
+        return results_df
     
     def run_complete_analysis(self):
         """Run the complete analysis pipeline"""
+        if self.config.get('dag', False):
+            return self.run_dag_analysis()
+        
         print("🚀 Starting S. suis antigen prevalence analysis...")
         print("=" * 60)
         
+        self._start_metrics()
         try:
             # Step 1: Validate inputs
-            total_genomes = self.validate_inputs()
-            
-            # Step 2: Merge genomes
-            merged_fasta = self.merge_genomes()
+            with self._stage('validate_inputs') as stage:
+                total_genomes = self.validate_inputs()
+                stage['rows'] = total_genomes
             
-            # Step 3: Create BLAST database
-            db_name = self.create_blast_database(merged_fasta)
-            
-            # Step 4: Run BLAST search
-            blast_output = self.run_tblastn_search(db_name)
+            # Steps 2-3: Merge genomes and create BLAST database
+            if self.config.get('incremental_db', False):
+                with self._stage('update_incremental_database') as stage:
+                    db_name = self.update_incremental_database()
+                    stage['rows'] = total_genomes
+            elif self.config.get('per_genome', False):
+                db_name = None  # every genome file is searched directly with -subject
+            else:
+                if self.config.get('dedup', False):
+                    with self._stage('reduce_redundancy') as stage:
+                        self.reduce_redundancy()
+                        stage['rows'] = total_genomes
+                with self._stage('merge_genomes') as stage:
+                    merged_fasta = self.merge_genomes()
+                    stage['rows'] = total_genomes
+                with self._stage('create_blast_database'):
+                    db_name = self.create_blast_database(merged_fasta)
+                if self.config.get('prefilter', False):
+                    with self._stage('build_prefilter_index'):
+                        self.build_prefilter_index(merged_fasta)
             
-            # Step 5: Load query lengths
-            query_lengths = self.load_query_lengths()
+            with self._stage('load_query_lengths') as stage:
+                query_lengths = self.load_query_lengths()
+                stage['rows'] = len(query_lengths)
             
-            # Step 6: Analyze results
-            results_df = self.analyze_blast_results(blast_output, total_genomes, query_lengths)
+            if self.config.get('streaming', False):
+                if self.config.get('coverage_mode', 'hsp') != 'hsp':
+                    raise ValueError("Streaming mode aggregates single HSPs; use coverage_mode='hsp'")
+                # Steps 4-6: Search and aggregate in one pass over tblastn's stdout
+                with self._stage('run_streaming_search') as stage:
+                    results_df = self.run_streaming_search(db_name, total_genomes, query_lengths)
+                    stage['rows'] = int(results_df['raw_hits'].sum()) if not results_df.empty else 0
+            else:
+                # Step 4: Run BLAST search
+                if self.config.get('per_genome', False):
+                    with self._stage('run_per_genome_search') as stage:
+                        # Genomes added to genome_dir during the search are included
+                        blast_output, total_genomes = self.run_per_genome_search(query_lengths)
+                        stage['rows'] = count_rows(blast_output)
+                else:
+                    with self._stage('run_tblastn_search') as stage:
+                        blast_output = self.run_tblastn_search(db_name)
+                        stage['rows'] = count_rows(blast_output)
+                    if self.config.get('blast_archive', False) and self.config.get('archive_columns'):
+                        with self._stage('reformat_archive') as stage:
+                            stage['rows'] = count_rows(self.reformat_archive())
+                
+                # Steps 5-6: Analyze results
+                with self._stage('analyze_blast_results') as stage:
+                    results_df = self.analyze_blast_results(blast_output, total_genomes, query_lengths)
+                    stage['rows'] = int(results_df['raw_hits'].sum()) if not results_df.empty else 0
+                
+                if self.config.get('conservation_profile', False):
+                    with self._stage('conservation_profile') as stage:
+                        stage['rows'] = len(self.conservation_profile(blast_output, total_genomes)['windows'])
+                
+                if self.config.get('extract_hits', False):
+                    with self._stage('extract_hit_sequences') as stage:
+                        stage['rows'] = int(self.extract_hit_sequences(blast_output)['hits'].sum())
+                
+                if self.config.get('allele_catalogue', False):
+                    with self._stage('allele_catalogue') as stage:
+                        stage['rows'] = self.allele_catalogue(blast_output, total_genomes)['hits']
             
             # Step 7: Save results
-            output_file = self.save_results(results_df)
+            with self._stage('save_results') as stage:
+                output_file = self.save_results(results_df)
+                stage['rows'] = len(results_df)
             
             print("✅ Analysis completed successfully!")
             print(f"📊 Results available in: {self.config['output_dir']}")
@@ -317,6 +952,8 @@ class SsuisAntiGenAnalyzer:
         except Exception as e:
             print(f"❌ Analysis failed: {e}")
             raise
+        finally:
+            self._finish_metrics()
 
 def main():
     """Main function to run the analysis"""
@@ -329,7 +966,40 @@ def main():
         'evalue': '1e-5',
         'min_identity': 60.0,
         'min_coverage': 0.8,
-        'threads': 4
+        'coverage_mode': 'hsp',   # 'merged': union of all HSPs per antigen/genome (split genes)
+        'threads': 4,
+        'incremental_db': False,  # True: only build new/changed genomes
+        'use_blast_cache': True,  # reuse hits of unchanged query sequences
+        'streaming': False,       # True: aggregate tblastn output as it streams
+        'keep_raw_tsv': True,     # streaming mode: also write blast_results.tsv
+        'sharded': False,         # True: 'threads' single-threaded tblastn shards in a process pool
+        'per_genome': False,      # True: tblastn -subject per genome file, no merge/makeblastdb (small runs)
+        'watch_genomes': 0,       # per_genome: seconds to wait for genome files added during the run
+        'blast_archive': False,   # True: keep the search as BLAST archives (-outfmt 11) for re-formatting
+        'archive_columns': None,  # blast_archive: fmt 6 fields of blast_results_extended.tsv, e.g. 'std qlen slen'
+        'hit_store': True,        # write a columnar copy of blast_results.tsv for fast reloading
+        'dedup': False,           # True: search one representative per cluster of near-identical genomes
+        'dedup_min_ani': 0.999,   # MinHash ANI estimate at or above which genomes are clustered
+        'sketch_k': 21,           # nucleotide k-mer length of the genome sketches
+        'sketch_scaled': 1000,    # keep about one k-mer hash per this many bases
+        'presence_matrix': True,  # write the bit-packed antigen x genome matrix of passing hits
+        'bootstrap_replicates': 2000,  # bootstrap CIs of prevalence/k-of-n from the matrix (0: off)
+        'genome_clusters': None,  # TSV genome -> clonal cluster: adds cluster-weighted CIs
+        'genome_metadata': None,  # genome metadata table (serotype, country, ...): prevalence per stratum
+        'strata': None,           # stratifying metadata columns (None: all)
+        'conservation_profile': False,  # True: per-residue conservation + ranked highlight windows from the hits
+        'extract_hits': False,    # True: per-antigen FASTA of every passing hit region (merged FASTA .fai)
+        'allele_catalogue': False,  # True: per-antigen allele frequency tables of the translated hits
+        'prefilter': False,       # True: tblastn only on genomes sharing translated k-mers with the query
+        'prefilter_k': 7,         # k-mer length (amino acids) of the prefilter index
+        'prefilter_min_seeds': 3, # shared k-mers needed to search a genome
+        'dag': False,             # True: stage DAG with skipping of up-to-date stages
+        'metrics': True,          # write per-stage time/CPU/memory/I-O metrics to run_metrics.json
+        'profile': False,         # True: also cProfile every stage into output_dir/profiles/
+        'highlight_fasta': 'query_antigens_highlight.fasta',  # DAG mode: highlight search runs alongside
+        'highlight_output_dir': 'suis_highlight_analysis',
+        'highlight_min_identity': 60.0,
+        'highlight_min_coverage': 0.5
     }
     
     # Run analysis
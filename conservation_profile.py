@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+S. suis Per-Residue Conservation Profile and Highlight-Window Discovery
+======================================================================
+
+The highlight regions of query_antigens_highlight.fasta were picked by hand
+and each candidate needs a second tblastn run.  The full-length hit table
+already says which residues of every antigen each genome covers: this
+module builds per-residue profiles from its qstart/qend columns and ranks
+candidate windows without another search.
+
+Profile (one row per antigen residue, all antigens in one pass):
+
+* genomes / conservation_percent: genomes whose HSPs at or above
+  min_identity cover the residue.  HSPs of one (antigen, genome) pair are
+  first merged into disjoint segments (hsp_coverage.union_segments), so a
+  genome counts once; the counts are a difference array (+1 at each segment
+  start, -1 past its end) over the concatenated residues of all antigens,
+  followed by one cumulative sum.
+* hsps / mean_identity: HSPs covering the residue and their mean percent
+  identity (tblastn reports one identity per HSP, so this is the identity of
+  the alignments spanning the residue, not of the residue itself).
+
+Windows of every length between min_length and max_length at every
+position are scored by their least conserved residue (sparse-table range
+minimum) and mean conservation (prefix sums), longer windows first on ties.
+The best non-overlapping windows per antigen are kept, and for those the
+exact window prevalence is computed: genomes whose merged segments cover at
+least min_coverage of the window, i.e. what a highlight search of the window
+would count if the local identity matches the HSP identity.
+
+Existing highlight sequences are placed on their full-length antigen by
+local alignment and estimated the same way; highlights that do not align
+still need analyze_highlight_sequences.py.
+
+Usage:
+    python conservation_profile.py -i blast_results.tsv -q query_antigens.fasta -t 388 \\
+        --contig_index contig_index.tsv --highlight_fasta query_antigens_highlight.fasta -o conservation
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from Bio import Align
+from Bio.Align import substitution_matrices
+
+from aggregation import annotate_hits, load_hits, summary_columns
+from blast_search import read_query_records
+from genome_index import load_contig_index
+from genome_redundancy import propagate_hits
+from hsp_coverage import PAIR_COLUMNS, union_segments
+
+CONSERVATION_DIR_NAME = 'conservation'
+PROFILE_NAME = 'conservation_profile.tsv'
+WINDOWS_NAME = 'conserved_windows.tsv'
+WINDOWS_FASTA = 'conserved_windows.fasta'
+HIGHLIGHTS_NAME = 'highlight_estimates.tsv'
+DEFAULT_MIN_LENGTH = 30
+DEFAULT_MAX_LENGTH = 150
+DEFAULT_TOP = 5
+MAX_OVERLAP = 0.5
+# A highlight is placed on an antigen when the local alignment spans this much
+# of the highlight at this identity
+MIN_ALIGNED_FRACTION = 0.8
+MIN_ALIGNED_IDENTITY = 0.5
+
+
+def _passing_segments(df, antigens, min_identity):
+    """Merged query segments (antigen code, genome code, lo, hi) of HSPs at or above min_identity"""
+    df = df[(df['pident'] >= min_identity) & df['qseqid'].isin(antigens) & df['genome_accession'].notna()]
+    antigen_codes = pd.Index(antigens).get_indexer(df['qseqid'])
+    pair_codes = df.groupby(PAIR_COLUMNS, sort=False, observed=True).ngroup().to_numpy()
+    pairs, lo, hi = union_segments(pair_codes, df['qstart'].to_numpy(), df['qend'].to_numpy())
+    n_pairs = int(pair_codes.max()) + 1 if pair_codes.size else 0
+    pair_antigen = np.zeros(n_pairs, dtype=np.int64)
+    pair_antigen[pair_codes] = antigen_codes
+    return df, pair_antigen[pairs], pairs, lo, hi
+
+
+def _difference_sum(offsets, lo, hi, n_residues, weights=None):
+    """Per-residue sum of ``weights`` over 1-based inclusive intervals (difference array)"""
+    diff = np.bincount(offsets + lo - 1, weights=weights, minlength=n_residues + 1)
+    diff -= np.bincount(offsets + hi, weights=weights, minlength=n_residues + 1)
+    return np.cumsum(diff[:n_residues])
+
+
+def residue_profile(df, query_lengths, total_genomes, min_identity):
+    """
+    Per-residue conservation and identity of every antigen.
+
+    Args:
+        df (pd.DataFrame): Hits annotated by aggregation.annotate_hits(), with qstart/qend.
+        query_lengths (dict): Query ID -> protein length; defines antigen order.
+        total_genomes (int): Denominator for conservation.
+        min_identity (float): Only HSPs at or above this identity count.
+
+    Returns:
+        pd.DataFrame: antigen, position (1-based), genomes, conservation_percent,
+                      hsps and mean_identity (NaN where no HSP covers the residue).
+    """
+    antigens = list(query_lengths)
+    lengths = np.array([query_lengths[a] for a in antigens], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(lengths)])
+    n_residues = int(starts[-1])
+
+    df, segment_antigens, _, lo, hi = _passing_segments(df, antigens, min_identity)
+    # Alignments never extend past the query, but clip in case lengths disagree
+    lo, hi = np.minimum(lo, lengths[segment_antigens]), np.minimum(hi, lengths[segment_antigens])
+    genomes = _difference_sum(starts[segment_antigens], lo, hi, n_residues).round().astype(np.int64)
+
+    hsp_antigens = pd.Index(antigens).get_indexer(df['qseqid'])
+    hsp_lo = np.minimum(df['qstart'], df['qend']).to_numpy(dtype=np.int64)
+    hsp_hi = np.minimum(np.maximum(df['qstart'], df['qend']).to_numpy(dtype=np.int64), lengths[hsp_antigens])
+    hsp_lo = np.minimum(hsp_lo, hsp_hi)
+    hsps = _difference_sum(starts[hsp_antigens], hsp_lo, hsp_hi, n_residues).round().astype(np.int64)
+    identity = _difference_sum(starts[hsp_antigens], hsp_lo, hsp_hi, n_residues,
+                               df['pident'].to_numpy(dtype=float))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_identity = np.where(hsps > 0, identity / hsps, np.nan)
+    return pd.DataFrame({
+        'antigen': np.repeat(antigens, lengths),
+        'position': np.arange(n_residues) - np.repeat(starts[:-1], lengths) + 1,
+        'genomes': genomes,
+        'conservation_percent': genomes / total_genomes * 100 if total_genomes else 0.0,
+        'hsps': hsps,
+        'mean_identity': mean_identity.round(2),
+    })
+
+
+def _range_minimum_table(values):
+    """Sparse table: level j holds the minimum of values[i : i + 2**j]"""
+    table = [values]
+    while 2 ** len(table) <= values.size:
+        prev, step = table[-1], 2 ** (len(table) - 1)
+        table.append(np.minimum(prev[:-step], prev[step:]))
+    return table
+
+
+def scan_windows(conservation, min_length=DEFAULT_MIN_LENGTH, max_length=DEFAULT_MAX_LENGTH):
+    """
+    Score every window of one antigen.
+
+    Returns:
+        tuple: (starts (0-based), lengths, min_conservation, mean_conservation)
+               arrays over all windows of min_length..max_length residues.
+    """
+    conservation = np.asarray(conservation, dtype=float)
+    n = conservation.size
+    table = _range_minimum_table(conservation)
+    prefix = np.concatenate([[0.0], np.cumsum(conservation)])
+    starts, lengths, minima, means = [], [], [], []
+    for length in range(min_length, min(max_length, n) + 1):
+        level = length.bit_length() - 1
+        start = np.arange(n - length + 1)
+        minima.append(np.minimum(table[level][start], table[level][start + length - 2 ** level]))
+        means.append((prefix[start + length] - prefix[start]) / length)
+        starts.append(start)
+        lengths.append(np.full(start.size, length))
+    if not starts:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty, empty
+    return np.concatenate(starts), np.concatenate(lengths), np.concatenate(minima), np.concatenate(means)
+
+
+def best_windows(conservation, min_length=DEFAULT_MIN_LENGTH, max_length=DEFAULT_MAX_LENGTH,
+                 top=DEFAULT_TOP, max_overlap=MAX_OVERLAP):
+    """
+    The ``top`` best windows of one antigen, overlapping each other by at most
+    ``max_overlap`` of the shorter window.
+
+    Windows rank by least conserved residue, then mean conservation, then
+    length (longer first) and position.
+
+    Returns:
+        list: (start (1-based), end, min_conservation, mean_conservation) tuples.
+    """
+    starts, lengths, minima, means = scan_windows(conservation, min_length, max_length)
+    order = np.lexsort((starts, -lengths, -np.round(means, 9), -minima))
+    chosen = []
+    for i in order:
+        start, end = int(starts[i]), int(starts[i] + lengths[i] - 1)
+        if all(min(end, e) - max(start, s) + 1 <= max_overlap * min(end - start + 1, e - s + 1)
+               for s, e, _, _ in chosen):
+            chosen.append((start, end, float(minima[i]), float(means[i])))
+            if len(chosen) == top:
+                break
+    return [(s + 1, e + 1, lo, mean) for s, e, lo, mean in chosen]
+
+
+def window_prevalence(df, windows, antigens, min_identity, min_coverage):
+    """
+    Genomes whose HSPs cover at least ``min_coverage`` of each window.
+
+    Args:
+        df (pd.DataFrame): Annotated hits with qstart/qend.
+        windows (pd.DataFrame): antigen, start and end (1-based, inclusive).
+        antigens (list): Query IDs of the hit table.
+        min_identity (float): Only HSPs at or above this identity count.
+        min_coverage (float): Fraction of the window a genome must cover.
+
+    Returns:
+        np.ndarray: Genome count per window.
+    """
+    _, segment_antigens, segment_pairs, lo, hi = _passing_segments(df, antigens, min_identity)
+    codes = pd.Index(antigens).get_indexer(windows['antigen'])
+    counts = np.zeros(len(windows), dtype=np.int64)
+    for i, (code, start, end) in enumerate(zip(codes, windows['start'], windows['end'])):
+        mask = segment_antigens == code
+        overlap = np.maximum(0, np.minimum(hi[mask], end) - np.maximum(lo[mask], start) + 1)
+        covered = np.bincount(segment_pairs[mask], weights=overlap)
+        counts[i] = int((covered >= min_coverage * (end - start + 1)).sum())
+    return counts
+
+
+def rank_windows(df, profile, query_sequences, total_genomes, min_identity, min_coverage,
+                 min_length=DEFAULT_MIN_LENGTH, max_length=DEFAULT_MAX_LENGTH, top=DEFAULT_TOP):
+    """
+    Best candidate windows per antigen with their estimated window prevalence.
+
+    Returns:
+        pd.DataFrame: antigen, rank, start, end, length, min/mean conservation,
+                      mean identity, window_genomes, window_prevalence_percent
+                      and the window sequence.
+    """
+    rows = []
+    for antigen, residues in profile.groupby('antigen', sort=False):
+        conservation = residues['conservation_percent'].to_numpy()
+        identity = residues['mean_identity'].to_numpy()
+        for rank, (start, end, minimum, mean) in enumerate(
+                best_windows(conservation, min_length, max_length, top), start=1):
+            rows.append({
+                'antigen': antigen, 'rank': rank, 'start': start, 'end': end, 'length': end - start + 1,
+                'min_conservation_percent': round(minimum, 2), 'mean_conservation_percent': round(mean, 2),
+                'mean_identity': round(float(np.nanmean(identity[start - 1:end])), 2)
+                if np.isfinite(identity[start - 1:end]).any() else np.nan,
+                'sequence': query_sequences[antigen][start - 1:end],
+            })
+    windows = pd.DataFrame(rows, columns=['antigen', 'rank', 'start', 'end', 'length',
+                                          'min_conservation_percent', 'mean_conservation_percent',
+                                          'mean_identity', 'sequence'])
+    genomes = window_prevalence(df, windows, list(query_sequences), min_identity, min_coverage)
+    windows.insert(8, 'window_genomes', genomes)
+    windows.insert(9, 'window_prevalence_percent', genomes / total_genomes * 100 if total_genomes else 0.0)
+    return windows
+
+
+def _aligner():
+    aligner = Align.PairwiseAligner()
+    aligner.mode = 'local'
+    aligner.substitution_matrix = substitution_matrices.load('BLOSUM62')
+    aligner.open_gap_score = -11
+    aligner.extend_gap_score = -1
+    return aligner
+
+
+def map_highlights(highlight_records, query_sequences):
+    """
+    Place highlight sequences on their full-length antigen by local alignment.
+
+    Returns:
+        pd.DataFrame: highlight, highlight_length, antigen, start, end (1-based,
+                      on the antigen) and aligned_identity; antigen is missing
+                      for highlights that align to no antigen well enough.
+    """
+    aligner = _aligner()
+    rows = []
+    for name, sequence in highlight_records:
+        sequence = ''.join(sequence.split()).upper()
+        best = None
+        for antigen, full in query_sequences.items():
+            alignment = aligner.align(full, sequence)[0]
+            if best is None or alignment.score > best[1].score:
+                best = (antigen, alignment)
+        antigen, alignment = best
+        target_blocks, query_blocks = alignment.aligned
+        identical = sum(a == b for (ts, te), (qs, qe) in zip(target_blocks, query_blocks)
+                        for a, b in zip(query_sequences[antigen][ts:te], sequence[qs:qe]))
+        span = int(query_blocks[-1][1] - query_blocks[0][0]) if len(query_blocks) else 0
+        aligned = int(sum(qe - qs for qs, qe in query_blocks))
+        identity = identical / aligned if aligned else 0.0
+        placed = span >= MIN_ALIGNED_FRACTION * len(sequence) and identity >= MIN_ALIGNED_IDENTITY
+        rows.append({
+            'highlight': name, 'highlight_length': len(sequence),
+            'antigen': antigen if placed else None,
+            'start': int(target_blocks[0][0]) + 1 if placed else np.nan,
+            'end': int(target_blocks[-1][1]) if placed else np.nan,
+            'aligned_identity': round(identity * 100, 1),
+        })
+    return pd.DataFrame(rows, columns=['highlight', 'highlight_length', 'antigen', 'start', 'end',
+                                       'aligned_identity'])
+
+
+def estimate_highlights(df, highlight_records, query_sequences, total_genomes, min_identity, min_coverage):
+    """Window prevalence of highlight sequences placed on the full-length hits (NaN if not placed)"""
+    placed = map_highlights(highlight_records, query_sequences)
+    mapped = placed[placed['antigen'].notna()]
+    genomes = window_prevalence(df, mapped.astype({'start': int, 'end': int}), list(query_sequences),
+                                min_identity, min_coverage)
+    placed['window_genomes'] = pd.Series(genomes, index=mapped.index, dtype=float)
+    placed['window_prevalence_percent'] = placed['window_genomes'] / total_genomes * 100 if total_genomes else 0.0
+    return placed
+
+
+def conservation_analysis(blast_file, query_fasta, total_genomes, min_identity, min_coverage,
+                          output_dir, contig_index=None, highlight_fasta=None,
+                          min_length=DEFAULT_MIN_LENGTH, max_length=DEFAULT_MAX_LENGTH, top=DEFAULT_TOP,
+                          clusters=None):
+    """
+    Write the residue profile, ranked windows (TSV and FASTA) and highlight estimates.
+
+    With ``clusters`` (genome_redundancy.py) the hits of cluster representatives
+    are first propagated to the members.
+
+    Returns:
+        dict: Paths of the written files and the windows / highlights DataFrames.
+    """
+    query_sequences = dict(read_query_records(query_fasta))
+    query_lengths = {name: len(sequence) for name, sequence in query_sequences.items()}
+    df = load_hits(blast_file, columns=summary_columns('merged'), min_identity=min_identity)
+    df = annotate_hits(df, query_lengths, contig_index)
+    if clusters is not None:
+        df = propagate_hits(df, clusters)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profile = residue_profile(df, query_lengths, total_genomes, min_identity)
+    profile.to_csv(output_dir / PROFILE_NAME, sep='\t', index=False)
+
+    windows = rank_windows(df, profile, query_sequences, total_genomes, min_identity, min_coverage,
+                           min_length, max_length, top)
+    windows.to_csv(output_dir / WINDOWS_NAME, sep='\t', index=False)
+    with open(output_dir / WINDOWS_FASTA, 'w') as fh:
+        for row in windows.itertuples():
+            fh.write(f">{row.antigen.split('|')[0]}_window{row.rank}|{row.start}-{row.end}\n{row.sequence}\n")
+    result = {'profile': output_dir / PROFILE_NAME, 'windows_tsv': output_dir / WINDOWS_NAME,
+              'windows_fasta': output_dir / WINDOWS_FASTA, 'windows': windows}
+
+    if highlight_fasta:
+        highlights = estimate_highlights(df, read_query_records(highlight_fasta), query_sequences,
+                                         total_genomes, min_identity, min_coverage)
+        highlights.to_csv(output_dir / HIGHLIGHTS_NAME, sep='\t', index=False)
+        result.update(highlights_tsv=output_dir / HIGHLIGHTS_NAME, highlights=highlights)
+    return result
+
+
+def print_conservation(result, indent='  '):
+    """Print the best window per antigen and the highlight estimates"""
+    for row in result['windows'][result['windows']['rank'] == 1].itertuples():
+        print(f"{indent}{row.antigen}: {row.start}-{row.end} ({row.length} aa), "
+              f"min conservation {row.min_conservation_percent:.1f}%, "
+              f"window prevalence {row.window_prevalence_percent:.1f}%")
+    for row in result.get('highlights', pd.DataFrame()).itertuples():
+        if pd.isna(row.antigen):
+            print(f"{indent}{row.highlight}: not found in the full-length antigens (needs a highlight search)")
+        else:
+            print(f"{indent}{row.highlight}: {row.antigen} {int(row.start)}-{int(row.end)}, "
+                  f"estimated prevalence {row.window_prevalence_percent:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-residue conservation profile and conserved-window ranking from full-length tblastn hits.")
+    parser.add_argument("-i", "--input", required=True, help="Full-length BLAST output (fmt 6) or its hit store.")
+    parser.add_argument("-q", "--query_fasta", required=True, help="Full-length antigen FASTA of the search.")
+    parser.add_argument("-t", "--total_genomes", required=True, type=int, help="Total number of genomes.")
+    parser.add_argument("-o", "--output_dir", default=CONSERVATION_DIR_NAME,
+                        help=f"Output directory (default: {CONSERVATION_DIR_NAME}).")
+    parser.add_argument("--contig_index", help="Optional contig_index.tsv (contig -> assembly).")
+    parser.add_argument("--highlight_fasta", help="Highlight sequences to estimate from the full-length hits.")
+    parser.add_argument("--min_identity", type=float, default=60.0, help="Minimum percent identity (default: 60.0).")
+    parser.add_argument("--min_coverage", type=float, default=0.5,
+                        help="Fraction of a window a genome must cover (default: 0.5, as for highlights).")
+    parser.add_argument("--min_length", type=int, default=DEFAULT_MIN_LENGTH,
+                        help=f"Shortest window in residues (default: {DEFAULT_MIN_LENGTH}).")
+    parser.add_argument("--max_length", type=int, default=DEFAULT_MAX_LENGTH,
+                        help=f"Longest window in residues (default: {DEFAULT_MAX_LENGTH}).")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help=f"Windows per antigen (default: {DEFAULT_TOP}).")
+    args = parser.parse_args()
+
+    contig_index = load_contig_index(args.contig_index) if args.contig_index else None
+    result = conservation_analysis(args.input, args.query_fasta, args.total_genomes, args.min_identity,
+                                   args.min_coverage, args.output_dir, contig_index, args.highlight_fasta,
+                                   args.min_length, args.max_length, args.top)
+    print_conservation(result)
+    print(f"Profile: {result['profile']}")
+    print(f"Windows: {result['windows_tsv']}, {result['windows_fasta']}")
+
+
+if __name__ == "__main__":
+    main()
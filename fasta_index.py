@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+S. suis Merged-FASTA Index and Hit-Region Extraction
+====================================================
+
+merge_genomes() writes a faidx-style index next to the merged genome FASTA
+(``all_suis_genomes.fna.fai``: name, length, offset of the first base, bases
+per line, bytes per line), built from the same buffers it scans for headers,
+so no second pass over the collection is needed.  The file is compatible
+with ``samtools faidx``.  Records whose lines are not all of the same width
+(samtools rejects these) are indexed with a line width of 0 and read whole.
+
+FastaIndex memory-maps the FASTA and turns a 1-based region into a byte range
+with the line arithmetic of the index, so fetching a hit region costs a slice
+of the map instead of a rescan or one ``blastdbcmd`` call per hit.
+extract_hit_regions() pulls every passing hit in one pass (sorted by file
+offset), reverse-complements minus-strand hits, translates them (table 11)
+and writes one nucleotide and one protein multi-FASTA per antigen.
+
+Usage:
+    python fasta_index.py index -f all_suis_genomes.fna
+    python fasta_index.py fetch -f all_suis_genomes.fna NZ_CP000001.1:1001-1600 [-r]
+    python fasta_index.py extract -i blast_results.tsv -q query_antigens.fasta \\
+        -f all_suis_genomes.fna -o hit_sequences [--contig_index contig_index.tsv] [--flank 0]
+"""
+
+import argparse
+import mmap
+import re
+import warnings
+from pathlib import Path
+
+import pandas as pd
+from Bio import BiopythonWarning
+from Bio.Seq import Seq
+
+from genome_index import normalize_seqid
+
+FAI_SUFFIX = '.fai'
+HIT_SEQUENCES_DIR_NAME = 'hit_sequences'
+MANIFEST_NAME = 'hit_sequences.tsv'
+FAI_COLUMNS = ['name', 'length', 'offset', 'linebases', 'linewidth']
+HEADER_PATTERN = re.compile(rb'(?m)^>([^\s]*)[^\n]*\n?')
+_COMPLEMENT = bytes.maketrans(b'ACGTNacgtnRYKMSWBDHVrykmswbdhv', b'TGCANtgcanYRMKSWVHDByrmkswvhdb')
+
+
+def fai_path(fasta_path):
+    return Path(f'{fasta_path}{FAI_SUFFIX}')
+
+
+def _record_entry(name, body, offset):
+    """fai fields of one record whose sequence lines start at ``offset``"""
+    length = len(body) - body.count(b'\n') - body.count(b'\r')
+    first = body.find(b'\n')
+    if length == 0:
+        return name, 0, offset, 0, 0
+    if first < 0:
+        return name, length, offset, length, length + 1
+    eol = 2 if body[first - 1:first] == b'\r' else 1
+    linebases = first - (eol - 1)
+    linewidth = linebases + eol
+    full = (length - 1) // linebases
+    # Every full line ends exactly one line width after the previous one and
+    # the rest is a single (possibly unterminated) last line
+    region = body[:full * linewidth]
+    tail = body[full * linewidth:].rstrip(b'\r\n')
+    uniform = (linebases > 0
+               and body[linewidth - 1:full * linewidth:linewidth].count(b'\n') == full
+               and region.count(b'\n') == full and region.count(b'\r') == full * (eol - 1)
+               and b'\n' not in tail and len(tail) == length - full * linebases)
+    if not uniform:
+        return name, length, offset, 0, 0
+    return name, length, offset, linebases, linewidth
+
+
+def index_records(buffer, base_offset=0):
+    """
+    fai entries of every record in a FASTA buffer (bytes or mmap).
+
+    Args:
+        buffer: FASTA content.
+        base_offset (int): Position of the buffer in the indexed file.
+
+    Returns:
+        list: (name, length, offset, linebases, linewidth) tuples.
+    """
+    headers = list(HEADER_PATTERN.finditer(buffer))
+    entries = []
+    for i, match in enumerate(headers):
+        start = match.end()
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(buffer)
+        entries.append(_record_entry(match.group(1).decode(), buffer[start:end], base_offset + start))
+    return entries
+
+
+def write_fai(entries, path):
+    with open(path, 'w') as fh:
+        for entry in entries:
+            fh.write('\t'.join(str(field) for field in entry) + '\n')
+    return Path(path)
+
+
+def read_fai(path):
+    """Name -> (length, offset, linebases, linewidth)"""
+    index = {}
+    with open(path) as fh:
+        for line in fh:
+            name, *fields = line.rstrip('\n').split('\t')
+            index[name] = tuple(int(field) for field in fields[:4])
+    return index
+
+
+def build_fai(fasta_path):
+    """Index an existing FASTA file (merge_genomes() does this while merging)"""
+    with open(fasta_path, 'rb') as fh:
+        if Path(fasta_path).stat().st_size == 0:
+            return write_fai([], fai_path(fasta_path))
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return write_fai(index_records(mm), fai_path(fasta_path))
+
+
+def reverse_complement(sequence):
+    return sequence.translate(_COMPLEMENT)[::-1]
+
+
+def translate(sequence):
+    """Protein (bacterial code, table 11) of the complete codons of a nucleotide sequence"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', BiopythonWarning)
+        return str(Seq(sequence[:len(sequence) - len(sequence) % 3].decode()).translate(table=11))
+
+
+class FastaIndex:
+    """Memory-mapped random access to the records of an indexed FASTA file"""
+
+    def __init__(self, fasta_path, index_path=None):
+        self.fasta_path = Path(fasta_path)
+        index_path = Path(index_path) if index_path else fai_path(fasta_path)
+        if not index_path.exists():
+            raise FileNotFoundError(f"FASTA index not found: {index_path} (see fasta_index.py index)")
+        self.index = read_fai(index_path)
+        self._fh = open(self.fasta_path, 'rb')
+        size = self.fasta_path.stat().st_size
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def length(self, name):
+        return self.index[name][0]
+
+    def offset(self, name):
+        return self.index[name][1]
+
+    def fetch(self, name, start=1, end=None, reverse=False):
+        """
+        Bases ``start``..``end`` (1-based, inclusive, clipped to the record) of a record.
+
+        Returns:
+            bytes: The sequence without line breaks (reverse-complemented
+                   with ``reverse``).
+        """
+        try:
+            length, offset, linebases, linewidth = self.index[name]
+        except KeyError:
+            raise KeyError(f"Sequence not in {self.fasta_path}: {name}") from None
+        lo = max(int(start), 1) - 1
+        hi = length if end is None else min(int(end), length)
+        if hi <= lo:
+            return b''
+        if linebases == 0:
+            # Ragged record: read it whole up to the next header
+            stop = self._mm.find(b'\n>', offset)
+            raw = self._mm[offset:stop if stop >= 0 else len(self._mm)]
+            sequence = raw.replace(b'\n', b'').replace(b'\r', b'')[lo:hi]
+        else:
+            first = offset + (lo // linebases) * linewidth + lo % linebases
+            last = offset + ((hi - 1) // linebases) * linewidth + (hi - 1) % linebases
+            sequence = self._mm[first:last + 1].replace(b'\n', b'').replace(b'\r', b'')
+        return reverse_complement(sequence) if reverse else sequence
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _file_stem(antigen):
+    return re.sub(r'[^\w.-]+', '_', antigen)
+
+
+def passing_hits(blast_file, query_lengths, min_identity, min_coverage, contig_index=None, coverage_mode='hsp'):
+    """Hits of the query antigens passing the thresholds, with their subject coordinates"""
+    from aggregation import annotate_hits, load_hits, passing_mask, summary_columns
+
+    columns = list(dict.fromkeys(summary_columns(coverage_mode) + ['sstart', 'send']))
+    df = load_hits(blast_file, columns=columns, min_identity=min_identity)
+    df = annotate_hits(df, query_lengths, contig_index, coverage_mode, min_identity)
+    return df[passing_mask(df, min_identity, min_coverage) & df['qseqid'].isin(list(query_lengths))]
+
+
+def locate_hits(df, fasta, antigens):
+    """
+    Hits on records of an indexed FASTA, in antigen order and then file order.
+
+    Adds lo / hi (1-based subject bounds), minus (strand) and file_offset.
+    Subject IDs wrapped by BLAST (``ref|NZ_CP012345.1|``, ``lcl|contig_1``)
+    are resolved through genome_index.normalize_seqid(); sseqid then holds
+    the FASTA record name.
+
+    Returns:
+        tuple: (located hits, hits per antigen whose subject is not in the FASTA).
+    """
+    records = {}
+    for sseqid in df['sseqid'].unique():
+        name = sseqid if sseqid in fasta else normalize_seqid(sseqid)
+        records[sseqid] = name if name in fasta else None
+    record = df['sseqid'].map(records)
+    known = record.notna()
+    hits = df[known].assign(
+        sseqid=record[known],
+        lo=df[['sstart', 'send']].min(axis=1), hi=df[['sstart', 'send']].max(axis=1),
+        minus=df['sstart'] > df['send'],
+        file_offset=record[known].map(lambda name: fasta.offset(name)))
+    missing = df.loc[~known, 'qseqid'].value_counts()
+    order = {antigen: i for i, antigen in enumerate(antigens)}
+    hits = hits.assign(rank=hits['qseqid'].map(order)).sort_values(['rank', 'file_offset', 'lo'], kind='stable')
+    return hits.drop(columns='rank'), missing
+
+
+def extract_hit_regions(blast_file, fasta_path, output_dir, query_lengths, min_identity, min_coverage,
+                        contig_index=None, flank=0, coverage_mode='hsp'):
+    """
+    Write the nucleotide and protein sequences of every passing hit, per antigen.
+
+    Args:
+        blast_file (str): BLAST output (fmt 6) or its hit store.
+        fasta_path (str): Indexed merged genome FASTA the hits refer to.
+        output_dir (str): Directory for <antigen>.fna / <antigen>.faa and the manifest.
+        query_lengths (dict): Query ID -> protein length; defines antigen order.
+        min_identity (float): Minimum percent identity.
+        min_coverage (float): Minimum query coverage (fraction).
+        contig_index (dict): Contig -> assembly index.
+        flank (int): Extra bases on both sides of the nucleotide region (the
+            protein is always the hit region itself).
+        coverage_mode (str): 'hsp' or 'merged' (see hsp_coverage.py).
+
+    Returns:
+        pd.DataFrame: antigen, hits, genomes, missing (subjects not in the
+                      FASTA), nucleotide_fasta and protein_fasta.
+    """
+    df = passing_hits(blast_file, query_lengths, min_identity, min_coverage, contig_index, coverage_mode)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rows = []
+    with FastaIndex(fasta_path) as fasta:
+        hits, missing = locate_hits(df, fasta, list(query_lengths))
+        groups = dict(tuple(hits.groupby('qseqid', sort=False, observed=True)))
+
+        for antigen in query_lengths:
+            group = groups.get(antigen, hits.iloc[:0])
+            stem = _file_stem(antigen)
+            nucleotide_path, protein_path = output_dir / f'{stem}.fna', output_dir / f'{stem}.faa'
+            with open(nucleotide_path, 'w') as nucleotides, open(protein_path, 'w') as proteins:
+                for hit in group.itertuples():
+                    region = fasta.fetch(hit.sseqid, hit.lo, hit.hi, hit.minus)
+                    start, end = max(1, hit.lo - flank), min(fasta.length(hit.sseqid), hit.hi + flank)
+                    flanked = fasta.fetch(hit.sseqid, start, end, hit.minus) if flank else region
+                    header = (f"{hit.genome_accession}|{hit.sseqid}:{start}-{end}({'-' if hit.minus else '+'}) "
+                              f"pident={hit.pident:.2f} coverage={hit.coverage:.3f}")
+                    nucleotides.write(f">{header}\n{flanked.decode()}\n")
+                    proteins.write(f">{header}\n{translate(region)}\n")
+            rows.append({
+                'antigen': antigen,
+                'hits': len(group),
+                'genomes': group['genome_accession'].nunique(),
+                'missing': int(missing.get(antigen, 0)),
+                'nucleotide_fasta': str(nucleotide_path),
+                'protein_fasta': str(protein_path),
+            })
+    manifest = pd.DataFrame(rows)
+    manifest.to_csv(output_dir / MANIFEST_NAME, sep='\t', index=False)
+    return manifest
+
+
+def print_extraction(manifest):
+    for row in manifest.itertuples():
+        note = f", {row.missing} hits on subjects missing from the FASTA" if row.missing else ''
+        print(f"  {row.antigen.split('|')[0]}: {row.hits} hit regions from {row.genomes} genomes{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the merged genome FASTA and extract hit regions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="Write a faidx-style .fai next to a FASTA file.")
+    fetch = commands.add_parser("fetch", help="Print regions (name:start-end, 1-based) of an indexed FASTA.")
+    extract = commands.add_parser("extract", help="Per-antigen FASTA files of every passing hit region.")
+    for command in (index, fetch, extract):
+        command.add_argument("-f", "--fasta", required=True, help="Merged genome FASTA.")
+    fetch.add_argument("regions", nargs='+', help="Regions as name or name:start-end.")
+    fetch.add_argument("-r", "--reverse_complement", action="store_true", help="Reverse-complement the regions.")
+    fetch.add_argument("-p", "--protein", action="store_true", help="Print the translation (table 11).")
+    extract.add_argument("-i", "--input", required=True, help="BLAST output (fmt 6) or its hit store.")
+    extract.add_argument("-q", "--query_fasta", required=True, help="Query FASTA of the search.")
+    extract.add_argument("-o", "--output_dir", default=HIT_SEQUENCES_DIR_NAME,
+                         help=f"Output directory (default: {HIT_SEQUENCES_DIR_NAME}).")
+    extract.add_argument("--contig_index", help="Optional contig_index.tsv (contig -> assembly).")
+    extract.add_argument("--min_identity", type=float, default=60.0, help="Minimum percent identity (default: 60.0).")
+    extract.add_argument("--min_coverage", type=float, default=0.8, help="Minimum query coverage (default: 0.8).")
+    extract.add_argument("--coverage_mode", choices=['hsp', 'merged'], default='hsp',
+                         help="Per-HSP coverage or the union of HSPs per antigen/genome (default: hsp).")
+    extract.add_argument("--flank", type=int, default=0, help="Extra bases around nucleotide regions (default: 0).")
+    args = parser.parse_args()
+
+    if args.command == "index":
+        print(f"Index: {build_fai(args.fasta)}")
+    elif args.command == "fetch":
+        with FastaIndex(args.fasta) as fasta:
+            for region in args.regions:
+                name, _, span = region.partition(':')
+                start, _, end = span.partition('-')
+                sequence = fasta.fetch(name, int(start or 1), int(end) if end else None)
+                if args.reverse_complement:
+                    sequence = reverse_complement(sequence)
+                print(f">{region}\n{translate(sequence) if args.protein else sequence.decode()}")
+    else:
+        from blast_search import read_query_records
+        from genome_index import load_contig_index
+
+        query_lengths = {name: len(sequence) for name, sequence in read_query_records(args.query_fasta)}
+        contig_index = load_contig_index(args.contig_index) if args.contig_index else None
+        manifest = extract_hit_regions(args.input, args.fasta, args.output_dir, query_lengths,
+                                       args.min_identity, args.min_coverage, contig_index,
+                                       args.flank, args.coverage_mode)
+        print_extraction(manifest)
+        print(f"Hit sequences: {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
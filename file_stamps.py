@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+S. suis File Stamps
+===================
+
+Size + mtime stamps used to tell whether a file changed since a result was
+derived from it (stage DAG state, tblastn cache fingerprints, k-mer index
+metadata), without reading the file.
+"""
+
+import os
+
+
+def file_stamp(path):
+    """[size, mtime_ns] of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
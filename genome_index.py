@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+S. suis Contig-to-Assembly Index
+================================
+
+BLAST reports hits against contigs (``sseqid``), while prevalence is defined
+per assembly (the GCF_/GCA_ accessions in supplementary/assembly_list.csv).
+The genome merger writes ``contig_index.tsv`` (contig ID -> assembly ID) while
+streaming the genome files; the parsers use it to map sseqid to genome with a
+categorical lookup over the distinct subject IDs instead of a regex per row,
+so multi-contig assemblies are counted once.
+"""
+
+import re
+
+INDEX_NAME = 'contig_index.tsv'
+ASSEMBLY_PATTERN = re.compile(r'(GC[AF]_\d+\.\d+)')
+ACCESSION_PATTERN = re.compile(r'([A-Z]{2}_\d+\.\d+)')
+
+
+def extract_accession(sseqid):
+    """Extract genome accession from BLAST subject ID (fallback without an index)"""
+    match = ASSEMBLY_PATTERN.search(sseqid) or ACCESSION_PATTERN.search(sseqid)
+    return match.group(1) if match else sseqid
+
+
+def assembly_from_filename(name):
+    """Assembly accession of a genome file, e.g. GCF_000993745.1 from its file name"""
+    match = ASSEMBLY_PATTERN.search(name)
+    if match:
+        return match.group(1)
+    for suffix in ('.gz', '.fna', '.fasta', '.fa'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def normalize_seqid(sseqid):
+    """Strip BLAST database wrappers such as ``ref|NZ_CP012345.1|`` or ``lcl|contig_1``"""
+    if '|' not in sseqid:
+        return sseqid
+    parts = [part for part in sseqid.split('|') if part]
+    return parts[-1] if parts else sseqid
+
+
+def write_contig_index(entries, path):
+    """Write (contig ID, assembly ID) pairs as a two-column TSV"""
+    with open(path, 'w') as fh:
+        fh.write("contig_id\tassembly\n")
+        for contig, assembly in entries:
+            fh.write(f"{contig}\t{assembly}\n")
+
+
+def load_contig_index(path):
+    """Load contig_index.tsv as a {contig ID: assembly ID} dict"""
+    index = {}
+    with open(path) as fh:
+        next(fh, None)
+        for line in fh:
+            contig, _, assembly = line.rstrip('\n').partition('\t')
+            if contig:
+                index[contig] = assembly
+    return index
+
+
+def resolve_genome(sseqid, contig_index=None):
+    """Genome (assembly) ID of a single subject ID"""
+    if contig_index:
+        genome = contig_index.get(sseqid) or contig_index.get(normalize_seqid(sseqid))
+        if genome:
+            return genome
+    return extract_accession(sseqid)
+
+
+def assign_genomes(sseqids, contig_index=None):
+    """
+    Map subject IDs to genome IDs.
+
+    The lookup runs once per distinct sseqid; rows are mapped through the
+    categorical codes. Categories are sorted so group-bys order genomes the
+    same way as plain strings.
+
+    Args:
+        sseqids (pd.Series): BLAST subject IDs (strings or categorical).
+        contig_index (dict): Optional contig -> assembly index.
+
+    Returns:
+        pd.Series: Categorical genome IDs aligned with sseqids.
+    """
+    # Imported here so resolve_genome() stays usable without numpy/pandas
+    # (parse_prevalence.py's stdlib path)
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(sseqids.dtype, pd.CategoricalDtype):
+        # Already dictionary-encoded (hit_store.py): reuse the codes
+        subjects = sseqids.array
+    else:
+        subjects = pd.Categorical(sseqids.astype(str))
+    resolved = np.array([resolve_genome(s, contig_index) for s in subjects.categories], dtype=object)
+    genomes = np.unique(resolved)
+    code_map = np.searchsorted(genomes, resolved).astype(np.int32)
+    codes = np.where(subjects.codes >= 0, code_map[subjects.codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=genomes),
+                     index=sseqids.index, name='genome_accession')
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+S. suis Genome Merger
+=====================
+
+Streams genome FASTA files into the makeblastdb input and writes the
+contig -> assembly index (contig_index.tsv) in the same pass.
+
+Inputs can be a directory of ``.fna`` / ``.fna.gz`` files or the NCBI
+Datasets bundle itself (``suis_genomes.zip``); compressed data is decompressed
+in memory, so no extracted copy is ever written to disk.  Plain files are
+header-scanned through mmap and copied kernel-side (copy_file_range/sendfile)
+where the platform supports it.  Compressed sources are decompressed in a
+small thread pool (zlib releases the GIL) while output is written in order.
+Headers are validated on the way: every record needs an ID, IDs must be
+unique across the collection and short enough for ``makeblastdb -parse_seqids``.
+The same scan yields a faidx-style index of the merged FASTA
+(``all_suis_genomes.fna.fai``, see fasta_index.py) for random access to hit
+regions.
+
+Usage:
+    python genome_merge.py -g suis_selected \\
+        -o suis_prevalence_analysis/all_suis_genomes.fna
+    python genome_merge.py -g suis_genomes.zip \\
+        -o suis_prevalence_analysis/all_suis_genomes.fna
+"""
+
+import argparse
+import gzip
+import mmap
+import os
+import re
+import shutil
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from fasta_index import fai_path, index_records, write_fai
+from genome_index import INDEX_NAME, assembly_from_filename, write_contig_index
+
+GENOME_SUFFIXES = ('.fna', '.fna.gz')
+BLOCK_SIZE = 8 << 20
+MAX_SEQID_LENGTH = 50  # makeblastdb -parse_seqids limit
+HEADER_PATTERN = re.compile(rb'(?m)^>([^\s]*)')
+
+
+class GenomeSource:
+    """One genome FASTA: a plain or gzipped file, or a member of a Datasets zip"""
+
+    def __init__(self, name, path, member=None):
+        self.name = name
+        self.path = Path(path)
+        self.member = member
+        self.assembly = assembly_from_filename(Path(name).name)
+
+    @property
+    def is_plain_file(self):
+        return self.member is None and not self.name.endswith('.gz')
+
+    def open(self, zip_handles=None):
+        """Binary stream of the uncompressed FASTA"""
+        if self.member is not None:
+            archive = zip_handles.get(self.path) if zip_handles is not None else None
+            if archive is None:
+                archive = zipfile.ZipFile(self.path)
+                if zip_handles is not None:
+                    zip_handles[self.path] = archive
+            stream = archive.open(self.member)
+            return gzip.GzipFile(fileobj=stream) if self.member.endswith('.gz') else stream
+        if self.name.endswith('.gz'):
+            return gzip.open(self.path, 'rb')
+        return open(self.path, 'rb')
+
+    def __repr__(self):
+        return f"GenomeSource({self.name!r})"
+
+
+def discover_genomes(source):
+    """
+    List genome sources in a directory or NCBI Datasets zip bundle.
+
+    Returns:
+        list: GenomeSource objects sorted by name.
+    """
+    source = Path(source)
+    if source.is_dir():
+        files = [p for p in source.iterdir() if p.name.endswith(GENOME_SUFFIXES)]
+        return [GenomeSource(p.name, p) for p in sorted(files)]
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            members = [m for m in archive.namelist() if m.endswith(GENOME_SUFFIXES)]
+        return [GenomeSource(m, source, member=m) for m in sorted(members)]
+    if source.name.endswith(GENOME_SUFFIXES):
+        return [GenomeSource(source.name, source)]
+    raise FileNotFoundError(f"No genome FASTA files found in {source}")
+
+
+def scan_contigs(genome_file):
+    """Contig IDs (first header token) of one genome FASTA"""
+    if isinstance(genome_file, GenomeSource):
+        with genome_file.open() as fh:
+            return _scan_stream(fh, [], genome_file.name)[0]
+    with open(genome_file, 'rb') as fh:
+        return _scan_stream(fh, [], str(genome_file))[0]
+
+
+def _scan_stream(stream, chunks, name):
+    """Read a stream in blocks, collecting header IDs (and the data if chunks is a list)"""
+    contigs = []
+    carry = b''
+    first = True
+    while True:
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            break
+        if first:
+            _check_starts_with_header(block, name)
+            first = False
+        data = carry + block
+        cut = data.rfind(b'\n') + 1
+        complete, carry = data[:cut], data[cut:]
+        contigs.extend(m.group(1).decode() for m in HEADER_PATTERN.finditer(complete))
+        if chunks is not None:
+            chunks.append(complete)
+    if carry:
+        contigs.extend(m.group(1).decode() for m in HEADER_PATTERN.finditer(carry))
+        if chunks is not None:
+            chunks.append(carry + b'\n')
+    return contigs, chunks
+
+
+def _check_starts_with_header(block, name):
+    if not block.lstrip().startswith(b'>'):
+        raise ValueError(f"{name}: not a FASTA file (first record has no '>' header)")
+
+
+def _read_source(source, local):
+    """
+    Thread-pool worker: decompress one source into memory and scan its headers.
+
+    Returns (source, contigs, chunks, ends_with_newline, fai entries); the fai
+    offsets are relative to the start of the source.
+    """
+    if source.is_plain_file:
+        with open(source.path, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return source, [], None, True, []
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                _check_starts_with_header(mm[:4096], source.name)
+                contigs = [m.group(1).decode() for m in HEADER_PATTERN.finditer(mm)]
+                ends_with_newline = mm[-1:] == b'\n'
+                records = index_records(mm)
+        return source, contigs, None, ends_with_newline, records
+    if not hasattr(local, 'zip_handles'):
+        local.zip_handles = {}
+    try:
+        with source.open(local.zip_handles) as fh:
+            contigs, chunks = _scan_stream(fh, [], source.name)
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as e:
+        raise ValueError(f"{source.name}: could not decompress ({e})")
+    # Records straddle block boundaries: index (and write) the genome as one buffer
+    data = b''.join(chunks)
+    return source, contigs, [data], True, index_records(data)
+
+
+def _copy_file(path, out):
+    """Append a whole file to out, kernel-side when possible"""
+    out.flush()
+    size = os.path.getsize(path)
+    offset = 0
+    with open(path, 'rb') as src:
+        try:
+            if hasattr(os, 'copy_file_range'):
+                while offset < size:
+                    sent = os.copy_file_range(src.fileno(), out.fileno(), size - offset, offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            elif hasattr(os, 'sendfile'):
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), src.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+        except OSError:
+            # e.g. cross-filesystem copies on older kernels: finish in user space
+            pass
+        if offset < size:
+            src.seek(offset)
+            out.seek(0, os.SEEK_END)
+            shutil.copyfileobj(src, out, BLOCK_SIZE)
+
+
+def _validate_contigs(source, contigs, seen):
+    for contig in contigs:
+        if not contig:
+            raise ValueError(f"{source.name}: FASTA header without a sequence ID")
+        if len(contig) > MAX_SEQID_LENGTH:
+            raise ValueError(f"{source.name}: sequence ID '{contig}' is longer than "
+                             f"{MAX_SEQID_LENGTH} characters (makeblastdb -parse_seqids limit)")
+        if contig in seen:
+            raise ValueError(f"{source.name}: duplicate sequence ID '{contig}' "
+                             f"(also in {seen[contig]})")
+        seen[contig] = source.name
+
+
+def merge_genomes(genome_files, merged_path, index_path=None, workers=4):
+    """
+    Stream genome sources into one FASTA and record which assembly owns each contig.
+
+    Args:
+        genome_files (iterable): GenomeSource objects or paths of .fna/.fna.gz files.
+        merged_path (str): Output merged FASTA.
+        index_path (str): contig_index.tsv path (default: next to merged_path).
+        workers (int): Threads used to read and decompress sources ahead of the writer.
+
+    Returns:
+        dict: Number of 'genomes' and 'contigs' merged, the 'index_path' and
+              the 'fai_path' of the merged FASTA.
+    """
+    sources = [s if isinstance(s, GenomeSource) else GenomeSource(Path(s).name, s)
+               for s in genome_files]
+    merged_path = Path(merged_path)
+    index_path = Path(index_path) if index_path else merged_path.parent / INDEX_NAME
+    entries = []
+    records = []
+    seen = {}
+    local = threading.local()
+    # Tracked by hand: kernel-side copies leave the file position behind
+    offset = 0
+
+    with open(merged_path, 'wb') as out, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # Bounded read-ahead: at most 2 x workers decompressed genomes in memory
+        window = max(1, workers) * 2
+        futures = [pool.submit(_read_source, s, local) for s in sources[:window]]
+        next_index = len(futures)
+        while futures:
+            source, contigs, chunks, ends_with_newline, source_records = futures.pop(0).result()
+            if next_index < len(sources):
+                futures.append(pool.submit(_read_source, sources[next_index], local))
+                next_index += 1
+
+            _validate_contigs(source, contigs, seen)
+            records.extend((name, length, offset + start, linebases, linewidth)
+                           for name, length, start, linebases, linewidth in source_records)
+            if chunks is None:
+                _copy_file(source.path, out)
+                offset += os.path.getsize(source.path)
+                # Never glue the next file's header onto an unterminated last line
+                if not ends_with_newline:
+                    out.write(b'\n')
+                    offset += 1
+            else:
+                for chunk in chunks:
+                    out.write(chunk)
+                    offset += len(chunk)
+            entries.extend((contig, source.assembly) for contig in contigs)
+
+    write_contig_index(entries, index_path)
+    fai = write_fai(records, fai_path(merged_path))
+    return {'genomes': len(sources), 'contigs': len(entries), 'index_path': index_path, 'fai_path': fai}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge genome FASTA files (.fna, .fna.gz or an NCBI Datasets zip) and write the contig -> assembly index."
+    )
+    parser.add_argument("-g", "--genome_dir", required=True, help="Genome directory or NCBI Datasets zip bundle.")
+    parser.add_argument("-o", "--output", help="Merged FASTA output path.")
+    parser.add_argument("--index", help=f"Contig index path (default: {INDEX_NAME} next to the output).")
+    parser.add_argument("--workers", type=int, default=4, help="Reader/decompression threads (default: 4).")
+    parser.add_argument("--list", action="store_true", help="Only list the genome sources found, one per line.")
+    args = parser.parse_args()
+
+    genome_sources = discover_genomes(args.genome_dir)
+    if args.list:
+        for genome_source in genome_sources:
+            print(genome_source.name)
+        exit(0)
+    if not args.output:
+        parser.error("-o/--output is required unless --list is given")
+
+    summary = merge_genomes(genome_sources, args.output, args.index, args.workers)
+    print(f"Merged {summary['genomes']} genomes ({summary['contigs']} contigs) into: {args.output}")
+    print(f"Contig index: {summary['index_path']}")
+    print(f"FASTA index: {summary['fai_path']}")
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+S. suis Genome Redundancy Reduction (MinHash)
+=============================================
+
+Many assemblies of the collection are near-identical clones, and tblastn
+repeats the same work on each of them.  This module sketches every genome
+before the database is built, clusters genomes above an ANI-like similarity
+and keeps one representative per cluster for the search; hits of a
+representative are afterwards propagated to the members of its cluster
+(flagged ``propagated``).
+
+Sketches are FracMinHash ("scaled" MinHash): the canonical nucleotide
+k-mers (default k=21) of a genome are hashed (splitmix64) and only hashes
+below 2^64 / scaled are kept, roughly one per ``scaled`` bases.  K-mer codes
+are computed for a whole contig at once with a shift-or over the k window
+offsets, so sketching is a few vectorized passes per genome; genomes are
+sketched in a process pool.
+
+Pairwise Jaccard similarities come from one incidence-matrix product
+(genomes x distinct hashes, in column chunks), and are turned into the Mash
+ANI estimate 1 + ln(2J / (1 + J)) / k.  Clustering is greedy: the genome
+with most neighbours at or above ``min_ani`` becomes a representative and
+takes every unassigned neighbour, so each member is within ``min_ani`` of its
+own representative.
+
+Propagation assumes members carry the antigens of their representative;
+lower ``min_ani`` saves more search time at a higher risk of propagating
+presence across a recent gain or loss.  Prevalence is then reported both
+over all genomes (with propagated presence) and over clusters (each cluster
+counted once).
+
+genome_clusters.tsv has one row per genome: genome, representative, ani (to
+the representative), cluster_size, is_representative, bases and source.  Its
+first two columns make it usable as the clonal-cluster table of
+bootstrap_ci.py.
+
+Usage:
+    python genome_redundancy.py -g suis_selected -o genome_clusters.tsv [--min_ani 0.999] [--workers 4]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregation import passing_mask
+from genome_merge import GenomeSource, discover_genomes
+
+REDUNDANCY_NAME = 'genome_clusters.tsv'
+DEFAULT_K = 21
+DEFAULT_SCALED = 1000
+DEFAULT_MIN_ANI = 0.999
+MAX_INCIDENCE_CELLS = 1 << 24
+CLUSTER_COLUMNS = ['genome', 'representative', 'ani', 'cluster_size', 'is_representative', 'bases', 'source']
+
+_BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate('ACGT'):
+    _BASE_CODES[ord(_base)] = _BASE_CODES[ord(_base.lower())] = _code
+
+
+def _mix64(x):
+    """splitmix64 finalizer (uint64 arithmetic wraps)"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def kmer_hashes(sequence, k=DEFAULT_K):
+    """
+    Hashes of the canonical k-mers (k <= 32) of one nucleotide sequence.
+
+    Windows containing a base other than A/C/G/T are skipped.
+    """
+    codes = _BASE_CODES[np.frombuffer(sequence, dtype=np.uint8)]
+    n = codes.size - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    invalid = np.concatenate([[0], np.cumsum(codes == 4)])
+    valid = invalid[k:] == invalid[:n]
+    bases = np.minimum(codes, 3).astype(np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        window = bases[j:j + n]
+        forward = (forward << np.uint64(2)) | window
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+    return _mix64(np.minimum(forward, reverse)[valid])
+
+
+def _contig_sequences(data):
+    """Sequences (bytes, line breaks removed) of the records of a FASTA file's content"""
+    for record in data.split(b'\n>'):
+        _, _, body = record.partition(b'\n')
+        yield body.replace(b'\n', b'').replace(b'\r', b'')
+
+
+def sketch_genome(source, k=DEFAULT_K, scaled=DEFAULT_SCALED):
+    """
+    FracMinHash sketch of one genome.
+
+    Returns:
+        tuple: (sorted unique uint64 hashes, number of bases).
+    """
+    source = source if isinstance(source, GenomeSource) else GenomeSource(Path(source).name, source)
+    with source.open() as fh:
+        data = fh.read()
+    max_hash = np.uint64((1 << 64) // scaled - 1)
+    parts, bases = [], 0
+    for sequence in _contig_sequences(data):
+        bases += len(sequence)
+        hashes = kmer_hashes(sequence, k)
+        parts.append(hashes[hashes <= max_hash])
+    hashes = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+    return hashes, bases
+
+
+def _sketch_task(task):
+    return sketch_genome(*task)
+
+
+def sketch_genomes(sources, k=DEFAULT_K, scaled=DEFAULT_SCALED, workers=1):
+    """Sketches and base counts of every source, in a process pool when workers > 1"""
+    tasks = [(source, k, scaled) for source in sources]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(_sketch_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        results = [_sketch_task(task) for task in tasks]
+    return [hashes for hashes, _ in results], np.array([bases for _, bases in results], dtype=np.int64)
+
+
+def jaccard_matrix(sketches):
+    """
+    Pairwise Jaccard similarity of sketches from one incidence-matrix product.
+
+    The genomes x distinct-hashes incidence matrix is built in column chunks
+    of at most MAX_INCIDENCE_CELLS cells.
+    """
+    n = len(sketches)
+    sizes = np.array([s.size for s in sketches], dtype=np.int64)
+    intersections = np.zeros((n, n))
+    if sizes.sum():
+        hash_ids = np.unique(np.concatenate(sketches), return_inverse=True)[1].ravel()
+        owners = np.repeat(np.arange(n), sizes)
+        order = np.argsort(hash_ids, kind='stable')
+        hash_ids, owners = hash_ids[order], owners[order]
+        n_hashes = int(hash_ids[-1]) + 1
+        step = max(1, MAX_INCIDENCE_CELLS // max(n, 1))
+        bounds = np.searchsorted(hash_ids, np.arange(0, n_hashes + step, step))
+        for c, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if lo == hi:
+                continue
+            incidence = np.zeros((n, step), dtype=np.float32)
+            incidence[owners[lo:hi], hash_ids[lo:hi] - c * step] = 1.0
+            intersections += incidence @ incidence.T
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jaccard = np.where(unions > 0, intersections / unions, 0.0)
+    np.fill_diagonal(jaccard, 1.0)
+    return jaccard
+
+
+def ani_from_jaccard(jaccard, k=DEFAULT_K):
+    """Mash ANI estimate 1 - D, D = -ln(2J / (1 + J)) / k (0 for disjoint sketches)"""
+    jaccard = np.asarray(jaccard, dtype=float)
+    with np.errstate(divide='ignore'):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+    return np.clip(1 - distance, 0.0, 1.0)
+
+
+def cluster_genomes(ani, min_ani=DEFAULT_MIN_ANI):
+    """
+    Greedy representative clustering.
+
+    Returns:
+        np.ndarray: Representative index of every genome.
+    """
+    neighbours = np.asarray(ani) >= min_ani
+    degree = neighbours.sum(axis=1)
+    representative = np.full(len(degree), -1, dtype=np.int64)
+    for i in np.lexsort((np.arange(len(degree)), -degree)):
+        if representative[i] < 0:
+            representative[np.flatnonzero(neighbours[i] & (representative < 0))] = i
+    return representative
+
+
+def reduce_redundancy(sources, output_path=None, k=DEFAULT_K, scaled=DEFAULT_SCALED,
+                      min_ani=DEFAULT_MIN_ANI, workers=1):
+    """
+    Sketch and cluster genomes; optionally write genome_clusters.tsv.
+
+    Args:
+        sources (list): GenomeSource objects (see genome_merge.discover_genomes).
+        output_path (str): Where to write the cluster table (None: not written).
+        k (int): Nucleotide k-mer length.
+        scaled (int): Keep about one hash per ``scaled`` k-mers.
+        min_ani (float): Similarity at or above which genomes are clustered.
+        workers (int): Sketching processes.
+
+    Returns:
+        pd.DataFrame: CLUSTER_COLUMNS, in source order.
+    """
+    sources = [s if isinstance(s, GenomeSource) else GenomeSource(Path(s).name, s) for s in sources]
+    sketches, bases = sketch_genomes(sources, k, scaled, workers)
+    ani = ani_from_jaccard(jaccard_matrix(sketches), k)
+    representative = cluster_genomes(ani, min_ani)
+    sizes = np.bincount(representative, minlength=len(sources))
+    genomes = np.array([s.assembly for s in sources], dtype=object)
+    clusters = pd.DataFrame({
+        'genome': genomes,
+        'representative': genomes[representative],
+        'ani': ani[np.arange(len(sources)), representative] if len(sources) else np.empty(0),
+        'cluster_size': sizes[representative],
+        'is_representative': representative == np.arange(len(sources)),
+        'bases': bases,
+        'source': [s.name for s in sources],
+    })
+    if output_path is not None:
+        clusters.to_csv(output_path, sep='\t', index=False, float_format='%.6f')
+    return clusters
+
+
+def read_clusters(path):
+    """Load genome_clusters.tsv"""
+    return pd.read_csv(path, sep='\t', dtype={'genome': str, 'representative': str, 'source': str})
+
+
+def representative_sources(sources, clusters):
+    """The sources of the cluster representatives, in their original order"""
+    keep = set(clusters.loc[clusters['is_representative'], 'source'])
+    return [s for s in sources if s.name in keep]
+
+
+def redundancy_report(clusters):
+    """Genome / cluster counts and the fraction of database bases (tblastn work) saved"""
+    total = int(clusters['bases'].sum())
+    searched = int(clusters.loc[clusters['is_representative'], 'bases'].sum())
+    return {
+        'genomes': len(clusters),
+        'clusters': int(clusters['is_representative'].sum()),
+        'total_bases': total,
+        'searched_bases': searched,
+        'work_saved': 1 - searched / total if total else 0.0,
+    }
+
+
+def print_redundancy_report(report):
+    print(f"  Redundancy: {report['genomes']} genomes in {report['clusters']} clusters; "
+          f"searching representatives only saves {report['work_saved']:.1%} of the database")
+
+
+def propagate_hits(df, clusters):
+    """
+    Copy every hit of a representative to the members of its cluster.
+
+    Args:
+        df (pd.DataFrame): Hits annotated by aggregation.annotate_hits().
+        clusters (pd.DataFrame): Cluster table (see reduce_redundancy()).
+
+    Returns:
+        pd.DataFrame: The searched hits (propagated=False) followed by their
+                      copies on member genomes (propagated=True).
+    """
+    members = clusters.loc[~clusters['is_representative'].astype(bool), ['representative', 'genome']]
+    members = members.sort_values('representative', kind='stable')
+    representatives, starts, counts = np.unique(members['representative'].to_numpy(dtype=str),
+                                                return_index=True, return_counts=True)
+    df = df.assign(propagated=False)
+    if df.empty or not len(members):
+        return df
+
+    genome = df['genome_accession'].astype(object)
+    code = pd.Index(representatives).get_indexer(genome.where(genome.notna(), None))
+    repeats = np.where(code >= 0, counts[np.maximum(code, 0)], 0)
+    rows = np.repeat(np.arange(len(df)), repeats)
+    # Offset of every copy within its representative's member list
+    within = np.arange(rows.size) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    member_names = members['genome'].to_numpy(dtype=object)[starts[code[rows]] + within]
+
+    copies = df.iloc[rows].assign(propagated=True)
+    copies['genome_accession'] = member_names
+    df = df.assign(genome_accession=genome)
+    result = pd.concat([df, copies], ignore_index=True)
+    result['genome_accession'] = result['genome_accession'].astype('category')
+    return result
+
+
+def cluster_prevalence(df, antigens, clusters, min_identity, min_coverage):
+    """
+    Redundancy-weighted statistics per antigen.
+
+    Args:
+        df (pd.DataFrame): Hits after propagate_hits().
+        antigens (list): Row order.
+        clusters (pd.DataFrame): Cluster table.
+        min_identity (float): Minimum percent identity.
+        min_coverage (float): Minimum query coverage (fraction).
+
+    Returns:
+        pd.DataFrame: antigen, propagated_genomes (genomes counted only through
+                      a representative), hit_clusters (representatives with a
+                      passing hit), clusters and cluster_prevalence_percent.
+    """
+    representatives = clusters.loc[clusters['is_representative'].astype(bool), 'genome']
+    n_clusters = len(representatives)
+    passing = df[passing_mask(df, min_identity, min_coverage)
+                 & (df['propagated'] | df['genome_accession'].isin(representatives))]
+    genomes = passing.groupby(['propagated', 'qseqid'], sort=False, observed=True)['genome_accession'].nunique()
+    propagated = genomes.get(True, pd.Series(dtype=np.int64))
+    searched = genomes.get(False, pd.Series(dtype=np.int64))
+    hit_clusters = searched.reindex(antigens, fill_value=0).to_numpy(dtype=np.int64)
+    return pd.DataFrame({
+        'antigen': antigens,
+        'propagated_genomes': propagated.reindex(antigens, fill_value=0).to_numpy(dtype=np.int64),
+        'hit_clusters': hit_clusters,
+        'clusters': n_clusters,
+        'cluster_prevalence_percent': hit_clusters / n_clusters * 100 if n_clusters else 0.0,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-identical genomes by MinHash sketches and pick representatives.")
+    parser.add_argument("-g", "--genome_dir", required=True, help="Genome directory or NCBI Datasets zip bundle.")
+    parser.add_argument("-o", "--output", default=REDUNDANCY_NAME, help=f"Cluster table (default: {REDUNDANCY_NAME}).")
+    parser.add_argument("-k", type=int, default=DEFAULT_K, help=f"K-mer length (default: {DEFAULT_K}).")
+    parser.add_argument("--scaled", type=int, default=DEFAULT_SCALED,
+                        help=f"Keep about one k-mer hash per this many (default: {DEFAULT_SCALED}).")
+    parser.add_argument("--min_ani", type=float, default=DEFAULT_MIN_ANI,
+                        help=f"Cluster genomes at or above this ANI estimate (default: {DEFAULT_MIN_ANI}).")
+    parser.add_argument("--workers", type=int, default=4, help="Sketching processes (default: 4).")
+    args = parser.parse_args()
+
+    clusters = reduce_redundancy(discover_genomes(args.genome_dir), args.output, args.k, args.scaled,
+                                 args.min_ani, args.workers)
+    print_redundancy_report(redundancy_report(clusters))
+    for row in clusters[clusters['cluster_size'] > 1].sort_values(['representative', 'genome']).itertuples():
+        if not row.is_representative:
+            print(f"  {row.genome} -> {row.representative} (ANI {row.ani:.5f})")
+    print(f"Clusters: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+S. suis Columnar Hit Store
+==========================
+
+Binary, memory-mappable copy of a tblastn fmt 6 table, written once after
+BLAST so the analysis scripts do not reparse the text TSV every time.
+
+A store is a directory (``blast_results.tsv.hits/``) holding one ``.npy`` file
+per column plus ``meta.json``:
+
+* ``qseqid`` / ``sseqid`` are dictionary-encoded: the codes are stored and the
+  distinct IDs live in the metadata, so they load as pandas categoricals.
+* Integer columns use the narrowest signed dtype that holds their range.
+* ``pident`` and ``bitscore`` are stored as fixed-point integers when the text
+  values allow it (fmt 6 prints 3 and 1 decimals); decoding gives exactly the
+  floats read_csv would have produced.  ``evalue`` stays float64.
+* Zone maps (per-block min/max of pident and evalue) let ``read`` skip whole
+  blocks for ``min_identity`` / ``max_evalue`` predicates; only the requested
+  columns of the surviving rows are touched.
+
+``aggregation.load_hits`` picks the store up automatically as long as the TSV
+it was built from is unchanged (same size and mtime).
+
+Tables re-formatted from a BLAST archive (blast_archive.py) may carry other
+columns (qlen, slen, qcovhsp, sseq, ...); their names are kept in a
+``<table>.columns`` sidecar, see table_columns().  The store holds the 12
+standard columns, which such a table must contain.
+
+Usage:
+    python hit_store.py suis_prevalence_analysis/blast_results.tsv
+"""
+
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BLAST_COLUMNS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+                 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
+
+STORE_SUFFIX = '.hits'
+COLUMNS_SUFFIX = '.columns'
+META_NAME = 'meta.json'
+STORE_VERSION = 1
+BLOCK_ROWS = 1 << 16
+CHUNK_ROWS = 1 << 20
+CATEGORICAL_COLUMNS = ('qseqid', 'sseqid')
+FIXED_POINT_SCALES = {'pident': 1000, 'bitscore': 10}
+FLOAT_COLUMNS = ('pident', 'evalue', 'bitscore')
+ZONE_COLUMNS = ('pident', 'evalue')
+
+
+def store_path(blast_file):
+    """Default store location for a fmt 6 file: ``<blast_file>.hits``"""
+    return Path(f'{blast_file}{STORE_SUFFIX}')
+
+
+def columns_path(blast_file):
+    """Column schema sidecar of a tabular file: ``<blast_file>.columns``"""
+    return Path(f'{blast_file}{COLUMNS_SUFFIX}')
+
+
+def write_table_columns(blast_file, columns):
+    """Record the column names of blast_file (write it after the table)"""
+    with open(columns_path(blast_file), 'w') as fh:
+        fh.write(' '.join(columns) + '\n')
+
+
+def table_columns(blast_file):
+    """
+    Column names of a tabular BLAST file: its sidecar, or the 12 fmt 6 columns.
+
+    A sidecar older than the table belongs to an earlier version of the file
+    (e.g. tblastn rewrote it) and is ignored.
+    """
+    sidecar = columns_path(blast_file)
+    try:
+        if os.stat(sidecar).st_mtime_ns >= os.stat(blast_file).st_mtime_ns:
+            with open(sidecar) as fh:
+                return fh.read().split()
+    except FileNotFoundError:
+        pass
+    return list(BLAST_COLUMNS)
+
+
+def _source_stamp(blast_file):
+    stat = os.stat(blast_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_store(path):
+    return (Path(path) / META_NAME).exists()
+
+
+def find_store(blast_file):
+    """
+    The store to read for blast_file, or None.
+
+    blast_file may be the store directory itself; otherwise the sibling
+    ``.hits`` store is used if it was built from the current file contents.
+    """
+    path = Path(blast_file)
+    if is_store(path):
+        return path
+    store = store_path(path)
+    if not is_store(store) or not path.exists():
+        return None
+    with open(store / META_NAME) as fh:
+        meta = json.load(fh)
+    if meta.get('version') != STORE_VERSION or meta.get('source') != _source_stamp(path):
+        return None
+    return store
+
+
+def _narrow_int(values):
+    """Cast an integer array to the smallest signed dtype holding its range"""
+    if values.size == 0:
+        return values.astype(np.int8)
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= values.min() and values.max() <= info.max:
+            return values.astype(dtype, copy=False)
+    return values
+
+
+def _fixed_point(values, scale):
+    """Scaled integers if they reproduce values exactly, else None"""
+    if not np.isfinite(values).all():
+        return None
+    scaled = np.rint(values * scale)
+    if not np.array_equal(scaled / scale, values):
+        return None
+    return _narrow_int(scaled.astype(np.int64))
+
+
+def _encode_chunk(chunk, dictionaries, parts, fixed_point):
+    """Append the narrow binary encoding of one parsed chunk to the column parts"""
+    for name in CATEGORICAL_COLUMNS:
+        uniques, codes = np.unique(chunk[name].to_numpy(), return_inverse=True)
+        lookup = dictionaries[name]
+        remap = np.array([lookup.setdefault(u, len(lookup)) for u in uniques], dtype=np.int64)
+        parts[name].append(_narrow_int(remap[codes.reshape(-1)]))
+    for name in BLAST_COLUMNS:
+        if name in CATEGORICAL_COLUMNS:
+            continue
+        values = chunk[name].to_numpy()
+        if fixed_point.get(name):
+            scale = FIXED_POINT_SCALES[name]
+            scaled = _fixed_point(values, scale)
+            if scaled is None:
+                # Not fixed-point after all: earlier parts go back to the (exactly equal) floats
+                fixed_point[name] = False
+                parts[name] = [part / scale for part in parts[name]]
+            else:
+                values = scaled
+        elif name not in FLOAT_COLUMNS:
+            values = _narrow_int(values.astype(np.int64, copy=False))
+        parts[name].append(values)
+
+
+def write_hit_store(blast_file, store=None, chunksize=CHUNK_ROWS):
+    """
+    Convert a fmt 6 TSV into a columnar store.
+
+    The text is parsed once in chunks; every chunk is encoded right away (IDs
+    dictionary-encoded, integers narrowed, pident/bitscore fixed-point) and
+    only these narrow parts are kept.  Each column is then copied part by
+    part into a memory-mapped ``.npy`` file, so peak memory is about the size
+    of the narrow binary columns plus one parsed chunk.
+
+    Args:
+        blast_file (str): tblastn fmt 6 output.
+        store (str): Store directory (default: ``<blast_file>.hits``).
+        chunksize (int): Rows parsed per read_csv chunk.
+
+    Returns:
+        Path: The store directory.
+    """
+    store = Path(store) if store else store_path(blast_file)
+    stamp = _source_stamp(blast_file)
+    names = table_columns(blast_file)
+    missing = [name for name in BLAST_COLUMNS if name not in names]
+    if missing:
+        raise ValueError(f"{blast_file} lacks the fmt 6 columns {', '.join(missing)} needed by the hit store")
+    dictionaries = {name: {} for name in CATEGORICAL_COLUMNS}
+    parts = {name: [] for name in BLAST_COLUMNS}
+    fixed_point = {name: True for name in FIXED_POINT_SCALES}
+
+    dtypes = {name: str for name in CATEGORICAL_COLUMNS}
+    dtypes.update({name: np.float64 for name in FLOAT_COLUMNS})
+    try:
+        reader = pd.read_csv(blast_file, sep='\t', names=names, header=None, usecols=BLAST_COLUMNS,
+                             dtype=dtypes, chunksize=chunksize)
+        for chunk in reader:
+            _encode_chunk(chunk, dictionaries, parts, fixed_point)
+    except pd.errors.EmptyDataError:
+        pass
+    if not parts['qseqid']:
+        empty = pd.DataFrame({name: np.empty(0, dtype=object if name in CATEGORICAL_COLUMNS else
+                                             np.float64 if name in FLOAT_COLUMNS else np.int64)
+                              for name in BLAST_COLUMNS})
+        _encode_chunk(empty, dictionaries, parts, fixed_point)
+    n_rows = sum(len(part) for part in parts['qseqid'])
+
+    # Build next to the target and swap in, so readers never see half a store
+    tmp = store.with_name(store.name + '.tmp')
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    columns = {}
+    zones = {}
+    starts = np.arange(0, n_rows, BLOCK_ROWS)
+    for name in BLAST_COLUMNS:
+        # The widest part dtype is the narrowest one holding the whole column
+        dtype = np.result_type(*parts[name])
+        spec = {}
+        if name in CATEGORICAL_COLUMNS:
+            spec['categories'] = list(dictionaries[name])
+        elif fixed_point.get(name):
+            spec['scale'] = FIXED_POINT_SCALES[name]
+        spec['dtype'] = dtype.str
+        columns[name] = spec
+
+        values = np.lib.format.open_memmap(tmp / f'{name}.npy', mode='w+', dtype=dtype, shape=(n_rows,))
+        offset = 0
+        while parts[name]:
+            part = parts[name].pop(0)
+            values[offset:offset + len(part)] = part
+            offset += len(part)
+        if name in ZONE_COLUMNS:
+            if n_rows:
+                zones[name] = np.stack([np.minimum.reduceat(values, starts),
+                                        np.maximum.reduceat(values, starts)], axis=1)
+            else:
+                zones[name] = np.empty((0, 2), dtype=dtype)
+        values.flush()
+        del values
+
+    for name, zone in zones.items():
+        np.save(tmp / f'zone_{name}.npy', zone)
+    meta = {'version': STORE_VERSION, 'rows': n_rows, 'block_rows': BLOCK_ROWS,
+            'columns': columns, 'source': stamp}
+    with open(tmp / META_NAME, 'w') as fh:
+        json.dump(meta, fh)
+    if store.exists():
+        shutil.rmtree(store)
+    os.replace(tmp, store)
+    return store
+
+
+class HitStore:
+    """Read access to a columnar hit store (columns are memory-mapped)"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_NAME) as fh:
+            self.meta = json.load(fh)
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported hit store version in {self.path}")
+        self.rows = self.meta['rows']
+        self.columns = list(self.meta['columns'])
+
+    def _raw(self, name):
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def _decode(self, name, values):
+        spec = self.meta['columns'][name]
+        if 'categories' in spec:
+            return pd.Categorical.from_codes(np.asarray(values), categories=spec['categories'])
+        return self._values(name, values)
+
+    def _values(self, name, values):
+        """Stored numbers in their float units (fixed-point columns are descaled)"""
+        scale = self.meta['columns'][name].get('scale')
+        return np.asarray(values) / scale if scale else np.asarray(values)
+
+    def row_selection(self, min_identity=None, max_evalue=None):
+        """
+        Indices of rows with pident >= min_identity and evalue <= max_evalue.
+
+        Returns None when no predicate is given (all rows).
+        """
+        predicates = []
+        if min_identity is not None:
+            predicates.append(('pident', min_identity, np.greater_equal))
+        if max_evalue is not None:
+            predicates.append(('evalue', max_evalue, np.less_equal))
+        if not predicates:
+            return None
+
+        block_rows = self.meta['block_rows']
+        n_blocks = -(-self.rows // block_rows)
+        candidate = np.ones(n_blocks, dtype=bool)
+        for name, threshold, op in predicates:
+            zone = self._values(name, np.load(self.path / f'zone_{name}.npy'))
+            # Block max below / block min above the threshold: nothing can pass
+            candidate &= op(zone[:, 1] if op is np.greater_equal else zone[:, 0], threshold)
+
+        raw = {name: self._raw(name) for name, _, _ in predicates}
+        selected = []
+        for block in np.flatnonzero(candidate):
+            start = block * block_rows
+            stop = min(start + block_rows, self.rows)
+            keep = np.ones(stop - start, dtype=bool)
+            for name, threshold, op in predicates:
+                keep &= op(self._values(name, raw[name][start:stop]), threshold)
+            selected.append(np.flatnonzero(keep) + start)
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(selected)
+
+    def read(self, columns=None, min_identity=None, max_evalue=None):
+        """
+        Load hits as a DataFrame.
+
+        Args:
+            columns (list): Columns to load (default: all 12 fmt 6 columns).
+            min_identity (float): Keep hits with pident >= min_identity.
+            max_evalue (float): Keep hits with evalue <= max_evalue.
+
+        Returns:
+            pd.DataFrame: qseqid/sseqid are categoricals; numbers keep their
+                          narrow stored dtypes (fixed-point columns as float64).
+        """
+        columns = list(columns) if columns else BLAST_COLUMNS
+        rows = self.row_selection(min_identity, max_evalue)
+        data = {}
+        for name in columns:
+            values = self._raw(name)
+            data[name] = self._decode(name, values if rows is None else values[rows])
+        return pd.DataFrame(data, columns=columns)
+
+
+def open_hits(blast_file, columns=None, min_identity=None, max_evalue=None):
+    """Read a store (or the current store of a TSV) as a DataFrame"""
+    store = find_store(blast_file)
+    if store is None:
+        raise FileNotFoundError(f"No current hit store for {blast_file}")
+    return HitStore(store).read(columns, min_identity, max_evalue)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert tblastn tabular output (fmt 6) into a columnar, memory-mappable hit store."
+    )
+    parser.add_argument("input", help="tblastn fmt 6 output file.")
+    parser.add_argument("-o", "--output", help="Store directory (default: <input>.hits).")
+    args = parser.parse_args()
+
+    path = write_hit_store(args.input, args.output)
+    print(f"Hit store written: {path} ({HitStore(path).rows} hits)")
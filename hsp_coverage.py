@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+S. suis HSP Interval-Union Coverage
+===================================
+
+tblastn reports one row per HSP, and the default coverage of a hit is
+``length / query_length`` of that single HSP.  A gene split across a
+frameshift or a contig boundary then yields several partial HSPs of which
+none passes the coverage threshold (the HP0197 "coverage threshold issue"),
+while overlapping HSPs push mean coverage above 100%.
+
+'merged' coverage is instead the union of the query intervals
+[qstart, qend] of all HSPs of an (antigen, genome) pair that pass the
+identity threshold, divided by the query length.  It is computed for all
+pairs at once with one sort and a running maximum (no per-group Python loop):
+after sorting HSPs by (pair, qstart), each HSP adds the residues beyond the
+furthest qend reached so far within its pair.
+"""
+
+import numpy as np
+import pandas as pd
+
+COVERAGE_MODES = ('hsp', 'merged')
+INTERVAL_COLUMNS = ['qstart', 'qend']
+PAIR_COLUMNS = ['qseqid', 'genome_accession']
+
+
+def check_coverage_mode(coverage_mode):
+    if coverage_mode not in COVERAGE_MODES:
+        raise ValueError(f"coverage_mode must be one of {COVERAGE_MODES}, got {coverage_mode!r}")
+    return coverage_mode
+
+
+def union_segments(pairs, starts, ends):
+    """
+    Disjoint segments covering the same residues as the intervals of each pair.
+
+    Args:
+        pairs (array): Pair code of every 1-based inclusive interval.
+        starts (array): Interval starts.
+        ends (array): Interval ends (may be smaller than starts; they are swapped).
+
+    Returns:
+        tuple: (pairs, lo, hi) int64 arrays of the segments, sorted by pair and lo.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64)
+    lo = np.minimum(starts, ends).astype(np.int64)
+    hi = np.maximum(starts, ends).astype(np.int64)
+    if pairs.size == 0:
+        return pairs, lo, hi
+
+    order = np.lexsort((lo, pairs))
+    pairs, lo, hi = pairs[order], lo[order], hi[order]
+    # Offsetting each pair above every coordinate of the previous pairs turns the
+    # per-pair running maximum of qend into one global maximum.accumulate
+    offset = pairs * (int(hi.max()) + 1)
+    reach = np.maximum.accumulate(hi + offset) - offset
+    # A segment starts at a new pair or past the furthest qend reached so far
+    new = np.ones(pairs.size, dtype=bool)
+    new[1:] = (pairs[1:] != pairs[:-1]) | (lo[1:] > reach[:-1])
+    first = np.flatnonzero(new)
+    last = np.append(first[1:] - 1, pairs.size - 1)
+    return pairs[first], lo[first], reach[last]
+
+
+def interval_union(pairs, starts, ends, n_pairs):
+    """
+    Residues covered by the union of 1-based inclusive intervals per pair.
+
+    Args:
+        pairs (array): Pair code (0 .. n_pairs-1) of every interval.
+        starts (array): Interval starts.
+        ends (array): Interval ends (may be smaller than starts; they are swapped).
+        n_pairs (int): Number of pairs.
+
+    Returns:
+        np.ndarray: Covered residues per pair code (int64).
+    """
+    segment_pairs, lo, hi = union_segments(pairs, starts, ends)
+    return np.bincount(segment_pairs, weights=hi - lo + 1, minlength=n_pairs).astype(np.int64)
+
+
+def _pair_codes(df):
+    """Pair code of every row; -1 where the antigen or genome is missing"""
+    return df.groupby(PAIR_COLUMNS, sort=False, observed=True, dropna=True).ngroup().to_numpy()
+
+
+def merged_coverage(df, min_identity=None):
+    """
+    Per (antigen, genome) union coverage of the HSPs passing ``min_identity``.
+
+    Args:
+        df (pd.DataFrame): Hits annotated by aggregation.annotate_hits(), with
+            qstart and qend.
+        min_identity (float): Only HSPs at or above this identity count (None: all).
+
+    Returns:
+        pd.DataFrame: qseqid, genome_accession, hsps, contigs, covered_residues,
+                      query_length and merged_coverage (fraction) per pair.
+    """
+    if min_identity is not None:
+        df = df[df['pident'] >= min_identity]
+    df = df[df['query_length'].notna()]
+    codes = _pair_codes(df)
+    keep = codes >= 0
+    df, codes = df[keep], codes[keep]
+    n_pairs = int(codes.max()) + 1 if codes.size else 0
+
+    covered = interval_union(codes, df['qstart'].to_numpy(), df['qend'].to_numpy(), n_pairs)
+    first = np.zeros(n_pairs, dtype=np.int64)
+    first[codes[::-1]] = np.arange(codes.size)[::-1]
+    keys = df.iloc[first] if n_pairs else df.iloc[:0]
+    contigs = (pd.DataFrame({'pair': codes, 'sseqid': df['sseqid'].to_numpy()})
+               .drop_duplicates().groupby('pair').size()
+               .reindex(range(n_pairs), fill_value=0).to_numpy())
+    query_length = keys['query_length'].to_numpy(dtype=float)
+    return pd.DataFrame({
+        'qseqid': keys['qseqid'].to_numpy(),
+        'genome_accession': keys['genome_accession'].to_numpy(),
+        'hsps': np.bincount(codes, minlength=n_pairs),
+        'contigs': contigs,
+        'covered_residues': covered,
+        'query_length': query_length,
+        'merged_coverage': covered / query_length if n_pairs else np.empty(0),
+    })
+
+
+def add_merged_coverage(df, min_identity):
+    """
+    Add a 'merged_coverage' column: the union coverage of the HSP's (antigen,
+    genome) pair, NaN for HSPs below ``min_identity`` or of unknown queries.
+    """
+    codes = _pair_codes(df)
+    counted = (codes >= 0) & (df['pident'] >= min_identity).to_numpy() & df['query_length'].notna().to_numpy()
+    n_pairs = int(codes.max()) + 1 if codes.size else 0
+    covered = interval_union(codes[counted], df['qstart'].to_numpy()[counted],
+                             df['qend'].to_numpy()[counted], n_pairs)
+    values = np.full(len(df), np.nan)
+    values[counted] = covered[codes[counted]] / df['query_length'].to_numpy(dtype=float)[counted]
+    df['merged_coverage'] = values
+    return df
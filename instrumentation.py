@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+S. suis Pipeline Instrumentation
+================================
+
+Per-stage run metrics for the analysis pipeline: wall time, CPU time of the
+Python process and of the child processes it waited for (makeblastdb,
+tblastn), peak RSS, bytes read/written and row counts, exported as one JSON
+file per run (run_metrics.json next to the results).  Python stages can
+optionally be profiled with cProfile (one .prof file per stage).
+
+CPU time of the Python code is per thread, so stages running concurrently
+under the DAG scheduler are accounted separately.  Child-process CPU time,
+I/O counters and peak RSS are process-wide: for overlapping stages they
+include the other stage's work, and peak RSS is the high-water mark up to the
+end of the stage.
+
+The command-line mode wraps one external command (used by
+run_suis_prevalence.sh) and appends its stage to a metrics file:
+
+Usage:
+    python instrumentation.py -m run_metrics.json -s tblastn --rows_file hits.tsv -- tblastn ...
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+METRICS_NAME = 'run_metrics.json'
+PROFILE_DIR_NAME = 'profiles'
+IO_FIELDS = ('rchar', 'wchar', 'read_bytes', 'write_bytes')
+# Python stages: per-thread CPU time where the platform has it
+_THREAD_USAGE = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+
+
+def read_proc_io():
+    """
+    Process I/O counters from /proc/self/io (Linux); includes reaped children.
+
+    rchar/wchar count every read()/write() (pipes and page cache included),
+    read_bytes/write_bytes only what went to storage.  Empty dict elsewhere.
+    """
+    try:
+        with open('/proc/self/io') as fh:
+            fields = dict(line.split(':', 1) for line in fh)
+    except OSError:
+        return {}
+    return {name: int(fields[name]) for name in IO_FIELDS if name in fields}
+
+
+def _rss_mb(usage):
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _snapshot():
+    return {
+        'wall': time.perf_counter(),
+        'cpu': resource.getrusage(_THREAD_USAGE),
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN),
+        'io': read_proc_io(),
+    }
+
+
+def _delta(start, end, name, status):
+    """One stage record from two snapshots"""
+    record = {
+        'stage': name,
+        'status': status,
+        'wall_s': round(end['wall'] - start['wall'], 6),
+        'cpu_user_s': round(end['cpu'].ru_utime - start['cpu'].ru_utime, 6),
+        'cpu_system_s': round(end['cpu'].ru_stime - start['cpu'].ru_stime, 6),
+        'children_user_s': round(end['children'].ru_utime - start['children'].ru_utime, 6),
+        'children_system_s': round(end['children'].ru_stime - start['children'].ru_stime, 6),
+        'peak_rss_mb': round(_rss_mb(resource.getrusage(resource.RUSAGE_SELF)), 1),
+        'children_peak_rss_mb': round(_rss_mb(end['children']), 1),
+        'rows': None,
+    }
+    for field in IO_FIELDS:
+        if field in start['io'] and field in end['io']:
+            record[field] = end['io'][field] - start['io'][field]
+    return record
+
+
+def count_rows(path):
+    """Rows of a hit table: from its hit store when current, else by counting lines"""
+    # hit_store pulls in numpy/pandas: only import it when a store can exist (the
+    # path itself or its hit_store.store_path() sibling), so wrapped commands start fast
+    if os.path.isdir(path) or os.path.isdir(f'{path}.hits'):
+        from hit_store import HitStore, find_store
+        store = find_store(path)
+        if store is not None:
+            return HitStore(store).rows
+    rows = 0
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            rows += block.count(b'\n')
+    return rows
+
+
+class RunMetrics:
+    """
+    Collects stage records for one run.
+
+    Args:
+        run_name (str): Name stored in the metrics file (e.g. the script name).
+        profile_dir (str): Write a cProfile dump per stage here (None: no profiling).
+        params (dict): Run parameters stored alongside the stages.
+    """
+
+    def __init__(self, run_name, profile_dir=None, params=None):
+        self.run_name = run_name
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.params = params or {}
+        self.started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.stages = []
+        self._start = _snapshot()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Measure the enclosed block as stage ``name``.
+
+        Yields the stage record; set ``record['rows']`` inside the block when
+        the row count is only known there.  A failing block is recorded with
+        status 'failed' and its exception re-raised.
+        """
+        record = {'rows': rows}
+        profiler = None
+        if self.profile_dir is not None:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            profiler = cProfile.Profile()
+        start = _snapshot()
+        status = 'ok'
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException:
+            status = 'failed'
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            measured = _delta(start, _snapshot(), name, status)
+            measured['rows'] = record.get('rows')
+            if profiler:
+                profile_path = self.profile_dir / f'{name}.prof'
+                profiler.dump_stats(profile_path)
+                measured['profile'] = str(profile_path)
+            record.update(measured)
+            with self._lock:
+                self.stages.append(record)
+
+    def to_dict(self):
+        with self._lock:
+            stages = list(self.stages)
+        total = _delta(self._start, _snapshot(), 'total', 'ok')
+        total['rows'] = None
+        # Per-thread CPU of the stages; the process-wide figure is the honest total
+        process = resource.getrusage(resource.RUSAGE_SELF)
+        total['cpu_user_s'] = round(process.ru_utime, 6)
+        total['cpu_system_s'] = round(process.ru_stime, 6)
+        return {
+            'run': self.run_name,
+            'started': self.started,
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'pid': os.getpid(),
+            'params': self.params,
+            'stages': stages,
+            'total': total,
+        }
+
+    def write(self, path):
+        """Write the metrics JSON atomically"""
+        write_metrics(self.to_dict(), path)
+        return path
+
+    def summary_lines(self):
+        """A small table of the recorded stages"""
+        lines = [f"{'stage':<22} {'status':<7} {'wall s':>9} {'cpu s':>8} {'child cpu s':>11} "
+                 f"{'peak MB':>8} {'rows':>12}"]
+        with self._lock:
+            stages = list(self.stages)
+        for r in stages:
+            rows = f"{r['rows']:,}" if r['rows'] is not None else '-'
+            lines.append(f"{r['stage']:<22} {r['status']:<7} {r['wall_s']:>9.2f} "
+                         f"{r['cpu_user_s'] + r['cpu_system_s']:>8.2f} "
+                         f"{r['children_user_s'] + r['children_system_s']:>11.2f} "
+                         f"{max(r['peak_rss_mb'], r['children_peak_rss_mb']):>8.1f} {rows:>12}")
+        return lines
+
+
+def write_metrics(metrics, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w') as fh:
+        json.dump(metrics, fh, indent=1)
+    os.replace(tmp_path, path)
+
+
+def append_stage(path, record, run_name):
+    """Add one stage record to a metrics file (created on first use)"""
+    path = Path(path)
+    if path.exists():
+        with open(path) as fh:
+            metrics = json.load(fh)
+    else:
+        metrics = {'run': run_name,
+                   'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                   'host': platform.node(), 'python': platform.python_version(),
+                   'params': {}, 'stages': []}
+    metrics['stages'].append(record)
+    write_metrics(metrics, path)
+    return metrics
+
+
+def _profiled_command(cmd, profile_path):
+    """Insert cProfile into 'python script.py ...' commands; others run unchanged"""
+    if len(cmd) > 1 and Path(cmd[0]).name.startswith('python') and cmd[1].endswith('.py'):
+        return [cmd[0], '-m', 'cProfile', '-o', str(profile_path)] + cmd[1:]
+    return cmd
+
+
+def run_command(cmd, metrics_path, stage, rows_file=None, profile_dir=None, run_name='shell'):
+    """Run an external command as one instrumented stage; returns its exit code"""
+    if profile_dir:
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+        cmd = _profiled_command(cmd, Path(profile_dir) / f'{stage}.prof')
+    start = _snapshot()
+    returncode = subprocess.call(cmd)
+    record = _delta(start, _snapshot(), stage, 'ok' if returncode == 0 else 'failed')
+    # This process only waits for the command, so its own figures are noise
+    for field in ('cpu_user_s', 'cpu_system_s', 'peak_rss_mb'):
+        del record[field]
+    record['command'] = cmd
+    record['returncode'] = returncode
+    if returncode == 0 and rows_file and Path(rows_file).exists():
+        record['rows'] = count_rows(rows_file)
+    append_stage(metrics_path, record, run_name)
+    return returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run one command as an instrumented pipeline stage and append its metrics."
+    )
+    parser.add_argument("-m", "--metrics", required=True, help="Metrics JSON file to append to.")
+    parser.add_argument("-s", "--stage", required=True, help="Stage name.")
+    parser.add_argument("--rows_file", help="Record the row count of this file (e.g. the hit table).")
+    parser.add_argument("--profile_dir", help="Profile 'python script.py' commands with cProfile into this directory.")
+    parser.add_argument("--run_name", default="run_suis_prevalence.sh", help="Run name for a new metrics file.")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="Command to run (after --).")
+    args = parser.parse_args()
+
+    cmd = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not cmd:
+        parser.error("no command given")
+    exit(run_command(cmd, args.metrics, args.stage, args.rows_file, args.profile_dir, args.run_name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+S. suis k-mer Prefilter for tBLASTn
+===================================
+
+tblastn scans all six frames of every genome for every query, although most
+antigen-genome pairs of a large candidate panel have no hit at all.  This
+module builds a persistent index of the translated k-mers (amino-acid words,
+default k=7) of every genome in the merged genome FASTA, and restricts each
+tblastn run to the genomes sharing at least ``min_seeds`` k-mers with the
+query (via ``-seqidlist``; ``-dbsize`` keeps e-values those of the full
+database).
+
+The index is array-backed and compact: genomes of one species share most of
+their k-mers, so instead of one k-mer list per genome it stores the sorted
+distinct k-mers once, each with a "color" (the set of genomes containing
+it), and one packed genome bitmap per distinct color:
+
+    kmers.npy       sorted distinct k-mer codes (uint32 for k <= 7)
+    colors.npy      color ID of every k-mer (uint32)
+    color_sets.npy  packed genome bitmap per color (uint8, colors x bytes)
+    meta.json       k, genomes (assembly, contigs, bases) and source stamps
+
+Prefiltering trades recall for speed; ``prefilter_recall`` measures the
+fraction of passing (antigen, genome) pairs of a full search that the
+prefilter keeps.
+
+Usage:
+    python kmer_prefilter.py build -f all_suis_genomes.fna --contig_index contig_index.tsv -o kmer_index
+    python kmer_prefilter.py search -i kmer_index -q query_antigens.fasta -d suis_db -o blast_results.tsv
+    python kmer_prefilter.py recall -i kmer_index -q query_antigens.fasta -b full_blast_results.tsv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from blast_search import read_query_records, run_tblastn
+from file_stamps import file_stamp
+from genome_index import load_contig_index, resolve_genome
+
+INDEX_DIR_NAME = 'kmer_index'
+META_NAME = 'meta.json'
+INDEX_VERSION = 1
+DEFAULT_K = 7
+DEFAULT_MIN_SEEDS = 3
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+_INVALID = 255
+# Standard / bacterial (table 11) code in TCAG order
+_CODONS_TCAG = 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'
+
+
+def _lookup_tables():
+    nucleotides = np.full(256, 4, dtype=np.uint8)
+    for code, base in enumerate('ACGT'):
+        nucleotides[ord(base)] = nucleotides[ord(base.lower())] = code
+    residues = np.full(256, _INVALID, dtype=np.uint8)
+    for code, residue in enumerate(AMINO_ACIDS):
+        residues[ord(residue)] = residues[ord(residue.lower())] = code
+    # Codon (16*b1 + 4*b2 + b3 in ACGT codes) -> residue code; 64 = codon with N
+    codons = np.full(65, _INVALID, dtype=np.uint8)
+    for i, b1 in enumerate('TCAG'):
+        for j, b2 in enumerate('TCAG'):
+            for m, b3 in enumerate('TCAG'):
+                residue = _CODONS_TCAG[16 * i + 4 * j + m]
+                if residue != '*':
+                    codon = 16 * 'ACGT'.index(b1) + 4 * 'ACGT'.index(b2) + 'ACGT'.index(b3)
+                    codons[codon] = AMINO_ACIDS.index(residue)
+    return nucleotides, residues, codons
+
+
+_NUCLEOTIDES, _RESIDUES, _CODON_TABLE = _lookup_tables()
+
+
+def code_dtype(k):
+    return np.uint32 if len(AMINO_ACIDS) ** k <= 2 ** 32 else np.uint64
+
+
+def six_frames(sequence):
+    """Residue-code arrays of the six reading frames of a nucleotide sequence (bytes)"""
+    forward = _NUCLEOTIDES[np.frombuffer(sequence, dtype=np.uint8)]
+    reverse = np.where(forward < 4, 3 - forward, 4)[::-1]
+    frames = []
+    for strand in (forward, reverse):
+        for offset in range(3):
+            n = (strand.size - offset) // 3
+            codons = strand[offset:offset + 3 * n].reshape(n, 3).astype(np.int16)
+            index = codons[:, 0] * 16 + codons[:, 1] * 4 + codons[:, 2]
+            index[(codons == 4).any(axis=1)] = 64
+            frames.append(_CODON_TABLE[index])
+    return frames
+
+
+def kmer_codes(residues, k):
+    """Codes of the k-mers of a residue-code array that span no stop or unknown residue"""
+    n = residues.size - k + 1
+    dtype = code_dtype(k)
+    if n <= 0:
+        return np.empty(0, dtype=dtype)
+    invalid = np.concatenate([[0], np.cumsum(residues == _INVALID)])
+    valid = invalid[k:] - invalid[:n] == 0
+    codes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        codes = codes * len(AMINO_ACIDS) + residues[j:j + n]
+    return codes[valid].astype(dtype)
+
+
+def sorted_unique(codes):
+    """Sorted distinct values (a plain sort is much faster than np.unique on large integer arrays)"""
+    codes = np.sort(codes)
+    keep = np.empty(codes.size, dtype=bool)
+    keep[:1] = True
+    np.not_equal(codes[1:], codes[:-1], out=keep[1:])
+    return codes[keep]
+
+
+def protein_kmers(sequence, k):
+    """Distinct k-mer codes of a protein sequence"""
+    residues = _RESIDUES[np.frombuffer(sequence.encode(), dtype=np.uint8)]
+    return sorted_unique(kmer_codes(residues, k))
+
+
+def genome_kmers(contig_sequences, k):
+    """Distinct translated k-mer codes over all contigs of a genome"""
+    codes = [kmer_codes(frame, k) for sequence in contig_sequences for frame in six_frames(sequence)]
+    return sorted_unique(np.concatenate(codes)) if codes else np.empty(0, dtype=code_dtype(k))
+
+
+def iter_genomes(merged_fasta, contig_index=None):
+    """
+    Yield (assembly, [(contig ID, sequence bytes)]) for each run of contigs
+    belonging to the same assembly in a merged FASTA.
+    """
+    assembly, contigs, contig_id, chunks = None, [], None, []
+    with open(merged_fasta, 'rb') as fh:
+        for line in fh:
+            if line.startswith(b'>'):
+                if contig_id is not None:
+                    contigs.append((contig_id, b''.join(chunks)))
+                contig_id = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ''
+                chunks = []
+                owner = resolve_genome(contig_id, contig_index)
+                if owner != assembly:
+                    if contigs:
+                        yield assembly, contigs
+                    assembly, contigs = owner, []
+            else:
+                chunks.append(line.rstrip())
+    if contig_id is not None:
+        contigs.append((contig_id, b''.join(chunks)))
+    if contigs:
+        yield assembly, contigs
+
+
+def _dense_unique(values, n):
+    """np.unique(values, return_inverse=True) for small non-negative integers (no sort)"""
+    present = np.zeros(n, dtype=bool)
+    present[values] = True
+    unique = np.flatnonzero(present)
+    lookup = np.zeros(n, dtype=np.uint32)
+    lookup[unique] = np.arange(unique.size, dtype=np.uint32)
+    return unique, lookup[values]
+
+
+def _set_bit(rows, genome):
+    rows[:, genome // 8] |= np.uint8(0x80 >> (genome % 8))
+    return rows
+
+
+def build_kmer_index(merged_fasta, index_dir, contig_index_path=None, k=DEFAULT_K):
+    """
+    Build the colored k-mer index of a merged genome FASTA.
+
+    Genomes are added one at a time: the k-mers a genome shares with the index
+    move from their color to the color "old set + this genome" (one new color
+    per distinct old color), and its new k-mers are inserted with the color
+    {this genome}.  Unused colors are dropped as the index grows.
+
+    Args:
+        merged_fasta (str): Merged genome FASTA (genome_merge.py output).
+        index_dir (str): Output directory (replaced atomically).
+        contig_index_path (str): contig_index.tsv grouping contigs into assemblies
+            (default: accession parsing of the contig IDs).
+        k (int): Word length in amino acids.
+
+    Returns:
+        Path: The index directory.
+    """
+    contig_index = load_contig_index(contig_index_path) if contig_index_path else None
+    dtype = code_dtype(k)
+    kmers = np.empty(0, dtype=dtype)
+    colors = np.empty(0, dtype=np.uint32)
+    color_sets = np.zeros((0, 1), dtype=np.uint8)
+    genomes, genome_ids = [], {}
+    compacted = 0
+
+    for assembly, contigs in iter_genomes(merged_fasta, contig_index):
+        g = genome_ids.get(assembly)
+        if g is None:
+            g = genome_ids[assembly] = len(genomes)
+            genomes.append({'assembly': assembly, 'contigs': [], 'bases': 0})
+            if g // 8 >= color_sets.shape[1]:
+                color_sets = np.pad(color_sets, ((0, 0), (0, color_sets.shape[1])))
+        genomes[g]['contigs'].extend(contig for contig, _ in contigs)
+        genomes[g]['bases'] += sum(len(sequence) for _, sequence in contigs)
+
+        codes = genome_kmers([sequence for _, sequence in contigs], k)
+        pos = np.searchsorted(kmers, codes)
+        found = pos < kmers.size
+        found[found] = kmers[pos[found]] == codes[found]
+
+        shared = pos[found]
+        old, inverse = _dense_unique(colors[shared], color_sets.shape[0])
+        # One new color per old color of the shared k-mers, plus {g} for the new ones
+        new_sets = np.concatenate([color_sets[old], np.zeros((1, color_sets.shape[1]), dtype=np.uint8)])
+        new_sets = _set_bit(new_sets, g)
+        base = color_sets.shape[0]
+        colors[shared] = inverse + np.uint32(base)
+        color_sets = np.concatenate([color_sets, new_sets])
+
+        fresh = ~found
+        kmers = np.insert(kmers, pos[fresh], codes[fresh])
+        colors = np.insert(colors, pos[fresh], np.uint32(base + old.size))
+
+        if color_sets.shape[0] > 2 * compacted + 4096:
+            colors, color_sets = _compact(colors, color_sets)
+            compacted = color_sets.shape[0]
+        if len(genomes) % 50 == 0:
+            print(f"  {len(genomes)} genomes indexed ({kmers.size:,} k-mers, {color_sets.shape[0]:,} colors)")
+
+    colors, color_sets = _compact(colors, color_sets)
+    print(f"  {len(genomes)} genomes indexed ({kmers.size:,} k-mers, {color_sets.shape[0]:,} colors)")
+    meta = {
+        'version': INDEX_VERSION,
+        'k': k,
+        'genomes': genomes,
+        'source': _source_stamps(merged_fasta, contig_index_path),
+    }
+    _write_index(index_dir, kmers, colors, color_sets, meta)
+    return Path(index_dir)
+
+
+def _compact(colors, color_sets):
+    """Drop colors no k-mer refers to any more"""
+    used, remapped = _dense_unique(colors, color_sets.shape[0])
+    return remapped, color_sets[used]
+
+
+def _source_stamps(merged_fasta, contig_index_path):
+    return {'fasta': [str(merged_fasta), file_stamp(merged_fasta)],
+            'contig_index': [str(contig_index_path), file_stamp(contig_index_path)] if contig_index_path else None}
+
+
+def _write_index(index_dir, kmers, colors, color_sets, meta):
+    index_dir = Path(index_dir)
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{index_dir.name}.', dir=index_dir.parent))
+    np.save(tmp_dir / 'kmers.npy', kmers)
+    np.save(tmp_dir / 'colors.npy', colors)
+    np.save(tmp_dir / 'color_sets.npy', color_sets)
+    with open(tmp_dir / META_NAME, 'w') as fh:
+        json.dump(meta, fh)
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    os.replace(tmp_dir, index_dir)
+
+
+def index_is_current(index_dir, merged_fasta, contig_index_path=None, k=DEFAULT_K):
+    meta_path = Path(index_dir) / META_NAME
+    if not meta_path.exists():
+        return False
+    with open(meta_path) as fh:
+        meta = json.load(fh)
+    return (meta.get('version') == INDEX_VERSION and meta.get('k') == k
+            and meta.get('source') == _source_stamps(merged_fasta, contig_index_path))
+
+
+def ensure_kmer_index(merged_fasta, index_dir, contig_index_path=None, k=DEFAULT_K):
+    """Build the index unless a current one (same sources and k) exists"""
+    if index_is_current(index_dir, merged_fasta, contig_index_path, k):
+        print(f"  k-mer index up to date: {index_dir}")
+        return Path(index_dir)
+    print(f"  Building k-mer index (k={k}) from {merged_fasta}...")
+    return build_kmer_index(merged_fasta, index_dir, contig_index_path, k)
+
+
+class KmerIndex:
+    """Read-only view of an index directory (k-mer arrays are memory-mapped)"""
+
+    def __init__(self, index_dir):
+        self.path = Path(index_dir)
+        with open(self.path / META_NAME) as fh:
+            self.meta = json.load(fh)
+        self.k = self.meta['k']
+        self.genomes = [g['assembly'] for g in self.meta['genomes']]
+        self.bases = np.array([g['bases'] for g in self.meta['genomes']], dtype=np.int64)
+        self.kmers = np.load(self.path / 'kmers.npy', mmap_mode='r')
+        self.colors = np.load(self.path / 'colors.npy', mmap_mode='r')
+        self.color_sets = np.load(self.path / 'color_sets.npy')
+
+    @property
+    def fingerprint(self):
+        payload = json.dumps([self.meta['version'], self.k, self.meta['source']], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:20]
+
+    def seed_counts(self, sequence):
+        """Number of distinct query k-mers found in each genome"""
+        codes = protein_kmers(sequence, self.k)
+        pos = np.searchsorted(self.kmers, codes)
+        inside = pos < self.kmers.size
+        pos, codes = pos[inside], codes[inside]
+        pos = pos[self.kmers[pos] == codes]
+        color_ids, weights = np.unique(self.colors[pos], return_counts=True)
+        bits = np.unpackbits(self.color_sets[color_ids], axis=1, count=len(self.genomes))
+        return weights @ bits if color_ids.size else np.zeros(len(self.genomes), dtype=np.int64)
+
+    def candidates(self, sequence, min_seeds=DEFAULT_MIN_SEEDS):
+        """Indices of the genomes sharing at least min_seeds k-mers with the query"""
+        return np.flatnonzero(self.seed_counts(sequence) >= min_seeds)
+
+    def contigs(self, genome_indices):
+        return [contig for g in genome_indices for contig in self.meta['genomes'][g]['contigs']]
+
+
+def work_report(index, records, candidates):
+    """
+    Searched vs. skipped work of a prefiltered search.
+
+    tblastn time grows with query length x database length, so the saved
+    fraction weights every query by its length and the bases of the genomes
+    it skips.
+    """
+    total = index.bases.sum()
+    full = sum(len(sequence) * total for _, sequence in records)
+    searched = sum(len(sequence) * index.bases[candidates[qseqid]].sum() for qseqid, sequence in records)
+    pairs = len(records) * len(index.genomes)
+    kept = sum(len(c) for c in candidates.values())
+    return {
+        'queries': len(records),
+        'genomes': len(index.genomes),
+        'searched_pairs': kept,
+        'skipped_pairs': pairs - kept,
+        'work_saved': 1 - searched / full if full else 0.0,
+        'per_query': {qseqid: len(candidates[qseqid]) for qseqid, _ in records},
+    }
+
+
+class PrefilteredSearch:
+    """
+    tblastn runner that only searches the genomes passing the k-mer prefilter.
+
+    Has the signature of blast_search.run_tblastn, so it can be passed as the
+    runner of blast_search.cached_tblastn (with ``cache_params`` as its cache
+    parameters, so prefiltered and full hits are cached apart).  Queries with
+    the same candidate genomes share one tblastn run; queries without
+    candidates are not searched.  ``report`` holds the work_report() of the
+    last call.
+    """
+
+    def __init__(self, index_dir, min_seeds=DEFAULT_MIN_SEEDS, runner=None):
+        self.index = KmerIndex(index_dir)
+        self.min_seeds = min_seeds
+        self.runner = runner or run_tblastn
+        self.report = None
+
+    @property
+    def cache_params(self):
+        return {'prefilter_index': self.index.fingerprint, 'prefilter_min_seeds': self.min_seeds}
+
+    def __call__(self, query_fasta, db_name, blast_output, evalue, threads, extra_args=()):
+        from sharded_search import database_length
+
+        records = read_query_records(query_fasta)
+        candidates = {qseqid: self.index.candidates(sequence, self.min_seeds)
+                      for qseqid, sequence in records}
+        self.report = work_report(self.index, records, candidates)
+
+        groups = {}
+        for qseqid, sequence in records:
+            if candidates[qseqid].size:
+                groups.setdefault(tuple(candidates[qseqid]), []).append((qseqid, sequence))
+
+        rows = {qseqid: [] for qseqid, _ in records}
+        if groups:
+            db_args = [] if '-dbsize' in extra_args else ['-dbsize', str(database_length(db_name))]
+            with tempfile.TemporaryDirectory(dir=Path(blast_output).parent) as tmp_dir:
+                for i, (genome_ids, group) in enumerate(groups.items()):
+                    group_query = Path(tmp_dir) / f'query_{i}.fasta'
+                    seqidlist = Path(tmp_dir) / f'seqids_{i}.txt'
+                    group_output = Path(tmp_dir) / f'hits_{i}.tsv'
+                    with open(group_query, 'w') as fh:
+                        for qseqid, sequence in group:
+                            fh.write(f">{qseqid}\n{sequence}\n")
+                    with open(seqidlist, 'w') as fh:
+                        fh.writelines(f"{contig}\n" for contig in self.index.contigs(genome_ids))
+                    self.runner(group_query, db_name, group_output, evalue, threads,
+                                list(extra_args) + ['-seqidlist', str(seqidlist)] + db_args)
+                    with open(group_output) as fh:
+                        for line in fh:
+                            qseqid = line.split('\t', 1)[0]
+                            if qseqid in rows:
+                                rows[qseqid].append(line if line.endswith('\n') else line + '\n')
+
+        with open(blast_output, 'w') as out:
+            for qseqid, _ in records:
+                out.writelines(rows[qseqid])
+        return self.report
+
+
+def print_report(report):
+    print(f"  Prefilter: {report['searched_pairs']} of {report['queries'] * report['genomes']} "
+          f"query-genome pairs searched, {report['work_saved']:.1%} of the tblastn work saved")
+
+
+def prefilter_recall(index_dir, query_fasta, blast_file, min_identity, min_coverage,
+                     min_seeds=DEFAULT_MIN_SEEDS, contig_index=None, coverage_mode='hsp'):
+    """
+    Recall of the prefilter against a full (unfiltered) search.
+
+    Returns:
+        dict: 'passing_pairs' of the full search, 'kept_pairs' among them and
+              'recall', plus the work_report() of the prefilter.
+    """
+    from aggregation import annotate_hits, load_hits, passing_mask, summary_columns
+
+    index = KmerIndex(index_dir)
+    records = read_query_records(query_fasta)
+    candidates = {qseqid: index.candidates(sequence, min_seeds) for qseqid, sequence in records}
+    kept = {(qseqid, index.genomes[g]) for qseqid, genomes in candidates.items() for g in genomes}
+
+    query_lengths = {qseqid: len(sequence) for qseqid, sequence in records}
+    df = load_hits(blast_file, columns=summary_columns(coverage_mode))
+    df = annotate_hits(df, query_lengths, contig_index, coverage_mode, min_identity)
+    passing = df[passing_mask(df, min_identity, min_coverage)]
+    pairs = set(zip(passing['qseqid'].astype(str), passing['genome_accession'].astype(str)))
+    found = len(pairs & kept)
+    return {
+        'passing_pairs': len(pairs),
+        'kept_pairs': found,
+        'recall': found / len(pairs) if pairs else 1.0,
+        'work': work_report(index, records, candidates),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="k-mer prefilter index for tblastn searches.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build the k-mer index of a merged genome FASTA.")
+    build.add_argument("-f", "--fasta", required=True, help="Merged genome FASTA (genome_merge.py output).")
+    build.add_argument("-o", "--output", required=True, help="Index directory.")
+    build.add_argument("--contig_index", help="contig_index.tsv grouping contigs into assemblies.")
+    build.add_argument("-k", type=int, default=DEFAULT_K, help=f"Word length in amino acids (default: {DEFAULT_K}).")
+
+    search = commands.add_parser("search", help="Run tblastn on the genomes passing the prefilter.")
+    search.add_argument("-i", "--index", required=True, help="Index directory.")
+    search.add_argument("-q", "--query_fasta", required=True, help="Protein query FASTA.")
+    search.add_argument("-d", "--db", required=True, help="BLAST nucleotide database.")
+    search.add_argument("-o", "--output", required=True, help="Tabular (fmt 6) output path.")
+    search.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    search.add_argument("--threads", type=int, default=4, help="tblastn threads (default: 4).")
+    search.add_argument("--min_seeds", type=int, default=DEFAULT_MIN_SEEDS,
+                        help=f"Shared k-mers needed to search a genome (default: {DEFAULT_MIN_SEEDS}).")
+
+    recall = commands.add_parser("recall", help="Recall of the prefilter against a full search.")
+    recall.add_argument("-i", "--index", required=True, help="Index directory.")
+    recall.add_argument("-q", "--query_fasta", required=True, help="Protein query FASTA.")
+    recall.add_argument("-b", "--blast", required=True, help="fmt 6 output of the full (unfiltered) search.")
+    recall.add_argument("--min_identity", type=float, default=70.0, help="Minimum percent identity (default: 70.0).")
+    recall.add_argument("--min_coverage", type=float, default=0.8, help="Minimum coverage fraction (default: 0.8).")
+    recall.add_argument("--min_seeds", type=int, default=DEFAULT_MIN_SEEDS,
+                        help=f"Shared k-mers needed to search a genome (default: {DEFAULT_MIN_SEEDS}).")
+    recall.add_argument("--contig_index", help="contig_index.tsv (contig -> assembly).")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_kmer_index(args.fasta, args.output, args.contig_index, args.k)
+        print(f"k-mer index written to: {args.output}")
+    elif args.command == "search":
+        report = PrefilteredSearch(args.index, args.min_seeds)(
+            args.query_fasta, args.db, args.output, args.evalue, args.threads)
+        print_report(report)
+        print(f"BLAST results: {args.output}")
+    else:
+        contig_index = load_contig_index(args.contig_index) if args.contig_index else None
+        result = prefilter_recall(args.index, args.query_fasta, args.blast, args.min_identity, args.min_coverage, args.min_seeds, contig_index)
+        print_report(result['work'])
+        print(f"  Recall: {result['kept_pairs']} of {result['passing_pairs']} passing "
+              f"antigen-genome pairs kept ({result['recall']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,73 @@
 #!/usr/bin/env python3
 import argparse
-import pandas as pd
-import re
-from Bio import SeqIO
+import csv
+import os
 
-# Helper function to safely extract accession
-def extract_accession(sseqid):
-    match = re.search(r'([A-Z]{2}_\d+\.\d+)', sseqid)
-    return match.group(1) if match else sseqid # Return original sseqid if no match
+# pandas, numpy and Biopython take most of a small run's wall time just to
+# import, so they are imported where needed: a small hsp-mode table goes
+# through the stdlib path below (fast_parse_blast_output) without them.
+from genome_index import load_contig_index, resolve_genome
+
+# hsp_coverage.COVERAGE_MODES, without importing pandas
+COVERAGE_MODES = ('hsp', 'merged')
+STATS_COLUMNS = ['genome_accession', 'hit_count', 'max_identity', 'mean_coverage']
+# Larger tables are parsed faster by pandas than the import costs
+FAST_PATH_MAX_BYTES = 8 << 20
+# Strings read_csv turns into NaN or booleans; tables holding them take the pandas path
+_PANDAS_SPECIAL = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                             '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+                             'True', 'TRUE', 'true', 'False', 'FALSE', 'false'])
+_SEQUENCE_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+def fasta_lengths(path):
+    """
+    (ID, sequence length) of every FASTA record, read as Bio.SeqIO's 'fasta'
+    parser reads it (ID = first word of the title, whitespace not counted).
+    """
+    records = []
+    with open(path) as fh:
+        line = fh.readline()
+        if line and not line.startswith('>'):
+            raise ValueError("FASTA file does not start with '>' (comments before the first record are not allowed)")
+        while line:
+            title, length = line[1:].split(None, 1), 0
+            for line in fh:
+                if line[0] == '>':
+                    break
+                length += len(line.translate(_SEQUENCE_WHITESPACE))
+            else:
+                line = ''
+            records.append((title[0] if title else '', length))
+    return records
+
+def read_query_lengths(query_fasta):
+    """Return {query ID: length} for every record in the query FASTA (exits on error)"""
+    try:
+        query_lengths = {}
+        for query_id, length in fasta_lengths(query_fasta):
+            query_lengths[query_id] = length
+            print(f"Query sequence ID: {query_id}, Length: {length}")
+    except FileNotFoundError:
+        print(f"Error: Query FASTA file not found at {query_fasta}")
+        exit(1)
+    except Exception as e:
+        print(f"Error reading query FASTA file {query_fasta}: {e}")
+        exit(1)
+
+    if not query_lengths:
+        print(f"Error: No sequences found in query FASTA file {query_fasta}")
+        exit(1)
+    if 0 in query_lengths.values():
+        print("Error: Query sequence length is 0.")
+        exit(1)
+    return query_lengths
+
+def stats_columns(query_lengths):
+    """Columns of the genome statistics: with 'antigen' whenever the query FASTA holds several records"""
+    return ['antigen'] + STATS_COLUMNS if len(query_lengths) > 1 else list(STATS_COLUMNS)
 
 def parse_blast_output(blast_file, total_genomes, query_fasta,
-                       min_identity, min_coverage):
+                       min_identity, min_coverage, contig_index=None, coverage_mode='hsp'):
     """
     Parses BLAST tabular output (format 6), filters by identity/coverage,
     and calculates prevalence statistics.
@@ -18,74 +75,67 @@ def parse_blast_output(blast_file, total_genomes, query_fasta,
     Args:
         blast_file (str): Path to the BLAST output file (fmt 6).
         total_genomes (int): Total number of genomes from metadata.
-        query_fasta (str): Path to the query protein FASTA file.
+        query_fasta (str): Path to the query protein FASTA file (every record is used).
         min_identity (float): Minimum percent identity threshold.
         min_coverage (float): Minimum query coverage threshold (fraction, e.g., 0.8).
+        contig_index (str): Optional contig_index.tsv mapping contigs to assemblies.
+        coverage_mode (str): 'hsp' (coverage of each HSP) or 'merged' (union of the
+            query intervals of all HSPs per antigen and genome).
 
     Returns:
         tuple: (prevalence_percentage, hit_stats_df)
-               - prevalence_percentage (float): Percentage of genomes with hits passing filters.
-               - hit_stats_df (pd.DataFrame): DataFrame with stats per hit genome.
+               - prevalence_percentage (float): Percentage of genomes with hits passing filters
+                 (for any antigen when the query FASTA holds several).
+               - hit_stats_df (pd.DataFrame): DataFrame with stats per hit genome; an
+                 'antigen' column is added when the query FASTA holds several
+                 records (whatever passes), so the schema does not depend on the hits.
     """
+    import pandas as pd
+    from aggregation import annotate_hits, genome_stats, load_hits, passing_mask, summarize_antigens, summary_columns
+
     try:
+        # Query lengths for every sequence in the FASTA (multi-antigen aware)
+        query_lengths = read_query_lengths(query_fasta)
+        multi_antigen = len(query_lengths) > 1
+
         # Read BLAST results
-        cols = ['qseqid','sseqid','pident','length','mismatch','gapopen',
-                'qstart','qend','sstart','send','evalue','bitscore']
-        df = pd.read_csv(blast_file, sep='\t', names=cols, header=None)
+        df = load_hits(blast_file, columns=summary_columns(coverage_mode))
 
         if df.empty:
             print("No hits found in BLAST results.")
-            return 0.0, pd.DataFrame()
-
-        # Calculate Query length from the first sequence in the FASTA
-        try:
-            query_seq = next(SeqIO.parse(query_fasta, 'fasta'))
-            qlen = len(query_seq.seq)
-            print(f"Query sequence ID: {query_seq.id}, Length: {qlen}")
-        except FileNotFoundError:
-            print(f"Error: Query FASTA file not found at {query_fasta}")
-            exit(1)
-        except StopIteration:
-             print(f"Error: No sequences found in query FASTA file {query_fasta}")
-             exit(1)
-        except Exception as e:
-            print(f"Error reading query FASTA file {query_fasta}: {e}")
-            exit(1)
-
-        if qlen == 0:
-            print("Error: Query sequence length is 0.")
-            exit(1)
-
-        # Add genome accession column
-        df['genome_accession'] = df['sseqid'].apply(extract_accession)
-        # Calculate coverage (alignment length / query length)
-        # Note: 'length' in BLAST fmt 6 is the alignment length
-        df['coverage'] = df['length'] / qlen
+            return 0.0, pd.DataFrame(columns=stats_columns(query_lengths))
+
+        unknown = set(df['qseqid'].unique()) - set(query_lengths)
+        if unknown:
+            print(f"Warning: {len(unknown)} query IDs in BLAST output are not in {query_fasta}; their hits are ignored.")
+
+        # Add genome accession and coverage (alignment length / length of that hit's query)
+        # Note: 'length' in BLAST fmt 6 is the alignment length; merged mode
+        # uses the union of qstart-qend intervals of each antigen/genome pair instead
+        df = annotate_hits(df, query_lengths, _load_index(contig_index), coverage_mode, min_identity)
 
         # Apply identity and coverage filters
-        print(f"Applying filters: Identity >= {min_identity}%, Coverage >= {min_coverage*100:.1f}%")
-        filt = df[(df['pident'] >= min_identity) & (df['coverage'] >= min_coverage)].copy() # Use .copy() to avoid SettingWithCopyWarning
+        print(f"Applying filters: Identity >= {min_identity}%, Coverage >= {min_coverage*100:.1f}%"
+              f"{' (merged HSPs)' if coverage_mode == 'merged' else ''}")
+        filt = df[passing_mask(df, min_identity, min_coverage)]
 
         if filt.empty:
             print("No hits passed the identity/coverage filters.")
-            return 0.0, pd.DataFrame()
+            return 0.0, pd.DataFrame(columns=stats_columns(query_lengths))
 
-        # Aggregate stats per genome: count hits, max identity, mean coverage
+        # Aggregate stats per genome (per antigen and genome for a multi-record query FASTA)
         print("Aggregating statistics per genome...")
-        grp = filt.groupby('genome_accession')
-        stats = pd.DataFrame({
-            'hit_count': grp.size(),
-            'max_identity': grp['pident'].max(),
-            'mean_coverage': grp['coverage'].mean() # Mean coverage of hits passing filters
-        }).reset_index()
-
-        # Calculate prevalence percentage
-        num_hit_genomes = stats.shape[0]
-        prevalence_percentage = (num_hit_genomes / total_genomes) * 100 if total_genomes > 0 else 0
+        if multi_antigen:
+            stats = genome_stats(filt, by=('qseqid', 'genome_accession')).rename(columns={'qseqid': 'antigen'})
+            summary = summarize_antigens(df, query_lengths, total_genomes, min_identity, min_coverage)
+            for row in summary.itertuples():
+                print(f"  {row.antigen}: {row.hit_genomes} genomes ({row.prevalence_percent:.2f}%)")
+        else:
+            stats = genome_stats(filt)
 
-        # Format output DataFrame
-        stats['max_identity'] = stats['max_identity'].round(1)
-        stats['mean_coverage'] = (stats['mean_coverage'] * 100).round(1) # Convert coverage back to percentage for output
+        # Calculate prevalence percentage (genomes with a passing hit for any antigen)
+        num_hit_genomes = filt['genome_accession'].nunique()
+        prevalence_percentage = (num_hit_genomes / total_genomes) * 100 if total_genomes > 0 else 0
 
         print(f"\n--- Results Summary ---")
         print(f"Total genomes analyzed (from metadata): {total_genomes}")
@@ -102,6 +152,195 @@ def parse_blast_output(blast_file, total_genomes, query_fasta,
         print(f"An error occurred during BLAST parsing: {e}")
         exit(1)
 
+def _load_index(contig_index):
+    """Load an optional contig index, falling back to accession parsing when absent"""
+    if contig_index and os.path.exists(contig_index):
+        print(f"Using contig index: {contig_index}")
+        return load_contig_index(contig_index)
+    return None
+
+def can_use_fast_path(blast_file, coverage_mode='hsp'):
+    """Whether fast_parse_blast_output() may handle blast_file: a small hsp-mode text table without a hit store"""
+    if coverage_mode != 'hsp' or not os.path.isfile(blast_file):
+        return False
+    # A sibling hit store (hit_store.store_path()) is what load_hits() would read
+    if os.path.isdir(f'{blast_file}.hits'):
+        return False
+    # A column sidecar (hit_store.columns_path()) means a non-standard column set
+    if os.path.exists(f'{blast_file}.columns'):
+        return False
+    return os.path.getsize(blast_file) <= FAST_PATH_MAX_BYTES
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+def _read_hit_rows(blast_file):
+    """
+    (qseqid, sseqid, pident, length) of every hit, or None when read_csv
+    could type the table differently (numeric IDs, integer identities,
+    NaN markers, malformed rows).
+    """
+    hits = []
+    numeric_qseqid = numeric_sseqid = integer_pident = True
+    with open(blast_file) as fh:
+        for line in fh:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 12:
+                if line.strip('\n'):
+                    return None
+                continue   # read_csv skips blank lines
+            qseqid, sseqid, pident, length = fields[:4]
+            if (qseqid in _PANDAS_SPECIAL or sseqid in _PANDAS_SPECIAL or pident in _PANDAS_SPECIAL
+                    or '_' in pident or '_' in length):
+                return None
+            try:
+                hit = (qseqid, sseqid, float(pident), int(length))
+            except ValueError:
+                return None
+            numeric_qseqid = numeric_qseqid and _is_number(qseqid)
+            numeric_sseqid = numeric_sseqid and _is_number(sseqid)
+            integer_pident = integer_pident and pident.strip().lstrip('+-').isdigit()
+            hits.append(hit)
+    if hits and (numeric_qseqid or numeric_sseqid or integer_pident):
+        return None
+    return hits
+
+def _round1(value):
+    # Series.round(1): rint(value * 10) / 10
+    return round(value * 10) / 10
+
+def _genome_stats_row(values):
+    """hit_count, max_identity and mean_coverage of one group as aggregation.genome_stats() computes them"""
+    # Kahan-compensated sum, as pandas' grouped mean
+    total = compensation = 0.0
+    for _, coverage in values:
+        y = coverage - compensation
+        t = total + y
+        compensation = t - total - y
+        total = t
+    return [len(values), _round1(max(pident for pident, _ in values)), _round1(total / len(values) * 100)]
+
+def fast_parse_blast_output(blast_file, total_genomes, query_fasta,
+                            min_identity, min_coverage, contig_index=None):
+    """
+    parse_blast_output() for small tables in hsp coverage mode, in plain
+    Python (no pandas, numpy or Biopython import).
+
+    Genome statistics are grouped, ordered, averaged and rounded as
+    aggregation.genome_stats() does, so write_stats() produces the same file
+    as the pandas path.
+
+    Returns:
+        tuple: (prevalence_percentage, columns, rows) for write_stats(), or
+               None when the table has to be parsed by parse_blast_output().
+    """
+    try:
+        hits = _read_hit_rows(blast_file)
+        if hits is None:
+            return None
+        query_lengths = read_query_lengths(query_fasta)
+        columns = stats_columns(query_lengths)
+        multi_antigen = len(query_lengths) > 1
+        if not hits:
+            print("No hits found in BLAST results.")
+            return 0.0, columns, []
+
+        unknown = {hit[0] for hit in hits} - set(query_lengths)
+        if unknown:
+            print(f"Warning: {len(unknown)} query IDs in BLAST output are not in {query_fasta}; their hits are ignored.")
+        index = _load_index(contig_index)
+
+        print(f"Applying filters: Identity >= {min_identity}%, Coverage >= {min_coverage*100:.1f}%")
+        genomes = {}
+        passing = []
+        for qseqid, sseqid, pident, length in hits:
+            query_length = query_lengths.get(qseqid)
+            if query_length is None or pident < min_identity:
+                continue
+            coverage = length / query_length
+            if coverage < min_coverage:
+                continue
+            genome = genomes.get(sseqid)
+            if genome is None:
+                genome = genomes[sseqid] = resolve_genome(sseqid, index)
+            passing.append((qseqid, genome, pident, coverage))
+
+        if not passing:
+            print("No hits passed the identity/coverage filters.")
+            return 0.0, columns, []
+
+        print("Aggregating statistics per genome...")
+        groups = {}
+        for qseqid, genome, pident, coverage in passing:
+            key = (qseqid, genome) if multi_antigen else (genome,)
+            groups.setdefault(key, []).append((pident, coverage))
+        rows = [list(key) + _genome_stats_row(groups[key]) for key in sorted(groups)]
+        if multi_antigen:
+            for antigen in query_lengths:
+                hit_genomes = len({genome for qseqid, genome in groups if qseqid == antigen})
+                prevalence = hit_genomes / total_genomes * 100 if total_genomes else 0.0
+                print(f"  {antigen}: {hit_genomes} genomes ({prevalence:.2f}%)")
+
+        num_hit_genomes = len({hit[1] for hit in passing})
+        prevalence_percentage = (num_hit_genomes / total_genomes) * 100 if total_genomes > 0 else 0
+
+        print(f"\n--- Results Summary ---")
+        print(f"Total genomes analyzed (from metadata): {total_genomes}")
+        print(f"Genomes with hits passing filters: {num_hit_genomes}")
+        print(f"Prevalence (filtered): {prevalence_percentage:.2f}%")
+        print(f"-----------------------\n")
+
+        return prevalence_percentage, columns, rows
+
+    except FileNotFoundError:
+        print(f"Error: BLAST output file not found at {blast_file}")
+        exit(1)
+    except Exception as e:
+        print(f"An error occurred during BLAST parsing: {e}")
+        exit(1)
+
+def write_stats(path, columns, rows):
+    """Write genome statistics rows as DataFrame.to_csv() writes them (tab-separated, floats as '%.1f')"""
+    with open(path, 'w', newline='') as fh:
+        writer = csv.writer(fh, delimiter='\t', lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows([f'{value:.1f}' if isinstance(value, float) else value for value in row] for row in rows)
+
+def sweep_blast_output(blast_file, total_genomes, query_fasta,
+                       identity_grid, coverage_grid, evalue_grid=None, contig_index=None):
+    """
+    Prevalence of every query over a grid of identity/coverage(/e-value) thresholds.
+
+    Args:
+        blast_file (str): Path to the BLAST output file (fmt 6).
+        total_genomes (int): Total number of genomes from metadata.
+        query_fasta (str): Path to the query protein FASTA file.
+        identity_grid (array): Minimum percent identity thresholds.
+        coverage_grid (array): Minimum coverage thresholds (fractions).
+        evalue_grid (array): Optional maximum e-value thresholds.
+        contig_index (str): Optional contig_index.tsv mapping contigs to assemblies.
+
+    Returns:
+        threshold_sweep.SweepResult: Genome counts per antigen and grid point.
+    """
+    from aggregation import annotate_hits, load_hits
+    from threshold_sweep import sweep_prevalence
+
+    query_lengths = read_query_lengths(query_fasta)
+    # Hits below the loosest grid point never count, so they are not loaded
+    df = load_hits(blast_file, columns=['qseqid', 'sseqid', 'pident', 'length', 'evalue'],
+                   min_identity=min(identity_grid),
+                   max_evalue=max(evalue_grid) if evalue_grid is not None else None)
+    df = annotate_hits(df, query_lengths, _load_index(contig_index))
+    print(f"Sweeping {len(identity_grid)} identity x {len(coverage_grid)} coverage"
+          f"{f' x {len(evalue_grid)} e-value' if evalue_grid is not None else ''} thresholds...")
+    return sweep_prevalence(df, total_genomes, identity_grid, coverage_grid, evalue_grid,
+                            antigens=list(query_lengths))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -114,6 +353,17 @@ if __name__ == "__main__":
     parser.add_argument("--min_coverage", type=float, default=0.8, help="Minimum query coverage threshold (fraction, e.g., 0.8 for 80%, default: 0.8).")
     parser.add_argument("-o", "--output", default="genomes_with_hit_stats.tsv", help="Path to save the filtered hit statistics (TSV format). Default: genomes_with_hit_stats.tsv")
 
+    parser.add_argument("--coverage_mode", choices=COVERAGE_MODES, default="hsp",
+                        help="Coverage of each HSP ('hsp', default) or of the union of all HSPs of an antigen in a genome ('merged').")
+    parser.add_argument("--contig_index", help="Optional contig_index.tsv (contig -> assembly) written when merging genomes.")
+    parser.add_argument("--sweep_identity", help="Identity grid for a threshold sweep, e.g. 50:100:1 or 60,70,80.")
+    parser.add_argument("--sweep_coverage", help="Coverage grid (fractions) for a threshold sweep, e.g. 0.3:1.0:0.01.")
+    parser.add_argument("--sweep_evalue", help="Optional e-value grid for a threshold sweep, e.g. 1e-30,1e-10,1e-5.")
+    parser.add_argument("--sweep_output", default="threshold_sweep", help="Output prefix for <prefix>.tsv and <prefix>.npz (default: threshold_sweep).")
+
+    parser.add_argument("--no_fast_path", action="store_true",
+                        help="Always parse with pandas (small hsp-mode tables are otherwise parsed without it).")
+
     args = parser.parse_args()
 
     # Validate coverage input
@@ -121,19 +371,44 @@ if __name__ == "__main__":
         print("Error: --min_coverage must be between 0.0 and 1.0.")
         exit(1)
 
-    prevalence, df_stats = parse_blast_output(
-        args.input, args.total_genomes, args.query_fasta,
-        args.min_identity, args.min_coverage
-    )
+    if args.sweep_identity or args.sweep_coverage:
+        from threshold_sweep import parse_grid, write_sweep
+        identity_grid = parse_grid(args.sweep_identity or str(args.min_identity))
+        coverage_grid = parse_grid(args.sweep_coverage or str(args.min_coverage))
+        evalue_grid = parse_grid(args.sweep_evalue) if args.sweep_evalue else None
+        result = sweep_blast_output(args.input, args.total_genomes, args.query_fasta,
+                                    identity_grid, coverage_grid, evalue_grid, args.contig_index)
+        tsv_path, npz_path = write_sweep(result, args.sweep_output)
+        print(f"Threshold sweep saved to: {tsv_path} and {npz_path}")
+        exit(0)
+
+    fast = None
+    if not args.no_fast_path and can_use_fast_path(args.input, args.coverage_mode):
+        fast = fast_parse_blast_output(args.input, args.total_genomes, args.query_fasta,
+                                       args.min_identity, args.min_coverage, args.contig_index)
 
-    # Save the statistics DataFrame
-    if not df_stats.empty:
+    # Save the statistics
+    if fast is not None:
+        prevalence, output_cols, rows = fast
+        has_stats = bool(rows)
+        if has_stats:
+            write_stats(args.output, output_cols, rows)
+    else:
+        prevalence, df_stats = parse_blast_output(
+            args.input, args.total_genomes, args.query_fasta,
+            args.min_identity, args.min_coverage, args.contig_index, args.coverage_mode
+        )
+        has_stats = not df_stats.empty
         # Define output columns explicitly for order
-        output_cols = ['genome_accession', 'hit_count', 'max_identity', 'mean_coverage']
-        df_stats[output_cols].to_csv(args.output, sep='\t', index=False, float_format='%.1f')
+        output_cols = STATS_COLUMNS
+        if 'antigen' in df_stats.columns:
+            output_cols = ['antigen'] + output_cols
+        if has_stats:
+            df_stats[output_cols].to_csv(args.output, sep='\t', index=False, float_format='%.1f')
+
+    if has_stats:
         print(f"Filtered hit statistics saved to: {args.output}")
     else:
         # Create an empty file with header if no hits passed filters
-        with open(args.output, 'w') as f:
-            f.write("genome_accession\thit_count\tmax_identity\tmean_coverage\n")
+        write_stats(args.output, output_cols, [])
         print(f"No hits passed filters. Empty file with header created: {args.output}")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+S. suis Database-Free Per-Genome Search
+=======================================
+
+For a few dozen new isolates, merging the collection and running
+makeblastdb costs more than the search itself.  This module runs one
+single-threaded ``tblastn -subject <genome>`` per genome FASTA in a bounded
+process pool, with no merged FASTA and no database:
+
+* every finished genome is fed into a PrevalenceAggregator right away, so
+  partial prevalence (over the genomes finished so far) is available after
+  the first genome rather than after makeblastdb;
+* the genome directory is rescanned while the run is in progress, and files
+  added to it are searched as well (files modified in the last
+  SETTLE_SECONDS are left for the next scan, so half-copied files are not
+  picked up); ``watch`` keeps waiting that many seconds for more genomes
+  once the pool is idle;
+* compressed genomes and NCBI Datasets zip members are decompressed by the
+  worker into a temporary file, since -subject needs a path;
+* at the end the per-genome outputs are merged, in genome order and sorted
+  as sharded_search.py sorts shards, into one deterministic fmt 6 table, and
+  contig_index.tsv is written from the headers of the searched genomes, so
+  the regular aggregation (analyze_blast_results, presence matrix, ...)
+  runs on the result unchanged.
+
+E-values of -subject searches are computed against each genome rather than
+the whole collection; pass ``-dbsize`` with collection_bases() in
+extra_args (as the pipeline does) to keep the e-value cut-off of a database
+search.  The identity and coverage filters are unaffected.  tblastn's
+per-database max_target_seqs limit does not apply across genomes.
+
+Usage:
+    python per_genome_search.py -q query_antigens.fasta -g new_isolates \\
+        -o blast_results.tsv --workers 8 [--watch 60]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from blast_search import read_query_records
+from genome_index import INDEX_NAME, write_contig_index
+from genome_merge import BLOCK_SIZE, discover_genomes, scan_contigs
+from sharded_search import _merge_sorted, hit_sort_key
+from streaming_prevalence import PrevalenceAggregator
+
+SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+def _search_genome(task):
+    """Process-pool worker: tblastn one genome against the queries and sort its hits"""
+    source = task['source']
+    tmp_dir = Path(task['tmp_dir'])
+    subject = source.path
+    raw_output = tmp_dir / f"{task['key']}.raw.tsv"
+    try:
+        if not source.is_plain_file:
+            subject = tmp_dir / f"{task['key']}.fna"
+            with source.open() as src, open(subject, 'wb') as dst:
+                shutil.copyfileobj(src, dst, BLOCK_SIZE)
+        contigs = scan_contigs(subject)
+        cmd = [
+            'tblastn',
+            '-query', str(task['query_fasta']),
+            '-subject', str(subject),
+            '-evalue', str(task['evalue']),
+            '-outfmt', '6',
+            '-out', str(raw_output)
+        ] + list(task['extra_args'])
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            return task['key'], None, result.stderr or f"exit code {result.returncode}"
+        with open(raw_output) as fh:
+            lines = [line if line.endswith('\n') else line + '\n' for line in fh if line.strip()]
+    except (OSError, EOFError, ValueError, zlib.error, zipfile.BadZipFile) as e:
+        return task['key'], None, f"{source.name}: {e}"
+    finally:
+        raw_output.unlink(missing_ok=True)
+        if subject != source.path:
+            Path(subject).unlink(missing_ok=True)
+    lines.sort(key=lambda line: hit_sort_key(line, task['query_rank']))
+    with open(task['output'], 'w') as fh:
+        fh.writelines(lines)
+    return task['key'], contigs, None
+
+
+def collection_bases(genome_dir):
+    """Total sequence length of the genomes in genome_dir: the -dbsize of a database built from them"""
+    total = 0
+    for source in discover_genomes(genome_dir):
+        with source.open() as fh:
+            for line in fh:
+                if not line.startswith(b'>'):
+                    total += len(line.strip())
+    return total
+
+
+class _GenomeScanner:
+    """Genome sources of a directory (or zip bundle) that have not been searched yet"""
+
+    def __init__(self, genome_dir):
+        self.genome_dir = Path(genome_dir)
+        self.seen = set()
+        self.deferred = 0
+        self.started = time.time()
+        self.last_scan = time.monotonic()
+
+    def scan(self):
+        """Sources not returned before; files added after the start and still being written wait for a later scan"""
+        if self.seen and not self.genome_dir.is_dir():
+            return []   # a zip bundle does not change
+        fresh, self.deferred = [], 0
+        now = time.time()
+        self.last_scan = time.monotonic()
+        for source in discover_genomes(self.genome_dir):
+            if source.name in self.seen:
+                continue
+            if source.member is None:
+                try:
+                    mtime = source.path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime > self.started and now - mtime < SETTLE_SECONDS:
+                    self.deferred += 1
+                    continue
+            self.seen.add(source.name)
+            fresh.append(source)
+        return fresh
+
+
+def per_genome_tblastn(query_fasta, genome_dir, blast_output, evalue, workers, aggregator=None,
+                       extra_args=(), index_path=None, watch=0.0, poll_interval=DEFAULT_POLL_INTERVAL,
+                       max_retries=1, progress=True):
+    """
+    Search every genome FASTA with ``tblastn -subject`` in a process pool.
+
+    Args:
+        query_fasta (str): Protein query FASTA file.
+        genome_dir (str): Genome directory (rescanned during the run) or NCBI Datasets zip.
+        blast_output (str): Merged, sorted fmt 6 output path.
+        evalue (str): E-value cut-off.
+        workers (int): Concurrent tblastn processes.
+        aggregator (PrevalenceAggregator): Receives the hits of every genome as
+            soon as it finishes; its total_genomes follows the finished genomes.
+        extra_args (tuple): Additional tblastn arguments (e.g. -dbsize).
+        index_path (str): contig_index.tsv path (default: next to blast_output).
+        watch (float): Seconds to keep waiting for new genome files once idle.
+        poll_interval (float): Seconds between directory scans.
+        max_retries (int): Extra attempts for each failed genome.
+        progress (bool): Print partial prevalence after every genome.
+
+    Returns:
+        dict: Number of 'genomes', 'contigs' and 'hits', 'retries' needed,
+              'first_result' (seconds until the first genome finished) and
+              the 'index_path'.
+    """
+    records = read_query_records(query_fasta)
+    query_rank = {qseqid: i for i, (qseqid, _) in enumerate(records)}
+    blast_output = Path(blast_output)
+    index_path = Path(index_path) if index_path else blast_output.parent / INDEX_NAME
+    if aggregator is not None and aggregator.contig_index is None:
+        aggregator.contig_index = {}
+
+    scanner = _GenomeScanner(genome_dir)
+    pending = deque(scanner.scan())
+    sources, outputs, contigs_of, owner = {}, {}, {}, {}
+    attempts, retries, hits = {}, 0, 0
+    start = time.monotonic()
+    first_result = None
+    workers = max(1, int(workers))
+
+    with tempfile.TemporaryDirectory(dir=blast_output.parent) as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        last_activity = time.monotonic()
+        while True:
+            # Bounded submission: at most 2 x workers genomes queued in the pool
+            while pending and len(in_flight) < 2 * workers:
+                source = pending.popleft()
+                key = sources.get(source.name) or f"g{len(sources)}"
+                sources.setdefault(source.name, key)
+                outputs[key] = Path(tmp_dir) / f"{key}.tsv"
+                task = {'key': key, 'source': source, 'tmp_dir': tmp_dir, 'query_fasta': str(query_fasta),
+                        'evalue': evalue, 'extra_args': tuple(extra_args), 'query_rank': query_rank,
+                        'output': str(outputs[key])}
+                in_flight[pool.submit(_search_genome, task)] = (source, task)
+
+            if in_flight:
+                finished, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    source, task = in_flight.pop(future)
+                    key, contigs, error = future.result()
+                    if error is not None:
+                        attempts[key] = attempts.get(key, 0) + 1
+                        if attempts[key] > max_retries:
+                            raise RuntimeError(f"tblastn on {source.name} failed after {attempts[key]} attempts: {error}")
+                        retries += 1
+                        pending.append(source)
+                        continue
+                    for contig in contigs:
+                        if contig in owner:
+                            raise ValueError(f"{source.name}: duplicate sequence ID '{contig}' "
+                                             f"(also in {owner[contig]})")
+                        owner[contig] = source.name
+                    contigs_of[source.name] = (source.assembly, contigs)
+                    hits += _feed(outputs[key], aggregator, contigs, source.assembly, len(contigs_of))
+                    if first_result is None:
+                        first_result = time.monotonic() - start
+                    if progress and aggregator is not None:
+                        print(f"{aggregator.progress_line()} [{len(contigs_of)} genomes]", flush=True)
+                last_activity = time.monotonic()
+            else:
+                # Idle: stop unless new or still-settling genome files turn up within ``watch``
+                pending.extend(scanner.scan())
+                if pending:
+                    continue
+                if not scanner.deferred and time.monotonic() - last_activity >= watch:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            if time.monotonic() - scanner.last_scan >= poll_interval:
+                pending.extend(scanner.scan())
+
+        names = sorted(contigs_of)
+        _merge_sorted([outputs[sources[name]] for name in names], blast_output, query_rank, None)
+
+    entries = [(contig, contigs_of[name][0]) for name in names for contig in contigs_of[name][1]]
+    write_contig_index(entries, index_path)
+    return {'genomes': len(names), 'contigs': len(entries), 'hits': hits, 'retries': retries,
+            'first_result': first_result, 'index_path': index_path}
+
+
+def _feed(path, aggregator, contigs, assembly, finished):
+    """Stream one genome's hits into the aggregator; returns the number of hits"""
+    rows = 0
+    if aggregator is not None:
+        aggregator.contig_index.update((contig, assembly) for contig in contigs)
+        aggregator.total_genomes = finished
+    with open(path) as fh:
+        for line in fh:
+            rows += 1
+            if aggregator is not None:
+                aggregator.add_line(line)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run tblastn -subject on every genome FASTA in a process pool (no merged FASTA, no database)."
+    )
+    parser.add_argument("-q", "--query_fasta", required=True, help="Path to the query protein FASTA file.")
+    parser.add_argument("-g", "--genome_dir", required=True, help="Genome directory or NCBI Datasets zip bundle.")
+    parser.add_argument("-o", "--output", required=True, help="Merged tabular (fmt 6) output path.")
+    parser.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Concurrent tblastn processes (default: all cores).")
+    parser.add_argument("--min_identity", type=float, default=60.0, help="Minimum percent identity (default: 60.0).")
+    parser.add_argument("--min_coverage", type=float, default=0.8, help="Minimum query coverage (default: 0.8).")
+    parser.add_argument("--stats", help="Optional per-antigen summary TSV.")
+    parser.add_argument("--index", help=f"Contig index path (default: {INDEX_NAME} next to the output).")
+    parser.add_argument("--dbsize", type=int, help="Effective search space length for collection-wide e-values.")
+    parser.add_argument("--watch", type=float, default=0.0,
+                        help="Keep waiting this many seconds for new genome files once idle (default: 0).")
+    args = parser.parse_args()
+
+    query_lengths = {qseqid: len(seq) for qseqid, seq in read_query_records(args.query_fasta)}
+    aggregator = PrevalenceAggregator(query_lengths, 0, args.min_identity, args.min_coverage)
+    summary = per_genome_tblastn(args.query_fasta, args.genome_dir, args.output, args.evalue, args.workers,
+                                 aggregator, ['-dbsize', str(args.dbsize)] if args.dbsize else (),
+                                 args.index, args.watch)
+    print(f"Searched {summary['genomes']} genomes ({summary['contigs']} contigs, {summary['hits']} hits); "
+          f"first result after {summary['first_result'] or 0:.1f} s")
+    print(f"Merged results: {args.output}")
+    print(f"Contig index: {summary['index_path']}")
+    if args.stats:
+        aggregator.summary().to_csv(args.stats, sep='\t', index=False)
+        print(f"Antigen statistics saved to: {args.stats}")
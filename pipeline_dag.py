@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+S. suis Pipeline Stage Scheduler
+================================
+
+A small make-like DAG runner for the analysis stages.
+
+Each stage declares its dependencies, the files it reads, the files it writes
+and the parameters it depends on.  A stage is skipped when its fingerprint
+(parameters + size/mtime of its input files + the fingerprints and results of
+the stages it depends on) matches the one recorded after its last successful
+run and its recorded outputs are still in place; its stored result is reused.  State is
+saved after every stage, so a re-run after a failure resumes from the last
+good stage.  Stages whose dependencies are satisfied run concurrently in a
+thread pool (the heavy lifting happens in BLAST subprocesses).  Given an
+instrumentation.RunMetrics, every stage that runs is recorded as a metrics stage.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from pathlib import Path
+
+from file_stamps import file_stamp
+
+STATE_NAME = 'pipeline_state.json'
+
+
+class Stage:
+    """
+    One pipeline step.
+
+    Args:
+        name (str): Unique stage name.
+        func (callable): Called with {dependency name: result}; returns a
+            JSON-serializable result that is stored and reused on skips.
+        deps (tuple): Names of stages that must finish first.
+        inputs (list or callable): Files read by the stage (a callable gets
+            the dependency results and returns the paths).
+        outputs (list or callable): Files written by the stage; the stage is
+            re-run if any of them is missing or changed since its last run.
+        params (dict): JSON-serializable settings that affect the outputs.
+        always_run (bool): Never skip (cheap checks such as input validation).
+        rows (callable): Row count of the stage from its result, for the run metrics.
+    """
+
+    def __init__(self, name, func, deps=(), inputs=(), outputs=(), params=None, always_run=False,
+                 rows=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.always_run = always_run
+        self.rows = rows
+
+    def input_paths(self, results):
+        return self.inputs(results) if callable(self.inputs) else self.inputs
+
+    def output_paths(self, results):
+        return self.outputs(results) if callable(self.outputs) else self.outputs
+
+
+class PipelineDAG:
+    """Runs stages in dependency order, skipping the ones that are up to date"""
+
+    def __init__(self, state_dir, metrics=None):
+        self.state_path = Path(state_dir) / STATE_NAME
+        self.metrics = metrics
+        self.stages = {}
+        self.status = {}
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def _load_state(self):
+        if not self.state_path.exists():
+            return {}
+        with open(self.state_path) as fh:
+            return json.load(fh)
+
+    def _save_state(self):
+        tmp_path = self.state_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as fh:
+            json.dump(self._state, fh, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def topological_order(self):
+        """Stage names in a valid execution order; raises on unknown deps or cycles"""
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _fingerprint(self, stage, results, fingerprints):
+        payload = {
+            'params': stage.params,
+            'inputs': [[str(p), file_stamp(p)] for p in stage.input_paths(results)],
+            'deps': {dep: [fingerprints[dep], results[dep]] for dep in stage.deps},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _up_to_date(self, stage, fingerprint, results):
+        previous = self._state.get(stage.name)
+        if stage.always_run or not previous or previous['fingerprint'] != fingerprint:
+            return False
+        outputs = {str(p): file_stamp(p) for p in stage.output_paths(results)}
+        return all(outputs.values()) and outputs == previous['outputs']
+
+    def _execute(self, stage, results, fingerprints):
+        """Worker: run one stage unless it is up to date"""
+        dep_results = {dep: results[dep] for dep in stage.deps}
+        fingerprint = self._fingerprint(stage, dep_results, fingerprints)
+        if self._up_to_date(stage, fingerprint, dep_results):
+            entry = self._state[stage.name]
+            status = 'skipped'
+        else:
+            with self.metrics.stage(stage.name) if self.metrics else nullcontext({}) as record:
+                result = stage.func(dep_results)
+                if stage.rows is not None:
+                    record['rows'] = stage.rows(result)
+            outputs = {str(p): file_stamp(p) for p in stage.output_paths(dep_results)}
+            entry = {'fingerprint': fingerprint, 'result': result, 'outputs': outputs}
+            with self._lock:
+                self._state[stage.name] = entry
+                self._save_state()
+            status = 'ran'
+        # Dependants see the outputs too, so regenerated files invalidate them
+        downstream = hashlib.sha256(json.dumps([fingerprint, entry['outputs']], sort_keys=True)
+                                    .encode()).hexdigest()
+        return stage.name, downstream, entry['result'], status
+
+    def run(self, max_workers=2):
+        """
+        Run every stage, concurrently where dependencies allow.
+
+        Returns:
+            dict: Stage name -> result.  ``self.status`` records whether each
+                  stage 'ran' or was 'skipped'.
+        """
+        order = self.topological_order()
+        results, fingerprints = {}, {}
+        self.status = {}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            running = {}
+            while len(results) < len(order):
+                for name in order:
+                    stage = self.stages[name]
+                    if (name not in results and name not in running.values()
+                            and all(dep in results for dep in stage.deps)):
+                        running[pool.submit(self._execute, stage, results, fingerprints)] = name
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del running[future]
+                    try:
+                        name, fingerprint, result, status = future.result()
+                    except BaseException:
+                        # Let concurrently running stages finish (and record their state)
+                        wait(running)
+                        raise
+                    results[name] = result
+                    fingerprints[name] = fingerprint
+                    self.status[name] = status
+                    print(f"  [{status}] {name}")
+        return results
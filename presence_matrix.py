@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+S. suis Antigen x Genome Presence Matrix
+========================================
+
+Per-antigen prevalence does not say how a multi-antigen (e.g. penta-antigen
+fusion) vaccine covers the collection: which fraction of genomes carries at
+least k of the antigens, or which panel of candidates covers the most
+genomes.  analyze_blast_results() therefore persists the passing
+(antigen, genome) pairs as a bit-packed matrix, one row of genome bits per
+antigen:
+
+    bits.npy    uint8, antigens x bytes (rows padded to 64-bit words, memory-mappable)
+    meta.json   antigens, genomes (column order), total_genomes and thresholds
+
+Genomes without any hit still get a column (named from the contig index,
+unnamed padding up to total_genomes otherwise), so every fraction is over the
+whole collection.
+
+Queries work on 64-bit words with AND/OR and popcount:
+
+* genome_counts() adds the antigen rows with a bit-sliced counter
+  (log2(n) bit planes), giving the k-of-n coverage for every k at once;
+* levels() keeps "covered by >= j antigens" masks for j = 1..k and is
+  vectorized over many panels at once; combinations() extends the levels of
+  every (size - 1)-antigen prefix by each later antigen to score all panels
+  of a given size in chunks;
+* greedy_panel() adds the antigen with the largest marginal gain per step;
+  exact_panel() finds the maximum-coverage panel by branch and bound.
+
+Usage:
+    python presence_matrix.py kofn -m suis_prevalence_analysis/presence_matrix
+    python presence_matrix.py combinations -m .../presence_matrix --size 3 --top 10
+    python presence_matrix.py panel -m .../presence_matrix --size 5 [--exact] [-k 2]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregation import passing_mask
+
+MATRIX_DIR_NAME = 'presence_matrix'
+META_NAME = 'meta.json'
+BITS_NAME = 'bits.npy'
+MATRIX_VERSION = 1
+MAX_COMBINATIONS = 50_000_000
+CHUNK_WORDS = 1 << 22
+MAX_NODES = 1_000_000
+
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """Set bits of every uint64 word (np.bitwise_count where numpy has it)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    words = np.ascontiguousarray(words)
+    return _BYTE_COUNTS[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def count_bits(words):
+    """Set bits per row of a (..., words) array"""
+    return popcount(words).sum(axis=-1, dtype=np.int64)
+
+
+def pack_rows(antigen_codes, genome_codes, n_antigens, n_genomes):
+    """Packed bit rows (uint8, padded to 64-bit words) with the given (antigen, genome) bits set"""
+    n_bytes = -(-n_genomes // 64) * 8
+    dense = np.zeros((n_antigens, n_bytes * 8), dtype=bool)
+    dense[antigen_codes, genome_codes] = True
+    return np.packbits(dense, axis=1, bitorder='little')
+
+
+def write_presence_matrix(matrix_dir, df, antigens, total_genomes, min_identity, min_coverage,
+                          contig_index=None, coverage_mode='hsp'):
+    """
+    Persist the passing (antigen, genome) pairs of annotated hits.
+
+    Args:
+        matrix_dir (str): Output directory (replaced atomically).
+        df (pd.DataFrame): Hits annotated by aggregation.annotate_hits().
+        antigens (list): Query IDs; defines the row order.
+        total_genomes (int): Genomes in the collection (columns at least).
+        min_identity (float): Minimum percent identity.
+        min_coverage (float): Minimum query coverage (fraction).
+        contig_index (dict): Contig -> assembly index naming the hit-free genomes.
+        coverage_mode (str): Recorded in meta.json.
+
+    Returns:
+        Path: The matrix directory.
+    """
+    passing = df[passing_mask(df, min_identity, min_coverage)]
+    passing = passing[passing['qseqid'].isin(antigens) & passing['genome_accession'].notna()]
+    hit_genomes = passing['genome_accession'].astype(str).unique()
+    genomes = sorted(set(contig_index.values() if contig_index else ()) | set(hit_genomes))
+    n_genomes = max(len(genomes), total_genomes)
+
+    antigen_codes = pd.Index(antigens).get_indexer(passing['qseqid'])
+    genome_codes = pd.Index(genomes).get_indexer(passing['genome_accession'].astype(str))
+    bits = pack_rows(antigen_codes, genome_codes, len(antigens), n_genomes)
+
+    meta = {
+        'version': MATRIX_VERSION,
+        'antigens': list(antigens),
+        'genomes': genomes,
+        'total_genomes': n_genomes,
+        'min_identity': min_identity,
+        'min_coverage': min_coverage,
+        'coverage_mode': coverage_mode,
+    }
+    matrix_dir = Path(matrix_dir)
+    matrix_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f'.{matrix_dir.name}.', dir=matrix_dir.parent))
+    np.save(tmp_dir / BITS_NAME, bits)
+    with open(tmp_dir / META_NAME, 'w') as fh:
+        json.dump(meta, fh)
+    if matrix_dir.exists():
+        shutil.rmtree(matrix_dir)
+    os.replace(tmp_dir, matrix_dir)
+    return matrix_dir
+
+
+class PresenceMatrix:
+    """Memory-mapped presence matrix with coverage queries over antigen subsets"""
+
+    def __init__(self, matrix_dir):
+        self.matrix_dir = Path(matrix_dir)
+        with open(self.matrix_dir / META_NAME) as fh:
+            self.meta = json.load(fh)
+        if self.meta.get('version') != MATRIX_VERSION:
+            raise ValueError(f"Unsupported presence matrix version in {matrix_dir}")
+        self.antigens = self.meta['antigens']
+        self.genomes = self.meta['genomes']
+        self.total_genomes = self.meta['total_genomes']
+        self.bits = np.load(self.matrix_dir / BITS_NAME, mmap_mode='r')
+        self.words = self.bits.view(np.uint64)
+
+    def rows(self, antigens=None):
+        """Row indices of ``antigens`` (names or indices; None: all)"""
+        if antigens is None:
+            return np.arange(len(self.antigens))
+        lookup = {name: i for i, name in enumerate(self.antigens)}
+        try:
+            return np.array([a if isinstance(a, (int, np.integer)) else lookup[a] for a in antigens], dtype=np.int64)
+        except KeyError as exc:
+            raise ValueError(f"Antigen not in the presence matrix: {exc.args[0]}") from None
+
+    def dense(self, antigens=None):
+        """Boolean antigens x genomes matrix"""
+        return np.unpackbits(self.bits[self.rows(antigens)], axis=1, count=self.total_genomes,
+                             bitorder='little').astype(bool)
+
+    def genome_counts(self, antigens=None):
+        """Number of ``antigens`` present in every genome, from a bit-sliced counter"""
+        rows = self.words[self.rows(antigens)]
+        planes = []
+        for row in rows:
+            carry = row
+            for p in range(len(planes)):
+                planes[p], carry = planes[p] ^ carry, planes[p] & carry
+                if not carry.any():
+                    break
+            if carry.any():
+                planes.append(carry)
+        counts = np.zeros(self.total_genomes, dtype=np.int64)
+        for p, plane in enumerate(planes):
+            counts += np.unpackbits(plane.view(np.uint8), count=self.total_genomes,
+                                    bitorder='little').astype(np.int64) << p
+        return counts
+
+    def k_of_n(self, antigens=None):
+        """
+        Genomes covered by at least k of ``antigens``, for k = 1..n.
+
+        Returns:
+            pd.DataFrame: k, genomes and percent (of total_genomes).
+        """
+        n = len(self.rows(antigens))
+        histogram = np.bincount(self.genome_counts(antigens), minlength=n + 1)
+        at_least = histogram[::-1].cumsum()[::-1][1:]
+        return pd.DataFrame({
+            'k': np.arange(1, n + 1),
+            'genomes': at_least,
+            'percent': at_least / self.total_genomes * 100 if self.total_genomes else 0.0,
+        })
+
+    @staticmethod
+    def levels(rows, k=1):
+        """
+        Word masks of genomes present in at least 1..k of ``rows``.
+
+        ``rows`` has shape (..., antigens, words); the leading axes are kept,
+        so many panels are evaluated at once.
+
+        Returns:
+            list: k arrays of shape (..., words); item j is ">= j + 1 antigens".
+        """
+        rows = np.asarray(rows)
+        if k == 1:
+            return [np.bitwise_or.reduce(rows, axis=-2)]
+        ge = [np.zeros(rows.shape[:-2] + rows.shape[-1:], dtype=np.uint64) for _ in range(k)]
+        for i in range(rows.shape[-2]):
+            x = rows[..., i, :]
+            for j in range(min(k, i + 1) - 1, 0, -1):
+                ge[j] |= ge[j - 1] & x
+            ge[0] |= x
+        return ge
+
+    def at_least(self, rows, k=1):
+        """Word masks of genomes present in at least ``k`` of ``rows`` (see levels())"""
+        return self.levels(rows, k)[k - 1]
+
+    def coverage(self, antigens, k=1):
+        """Genomes with at least ``k`` of ``antigens``"""
+        return int(count_bits(self.at_least(self.words[self.rows(antigens)], k)))
+
+    def combinations(self, size, k=1, antigens=None, top=20):
+        """
+        Score every panel of ``size`` antigens by the genomes it covers (>= k antigens).
+
+        Panels are built as a (size - 1)-antigen prefix, whose coverage levels
+        are computed once, extended by each later antigen, so every panel costs
+        one AND/OR and popcount pass over its words.
+
+        Returns:
+            pd.DataFrame: The ``top`` panels (None: all) with antigens, genomes and percent.
+        """
+        if size < 1:
+            raise ValueError("Panels need at least one antigen")
+        rows = self.rows(antigens)
+        n, n_words = len(rows), self.words.shape[1]
+        n_panels = math.comb(n, size)
+        if n_panels > MAX_COMBINATIONS:
+            raise ValueError(f"{n_panels:,} panels of {size} antigens; use greedy_panel() or exact_panel()")
+        chunk = max(1, CHUNK_WORDS // (max(1, n_words) * max(1, n)))
+        prefixes = itertools.combinations(range(n), size - 1)
+        best_panels, best_covered = np.empty((0, size), dtype=np.int64), np.empty(0, dtype=np.int64)
+        while True:
+            block = list(itertools.islice(prefixes, chunk))
+            if not block:
+                break
+            block = np.array(block, dtype=np.int64).reshape(len(block), size - 1)
+            first = block[:, -1] + 1 if size > 1 else np.zeros(len(block), dtype=np.int64)
+            extensions = n - first
+            prefix = np.repeat(np.arange(len(block)), extensions)
+            offsets = np.cumsum(extensions) - extensions
+            last = np.arange(prefix.size) - offsets[prefix] + first[prefix]
+
+            ge = self.levels(self.words[rows[block]], k)
+            x = self.words[rows[last]]
+            reached = ge[-1][prefix] | ((ge[-2][prefix] & x) if k > 1 else x)
+            covered = count_bits(reached)
+            best_panels = np.concatenate([best_panels, np.column_stack([block[prefix], last])])
+            best_covered = np.concatenate([best_covered, covered])
+            if top is not None and best_covered.size > top:
+                keep = np.argpartition(-best_covered, top - 1)[:top]
+                best_panels, best_covered = best_panels[keep], best_covered[keep]
+        order = np.lexsort((np.arange(best_covered.size), -best_covered))
+        return pd.DataFrame({
+            'antigens': [tuple(self.antigens[r] for r in rows[p]) for p in best_panels[order]],
+            'genomes': best_covered[order],
+            'percent': best_covered[order] / self.total_genomes * 100 if self.total_genomes else 0.0,
+        })
+
+    def greedy_panel(self, size, k=1, antigens=None):
+        """
+        Add, up to ``size`` times, the antigen that brings the most genomes to
+        >= k antigens (ties: the most genomes one antigen closer to k); stops
+        early when no antigen adds anything.
+
+        Returns:
+            pd.DataFrame: One row per step with antigen, genomes and percent covered so far.
+        """
+        candidates = list(self.rows(antigens))
+        ge = [np.zeros(self.words.shape[1], dtype=np.uint64) for _ in range(k)]
+        steps, reached = [], 0
+        for _ in range(min(size, len(candidates))):
+            x = self.words[candidates]
+            new = [ge[0] | x] + [ge[j] | (ge[j - 1] & x) for j in range(1, k)]
+            covered = count_bits(new[-1])
+            progress = sum(count_bits(level) for level in new)
+            best = int(np.lexsort((-progress, -covered))[0])
+            if progress[best] == reached:
+                break
+            reached = progress[best]
+            ge = [level[best] for level in new]
+            steps.append((self.antigens[candidates.pop(best)], int(covered[best])))
+        return pd.DataFrame({
+            'antigen': [antigen for antigen, _ in steps],
+            'genomes': [covered for _, covered in steps],
+            'percent': [covered / self.total_genomes * 100 if self.total_genomes else 0.0
+                        for _, covered in steps],
+        })
+
+    def exact_panel(self, size, antigens=None, max_nodes=MAX_NODES):
+        """
+        Maximum-coverage panel of at most ``size`` antigens (genomes with >= 1).
+
+        Branch and bound over include/exclude of the antigen with the largest
+        marginal gain; a branch is cut when its coverage plus the largest
+        ``size - chosen`` remaining gains (at most the genomes the remaining
+        antigens reach at all) cannot beat the best panel so far (initially
+        the greedy one).
+
+        Returns:
+            dict: antigens, genomes, percent, nodes and optimal (False when
+                  ``max_nodes`` stopped the search first).
+        """
+        rows = self.rows(antigens)
+        greedy = self.greedy_panel(size, 1, rows)
+        best = tuple(greedy['antigen'])
+        best_covered = int(greedy['genomes'].iloc[-1]) if len(greedy) else 0
+
+        stack = [((), np.zeros(self.words.shape[1], dtype=np.uint64), rows)]
+        nodes = 0
+        while stack and nodes < max_nodes:
+            chosen, union, candidates = stack.pop()
+            nodes += 1
+            covered = int(count_bits(union))
+            if covered > best_covered:
+                best, best_covered = tuple(self.antigens[r] for r in chosen), covered
+            slots = size - len(chosen)
+            if not slots or not candidates.size:
+                continue
+            gains = count_bits(self.words[candidates] & ~union)
+            order = np.argsort(-gains, kind='stable')
+            candidates, gains = candidates[order], gains[order]
+            candidates, gains = candidates[gains > 0], gains[gains > 0]
+            if not candidates.size:
+                continue
+            reachable = count_bits(np.bitwise_or.reduce(self.words[candidates] & ~union, axis=0))
+            if covered + min(int(gains[:slots].sum()), int(reachable)) <= best_covered:
+                continue
+            first = candidates[0]
+            stack.append((chosen, union, candidates[1:]))
+            stack.append((chosen + (first,), union | self.words[first], candidates[1:]))
+        return {
+            'antigens': list(best),
+            'genomes': best_covered,
+            'percent': best_covered / self.total_genomes * 100 if self.total_genomes else 0.0,
+            'nodes': nodes,
+            'optimal': not stack,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coverage queries on an antigen x genome presence matrix.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    kofn = commands.add_parser("kofn", help="Genomes covered by at least k antigens, for every k.")
+    combos = commands.add_parser("combinations", help="Coverage of every panel of a given size.")
+    panel = commands.add_parser("panel", help="Greedy (or exact) maximum-coverage panel.")
+    for command in (kofn, combos, panel):
+        command.add_argument("-m", "--matrix", required=True, help="Presence matrix directory.")
+        command.add_argument("-a", "--antigens", help="Comma-separated candidate antigens (default: all).")
+    for command in (combos, panel):
+        command.add_argument("--size", type=int, required=True, help="Antigens per panel.")
+        command.add_argument("-k", type=int, default=1, help="Antigens a genome needs to count as covered (default: 1).")
+    combos.add_argument("--top", type=int, default=20, help="Panels to print (default: 20).")
+    panel.add_argument("--exact", action="store_true", help="Exact maximum coverage by branch and bound (k=1).")
+    args = parser.parse_args()
+
+    matrix = PresenceMatrix(args.matrix)
+    antigens = args.antigens.split(',') if args.antigens else None
+    print(f"Presence matrix: {len(matrix.antigens)} antigens x {matrix.total_genomes} genomes "
+          f"(identity >= {matrix.meta['min_identity']}%, coverage >= {matrix.meta['min_coverage'] * 100}%)")
+
+    if args.command == "kofn":
+        for row in matrix.k_of_n(antigens).itertuples():
+            print(f"  >= {row.k} antigens: {row.genomes} genomes ({row.percent:.2f}%)")
+    elif args.command == "combinations":
+        for row in matrix.combinations(args.size, args.k, antigens, args.top).itertuples():
+            print(f"  {row.genomes:6d} ({row.percent:6.2f}%)  {', '.join(row.antigens)}")
+    elif args.exact:
+        if args.k != 1:
+            parser.error("--exact supports k=1 only")
+        result = matrix.exact_panel(args.size, antigens)
+        print(f"  {'Optimal' if result['optimal'] else 'Best found'} panel ({result['nodes']} nodes): "
+              f"{result['genomes']} genomes ({result['percent']:.2f}%)")
+        for antigen in result['antigens']:
+            print(f"    {antigen}")
+    else:
+        for row in matrix.greedy_panel(args.size, args.k, antigens).itertuples():
+            print(f"  + {row.antigen}: {row.genomes} genomes ({row.percent:.2f}%)")
+
+
+if __name__ == "__main__":
+    main()
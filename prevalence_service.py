@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+S. suis Local Prevalence Service
+================================
+
+Every ad-hoc prevalence question otherwise pays a cold start of Python,
+pandas and Biopython plus a tblastn run against ``suis_db``.  This daemon
+wraps SsuisAntiGenAnalyzer once and keeps it warm:
+
+* the BLAST database, contig index (and k-mer prefilter) are built or
+  loaded at start-up; with ``dedup`` the database holds cluster
+  representatives only, searches get the ``-dbsize`` of the whole collection
+  and every hit is copied to the members of its representative's cluster;
+* hits are kept per query sequence in memory (least recently used first
+  out, bounded by rows) on top of the on-disk tblastn cache of
+  blast_search.py, so thresholds can be changed per request without
+  searching again;
+* sequences missing from both caches are queued and searched together:
+  requests arriving within ``batch_window`` seconds share one tblastn run,
+  and a sequence already being searched is never searched twice.
+
+API (JSON over HTTP on localhost, or on a Unix socket with ``--socket``):
+
+    GET  /health      database, genome count and cache sizes
+    POST /prevalence  {"sequences": {"name": "MKT..."}  or  "fasta": ">name\\nMKT...",
+                       "min_identity": 60, "min_coverage": 0.8,
+                       "coverage_mode": "hsp", "per_genome": false}
+
+The response lists one SUMMARY_COLUMNS row (plus classification) per
+sequence, optionally the per-genome stats of the passing hits, and how many
+sequences came from each cache.  Restart the service after rebuilding
+suis_db; the caches belong to the database fingerprint seen at start-up.
+
+Usage:
+    python prevalence_service.py serve -g suis_selected -o suis_prevalence_analysis
+    python prevalence_service.py query -q variant.fasta --min_identity 80 --per_genome
+"""
+
+import argparse
+import http.client
+import io
+import json
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+import pandas as pd
+from Bio import SeqIO
+
+from aggregation import annotate_hits, genome_stats, passing_mask, summarize_antigens
+from blast_search import TblastnCache
+from complete_analysis_pipeline import SsuisAntiGenAnalyzer
+from genome_index import INDEX_NAME
+from genome_merge import discover_genomes
+from genome_redundancy import propagate_hits
+from hit_store import BLAST_COLUMNS
+from hsp_coverage import check_coverage_mode
+from kmer_prefilter import INDEX_DIR_NAME, index_is_current
+
+DEFAULT_PORT = 8765
+BATCH_WINDOW_S = 0.05
+MAX_BATCH = 64
+MAX_CACHED_ROWS = 2_000_000
+HIT_COLUMNS = BLAST_COLUMNS[1:]
+RESIDUES = set('ABCDEFGHIKLMNPQRSTUVWXYZ*')
+
+
+def parse_sequences(payload):
+    """
+    Query name -> upper-cased protein sequence from a request payload.
+
+    Raises:
+        ValueError: On a missing, empty or non-protein sequence or a duplicate name.
+    """
+    if 'fasta' in payload:
+        records = [(rec.id, str(rec.seq)) for rec in SeqIO.parse(io.StringIO(payload['fasta']), 'fasta')]
+    else:
+        records = list((payload.get('sequences') or {}).items())
+    if not records:
+        raise ValueError("Request has no sequences ('sequences' or 'fasta')")
+
+    sequences = {}
+    for name, sequence in records:
+        sequence = ''.join(str(sequence).split()).upper()
+        if name in sequences:
+            raise ValueError(f"Duplicate sequence name: {name}")
+        if not sequence or not set(sequence) <= RESIDUES:
+            raise ValueError(f"Not a protein sequence: {name}")
+        sequences[name] = sequence
+    return sequences
+
+
+class HitMemo:
+    """In-memory hits per sequence, evicting the least recently used beyond ``max_rows``"""
+
+    def __init__(self, max_rows=MAX_CACHED_ROWS):
+        self.max_rows = max_rows
+        self.rows = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, sequence):
+        with self._lock:
+            frame = self._frames.get(sequence)
+            if frame is not None:
+                self._frames.move_to_end(sequence)
+            return frame
+
+    def put(self, sequence, frame):
+        with self._lock:
+            if sequence in self._frames:
+                self.rows -= len(self._frames.pop(sequence))
+            self._frames[sequence] = frame
+            self.rows += len(frame)
+            while self.rows > self.max_rows and len(self._frames) > 1:
+                self.rows -= len(self._frames.popitem(last=False)[1])
+
+
+def hit_frame(rows):
+    """DataFrame of cached hit rows (fmt 6 without qseqid)"""
+    if not rows:
+        return pd.DataFrame({column: pd.Series(dtype=object if column == 'sseqid' else float)
+                             for column in HIT_COLUMNS})
+    return pd.read_csv(io.StringIO('\n'.join(rows)), sep='\t', names=HIT_COLUMNS, header=None)
+
+
+class SearchBatcher:
+    """
+    Searches the sequences submitted by concurrent requests in shared batches.
+
+    ``search`` maps a list of sequences to {sequence: hit rows}.  A background
+    thread waits ``window`` seconds after the first pending sequence so that
+    concurrent requests join the batch, then searches up to ``max_batch``
+    sequences at once.
+    """
+
+    def __init__(self, search, window=BATCH_WINDOW_S, max_batch=MAX_BATCH):
+        self.search = search
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self._pending = OrderedDict()
+        self._running = {}
+        self._closed = False
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name='search-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, sequence):
+        """Future of the hit rows of ``sequence`` (shared with identical pending sequences)"""
+        with self._ready:
+            if self._closed:
+                raise RuntimeError("Search batcher is closed")
+            future = self._pending.get(sequence) or self._running.get(sequence)
+            if future is None:
+                future = self._pending[sequence] = Future()
+                self._ready.notify()
+            return future
+
+    def close(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._ready:
+                while not self._pending and not self._closed:
+                    self._ready.wait()
+                if not self._pending:
+                    return
+            time.sleep(self.window)
+            with self._ready:
+                batch = {}
+                while self._pending and len(batch) < self.max_batch:
+                    sequence, future = self._pending.popitem(last=False)
+                    batch[sequence] = future
+                self._running.update(batch)
+            try:
+                results = self.search(list(batch))
+            except Exception as exc:
+                for future in batch.values():
+                    future.set_exception(exc)
+            else:
+                for sequence, future in batch.items():
+                    future.set_result(results[sequence])
+            finally:
+                self.batches += 1
+                with self._ready:
+                    for sequence in batch:
+                        self._running.pop(sequence, None)
+
+
+class PrevalenceService:
+    """
+    Warm prevalence queries against one genome collection.
+
+    Args:
+        config (dict): SsuisAntiGenAnalyzer configuration (genome_dir,
+            output_dir, evalue, threads, sharded, prefilter, dedup...).
+        batch_window (float): Seconds to collect concurrent searches.
+        max_batch (int): Maximum sequences per tblastn run.
+        max_cached_rows (int): Hit rows kept in memory.
+    """
+
+    def __init__(self, config, batch_window=BATCH_WINDOW_S, max_batch=MAX_BATCH,
+                 max_cached_rows=MAX_CACHED_ROWS):
+        self.analyzer = SsuisAntiGenAnalyzer(config)
+        self.config = self.analyzer.config
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.memo = HitMemo(max_cached_rows)
+        self.batcher = None
+        self.searched = 0
+
+    def start(self, rebuild=False):
+        """Build or load the database, contig index, prefilter and genome clusters; start the batcher"""
+        output_dir = Path(self.config['output_dir'])
+        self.db_name = output_dir / 'suis_db'
+        merged_fasta = output_dir / 'all_suis_genomes.fna'
+        if rebuild or not any(self.db_name.parent.glob(f'{self.db_name.name}.n*')):
+            if self.config.get('dedup', False):
+                self.analyzer.reduce_redundancy()
+            merged_fasta = self.analyzer.merge_genomes()
+            self.analyzer.create_blast_database(merged_fasta)
+        if self.config.get('prefilter', False) and not index_is_current(
+                output_dir / INDEX_DIR_NAME, merged_fasta, output_dir / INDEX_NAME,
+                self.config.get('prefilter_k', 7)):
+            self.analyzer.build_prefilter_index(merged_fasta)
+
+        self.contig_index = self.analyzer.load_contig_index()
+        # A redundancy-reduced database holds representatives only: members get their hits
+        # afterwards and e-values keep the size of the whole collection
+        self.clusters = self.analyzer.load_genome_clusters()
+        self.search_args = self.analyzer.search_args()
+        if self.clusters is not None:
+            self.total_genomes = len(self.clusters)
+        else:
+            self.total_genomes = len(discover_genomes(self.config['genome_dir']))
+        self.runner, cache_params = self.analyzer.search_runner()
+        self.disk_cache = None
+        if self.config.get('use_blast_cache', True):
+            self.disk_cache = TblastnCache(output_dir / 'blast_cache', self.db_name, self.config['evalue'],
+                                           self.search_args, cache_params)
+        self.batcher = SearchBatcher(self._search, self.batch_window, self.max_batch)
+        return self
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def _search(self, sequences):
+        """One tblastn run over ``sequences``; stores their hits in both caches"""
+        rows = {sequence: [] for sequence in sequences}
+        with tempfile.TemporaryDirectory(dir=self.config['output_dir']) as tmp_dir:
+            query = Path(tmp_dir) / 'batch.fasta'
+            output = Path(tmp_dir) / 'batch_hits.tsv'
+            with open(query, 'w') as fh:
+                for i, sequence in enumerate(sequences):
+                    fh.write(f">q{i}\n{sequence}\n")
+            self.runner(query, self.db_name, output, self.config['evalue'], self.config['threads'],
+                        self.search_args)
+            with open(output) as fh:
+                for line in fh:
+                    qseqid, _, rest = line.rstrip('\n').partition('\t')
+                    rows[sequences[int(qseqid[1:])]].append(rest)
+        for sequence in sequences:
+            if self.disk_cache is not None:
+                self.disk_cache.store(sequence, rows[sequence])
+            self.memo.put(sequence, hit_frame(rows[sequence]))
+        self.searched += len(sequences)
+        return rows
+
+    def hits(self, sequences):
+        """
+        Hit tables of ``sequences`` (name -> sequence), searching only uncached ones.
+
+        Returns:
+            tuple: ({name: hit DataFrame}, {'memory', 'disk', 'searched'} counts)
+        """
+        frames, counts, futures = {}, {'memory': 0, 'disk': 0, 'searched': 0}, {}
+        for name, sequence in sequences.items():
+            frame = self.memo.get(sequence)
+            if frame is not None:
+                frames[name] = frame
+                counts['memory'] += 1
+                continue
+            rows = self.disk_cache.lookup(sequence) if self.disk_cache is not None else None
+            if rows is not None:
+                frames[name] = hit_frame(rows)
+                self.memo.put(sequence, frames[name])
+                counts['disk'] += 1
+            else:
+                futures[name] = self.batcher.submit(sequence)
+        for name, future in futures.items():
+            rows = future.result()
+            frame = self.memo.get(sequences[name])
+            frames[name] = frame if frame is not None else hit_frame(rows)
+            counts['searched'] += 1
+        return frames, counts
+
+    def prevalence(self, sequences, min_identity=None, min_coverage=None, coverage_mode=None,
+                   per_genome=False):
+        """
+        Prevalence statistics of ``sequences`` (name -> protein sequence).
+
+        Thresholds default to the service configuration.
+
+        Returns:
+            dict: 'antigens' (summary rows with classification), 'per_genome'
+                  (name -> passing genome stats, when requested), 'cache'
+                  counts and 'elapsed_s'.
+        """
+        started = time.perf_counter()
+        min_identity = float(self.config['min_identity'] if min_identity is None else min_identity)
+        min_coverage = float(self.config['min_coverage'] if min_coverage is None else min_coverage)
+        coverage_mode = check_coverage_mode(coverage_mode or self.config.get('coverage_mode', 'hsp'))
+
+        frames, counts = self.hits(sequences)
+        df = pd.concat([frame.assign(qseqid=name) for name, frame in frames.items()], ignore_index=True)
+        query_lengths = {name: len(sequence) for name, sequence in sequences.items()}
+        df = annotate_hits(df, query_lengths, self.contig_index, coverage_mode, min_identity)
+        if self.clusters is not None:
+            df = propagate_hits(df, self.clusters)
+        summary = summarize_antigens(df, query_lengths, self.total_genomes, min_identity, min_coverage)
+        summary['classification'] = summary['prevalence_percent'].map(self.analyzer._classify_prevalence)
+
+        response = {'antigens': summary.to_dict('records'), 'cache': counts}
+        if per_genome:
+            stats = genome_stats(df[passing_mask(df, min_identity, min_coverage)],
+                                 by=('qseqid', 'genome_accession'))
+            response['per_genome'] = {
+                name: stats[stats['qseqid'] == name].drop(columns='qseqid').to_dict('records')
+                for name in sequences
+            }
+        response['elapsed_s'] = round(time.perf_counter() - started, 4)
+        return response
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'database': str(self.db_name),
+            'genomes': self.total_genomes,
+            'cached_sequences': len(self.memo),
+            'cached_rows': self.memo.rows,
+            'searched_sequences': self.searched,
+            'search_batches': self.batcher.batches,
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON request handler; ``self.server.service`` is the PrevalenceService"""
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._reply(404, {'error': f"Unknown path: {self.path}"})
+        self._reply(200, self.server.service.health())
+
+    def do_POST(self):
+        if self.path != '/prevalence':
+            return self._reply(404, {'error': f"Unknown path: {self.path}"})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            response = self.server.service.prevalence(
+                parse_sequences(payload), payload.get('min_identity'), payload.get('min_coverage'),
+                payload.get('coverage_mode'), bool(payload.get('per_genome', False)))
+        except (ValueError, TypeError) as exc:
+            return self._reply(400, {'error': str(exc)})
+        except Exception as exc:
+            return self._reply(500, {'error': str(exc)})
+        self._reply(200, response)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None, quiet=False):
+    """HTTP server for ``service`` on host:port, or on a Unix socket when ``socket_path`` is set"""
+    if socket_path:
+        Path(socket_path).unlink(missing_ok=True)
+        server = UnixHTTPServer(str(socket_path), ServiceHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(str(self.socket_path))
+
+
+def request(method, path, payload=None, host='127.0.0.1', port=DEFAULT_PORT, socket_path=None,
+            timeout=3600):
+    """Send one request to a running service and return (status, decoded JSON body)"""
+    if socket_path:
+        connection = _UnixConnection(socket_path, timeout)
+    else:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = json.dumps(payload).encode() if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local S. suis antigen prevalence service.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Start the service.")
+    serve.add_argument("-g", "--genome_dir", default="suis_selected", help="Genome directory (default: suis_selected).")
+    serve.add_argument("-o", "--output_dir", default="suis_prevalence_analysis",
+                       help="Directory of suis_db and the caches (default: suis_prevalence_analysis).")
+    serve.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    serve.add_argument("--threads", type=int, default=4, help="tblastn threads (default: 4).")
+    serve.add_argument("--min_identity", type=float, default=60.0, help="Default minimum percent identity (default: 60.0).")
+    serve.add_argument("--min_coverage", type=float, default=0.8, help="Default minimum coverage fraction (default: 0.8).")
+    serve.add_argument("--sharded", action="store_true", help="Run single-threaded tblastn shards in a process pool.")
+    serve.add_argument("--prefilter", action="store_true", help="Restrict tblastn with the k-mer prefilter.")
+    serve.add_argument("--dedup", action="store_true",
+                       help="Search one representative per cluster of near-identical genomes (applied on build).")
+    serve.add_argument("--rebuild", action="store_true", help="Rebuild suis_db from genome_dir even if it exists.")
+    serve.add_argument("--batch_window", type=float, default=BATCH_WINDOW_S,
+                       help=f"Seconds to collect concurrent searches (default: {BATCH_WINDOW_S}).")
+    serve.add_argument("--max_cached_rows", type=int, default=MAX_CACHED_ROWS,
+                       help=f"Hit rows kept in memory (default: {MAX_CACHED_ROWS}).")
+    serve.add_argument("--host", default="127.0.0.1", help="Listen address (default: 127.0.0.1).")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Listen port (default: {DEFAULT_PORT}).")
+    serve.add_argument("--socket", help="Listen on this Unix socket instead of TCP.")
+    serve.add_argument("--quiet", action="store_true", help="Do not log requests.")
+
+    query = commands.add_parser("query", help="Ask a running service for the prevalence of a FASTA.")
+    query.add_argument("-q", "--query_fasta", required=True, help="Protein query FASTA.")
+    query.add_argument("--min_identity", type=float, help="Minimum percent identity (default: the service's).")
+    query.add_argument("--min_coverage", type=float, help="Minimum coverage fraction (default: the service's).")
+    query.add_argument("--coverage_mode", choices=["hsp", "merged"], help="Coverage per HSP or merged per genome.")
+    query.add_argument("--per_genome", action="store_true", help="Also print per-genome stats as JSON.")
+    query.add_argument("--host", default="127.0.0.1", help="Service address (default: 127.0.0.1).")
+    query.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Service port (default: {DEFAULT_PORT}).")
+    query.add_argument("--socket", help="Service Unix socket.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        config = {
+            'genome_dir': args.genome_dir,
+            'output_dir': args.output_dir,
+            'evalue': args.evalue,
+            'min_identity': args.min_identity,
+            'min_coverage': args.min_coverage,
+            'coverage_mode': 'hsp',
+            'threads': args.threads,
+            'use_blast_cache': True,
+            'sharded': args.sharded,
+            'prefilter': args.prefilter,
+            'dedup': args.dedup,
+        }
+        service = PrevalenceService(config, args.batch_window, max_cached_rows=args.max_cached_rows)
+        service.start(args.rebuild)
+        server = make_server(service, args.host, args.port, args.socket, args.quiet)
+        where = args.socket or f"http://{args.host}:{args.port}"
+        print(f"🛰️ Prevalence service on {where} ({service.total_genomes} genomes)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+        return
+
+    with open(args.query_fasta) as fh:
+        payload = {'fasta': fh.read(), 'per_genome': args.per_genome}
+    for key in ('min_identity', 'min_coverage', 'coverage_mode'):
+        if getattr(args, key) is not None:
+            payload[key] = getattr(args, key)
+    status, body = request('POST', '/prevalence', payload, args.host, args.port, args.socket)
+    if status != 200:
+        sys.exit(f"Service error ({status}): {body.get('error')}")
+    for row in body['antigens']:
+        print(f"{row['antigen']:30} {row['prevalence_percent']:6.2f}% "
+              f"({row['hit_genomes']}/{row['total_genomes']}, {row['classification']})")
+    print(f"  Cache: {body['cache']}, {body['elapsed_s']:.3f}s")
+    if args.per_genome:
+        print(json.dumps(body['per_genome'], indent=2))
+
+
+if __name__ == "__main__":
+    main()
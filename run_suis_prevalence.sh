@@ -4,13 +4,46 @@ set -e
 # --- Configuration ---
 QUERY_PROTEIN_FASTA="query_antigens.fasta"
 OUTPUT_DIR="suis_prevalence_analysis"
-FASTA_DIR="suis_selected"       # 이미 준비된 FASTA 모음
+: ${FASTA_DIR:=suis_selected}   # 이미 준비된 FASTA 모음 (.fna/.fna.gz 디렉터리 또는 datasets zip)
 PYTHON_SCRIPT="parse_prevalence.py"
 EVALUE="1e-5"
 THREADS=$(nproc)
 # Allow runtime override of identity/coverage thresholds
 : ${MIN_IDENTITY:=70.0}   # default 70%
 : ${MIN_COVERAGE:=0.8}    # default 80% (fraction)
+# COVERAGE_MODE=merged: coverage of the union of all HSPs per antigen/genome (genes split by frameshifts/contig ends)
+: ${COVERAGE_MODE:=hsp}
+# INCREMENTAL_DB=1 builds only new/changed genomes into per-genome volumes
+: ${INCREMENTAL_DB:=0}
+# STREAMING=1 aggregates tblastn output as it streams (KEEP_RAW_TSV=0 skips blast_results.tsv)
+: ${STREAMING:=0}
+: ${KEEP_RAW_TSV:=1}
+# SHARDED=1 runs single-threaded tblastn shards in a process pool of $THREADS workers
+: ${SHARDED:=0}
+# PREFILTER=1 runs tblastn only on genomes sharing >= PREFILTER_MIN_SEEDS translated k-mers with a query
+: ${PREFILTER:=0}
+: ${PREFILTER_MIN_SEEDS:=3}
+# Per-stage wall/CPU time, peak RSS, I/O and row counts (METRICS=0 disables)
+: ${METRICS:=1}
+: ${METRICS_FILE:=${OUTPUT_DIR}/run_metrics.json}
+# PROFILE=1 also cProfiles the Python stages into ${OUTPUT_DIR}/profiles/
+: ${PROFILE:=0}
+
+# run_stage NAME [--rows_file FILE] -- CMD...: run CMD, recording its metrics as stage NAME
+run_stage() {
+  local name="$1"; shift
+  if [ "$METRICS" != "1" ]; then
+    while [ "$1" != "--" ]; do shift; done
+    shift
+    "$@"
+    return
+  fi
+  local profile_args=()
+  if [ "$PROFILE" = "1" ]; then
+    profile_args=(--profile_dir "${OUTPUT_DIR}/profiles")
+  fi
+  python3 instrumentation.py -m "$METRICS_FILE" -s "$name" "${profile_args[@]}" "$@"
+}
 
 # --- Input Validation ---
 if [ ! -f "$QUERY_PROTEIN_FASTA" ]; then
@@ -21,50 +54,128 @@ if ! command -v makeblastdb &> /dev/null || ! command -v tblastn &> /dev/null; t
   echo "Error: BLAST+ tools (makeblastdb, tblastn) not found in PATH."
   exit 1
 fi
-if [ ! -d "$FASTA_DIR" ] || [ -z "$(ls -A "$FASTA_DIR"/*.fna 2>/dev/null)" ]; then
+if [ ! -e "$FASTA_DIR" ] || [ -z "$(python3 genome_merge.py -g "$FASTA_DIR" --list 2>/dev/null)" ]; then
   echo "Error: FASTA directory '$FASTA_DIR' not found or empty."
   exit 1
 fi
+if [ "$STREAMING" = "1" ] && [ "$COVERAGE_MODE" != "hsp" ]; then
+  echo "Error: STREAMING=1 aggregates single HSPs; use COVERAGE_MODE=hsp."
+  exit 1
+fi
+if [ "$STREAMING" = "1" ] && [ "$SHARDED" = "1" ]; then
+  echo "Error: STREAMING=1 aggregates the stdout of one tblastn run; it cannot be combined with SHARDED=1."
+  exit 1
+fi
+if [ "$PREFILTER" = "1" ] && { [ "$INCREMENTAL_DB" = "1" ] || [ "$STREAMING" = "1" ] || [ "$SHARDED" = "1" ]; }; then
+  echo "Error: PREFILTER=1 needs the merged FASTA and a plain tblastn run (not INCREMENTAL_DB, STREAMING or SHARDED)."
+  exit 1
+fi
+if [ "$INCREMENTAL_DB" = "1" ] && [ ! -d "$FASTA_DIR" ]; then
+  echo "Error: INCREMENTAL_DB=1 needs an unpacked directory of *.fna files."
+  exit 1
+fi
 
 echo "--- Starting S. suis Prevalence Analysis ---"
 echo "[1/5] Setting up directories..."
 mkdir -p "$OUTPUT_DIR"
+rm -f "$METRICS_FILE"   # one metrics file per run
 
 # --- 2. Merge FASTA files ---
-echo "[2/5] Merging FASTA files from '$FASTA_DIR'..."
-MERGED_FASTA="${OUTPUT_DIR}/all_suis_genomes.fna"
-find "$FASTA_DIR" -name '*.fna' -exec cat {} + > "$MERGED_FASTA"
-echo "Merged into: $MERGED_FASTA"
+BLAST_DB_NAME="${OUTPUT_DIR}/suis_db"
+CONTIG_INDEX="${OUTPUT_DIR}/contig_index.tsv"   # contig -> assembly, written by both merge modes
+if [ "$INCREMENTAL_DB" = "1" ]; then
+  echo "[2/5] Incremental mode: skipping merge (genomes are indexed individually)"
+else
+  echo "[2/5] Merging FASTA files from '$FASTA_DIR'..."
+  MERGED_FASTA="${OUTPUT_DIR}/all_suis_genomes.fna"
+  run_stage merge -- python3 genome_merge.py -g "$FASTA_DIR" -o "$MERGED_FASTA"
+  echo "Merged into: $MERGED_FASTA"
+fi
 
 # --- 3. Count genomes ---
-TOTAL_GENOMES=$(ls -1 "$FASTA_DIR"/*.fna | wc -l)
+TOTAL_GENOMES=$(python3 genome_merge.py -g "$FASTA_DIR" --list | wc -l)
 echo "[3/5] Total genomes (FASTA files): $TOTAL_GENOMES"
 
 # --- 4. Create BLAST DB ---
-echo "[4/5] Creating BLAST database..."
-BLAST_DB_NAME="${OUTPUT_DIR}/suis_db"
-makeblastdb -in "$MERGED_FASTA" -dbtype nucl -out "$BLAST_DB_NAME" -parse_seqids -title "S.suis_DB"
+if [ "$INCREMENTAL_DB" = "1" ]; then
+  echo "[4/5] Updating incremental BLAST database..."
+  run_stage incremental_db -- python3 blast_db.py -g "$FASTA_DIR" -o "$OUTPUT_DIR" -n suis_db
+else
+  echo "[4/5] Creating BLAST database..."
+  run_stage makeblastdb -- \
+    makeblastdb -in "$MERGED_FASTA" -dbtype nucl -out "$BLAST_DB_NAME" -parse_seqids -title "S.suis_DB"
+  if [ "$PREFILTER" = "1" ]; then
+    echo "Building k-mer prefilter index..."
+    run_stage kmer_index -- \
+      python3 kmer_prefilter.py build -f "$MERGED_FASTA" --contig_index "$CONTIG_INDEX" -o "${OUTPUT_DIR}/kmer_index"
+  fi
+fi
 echo "DB: $BLAST_DB_NAME.*"
 
 # --- 5. Run tblastn & parse ---
 echo "[5/5] Running tblastn & parsing results..."
 BLAST_OUT="${OUTPUT_DIR}/blast_results.tsv"
-tblastn -query "$QUERY_PROTEIN_FASTA" \
-        -db "$BLAST_DB_NAME" \
-        -evalue "$EVALUE" \
-        -outfmt 6 \
-        -num_threads "$THREADS" \
-        -out "$BLAST_OUT"
-echo "tblastn done: $BLAST_OUT"
-
 PARSER_OUT="${OUTPUT_DIR}/genomes_with_hit_stats.tsv"
-python3 "$PYTHON_SCRIPT" \
-  -i "$BLAST_OUT" \
-  -t "$TOTAL_GENOMES" \
-  -q "$QUERY_PROTEIN_FASTA" \
-  --min_identity "$MIN_IDENTITY" \
-  --min_coverage "$MIN_COVERAGE" \
-  -o "$PARSER_OUT"
-echo "Parsed stats: $PARSER_OUT"
+if [ "$STREAMING" = "1" ]; then
+  RAW_ARGS=()
+  if [ "$KEEP_RAW_TSV" = "1" ]; then
+    RAW_ARGS=(--raw_output "$BLAST_OUT")
+  fi
+  run_stage streaming_prevalence -- python3 streaming_prevalence.py \
+    -q "$QUERY_PROTEIN_FASTA" \
+    -d "$BLAST_DB_NAME" \
+    -t "$TOTAL_GENOMES" \
+    -e "$EVALUE" \
+    --threads "$THREADS" \
+    --min_identity "$MIN_IDENTITY" \
+    --min_coverage "$MIN_COVERAGE" \
+    -o "${OUTPUT_DIR}/antigen_prevalence_stats.tsv" \
+    --genome_stats "$PARSER_OUT" \
+    --contig_index "$CONTIG_INDEX" \
+    "${RAW_ARGS[@]}"
+  echo "Streamed stats: $PARSER_OUT"
+else
+  if [ "$PREFILTER" = "1" ]; then
+    run_stage tblastn_prefiltered --rows_file "$BLAST_OUT" -- python3 kmer_prefilter.py search \
+      -i "${OUTPUT_DIR}/kmer_index" \
+      -q "$QUERY_PROTEIN_FASTA" \
+      -d "$BLAST_DB_NAME" \
+      -e "$EVALUE" \
+      --threads "$THREADS" \
+      --min_seeds "$PREFILTER_MIN_SEEDS" \
+      -o "$BLAST_OUT"
+  elif [ "$SHARDED" = "1" ]; then
+    run_stage sharded_search --rows_file "$BLAST_OUT" -- python3 sharded_search.py \
+      -q "$QUERY_PROTEIN_FASTA" \
+      -d "$BLAST_DB_NAME" \
+      -e "$EVALUE" \
+      --workers "$THREADS" \
+      -o "$BLAST_OUT"
+  else
+    run_stage tblastn --rows_file "$BLAST_OUT" -- \
+      tblastn -query "$QUERY_PROTEIN_FASTA" \
+              -db "$BLAST_DB_NAME" \
+              -evalue "$EVALUE" \
+              -outfmt 6 \
+              -num_threads "$THREADS" \
+              -out "$BLAST_OUT"
+  fi
+  echo "tblastn done: $BLAST_OUT"
+  run_stage hit_store --rows_file "$BLAST_OUT" -- python3 hit_store.py "$BLAST_OUT"   # columnar copy read by the parsers
+
+  run_stage parse --rows_file "$PARSER_OUT" -- python3 "$PYTHON_SCRIPT" \
+    -i "$BLAST_OUT" \
+    -t "$TOTAL_GENOMES" \
+    -q "$QUERY_PROTEIN_FASTA" \
+    --min_identity "$MIN_IDENTITY" \
+    --min_coverage "$MIN_COVERAGE" \
+    --coverage_mode "$COVERAGE_MODE" \
+    --contig_index "$CONTIG_INDEX" \
+    -o "$PARSER_OUT"
+  echo "Parsed stats: $PARSER_OUT"
+fi
 
+if [ "$METRICS" = "1" ]; then
+  echo "Stage metrics: $METRICS_FILE"
+fi
 echo "--- Analysis Complete ---"
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+S. suis Sharded tBLASTn Execution
+=================================
+
+tblastn's own threading stops scaling after a few cores.  This module splits
+the query set and (for alias databases such as the incremental suis_db) the
+database volumes into shards, runs one single-threaded tblastn per shard in a
+bounded process pool, retries failed shards and merges the per-shard outputs
+into one deterministically sorted fmt 6 table.
+
+Database shards are searched with ``-dbsize`` set to the length of the whole
+database so e-values are computed against the full database rather than
+against each volume.
+
+Usage:
+    python sharded_search.py -q query_antigens.fasta \\
+        -d suis_prevalence_analysis/suis_db -o blast_results.tsv --workers 64
+"""
+
+import argparse
+import heapq
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from blast_search import read_query_records
+
+DEFAULT_MAX_TARGET_SEQS = 500
+
+
+def split_queries(records, n_shards):
+    """Split (id, sequence) records into at most n_shards length-balanced groups"""
+    n_shards = max(1, min(n_shards, len(records)))
+    shards = [[] for _ in range(n_shards)]
+    loads = [0] * n_shards
+    # Longest-first greedy assignment; tblastn time grows with query length
+    for record in sorted(records, key=lambda r: (-len(r[1]), r[0])):
+        target = loads.index(min(loads))
+        shards[target].append(record)
+        loads[target] += len(record[1])
+    return [shard for shard in shards if shard]
+
+
+def database_volumes(db_name):
+    """Return the volumes behind an alias database, or [db_name] for a plain one"""
+    alias = Path(f'{db_name}.nal')
+    if not alias.exists():
+        return [str(db_name)]
+    volumes = []
+    with open(alias) as fh:
+        for line in fh:
+            if line.startswith('DBLIST'):
+                for volume in shlex.split(line[len('DBLIST'):]):
+                    path = Path(volume)
+                    if not path.is_absolute():
+                        path = alias.parent / path
+                    volumes.append(str(path))
+    return volumes or [str(db_name)]
+
+
+def database_length(db_name):
+    """Total number of bases in a BLAST database (from blastdbcmd -info)"""
+    result = subprocess.run(['blastdbcmd', '-db', str(db_name), '-info'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"blastdbcmd failed: {result.stderr}")
+    match = re.search(r'([\d,]+) total (?:bases|residues)', result.stdout)
+    if not match:
+        raise RuntimeError(f"Could not read database length for {db_name}")
+    return int(match.group(1).replace(',', ''))
+
+
+def hit_sort_key(line, query_rank):
+    """Canonical ordering: query order, e-value, bitscore (desc), then subject coordinates"""
+    f = line.rstrip('\n').split('\t')
+    return (query_rank.get(f[0], len(query_rank)), float(f[10]), -float(f[11]), f[1],
+            int(f[8]), int(f[9]), int(f[6]), int(f[7]), line)
+
+
+def _run_shard(task):
+    """Process-pool worker: run one tblastn shard and sort its output"""
+    result = subprocess.run(task['cmd'], capture_output=True, text=True)
+    if result.returncode != 0:
+        return task['shard_id'], result.stderr or f"exit code {result.returncode}"
+    with open(task['raw_output']) as fh:
+        lines = [line if line.endswith('\n') else line + '\n' for line in fh if line.strip()]
+    lines.sort(key=lambda line: hit_sort_key(line, task['query_rank']))
+    with open(task['sorted_output'], 'w') as fh:
+        fh.writelines(lines)
+    return task['shard_id'], None
+
+
+def sharded_tblastn(query_fasta, db_name, blast_output, evalue, threads, extra_args=(),
+                    threads_per_shard=1, query_shards=None, split_db=True, max_retries=2,
+                    max_target_seqs=DEFAULT_MAX_TARGET_SEQS):
+    """
+    Run tblastn as query x database-volume shards in a process pool.
+
+    Has the same leading signature as blast_search.run_tblastn so it can be
+    used as the runner of blast_search.cached_tblastn.
+
+    Args:
+        query_fasta (str): Protein query FASTA file.
+        db_name (str): BLAST nucleotide database (or alias) path.
+        blast_output (str): Merged, sorted fmt 6 output path.
+        evalue (str): E-value cut-off.
+        threads (int): Total CPU budget; workers = threads // threads_per_shard.
+        extra_args (tuple): Additional tblastn arguments.
+        threads_per_shard (int): -num_threads for each tblastn process.
+        query_shards (int): Number of query shards (default: one per worker,
+            divided by the number of database shards).
+        split_db (bool): Also shard over the volumes of an alias database.
+        max_retries (int): Extra attempts for each failed shard.
+        max_target_seqs (int): Per-query subject limit re-applied after merging
+            database shards (tblastn applies it per shard).
+
+    Returns:
+        dict: Number of 'shards' run and 'retries' needed.
+    """
+    workers = max(1, int(threads) // max(1, threads_per_shard))
+    records = read_query_records(query_fasta)
+    if not records:
+        open(blast_output, 'w').close()
+        return {'shards': 0, 'retries': 0}
+    query_rank = {qseqid: i for i, (qseqid, _) in enumerate(records)}
+
+    volumes = database_volumes(db_name) if split_db else [str(db_name)]
+    db_args = []
+    if len(volumes) > 1 and '-dbsize' not in extra_args:
+        db_args = ['-dbsize', str(database_length(db_name))]
+    if query_shards is None:
+        query_shards = max(1, workers // len(volumes))
+    query_groups = split_queries(records, query_shards)
+
+    with tempfile.TemporaryDirectory(dir=Path(blast_output).parent) as tmp_dir:
+        tasks = []
+        for q, group in enumerate(query_groups):
+            shard_query = Path(tmp_dir) / f'query_{q}.fasta'
+            with open(shard_query, 'w') as fh:
+                for qseqid, sequence in group:
+                    fh.write(f">{qseqid}\n{sequence}\n")
+            for v, volume in enumerate(volumes):
+                shard_id = f'{q}_{v}'
+                raw_output = Path(tmp_dir) / f'hits_{shard_id}.tsv'
+                cmd = [
+                    'tblastn',
+                    '-query', str(shard_query),
+                    '-db', volume,
+                    '-evalue', str(evalue),
+                    '-outfmt', '6',
+                    '-out', str(raw_output),
+                    '-num_threads', str(threads_per_shard)
+                ] + db_args + list(extra_args)
+                tasks.append({'shard_id': shard_id, 'cmd': cmd, 'raw_output': str(raw_output),
+                              'sorted_output': f'{raw_output}.sorted', 'query_rank': query_rank})
+
+        retries = _run_pool(tasks, workers, max_retries)
+        _merge_sorted([t['sorted_output'] for t in tasks], blast_output, query_rank,
+                      max_target_seqs if len(volumes) > 1 else None)
+
+    return {'shards': len(tasks), 'retries': retries}
+
+
+def _run_pool(tasks, workers, max_retries):
+    """Run every task, resubmitting failures up to max_retries times"""
+    pending = {task['shard_id']: task for task in tasks}
+    retries = 0
+    errors = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        for attempt in range(max_retries + 1):
+            errors = {}
+            for shard_id, error in pool.map(_run_shard, list(pending.values())):
+                if error is None:
+                    del pending[shard_id]
+                else:
+                    errors[shard_id] = error
+            if not pending:
+                return retries
+            retries += len(pending)
+            print(f"  Retrying {len(pending)} failed shard(s) (attempt {attempt + 2})")
+    shard_id, error = next(iter(errors.items()))
+    raise RuntimeError(f"tblastn shard {shard_id} failed after {max_retries + 1} attempts: {error}")
+
+
+def _merge_sorted(paths, blast_output, query_rank, max_target_seqs):
+    """k-way merge of sorted shard outputs, optionally re-applying max_target_seqs"""
+    handles = [open(path) for path in paths]
+    try:
+        merged = heapq.merge(*handles, key=lambda line: hit_sort_key(line, query_rank))
+        with open(blast_output, 'w') as out:
+            current_query, subjects = None, set()
+            for line in merged:
+                if max_target_seqs:
+                    qseqid, sseqid = line.split('\t', 2)[:2]
+                    if qseqid != current_query:
+                        current_query, subjects = qseqid, set()
+                    if sseqid not in subjects:
+                        if len(subjects) >= max_target_seqs:
+                            continue
+                        subjects.add(sseqid)
+                out.write(line)
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run tblastn as parallel query/database shards and merge the results deterministically."
+    )
+    parser.add_argument("-q", "--query_fasta", required=True, help="Path to the query protein FASTA file.")
+    parser.add_argument("-d", "--db", required=True, help="BLAST nucleotide database (or alias) to search.")
+    parser.add_argument("-o", "--output", required=True, help="Merged tabular (fmt 6) output path.")
+    parser.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Total CPU budget (default: all cores).")
+    parser.add_argument("--threads_per_shard", type=int, default=1, help="tblastn threads per shard (default: 1).")
+    parser.add_argument("--query_shards", type=int, help="Number of query shards (default: derived from --workers).")
+    parser.add_argument("--no_db_split", action="store_true", help="Do not shard over alias database volumes.")
+    parser.add_argument("--max_retries", type=int, default=2, help="Retries per failed shard (default: 2).")
+    args = parser.parse_args()
+
+    summary = sharded_tblastn(args.query_fasta, args.db, args.output, args.evalue, args.workers,
+                              threads_per_shard=args.threads_per_shard, query_shards=args.query_shards,
+                              split_db=not args.no_db_split, max_retries=args.max_retries)
+    print(f"Shards run: {summary['shards']}, retries: {summary['retries']}")
+    print(f"Merged results: {args.output}")
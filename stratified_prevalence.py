@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+S. suis Stratified Prevalence
+=============================
+
+supplementary/assembly_list.csv only lists accessions, so prevalence is one
+number for the whole collection, while vaccine coverage decisions depend on
+serotype, geography, period and host.  This module joins a genome metadata
+table (one row per assembly; any columns such as serotype, country, year,
+host) to the presence matrix of analyze_blast_results() and reports every
+antigen's prevalence and the k-of-n multi-antigen coverage for every level of
+every stratifying column and of every combination of them.
+
+Everything is done on integer codes in one pass:
+
+* the metadata is aligned to the matrix columns through an integer index and
+  every stratifying column becomes level codes (genomes without metadata
+  fall into the 'unknown' level, so every stratification covers the whole
+  collection);
+* a combination of columns is a mixed-radix code over the level codes,
+  compacted to the observed strata, and the codes of all combinations are
+  offset into one stratum ID space;
+* with a few antigens, genomes are reduced to their presence pattern (a
+  handful of distinct patterns), a single bincount over (stratum, pattern)
+  pairs counts every stratum at once and one product with the pattern
+  features gives the hit genomes of every measure;
+* with many antigens the patterns approach the genomes in number, so the
+  features are instead summed per stratum directly: one sort and one
+  segment sum (np.add.reduceat) per combination.
+
+Whichever is cheaper is used: the cost grows with strata x patterns or with
+genomes x combinations (times the measures), not with one DataFrame filter
+per stratum.
+
+Output (stratified_prevalence.tsv): strata (the combined columns, 'all' for
+the whole collection), one column per stratifying column with the level (empty
+when not part of the stratification), genomes, measure, kind (antigen or
+k_of_n), hit_genomes and percent.
+
+Usage:
+    python stratified_prevalence.py -m suis_prevalence_analysis/presence_matrix \\
+        --metadata genome_metadata.tsv [--strata serotype,country] [--max_order 2] [--min_genomes 5]
+"""
+
+import argparse
+import itertools
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bootstrap_ci import presence_features
+from presence_matrix import PresenceMatrix
+
+STRATIFIED_NAME = 'stratified_prevalence.tsv'
+UNKNOWN = 'unknown'
+ALL_STRATA = 'all'
+
+
+def read_metadata(path, genome_column=None):
+    """
+    Genome metadata table (CSV or tab-separated) with every value as a string.
+
+    Args:
+        path (str): Metadata file; ``.csv`` is comma-separated, anything else tab-separated.
+        genome_column (str): Column holding the assembly accessions (default: the first).
+
+    Returns:
+        pd.DataFrame: The table indexed by genome accession.
+    """
+    table = pd.read_csv(path, sep=',' if str(path).endswith('.csv') else '\t', dtype=str)
+    genome_column = genome_column or table.columns[0]
+    if genome_column not in table:
+        raise ValueError(f"Genome column '{genome_column}' not in {path}")
+    table = table.dropna(subset=[genome_column]).set_index(genome_column)
+    duplicated = table.index[table.index.duplicated()]
+    if len(duplicated):
+        raise ValueError(f"{path}: genome '{duplicated[0]}' is listed more than once")
+    return table
+
+
+def level_codes(metadata, columns, genomes, n_genomes):
+    """
+    Level codes of every stratifying column for the matrix columns.
+
+    Args:
+        metadata (pd.DataFrame): Table indexed by genome (see read_metadata()).
+        columns (list): Stratifying columns.
+        genomes (list): Named genomes (the first matrix columns).
+        n_genomes (int): Matrix columns; the unnamed rest have no metadata.
+
+    Returns:
+        tuple: (int64 array columns x genomes of level codes, list of level
+                labels per column).
+    """
+    rows = metadata.index.get_indexer(pd.Index(genomes, dtype=object))
+    rows = np.concatenate([rows, np.full(n_genomes - len(genomes), -1, dtype=rows.dtype)])
+    codes = np.empty((len(columns), n_genomes), dtype=np.int64)
+    levels = []
+    for i, column in enumerate(columns):
+        values = metadata[column].fillna(UNKNOWN).to_numpy(dtype=object)
+        aligned = np.where(rows >= 0, values[np.maximum(rows, 0)] if len(values) else UNKNOWN, UNKNOWN)
+        codes[i], labels = pd.factorize(aligned, sort=True)
+        levels.append([str(label) for label in labels])
+    return codes, levels
+
+
+def stratum_ids(codes, levels, max_order=None):
+    """
+    Stratum ID of every genome in every combination of columns.
+
+    Args:
+        codes (np.ndarray): Columns x genomes level codes (see level_codes()).
+        levels (list): Level labels per column.
+        max_order (int): Most columns in one combination (default: all).
+
+    Returns:
+        tuple: (combinations, a list of column index tuples starting with the
+                empty one for the whole collection; int64 array combinations x
+                genomes of stratum IDs, numbered across all combinations;
+                combination index of every stratum; strata x columns level
+                index, -1 where the column is not part of the combination).
+    """
+    n_columns, n_genomes = codes.shape
+    max_order = n_columns if max_order is None else min(max_order, n_columns)
+    combinations = [()] + [combo for order in range(1, max_order + 1)
+                           for combo in itertools.combinations(range(n_columns), order)]
+    ids = np.empty((len(combinations), n_genomes), dtype=np.int64)
+    owners, decoded_levels, offset = [], [], 0
+    for c, combo in enumerate(combinations):
+        # Mixed-radix code over the level codes, compacted to the observed strata
+        combined = np.zeros(n_genomes, dtype=np.int64)
+        for column in combo:
+            combined = combined * len(levels[column]) + codes[column]
+        observed, inverse = np.unique(combined, return_inverse=True)
+        ids[c] = inverse.reshape(-1) + offset
+        offset += len(observed)
+
+        decoded = np.full((len(observed), n_columns), -1, dtype=np.int64)
+        rest = observed
+        for column in reversed(combo):
+            rest, decoded[:, column] = np.divmod(rest, len(levels[column]))
+        decoded_levels.append(decoded)
+        owners.append(np.full(len(observed), c, dtype=np.int64))
+    return combinations, ids, np.concatenate(owners), np.vstack(decoded_levels)
+
+
+def stratum_sums(ids, features, n_strata):
+    """
+    Per-stratum sums of every feature column.
+
+    Args:
+        ids (np.ndarray): Combinations x genomes stratum IDs (see stratum_ids()).
+        features (np.ndarray): Genomes x measures 0/1 features (uint8).
+        n_strata (int): Number of stratum IDs.
+
+    Returns:
+        np.ndarray: int64 strata x measures hit genome counts.
+    """
+    sums = np.zeros((n_strata, features.shape[1]), dtype=np.int64)
+    if features.shape[0] == 0:
+        return sums
+    for row in ids:
+        order = np.argsort(row, kind='stable')
+        sorted_ids = row[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+        sums[sorted_ids[starts]] = np.add.reduceat(features[order], starts, axis=0, dtype=np.int64)
+    return sums
+
+
+def stratified_prevalence(matrix, metadata, columns=None, max_order=None, min_genomes=1):
+    """
+    Prevalence of every antigen and k-of-n coverage in every stratum.
+
+    Args:
+        matrix (PresenceMatrix): Presence matrix of the run.
+        metadata (pd.DataFrame): Genome metadata indexed by genome (see read_metadata()).
+        columns (list): Stratifying columns (default: all metadata columns).
+        max_order (int): Most columns combined in one stratification (default: all).
+        min_genomes (int): Strata with fewer genomes are left out.
+
+    Returns:
+        pd.DataFrame: strata, one column per stratifying column, genomes,
+                      measure, kind, hit_genomes and percent.
+    """
+    columns = list(metadata.columns) if columns is None else list(columns)
+    missing = [column for column in columns if column not in metadata]
+    if missing:
+        raise ValueError(f"Stratifying columns not in the metadata: {', '.join(missing)}")
+
+    features, measures = presence_features(matrix)
+    features = features.astype(np.uint8)
+    n_genomes = features.shape[0]
+    codes, levels = level_codes(metadata, columns, matrix.genomes, n_genomes)
+    combinations, ids, owners, strata_levels = stratum_ids(codes, levels, max_order)
+    n_strata = len(owners)
+    genomes = np.bincount(ids.reshape(-1), minlength=n_strata)
+
+    patterns, pattern_codes = np.unique(features, axis=0, return_inverse=True)
+    n_patterns = len(patterns)
+    if n_strata * n_patterns <= ids.size:
+        # Few distinct presence patterns: count (stratum, pattern) pairs, then one product
+        counts = np.bincount((ids * n_patterns + pattern_codes.reshape(-1)).reshape(-1),
+                             minlength=n_strata * n_patterns).reshape(n_strata, n_patterns)
+        hit_genomes = counts @ patterns.astype(np.int64)
+    else:
+        hit_genomes = stratum_sums(ids, features, n_strata)
+
+    keep = np.flatnonzero(genomes >= min_genomes)
+    n_measures = len(measures)
+    names = np.array(['+'.join(columns[i] for i in combo) or ALL_STRATA for combo in combinations], dtype=object)
+    result = pd.DataFrame({'strata': np.repeat(names[owners[keep]], n_measures)})
+    for c, column in enumerate(columns):
+        labels = np.array(levels[c] + [''], dtype=object)
+        result[column] = np.repeat(labels[strata_levels[keep, c]], n_measures)
+    result['genomes'] = np.repeat(genomes[keep], n_measures)
+    result['measure'] = np.tile(measures['measure'].to_numpy(), len(keep))
+    result['kind'] = np.tile(measures['kind'].to_numpy(), len(keep))
+    result['hit_genomes'] = hit_genomes[keep].reshape(-1)
+    result['percent'] = result['hit_genomes'] / result['genomes'] * 100
+    return result
+
+
+def write_stratified(matrix_dir, metadata_file, output_file, columns=None, genome_column=None,
+                     max_order=None, min_genomes=1):
+    """Stratify the presence matrix of a run by a metadata table and write the TSV"""
+    matrix = PresenceMatrix(matrix_dir)
+    metadata = read_metadata(metadata_file, genome_column)
+    if not metadata.index.isin(matrix.genomes).any():
+        print(f"  Warning: no genome of the presence matrix is listed in {metadata_file}")
+    result = stratified_prevalence(matrix, metadata, columns, max_order, min_genomes)
+    result.to_csv(output_file, sep='\t', index=False, float_format='%.4f')
+    return result
+
+
+def print_stratified(result, indent='    '):
+    """Coverage by >= 1 antigen and by all antigens for every level of the single-column strata"""
+    k_of_n = result[result['kind'] == 'k_of_n']
+    n = k_of_n['measure'].nunique()
+    for column in result.columns[1:result.columns.get_loc('genomes')]:
+        rows = k_of_n[k_of_n['strata'] == column]
+        for level, group in rows.groupby(column, sort=True):
+            any_antigen = group['percent'].iloc[0]
+            every_antigen = group['percent'].iloc[-1]
+            print(f"{indent}{column}={level}: {group['genomes'].iloc[0]} genomes, "
+                  f"≥1 antigen {any_antigen:.2f}%, all {n} antigens {every_antigen:.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Antigen prevalence and k-of-n coverage per metadata stratum (serotype, country, year, host, ...)."
+    )
+    parser.add_argument("-m", "--matrix", required=True, help="Presence matrix directory.")
+    parser.add_argument("--metadata", required=True, help="Genome metadata table (.csv, otherwise tab-separated).")
+    parser.add_argument("--genome_column", help="Metadata column with the assembly accessions (default: the first).")
+    parser.add_argument("--strata", help="Comma-separated stratifying columns (default: all other columns).")
+    parser.add_argument("--max_order", type=int, help="Most columns combined in one stratification (default: all).")
+    parser.add_argument("--min_genomes", type=int, default=1, help="Leave out strata with fewer genomes (default: 1).")
+    parser.add_argument("-o", "--output", help=f"Output TSV (default: {STRATIFIED_NAME} next to the matrix directory).")
+    args = parser.parse_args()
+
+    output = args.output or Path(args.matrix).resolve().parent / STRATIFIED_NAME
+    result = write_stratified(args.matrix, args.metadata, output, args.strata.split(',') if args.strata else None,
+                              args.genome_column, args.max_order, args.min_genomes)
+    print_stratified(result)
+    print(f"Stratified prevalence: {output} ({result['strata'].nunique()} stratifications, "
+          f"{len(result) // max(1, result['measure'].nunique())} strata)")
+
+
+if __name__ == "__main__":
+    main()
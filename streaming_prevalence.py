@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+S. suis Streaming Prevalence Aggregation
+========================================
+
+Reads tblastn tabular output (fmt 6) from its stdout as it is produced and
+keeps running per-antigen and per-(antigen, genome) aggregates instead of
+loading a multi-gigabyte blast_results.tsv into pandas afterwards.  Memory is
+bounded by antigens x genomes, not by the number of hits.  Partial prevalence
+is printed while the search is running and the raw TSV is optional.
+
+Usage:
+    python streaming_prevalence.py -q query_antigens.fasta \\
+        -d suis_prevalence_analysis/suis_db -t 388 -o antigen_stats.tsv
+"""
+
+import argparse
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from blast_search import TblastnCache, read_query_records
+from genome_index import load_contig_index, resolve_genome
+
+
+class PrevalenceAggregator:
+    """Online per-antigen / per-genome aggregates over fmt 6 hit rows"""
+
+    def __init__(self, query_lengths, total_genomes, min_identity, min_coverage,
+                 contig_index=None):
+        self.query_lengths = dict(query_lengths)
+        self.total_genomes = total_genomes
+        self.min_identity = min_identity
+        self.min_coverage = min_coverage
+        self.contig_index = contig_index
+        self.rows_seen = 0
+        self._genome_cache = {}
+        self.antigens = {qseqid: self._new_antigen() for qseqid in self.query_lengths}
+        # (antigen, genome) -> [hit_count, max_identity, coverage_sum]
+        self.genome_stats = {}
+
+    @staticmethod
+    def _new_antigen():
+        return {'raw_hits': 0, 'filtered_hits': 0, 'identity_sum': 0.0,
+                'max_identity': 0.0, 'coverage_sum': 0.0, 'genomes': set()}
+
+    def _genome(self, sseqid):
+        genome = self._genome_cache.get(sseqid)
+        if genome is None:
+            genome = self._genome_cache[sseqid] = resolve_genome(sseqid, self.contig_index)
+        return genome
+
+    def add_line(self, line):
+        """Consume one fmt 6 line"""
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) < 12:
+            return
+        self.add(fields[0], fields[1], float(fields[2]), int(fields[3]))
+
+    def add(self, qseqid, sseqid, pident, length):
+        """Consume one hit"""
+        self.rows_seen += 1
+        antigen = self.antigens.get(qseqid)
+        if antigen is None:
+            antigen = self.antigens[qseqid] = self._new_antigen()
+        antigen['raw_hits'] += 1
+
+        qlen = self.query_lengths.get(qseqid)
+        if not qlen:
+            return
+        coverage = length / qlen
+        if pident < self.min_identity or coverage < self.min_coverage:
+            return
+
+        genome = self._genome(sseqid)
+        antigen['filtered_hits'] += 1
+        antigen['identity_sum'] += pident
+        antigen['coverage_sum'] += coverage
+        antigen['max_identity'] = max(antigen['max_identity'], pident)
+        antigen['genomes'].add(genome)
+
+        stats = self.genome_stats.get((qseqid, genome))
+        if stats is None:
+            self.genome_stats[(qseqid, genome)] = [1, pident, coverage]
+        else:
+            stats[0] += 1
+            stats[1] = max(stats[1], pident)
+            stats[2] += coverage
+
+    def prevalence(self, qseqid):
+        if not self.total_genomes:
+            return 0.0
+        return len(self.antigens[qseqid]['genomes']) / self.total_genomes * 100
+
+    def progress_line(self):
+        """One-line partial prevalence report"""
+        parts = [f"{qseqid.split('|')[0]} {self.prevalence(qseqid):.1f}%"
+                 for qseqid in self.antigens]
+        return f"  [{self.rows_seen} hits] " + ' | '.join(parts)
+
+    def summary(self):
+        """Per-antigen statistics in the detailed_antigen_stats.tsv layout"""
+        rows = []
+        for qseqid, antigen in self.antigens.items():
+            n = antigen['filtered_hits']
+            rows.append({
+                'antigen': qseqid,
+                'protein_length': self.query_lengths.get(qseqid, 0),
+                'raw_hits': antigen['raw_hits'],
+                'filtered_hits': n,
+                'hit_genomes': len(antigen['genomes']),
+                'total_genomes': self.total_genomes,
+                'prevalence_percent': self.prevalence(qseqid),
+                'max_identity': antigen['max_identity'],
+                'mean_identity': antigen['identity_sum'] / n if n else 0.0,
+                'mean_coverage_percent': antigen['coverage_sum'] / n * 100 if n else 0.0
+            })
+        return pd.DataFrame(rows)
+
+    def passing_hits(self):
+        """
+        One row per passing (antigen, genome) pair: the best identity and mean coverage of its hits.
+
+        Every row passes the aggregator's thresholds, so the frame can stand in
+        for the annotated hits of presence_matrix.write_presence_matrix().
+        """
+        return pd.DataFrame(
+            [(qseqid, genome, max_identity, coverage_sum / count)
+             for (qseqid, genome), (count, max_identity, coverage_sum) in self.genome_stats.items()],
+            columns=['qseqid', 'genome_accession', 'pident', 'coverage'])
+
+    def genome_table(self):
+        """Per-genome statistics pooled over antigens (parse_prevalence.py layout)"""
+        pooled = {}
+        for (_, genome), (count, max_identity, coverage_sum) in self.genome_stats.items():
+            entry = pooled.setdefault(genome, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] = max(entry[1], max_identity)
+            entry[2] += coverage_sum
+        stats = pd.DataFrame(
+            [(genome, count, max_identity, coverage_sum / count)
+             for genome, (count, max_identity, coverage_sum) in sorted(pooled.items())],
+            columns=['genome_accession', 'hit_count', 'max_identity', 'mean_coverage'])
+        stats['max_identity'] = stats['max_identity'].round(1)
+        stats['mean_coverage'] = (stats['mean_coverage'] * 100).round(1)
+        return stats
+
+
+def stream_tblastn(query_fasta, db_name, evalue, threads, aggregator,
+                   raw_output=None, progress_every=100000, cache=None, extra_args=()):
+    """
+    Run tblastn and feed its stdout into an aggregator line by line.
+
+    Args:
+        query_fasta (str): Protein query FASTA file.
+        db_name (str): BLAST nucleotide database path.
+        evalue (str): E-value cut-off.
+        threads (int): Number of tblastn threads.
+        aggregator (PrevalenceAggregator): Receives every hit row.
+        raw_output (str): Optional path to also write the raw fmt 6 rows to.
+        progress_every (int): Print partial prevalence every N hits (0 = never).
+        cache (TblastnCache): Optional hit cache; cached queries are replayed
+            and only the remaining queries are searched.
+
+    Returns:
+        dict: Counts of 'cached' and 'searched' query sequences.
+    """
+    records = read_query_records(query_fasta)
+    raw = open(raw_output, 'w') if raw_output else None
+    next_report = progress_every
+
+    def consume(line):
+        nonlocal next_report
+        if raw:
+            raw.write(line)
+        aggregator.add_line(line)
+        if progress_every and aggregator.rows_seen >= next_report:
+            print(aggregator.progress_line(), flush=True)
+            next_report += progress_every
+
+    missing = records
+    if cache is not None:
+        missing = []
+        for qseqid, sequence in records:
+            rows = cache.lookup(sequence)
+            if rows is None:
+                missing.append((qseqid, sequence))
+                continue
+            for rest in rows:
+                consume(f"{qseqid}\t{rest}\n")
+
+    try:
+        if missing:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tmp_query = Path(tmp_dir) / 'stream_queries.fasta'
+                with open(tmp_query, 'w') as fh:
+                    for qseqid, sequence in missing:
+                        fh.write(f">{qseqid}\n{sequence}\n")
+                _stream_search(tmp_query, db_name, evalue, threads, consume,
+                               missing if cache is not None else (), cache, extra_args)
+    finally:
+        if raw:
+            raw.close()
+
+    if progress_every:
+        print(aggregator.progress_line(), flush=True)
+    return {'cached': len(records) - len(missing), 'searched': len(missing)}
+
+
+def _stream_search(query_fasta, db_name, evalue, threads, consume, to_cache, cache, extra_args):
+    """Run tblastn to stdout, optionally writing new cache entries on the fly"""
+    writers = {qseqid: cache.writer(sequence) for qseqid, sequence in to_cache}
+    cmd = [
+        'tblastn',
+        '-query', str(query_fasta),
+        '-db', str(db_name),
+        '-evalue', str(evalue),
+        '-outfmt', '6',
+        '-num_threads', str(threads)
+    ] + list(extra_args)
+
+    # stderr goes to a file: a full stderr pipe would block tblastn while we wait on stdout
+    with tempfile.TemporaryFile('w+') as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file,
+                                text=True, bufsize=1 << 20)
+        try:
+            for line in proc.stdout:
+                consume(line)
+                writer = writers.get(line.partition('\t')[0])
+                if writer is not None:
+                    writer.write(line.partition('\t')[2])
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            for writer in writers.values():
+                writer.discard()
+            raise
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    if returncode != 0:
+        for writer in writers.values():
+            writer.discard()
+        raise RuntimeError(f"tblastn failed: {stderr}")
+    for writer in writers.values():
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run tblastn and aggregate prevalence statistics from its output stream."
+    )
+    parser.add_argument("-q", "--query_fasta", required=True, help="Path to the query protein FASTA file.")
+    parser.add_argument("-d", "--db", required=True, help="BLAST nucleotide database to search.")
+    parser.add_argument("-t", "--total_genomes", required=True, type=int, help="Total number of genomes.")
+    parser.add_argument("-e", "--evalue", default="1e-5", help="E-value threshold (default: 1e-5).")
+    parser.add_argument("--threads", type=int, default=4, help="tblastn threads (default: 4).")
+    parser.add_argument("--min_identity", type=float, default=70.0, help="Minimum percent identity threshold (default: 70.0).")
+    parser.add_argument("--min_coverage", type=float, default=0.8, help="Minimum query coverage threshold (fraction, default: 0.8).")
+    parser.add_argument("-o", "--output", default="antigen_prevalence_stats.tsv", help="Per-antigen summary TSV.")
+    parser.add_argument("--genome_stats", help="Optional per-genome statistics TSV (parse_prevalence.py layout).")
+    parser.add_argument("--raw_output", help="Optional path to also keep the raw tblastn rows (fmt 6).")
+    parser.add_argument("--progress_every", type=int, default=100000, help="Print partial prevalence every N hits (0 disables).")
+    parser.add_argument("--contig_index", help="Optional contig_index.tsv (contig -> assembly) written when merging genomes.")
+    parser.add_argument("--cache_dir", help="tblastn hit cache directory (default: no cache).")
+    args = parser.parse_args()
+
+    query_lengths = {qseqid: len(seq) for qseqid, seq in read_query_records(args.query_fasta)}
+    contig_index = None
+    if args.contig_index and Path(args.contig_index).exists():
+        contig_index = load_contig_index(args.contig_index)
+    aggregator = PrevalenceAggregator(query_lengths, args.total_genomes,
+                                      args.min_identity, args.min_coverage, contig_index)
+    cache = TblastnCache(args.cache_dir, args.db, args.evalue) if args.cache_dir else None
+    stream_tblastn(args.query_fasta, args.db, args.evalue, args.threads, aggregator,
+                   raw_output=args.raw_output, progress_every=args.progress_every, cache=cache)
+
+    aggregator.summary().to_csv(args.output, sep='\t', index=False)
+    print(f"Antigen statistics saved to: {args.output}")
+    if args.genome_stats:
+        aggregator.genome_table().to_csv(args.genome_stats, sep='\t', index=False, float_format='%.1f')
+        print(f"Per-genome statistics saved to: {args.genome_stats}")
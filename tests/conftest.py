@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def fake_tool(tmp_path, monkeypatch):
+    """Install stand-in executables (name, script text) in tmp_path/bin, ahead of everything else on PATH"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def install(name, script):
+        tool = bin_dir / name
+        tool.write_text(script)
+        tool.chmod(0o755)
+        return tool
+    return install
+
+
+@pytest.fixture
+def fake_blast(monkeypatch):
+    """Put the offline BLAST+ stand-ins of benchmarks/fake_blast on PATH"""
+    monkeypatch.setenv('PATH', f"{ROOT / 'benchmarks' / 'fake_blast'}{os.pathsep}{os.environ['PATH']}")
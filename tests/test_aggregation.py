@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aggregation import BLAST_COLUMNS, annotate_hits, summarize_antigens
+
+
+def _synthetic_hits(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'qseqid': rng.choice(['A', 'B', 'C'], n),
+        'sseqid': [f"NZ_CP{g:06d}.1" for g in rng.integers(0, 50, n)],
+        'pident': rng.uniform(40, 100, n).round(1),
+        'length': rng.integers(20, 420, n),
+    })
+    for col in BLAST_COLUMNS:
+        if col not in df:
+            df[col] = 0
+    return df[BLAST_COLUMNS]
+
+
+def test_grouped_summary_matches_per_antigen_loop():
+    query_lengths = {'A': 400, 'B': 300, 'C': 350, 'D': 100}
+    df = annotate_hits(_synthetic_hits(), query_lengths)
+    summary = summarize_antigens(df, query_lengths, 60, 70.0, 0.8).set_index('antigen')
+
+    filt = df[(df['pident'] >= 70.0) & (df['coverage'] >= 0.8)]
+    for qseqid in query_lengths:
+        hits = filt[filt['qseqid'] == qseqid]
+        row = summary.loc[qseqid]
+        assert row['raw_hits'] == (df['qseqid'] == qseqid).sum()
+        assert row['filtered_hits'] == len(hits)
+        assert row['hit_genomes'] == hits['genome_accession'].nunique()
+        assert np.isclose(row['prevalence_percent'], hits['genome_accession'].nunique() / 60 * 100)
+        if len(hits):
+            assert np.isclose(row['mean_identity'], hits['pident'].mean())
+            assert np.isclose(row['mean_coverage_percent'], hits['coverage'].mean() * 100)
+        else:
+            assert row['max_identity'] == 0.0
+
+
+def test_parser_uses_each_query_length(tmp_path):
+    from parse_prevalence import parse_blast_output
+
+    query = tmp_path / 'q.fasta'
+    query.write_text('>A\n' + 'M' * 100 + '\n>B\n' + 'M' * 400 + '\n')
+    blast = tmp_path / 'hits.tsv'
+    blast.write_text(
+        "A\tNZ_CP000001.1\t90.0\t90\t0\t0\t1\t90\t1\t270\t1e-30\t150\n"
+        "B\tNZ_CP000002.1\t90.0\t390\t0\t0\t1\t390\t1\t1170\t1e-90\t600\n"
+    )
+    prevalence, stats = parse_blast_output(str(blast), 4, str(query), 70.0, 0.8)
+    assert prevalence == 50.0
+    assert list(stats['antigen']) == ['A', 'B']
+    assert list(stats['mean_coverage']) == [90.0, 97.5]
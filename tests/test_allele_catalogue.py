@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from allele_catalogue import AlleleCatalogue, build_catalogue, reference_identity
+from fasta_index import build_fai, reverse_complement
+
+_CODONS = {'M': 'ATG', 'K': 'AAA', 'T': 'ACC', 'A': 'GCA', 'Y': 'TAT', 'I': 'ATT', 'Q': 'CAG', 'R': 'CGT',
+           'S': 'TCT', 'F': 'TTC', 'V': 'GTG', 'H': 'CAT', 'L': 'CTG', 'G': 'GGC', 'E': 'GAA', 'D': 'GAT'}
+_COLUMNS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+            'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
+
+
+def _dna(protein):
+    return ''.join(_CODONS[aa] for aa in protein)
+
+
+def test_interning_stores_each_sequence_once():
+    catalogue = AlleleCatalogue()
+    a = catalogue.intern_region(b'ATGAAAACC')
+    # Same region again, and a synonymous variant: one allele, two nucleotide variants
+    assert catalogue.intern_region(b'ATGAAAACC') == a
+    assert catalogue.intern_region(b'ATGAAGACT') == a
+    assert catalogue.intern_region(b'ATGAAAGCC') != a
+    assert catalogue.intern_protein('MKT*') == a
+    assert len(catalogue) == 2 and catalogue.sequences == ['MKT', 'MKA']
+    assert catalogue.nucleotide_variants == [2, 1]
+
+    identity, covered = reference_identity('MKTAYIAKQRQSFVKSHFSRQ', 'MKTAYIAKQRQISFVKSHFSRQ')
+    assert np.isclose(identity, 21 / 22 * 100) and covered == 100.0
+
+
+def test_catalogue_counts_alleles_per_genome(tmp_path):
+    reference = 'MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ'
+    variant = reference[:10] + 'G' + reference[11:]
+    rng = np.random.default_rng(8)
+    spacer = lambda: ''.join(rng.choice(list('ACGT'), 50))
+    # G1, G2: reference (G2 on the minus strand); G3: variant; G4: reference and variant copies
+    layout = {'G1': [reference], 'G2': [reference], 'G3': [variant], 'G4': [reference, variant]}
+    contigs, rows = [], []
+    for genome, proteins in layout.items():
+        sequence, hits = spacer(), []
+        for protein in proteins:
+            start = len(sequence) + 1
+            sequence += _dna(protein) + spacer()
+            hits.append((start, start + 3 * len(protein) - 1))
+        if genome == 'G2':
+            length = len(sequence)
+            sequence = reverse_complement(sequence.encode()).decode()
+            hits = [(length - s + 1, length - e + 1) for s, e in hits]
+        contigs.append((f'c{genome}', sequence))
+        # G3 and G4 hits carry subject IDs wrapped by the BLAST database
+        sseqid = f'lcl|c{genome}' if genome in ('G3', 'G4') else f'c{genome}'
+        rows += [('A|1', sseqid, 95.0, len(reference), 0, 0, 1, len(reference), s, e, 1e-30, 100)
+                 for s, e in hits]
+    rows.append(('A|1', 'cG1', 30.0, len(reference), 0, 0, 1, len(reference), 1, 99, 1e-3, 10))
+    fasta = tmp_path / 'merged.fna'
+    fasta.write_text(''.join(f'>{name}\n{sequence}\n' for name, sequence in contigs))
+    build_fai(fasta)
+    pd.DataFrame(rows, columns=_COLUMNS).to_csv(tmp_path / 'blast.tsv', sep='\t', header=False, index=False)
+    (tmp_path / 'q.fasta').write_text(f'>A|1\n{reference}\n')
+
+    result = build_catalogue(tmp_path / 'blast.tsv', tmp_path / 'q.fasta', fasta, 5, 60.0, 0.8,
+                             tmp_path / 'alleles', {f'c{g}': g for g in layout})
+    table = result['tables']['A|1']
+    assert result['alleles'] == 2 and result['hits'] == 5
+    assert table['allele_id'].tolist() == ['A_1', 'A_2']
+    assert table['genomes'].tolist() == [3, 2]
+    assert table['is_reference'].tolist() == [True, False]
+    assert np.allclose(table['frequency_percent'], [75.0, 50.0])
+    assert np.allclose(table['genome_percent'], [60.0, 40.0])
+    assert np.isclose(table['identity_percent'].iloc[1], round((len(reference) - 1) / len(reference) * 100, 2))
+
+    written = pd.read_csv(tmp_path / 'alleles' / 'genome_alleles.tsv', sep='\t')
+    assert written[written['allele_id'] == 'A_2']['genome'].tolist() == ['G3', 'G4']
+    assert (tmp_path / 'alleles' / 'A_1.faa').read_text().split('\n')[1] == reference
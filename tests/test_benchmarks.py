@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'benchmarks'))
+
+from aggregation import load_hits
+from run_benchmarks import PIPELINE_STAGES, bench_cold_start, bench_pipeline, compare
+from synthetic import generate_hits
+
+
+def test_synthetic_hits_are_seeded(tmp_path):
+    a, b = tmp_path / 'a.tsv', tmp_path / 'b.tsv'
+    collection = generate_hits(a, 5000, n_genomes=20, seed=3, chunk_rows=1200)
+    generate_hits(b, 5000, n_genomes=20, seed=3, chunk_rows=1200)
+    assert a.read_bytes() == b.read_bytes()
+
+    hits = load_hits(a)
+    assert len(hits) == 5000
+    assert set(hits['sseqid']) <= set(collection.contigs)
+    assert set(hits['qseqid']) == set(collection.query_lengths)
+
+
+def test_offline_pipeline_and_baseline_comparison(tmp_path):
+    stages = bench_pipeline(tmp_path, n_genomes=12, hits_per_query=200)
+    assert set(stages) == set(PIPELINE_STAGES) | {'total'}
+    assert (tmp_path / 'output' / 'detailed_antigen_stats.tsv').exists()
+
+    baseline = {'pipeline': {name: dict(m, wall_s=m['wall_s'] / 10) for name, m in stages.items()}}
+    _, regressions = compare({'pipeline': stages}, baseline, tolerance=0.25)
+    assert {stage for _, stage, _, _ in regressions} == set(stages)
+
+
+def test_cold_start_stages(tmp_path):
+    stages = bench_cold_start(tmp_path, runs=1, rows=200, n_genomes=20)
+    assert set(stages) == {'interpreter', 'parse_prevalence_fast', 'parse_prevalence_pandas'}
+    assert (tmp_path / 'cold_start_stats.tsv').read_text().startswith('antigen\tgenome_accession')
+    assert all(m['rows'] == 200 and m['wall_s'] > 0 for m in stages.values())
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from aggregation import annotate_hits, load_hits
+from blast_archive import archive_tblastn, contiguous_shards, format_archive, parse_columns
+from blast_search import run_tblastn
+from hit_store import BLAST_COLUMNS, HitStore, table_columns, write_hit_store
+from parse_prevalence import can_use_fast_path
+from synthetic import SyntheticCollection
+
+
+def _database(tmp_path, monkeypatch):
+    monkeypatch.setenv('SUIS_FAKE_HITS_PER_QUERY', '50')
+    collection = SyntheticCollection.random(6, seed=2)
+    collection.write_query_fasta(tmp_path / 'query.fasta')
+    collection.write_genomes(tmp_path / 'genomes')
+    with open(tmp_path / 'merged.fna', 'w') as out:
+        for path in sorted((tmp_path / 'genomes').glob('*.fna')):
+            out.write(path.read_text())
+    os.system(f"makeblastdb -in {tmp_path / 'merged.fna'} -dbtype nucl -out {tmp_path / 'db'} > /dev/null")
+    return collection
+
+
+def test_archive_search_matches_tabular_search_and_reformats(tmp_path, monkeypatch, fake_blast):
+    collection = _database(tmp_path, monkeypatch)
+    run_tblastn(tmp_path / 'query.fasta', tmp_path / 'db', tmp_path / 'plain.tsv', '1e-5', 1)
+    archive_tblastn(tmp_path / 'query.fasta', tmp_path / 'db', tmp_path / 'hits.tsv', '1e-5', 1)
+    assert (tmp_path / 'hits.tsv').read_bytes() == (tmp_path / 'plain.tsv').read_bytes()
+    assert table_columns(tmp_path / 'hits.tsv') == BLAST_COLUMNS
+
+    # The fake draws carriers over the queries of each call, so only the order is compared across shards
+    summary = archive_tblastn(tmp_path / 'query.fasta', tmp_path / 'db', tmp_path / 'hits.tsv', '1e-5', 3)
+    assert summary['shards'] == 3 and len(list(summary['archive_dir'].glob('shard_*.asn'))) == 3
+    # 5 queries on 64 threads: 5 shards sharing the budget, not 5 single-threaded searches
+    assert archive_tblastn(tmp_path / 'query.fasta', tmp_path / 'db', tmp_path / 'hits64.tsv', '1e-5',
+                           64)['threads_per_shard'] == 12
+    order = list(dict.fromkeys(load_hits(tmp_path / 'hits.tsv')['qseqid']))
+    assert order == [qseqid for qseqid in collection.query_lengths if qseqid in order]
+
+    extended = tmp_path / 'extended.tsv'
+    result = format_archive(summary['archive_dir'], extended, 'std,qlen slen qcovhsp', workers=2)
+    assert result['columns'] == BLAST_COLUMNS + ['qlen', 'slen', 'qcovhsp']
+    assert table_columns(extended) == result['columns']
+    hits = load_hits(extended, ['qseqid', 'length', 'qlen'])
+    assert list(hits.columns) == ['qseqid', 'length', 'qlen']
+    assert dict(zip(hits['qseqid'], hits['qlen'])) == collection.query_lengths
+    assert load_hits(extended)[BLAST_COLUMNS].equals(load_hits(tmp_path / 'hits.tsv'))
+
+    with pytest.raises(RuntimeError, match='Unrecognized'):
+        format_archive(summary['archive_dir'], tmp_path / 'bad.tsv', 'qseqid nosuchfield', max_retries=0)
+
+
+def test_extended_tables_feed_the_aggregation(tmp_path):
+    assert parse_columns(None) == BLAST_COLUMNS
+    assert parse_columns('std qlen std') == BLAST_COLUMNS + ['qlen']
+    with pytest.raises(ValueError, match='lacks qseqid'):
+        parse_columns('sseqid qlen')
+    records = [('a', 'M' * 100), ('b', 'M' * 10), ('c', 'M' * 90), ('d', 'M' * 300)]
+    shards = contiguous_shards(records, 3)
+    assert [r for shard in shards for r in shard] == records and len(shards) > 1
+
+    blast_file = tmp_path / 'extended.tsv'
+    blast_file.write_text('Q1\tctg1\t99.5\t90\t0\t0\t1\t90\t10\t279\t1e-50\t180.0\t100\t5000\n'
+                          'Q2\tctg2\t70.0\t20\t6\t0\t1\t20\t10\t69\t1e-8\t40.0\t50\t9000\n')
+    os.utime(blast_file, ns=(time.time_ns() - 10**9,) * 2)
+    (tmp_path / 'extended.tsv.columns').write_text(' '.join(BLAST_COLUMNS + ['qlen', 'slen']) + '\n')
+    assert not can_use_fast_path(blast_file)
+    with pytest.raises(ValueError, match='no column qcovhsp'):
+        load_hits(blast_file, ['qseqid', 'qcovhsp'])
+
+    # Q2 is missing from the query FASTA lengths: qlen fills in
+    hits = annotate_hits(load_hits(blast_file), {'Q1': 90}, {'ctg1': 'GCF_1', 'ctg2': 'GCF_2'})
+    assert hits['coverage'].tolist() == [1.0, 0.4]
+
+    store = write_hit_store(blast_file)
+    assert HitStore(store).read(['qseqid', 'send']).equals(load_hits(blast_file, ['qseqid', 'send']))
+    assert load_hits(blast_file, ['qseqid', 'slen'])['slen'].tolist() == [5000, 9000]
+
+    # tblastn rewrote the table after the sidecar: back to the 12 standard columns
+    blast_file.write_text('Q1\tctg1\t99.5\t90\t0\t0\t1\t90\t10\t279\t1e-50\t180.0\n')
+    os.utime(blast_file, ns=(time.time_ns() + 10**9,) * 2)
+    assert table_columns(blast_file) == BLAST_COLUMNS
+    assert len(load_hits(blast_file)) == 1
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from blast_db import IncrementalBlastDatabase
+
+FAKE_MAKEBLASTDB = """#!/usr/bin/env python3
+import sys
+args = sys.argv[1:]
+out = args[args.index('-out') + 1]
+src = args[args.index('-in') + 1]
+with open(out + '.nsq', 'w') as fh:
+    fh.write(src)
+with open({log!r}, 'a') as fh:
+    fh.write(src + '\\n')
+"""
+
+
+def test_incremental_update(tmp_path, fake_tool):
+    log = tmp_path / 'calls.log'
+    fake_tool('makeblastdb', FAKE_MAKEBLASTDB.format(log=str(log)))
+
+    genome_dir = tmp_path / 'genomes'
+    genome_dir.mkdir()
+    (genome_dir / 'a.fna').write_text('>c1\nACGT\n')
+    (genome_dir / 'b.fna').write_text('>c2\nGGCC\n')
+
+    database = IncrementalBlastDatabase(tmp_path / 'db')
+    summary = database.update(sorted(genome_dir.glob('*.fna')))
+    assert sorted(summary['added']) == ['a.fna', 'b.fna']
+    assert len(log.read_text().splitlines()) == 2
+
+    # Re-running without changes must not call makeblastdb again
+    summary = database.update(sorted(genome_dir.glob('*.fna')))
+    assert sorted(summary['unchanged']) == ['a.fna', 'b.fna']
+    assert len(log.read_text().splitlines()) == 2
+
+    # One new genome, one edited genome, one deleted genome
+    (genome_dir / 'a.fna').write_text('>c1\nACGTACGT\n')
+    (genome_dir / 'b.fna').unlink()
+    (genome_dir / 'c.fna').write_text('>c3\nTTTT\n')
+    summary = database.update(sorted(genome_dir.glob('*.fna')))
+    assert summary['added'] == ['c.fna']
+    assert summary['changed'] == ['a.fna']
+    assert summary['removed'] == ['b.fna']
+    assert len(log.read_text().splitlines()) == 4
+
+    alias = (tmp_path / 'db' / 'suis_db.nal').read_text()
+    assert alias.count('volumes/') == 2
+    assert len(list((tmp_path / 'db' / 'volumes').glob('*.nsq'))) == 2
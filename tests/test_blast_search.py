@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from blast_search import FINGERPRINT_MEMO, TblastnCache, cached_tblastn, database_fingerprint
+
+FAKE_TBLASTN = """#!/usr/bin/env python3
+import sys
+args = sys.argv[1:]
+query = args[args.index('-query') + 1]
+out = args[args.index('-out') + 1]
+ids = [line[1:].split()[0] for line in open(query) if line.startswith('>')]
+with open(out, 'w') as fh:
+    for qseqid in ids:
+        fh.write(f"{qseqid}\\tNZ_CP000001.1\\t95.0\\t100\\t5\\t0\\t1\\t100\\t1\\t300\\t1e-50\\t200\\n")
+with open(LOG, "a") as fh:
+    fh.write(' '.join(ids) + '\\n')
+"""
+
+
+def test_only_uncached_queries_are_searched(tmp_path, fake_tool):
+    log = tmp_path / 'calls.log'
+    fake_tool('tblastn', FAKE_TBLASTN.replace("LOG", repr(str(log))))
+
+    db_dir = tmp_path / 'db'
+    db_dir.mkdir()
+    (db_dir / 'suis_db.nsq').write_bytes(b'ACGT')
+    (db_dir / 'suis_db.nhr').write_bytes(b'hdr')
+    query = tmp_path / 'query.fasta'
+    query.write_text('>A\nMKV\n>B\nMTT\n')
+    out = tmp_path / 'hits.tsv'
+
+    assert cached_tblastn(query, db_dir / 'suis_db', out, '1e-5', 1) == {'cached': 0, 'searched': 2}
+    first = out.read_text()
+
+    # Unchanged queries come entirely from the cache
+    assert cached_tblastn(query, db_dir / 'suis_db', out, '1e-5', 1) == {'cached': 2, 'searched': 0}
+    assert out.read_text() == first
+
+    # Only the edited query is searched again
+    query.write_text('>A\nMKV\n>B\nMTTW\n')
+    assert cached_tblastn(query, db_dir / 'suis_db', out, '1e-5', 1) == {'cached': 1, 'searched': 1}
+    assert log.read_text().splitlines() == ['A B', 'B']
+
+    # A changed database evicts every entry
+    (db_dir / 'suis_db.nsq').write_bytes(b'ACGTT')
+    assert cached_tblastn(query, db_dir / 'suis_db', out, '1e-5', 1) == {'cached': 0, 'searched': 2}
+    assert len([path for path in (db_dir / 'blast_cache').iterdir() if path.is_dir()]) == 1
+
+
+def test_fingerprint_is_reused_while_the_database_files_are_unchanged(tmp_path):
+    (tmp_path / 'suis_db.nsq').write_bytes(b'ACGT')
+    (tmp_path / 'suis_db.nhr').write_bytes(b'hdr')
+    memo = tmp_path / 'cache' / FINGERPRINT_MEMO
+    fingerprint = database_fingerprint(tmp_path / 'suis_db', memo)
+    assert fingerprint == database_fingerprint(tmp_path / 'suis_db')
+
+    # A memo hit does not read the files: a forged entry with matching stamps is returned as is
+    entries = json.loads(memo.read_text())
+    entries[str((tmp_path / 'suis_db').resolve())]['fingerprint'] = 'memo'
+    memo.write_text(json.dumps(entries))
+    assert database_fingerprint(tmp_path / 'suis_db', memo) == 'memo'
+
+    # A rebuilt database with the same contents keeps its fingerprint (and so its cache)
+    (tmp_path / 'suis_db.nsq').write_bytes(b'ACGT')
+    os.utime(tmp_path / 'suis_db.nsq', ns=(1, 1))
+    assert database_fingerprint(tmp_path / 'suis_db', memo) == fingerprint
+
+
+def test_databases_sharing_a_cache_keep_their_entries(tmp_path):
+    cache_dir = tmp_path / 'blast_cache'
+    for name, content in (('suis_db', b'ACGT'), ('highlight_db', b'TTTT')):
+        (tmp_path / f'{name}.nsq').write_bytes(content)
+        (tmp_path / f'{name}.nhr').write_bytes(b'hdr')
+        TblastnCache(cache_dir, tmp_path / name, '1e-5').store('MKV', [f'{name}\t95.0'])
+    assert TblastnCache(cache_dir, tmp_path / 'suis_db', '1e-5').lookup('MKV') == ['suis_db\t95.0']
+    assert TblastnCache(cache_dir, tmp_path / 'highlight_db', '1e-5').lookup('MKV') == ['highlight_db\t95.0']
+
+    # A rebuilt suis_db drops its own old entries only
+    (tmp_path / 'suis_db.nsq').write_bytes(b'ACGTT')
+    assert TblastnCache(cache_dir, tmp_path / 'suis_db', '1e-5').lookup('MKV') is None
+    assert TblastnCache(cache_dir, tmp_path / 'highlight_db', '1e-5').lookup('MKV') == ['highlight_db\t95.0']
+    assert len([path for path in cache_dir.iterdir() if path.is_dir()]) == 2
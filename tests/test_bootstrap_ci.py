@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import bootstrap_ci
+from bootstrap_ci import bootstrap_replicates, cluster_weights, prevalence_intervals
+from presence_matrix import PresenceMatrix, write_presence_matrix
+
+
+def _matrix(tmp_path, presence, name='pm'):
+    a, g = np.nonzero(presence)
+    genomes = [f'GCF_{j:06d}' for j in range(presence.shape[1])]
+    df = pd.DataFrame({'qseqid': [f'A{i}' for i in a], 'genome_accession': [genomes[j] for j in g],
+                       'pident': 90.0, 'coverage': 0.95})
+    antigens = [f'A{i}' for i in range(presence.shape[0])]
+    write_presence_matrix(tmp_path / name, df, antigens, presence.shape[1], 60.0, 0.8,
+                          {f'c{j}': genome for j, genome in enumerate(genomes)})
+    return PresenceMatrix(tmp_path / name)
+
+
+def test_intervals_match_binomial_and_k_of_n(tmp_path):
+    rng = np.random.default_rng(1)
+    presence = rng.random((3, 400)) < np.array([[0.9], [0.5], [0.2]])
+    intervals = prevalence_intervals(_matrix(tmp_path, presence), replicates=4000)
+    assert intervals['method'].unique().tolist() == ['bootstrap']
+
+    p = presence.mean(axis=1)
+    antigens = intervals[intervals['kind'] == 'antigen']
+    assert np.allclose(antigens['estimate_percent'], p * 100)
+    assert np.allclose(antigens['std_error'], np.sqrt(p * (1 - p) / 400) * 100, rtol=0.1)
+    assert ((antigens['ci_low'] < antigens['estimate_percent'])
+            & (antigens['estimate_percent'] < antigens['ci_high'])).all()
+
+    counts = presence.sum(axis=0)
+    kofn = intervals[intervals['kind'] == 'k_of_n']
+    assert kofn['genomes'].tolist() == [int((counts >= k).sum()) for k in (1, 2, 3)]
+
+
+def test_chunks_and_workers_give_identical_replicates(monkeypatch):
+    features = (np.random.default_rng(2).random((50, 4)) < 0.5).astype(float)
+    monkeypatch.setattr(bootstrap_ci, 'MAX_DRAW_CELLS', 50 * 64)
+    serial = bootstrap_replicates(features, replicates=300, seed=7)
+    assert serial.shape == (300, 4)
+    assert np.array_equal(serial, bootstrap_replicates(features, replicates=300, seed=7, workers=2))
+
+
+def test_weighted_resampling_discounts_clones(tmp_path):
+    # One clone sequenced 10 times: weighting it by its cluster matches the deduplicated collection
+    presence = np.zeros((1, 20), dtype=bool)
+    presence[0, :10] = True
+    presence[0, 10:15] = True
+    clusters = {f'GCF_{j:06d}': 'ST1' for j in range(10)}
+    weights, n_clusters = cluster_weights([f'GCF_{j:06d}' for j in range(20)], 20, clusters)
+    assert n_clusters == 11 and np.isclose(weights.sum(), 1.0)
+
+    intervals = prevalence_intervals(_matrix(tmp_path, presence), clusters, replicates=500)
+    weighted = intervals[(intervals['method'] == 'weighted') & (intervals['kind'] == 'antigen')].iloc[0]
+    assert np.isclose(weighted['estimate_percent'], 6 / 11 * 100)
+    assert weighted['clusters'] == 11
+    plain = intervals[(intervals['method'] == 'bootstrap') & (intervals['kind'] == 'antigen')].iloc[0]
+    assert plain['estimate_percent'] == 75.0
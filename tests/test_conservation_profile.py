@@ -0,0 +1,69 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aggregation import annotate_hits
+from conservation_profile import best_windows, map_highlights, residue_profile, window_prevalence
+
+
+def _hits(rows):
+    df = pd.DataFrame(rows, columns=['qseqid', 'sseqid', 'pident', 'length', 'qstart', 'qend'])
+    return annotate_hits(df, {'A': 100, 'B': 80}, {f'c{g}': f'G{g}' for g in range(10)})
+
+
+def test_profile_matches_residue_sets():
+    rng = np.random.default_rng(2)
+    rows = []
+    for _ in range(400):
+        antigen = rng.choice(['A', 'B'])
+        length = 100 if antigen == 'A' else 80
+        start, end = sorted(rng.integers(1, length + 1, 2))
+        rows.append((antigen, f'c{rng.integers(10)}', rng.uniform(40, 100), end - start + 1,
+                     *((end, start) if rng.random() < 0.2 else (start, end))))
+    df = _hits(rows)
+    profile = residue_profile(df, {'A': 100, 'B': 80}, 20, 60.0)
+    assert len(profile) == 180
+
+    passing = df[df['pident'] >= 60.0]
+    for row in profile.sample(40, random_state=0).itertuples():
+        lo, hi = np.minimum(passing['qstart'], passing['qend']), np.maximum(passing['qstart'], passing['qend'])
+        covering = passing[(passing['qseqid'] == row.antigen) & (lo <= row.position) & (hi >= row.position)]
+        assert row.genomes == covering['genome_accession'].nunique()
+        assert row.hsps == len(covering)
+        assert row.conservation_percent == row.genomes / 20 * 100
+        if len(covering):
+            assert np.isclose(row.mean_identity, covering['pident'].mean(), atol=0.01)
+
+
+def test_windows_rank_conserved_regions():
+    # 10 genomes cover residues 1-60 (G0 with two overlapping HSPs), 5 also cover 61-100
+    rows = [('A', f'c{g}', 95.0, 60, 1, 60) for g in range(1, 10)]
+    rows += [('A', 'c0', 95.0, 40, 1, 40), ('A', 'c0', 95.0, 40, 21, 60)]
+    rows += [('A', f'c{g}', 90.0, 40, 61, 100) for g in range(5)]
+    df = _hits(rows)
+    profile = residue_profile(df, {'A': 100, 'B': 80}, 10, 60.0)
+    conservation = profile.loc[profile['antigen'] == 'A', 'conservation_percent'].to_numpy()
+    assert conservation[:60].tolist() == [100.0] * 60 and conservation[60:].tolist() == [50.0] * 40
+
+    windows = best_windows(conservation, min_length=20, max_length=50, top=3)
+    assert windows[0] == (1, 50, 100.0, 100.0)
+    assert windows[1] == (41, 60, 100.0, 100.0) and windows[2][2] == 50.0
+
+    spans = pd.DataFrame({'antigen': ['A', 'A', 'B'], 'start': [41, 41, 1], 'end': [80, 80, 10]})
+    assert window_prevalence(df, spans.iloc[:1], ['A', 'B'], 60.0, 0.5).tolist() == [10]
+    assert window_prevalence(df, spans, ['A', 'B'], 60.0, 0.6).tolist() == [5, 5, 0]
+
+
+def test_highlights_are_placed_by_local_alignment():
+    rng = np.random.default_rng(0)
+    full = ''.join(rng.choice(list('ACDEFGHIKLMNPQRSTVWY'), 300))
+    highlight = full[120:200]
+    highlight = highlight[:30] + 'W' + highlight[31:]
+    unrelated = ''.join(rng.choice(list('ACDEFGHIKLMNPQRSTVWY'), 80))
+    placed = map_highlights([('h1', highlight), ('h2', unrelated)], {'X|1': full})
+    assert placed.loc[0, ['antigen', 'start', 'end']].tolist() == ['X|1', 121, 200]
+    assert pd.isna(placed.loc[1, 'antigen'])
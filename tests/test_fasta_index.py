@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from Bio.Seq import Seq
+
+from fasta_index import FastaIndex, build_fai, extract_hit_regions, reverse_complement
+
+
+def _write_fasta(path, records, width):
+    with open(path, 'w') as fh:
+        for name, sequence in records:
+            fh.write(f">{name} description\n")
+            fh.write(''.join(sequence[i:i + width] + '\n' for i in range(0, len(sequence), width)))
+
+
+def test_fetch_matches_slicing_across_line_breaks(tmp_path):
+    rng = np.random.default_rng(5)
+    records = [(f'contig_{i}', ''.join(rng.choice(list('ACGT'), n))) for i, n in enumerate([1, 60, 61, 257])]
+    fasta = tmp_path / 'merged.fna'
+    _write_fasta(fasta, records, 60)
+    # A ragged record (lines of different widths) is read whole instead
+    with open(fasta, 'a') as fh:
+        fh.write('>ragged\nACG\nTTTTT\nGA\n')
+    records.append(('ragged', 'ACGTTTTTGA'))
+    build_fai(fasta)
+
+    with FastaIndex(fasta) as index:
+        assert index.index['ragged'][2:] == (0, 0)
+        for name, sequence in records:
+            assert index.fetch(name) == sequence.encode()
+            for _ in range(20):
+                start, end = sorted(rng.integers(1, len(sequence) + 1, 2))
+                assert index.fetch(name, start, end) == sequence[start - 1:end].encode()
+            assert index.fetch(name, 0, len(sequence) + 10) == sequence.encode()
+    assert reverse_complement(b'AACGTN') == b'NACGTT'
+
+
+def test_extract_writes_oriented_regions_per_antigen(tmp_path):
+    rng = np.random.default_rng(6)
+    genome = ''.join(rng.choice(list('ACGT'), 3000))
+    fasta = tmp_path / 'merged.fna'
+    _write_fasta(fasta, [('NZ_CP000001.1', genome), ('NZ_CP000002.1', genome[::-1])], 70)
+    build_fai(fasta)
+
+    plus = str(Seq(genome[99:399]).translate(table=11))
+    columns = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen',
+               'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
+    hits = pd.DataFrame([('A|1', 'NZ_CP000001.1', 99.0, 100, 0, 0, 1, 100, 100, 399, 1e-50, 200),
+                         ('A|1', 'NZ_CP000002.1', 99.0, 100, 0, 0, 1, 100, 1200, 901, 1e-50, 200),
+                         ('A|1', 'NZ_CP000002.1', 40.0, 100, 0, 0, 1, 100, 1, 300, 1e-5, 20),
+                         ('B', 'NZ_CP000001.1', 90.0, 50, 0, 0, 1, 50, 1000, 1149, 1e-20, 100),
+                         ('B', 'NZ_MISSING.1', 90.0, 50, 0, 0, 1, 50, 1, 150, 1e-20, 100)], columns=columns)
+    hits.to_csv(tmp_path / 'blast.tsv', sep='\t', header=False, index=False)
+
+    manifest = extract_hit_regions(tmp_path / 'blast.tsv', fasta, tmp_path / 'out', {'A|1': 100, 'B': 50},
+                                   60.0, 0.8, {'NZ_CP000001.1': 'G1', 'NZ_CP000002.1': 'G2'})
+    assert manifest['hits'].tolist() == [2, 1]
+    assert manifest['missing'].tolist() == [0, 1]
+
+    nucleotides = (tmp_path / 'out' / 'A_1.fna').read_text().split('\n')
+    assert nucleotides[0] == '>G1|NZ_CP000001.1:100-399(+) pident=99.00 coverage=1.000'
+    assert nucleotides[1] == genome[99:399]
+    assert nucleotides[2].startswith('>G2|NZ_CP000002.1:901-1200(-)')
+    # The minus-strand hit on the reversed copy reads back as the reverse complement
+    assert nucleotides[3] == reverse_complement(genome[::-1][900:1200].encode()).decode()
+    proteins = (tmp_path / 'out' / 'A_1.faa').read_text().split('\n')
+    assert proteins[1] == plus
+    assert (tmp_path / 'out' / 'B.faa').read_text().count('>') == 1
+
+    # Subject IDs wrapped by the BLAST database resolve to the same records
+    wrapped = hits.assign(sseqid=hits['sseqid'].map({'NZ_CP000001.1': 'ref|NZ_CP000001.1|',
+                                                    'NZ_CP000002.1': 'lcl|NZ_CP000002.1',
+                                                    'NZ_MISSING.1': 'ref|NZ_MISSING.1|'}))
+    wrapped.to_csv(tmp_path / 'wrapped.tsv', sep='\t', header=False, index=False)
+    manifest = extract_hit_regions(tmp_path / 'wrapped.tsv', fasta, tmp_path / 'wrapped', {'A|1': 100, 'B': 50},
+                                   60.0, 0.8, {'NZ_CP000001.1': 'G1', 'NZ_CP000002.1': 'G2'})
+    assert manifest['hits'].tolist() == [2, 1]
+    assert manifest['missing'].tolist() == [0, 1]
+    assert (tmp_path / 'wrapped' / 'A_1.fna').read_text() == (tmp_path / 'out' / 'A_1.fna').read_text()
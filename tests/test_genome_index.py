@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aggregation import annotate_hits, summarize_antigens
+from genome_index import assign_genomes, load_contig_index
+from genome_merge import merge_genomes
+
+
+def test_merge_writes_contig_index(tmp_path):
+    a = tmp_path / 'GCF_000000001.1_ASM1v1_genomic.fna'
+    b = tmp_path / 'GCF_000000002.1_ASM2v1_genomic.fna'
+    a.write_text('>NZ_CP000001.1 chromosome\nACGT\n>NZ_CP000002.1 plasmid\nGGCC')
+    b.write_text('>NZ_CP000003.1 chromosome\nTTTT\n')
+
+    summary = merge_genomes([a, b], tmp_path / 'merged.fna')
+    assert summary == {'genomes': 2, 'contigs': 3, 'index_path': tmp_path / 'contig_index.tsv',
+                       'fai_path': tmp_path / 'merged.fna.fai'}
+    assert (tmp_path / 'merged.fna').read_text().count('\n>') == 2
+
+    index = load_contig_index(tmp_path / 'contig_index.tsv')
+    assert index == {'NZ_CP000001.1': 'GCF_000000001.1',
+                     'NZ_CP000002.1': 'GCF_000000001.1',
+                     'NZ_CP000003.1': 'GCF_000000002.1'}
+
+    # Two contigs of the same assembly count as one genome
+    df = pd.DataFrame({'qseqid': ['A'] * 3,
+                       'sseqid': ['NZ_CP000001.1', 'ref|NZ_CP000002.1|', 'NZ_CP000003.1'],
+                       'pident': [95.0] * 3, 'length': [100] * 3})
+    df = annotate_hits(df, {'A': 100}, index)
+    assert list(df['genome_accession']) == ['GCF_000000001.1', 'GCF_000000001.1', 'GCF_000000002.1']
+    assert summarize_antigens(df, {'A': 100}, 2, 70.0, 0.8)['hit_genomes'].tolist() == [2]
+
+
+def test_assign_genomes_without_index():
+    genomes = assign_genomes(pd.Series(['GCF_000000001.1', 'NZ_CP000009.1', 'contig_7']))
+    assert list(genomes) == ['GCF_000000001.1', 'NZ_CP000009.1', 'contig_7']
@@ -0,0 +1,77 @@
+import gzip
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fasta_index import read_fai
+from genome_index import load_contig_index
+from genome_merge import discover_genomes, merge_genomes
+
+
+def test_merge_reads_gzip_and_datasets_zip(tmp_path):
+    genomes = tmp_path / 'genomes'
+    genomes.mkdir()
+    (genomes / 'GCF_000000001.1_genomic.fna').write_text('>NZ_CP000001.1 chromosome\nACGT\nAC')
+    with gzip.open(genomes / 'GCF_000000002.1_genomic.fna.gz', 'wt') as fh:
+        fh.write('>NZ_CP000002.1 chromosome\nTTTT\n')
+
+    merged = tmp_path / 'merged.fna'
+    summary = merge_genomes(discover_genomes(genomes), merged, workers=2)
+    assert summary['genomes'] == 2
+    # The unterminated last line must not swallow the next header
+    assert merged.read_text() == ('>NZ_CP000001.1 chromosome\nACGT\nAC\n'
+                                  '>NZ_CP000002.1 chromosome\nTTTT\n')
+
+    bundle = tmp_path / 'suis_genomes.zip'
+    with zipfile.ZipFile(bundle, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('README.md', 'NCBI Datasets bundle')
+        zf.writestr('ncbi_dataset/data/GCF_000000003.1/GCF_000000003.1_ASM3v1_genomic.fna',
+                    '>NZ_CP000003.1\nGGGG\n>NZ_CP000004.1\nCC\n')
+    sources = discover_genomes(bundle)
+    assert [s.assembly for s in sources] == ['GCF_000000003.1']
+
+    merge_genomes(sources, merged)
+    assert merged.read_text() == '>NZ_CP000003.1\nGGGG\n>NZ_CP000004.1\nCC\n'
+    assert load_contig_index(tmp_path / 'contig_index.tsv') == {
+        'NZ_CP000003.1': 'GCF_000000003.1', 'NZ_CP000004.1': 'GCF_000000003.1'}
+
+
+def test_merge_rejects_duplicate_and_missing_ids(tmp_path):
+    a = tmp_path / 'GCF_000000001.1.fna'
+    b = tmp_path / 'GCF_000000002.1.fna'
+    a.write_text('>contig_1\nACGT\n')
+    b.write_text('>contig_1\nTTTT\n')
+    with pytest.raises(ValueError, match="duplicate sequence ID 'contig_1'"):
+        merge_genomes([a, b], tmp_path / 'merged.fna')
+
+    b.write_text('> no id\nTTTT\n')
+    with pytest.raises(ValueError, match='without a sequence ID'):
+        merge_genomes([a, b], tmp_path / 'merged.fna')
+
+    b.write_text('TTTT\n')
+    with pytest.raises(ValueError, match='not a FASTA file'):
+        merge_genomes([a, b], tmp_path / 'merged.fna')
+
+
+def test_merge_writes_faidx_index(tmp_path):
+    genomes = tmp_path / 'genomes'
+    genomes.mkdir()
+    (genomes / 'GCF_000000001.1_genomic.fna').write_text('>NZ_CP000001.1 chromosome\nACGT\nAC')
+    with gzip.open(genomes / 'GCF_000000002.1_genomic.fna.gz', 'wt') as fh:
+        fh.write('>NZ_CP000002.1\nTTTTT\nGGGGG\nC\n>NZ_CP000003.1 plasmid\nAA\nCCCC\n')
+
+    merged = tmp_path / 'merged.fna'
+    summary = merge_genomes(discover_genomes(genomes), merged, workers=2)
+    assert summary['fai_path'] == tmp_path / 'merged.fna.fai'
+    data = merged.read_bytes()
+    fai = read_fai(summary['fai_path'])
+    assert fai == {'NZ_CP000001.1': (6, 26, 4, 5),
+                   'NZ_CP000002.1': (11, data.index(b'TTTTT'), 5, 6),
+                   'NZ_CP000003.1': (6, data.index(b'AA\n'), 0, 0)}
+    for name, (length, offset, linebases, linewidth) in fai.items():
+        record = data[offset:].split(b'>')[0].replace(b'\n', b'')
+        assert len(record) == length
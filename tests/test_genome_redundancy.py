@@ -0,0 +1,99 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import genome_redundancy
+from aggregation import annotate_hits
+from genome_merge import discover_genomes
+from genome_redundancy import (cluster_prevalence, jaccard_matrix, propagate_hits, reduce_redundancy,
+                               redundancy_report, representative_sources)
+
+_COMPLEMENT = str.maketrans('ACGT', 'TGCA')
+
+
+def _write(path, contigs):
+    with open(path, 'w') as fh:
+        for name, sequence in contigs:
+            fh.write(f">{name}\n{sequence}\n")
+
+
+def _mutate(rng, sequence, rate):
+    seq = np.array(list(sequence))
+    at = np.flatnonzero(rng.random(seq.size) < rate)
+    seq[at] = [rng.choice([b for b in 'ACGT' if b != s]) for s in seq[at]]
+    return ''.join(seq)
+
+
+def test_clones_cluster_and_unrelated_genomes_stay_apart(tmp_path):
+    rng = np.random.default_rng(3)
+    lineages = [''.join(rng.choice(list('ACGT'), 60000)) for _ in range(3)]
+    genome_dir = tmp_path / 'genomes'
+    genome_dir.mkdir()
+    layout = {0: 4, 1: 2, 2: 1}
+    g = 0
+    for lineage, copies in layout.items():
+        for c in range(copies):
+            sequence = lineage if c == 0 else _mutate(rng, lineages[lineage], 2e-4)
+            if c == 1:
+                # A clone assembled in two reverse-complemented contigs (and an N run)
+                half = len(sequence) // 2
+                contigs = [(f'c{g}_1', sequence[:half]),
+                           (f'c{g}_2', sequence[half:][::-1].translate(_COMPLEMENT) + 'N' * 50)]
+            else:
+                contigs = [(f'c{g}_1', lineages[lineage] if c == 0 else sequence)]
+            _write(genome_dir / f'GCF_{g:09d}.1_ASM{g}v1_genomic.fna', contigs)
+            g += 1
+
+    sources = discover_genomes(genome_dir)
+    clusters = reduce_redundancy(sources, tmp_path / 'clusters.tsv', scaled=20, min_ani=0.995, workers=2)
+    lineage_of = np.repeat(list(layout), list(layout.values()))
+    representative = clusters['representative'].map({a: i for i, a in enumerate(clusters['genome'])})
+    assert (lineage_of[representative] == lineage_of).all()
+    assert clusters['is_representative'].sum() == 3
+    assert (clusters['ani'] > 0.995).all() and (clusters.loc[~clusters['is_representative'], 'ani'] < 1).all()
+
+    report = redundancy_report(clusters)
+    assert report['clusters'] == 3
+    assert report['total_bases'] == 7 * 60000 + 2 * 50
+    assert report['searched_bases'] in (3 * 60000, 3 * 60000 + 50, 3 * 60000 + 100)
+    assert np.isclose(report['work_saved'], 1 - report['searched_bases'] / report['total_bases'])
+    assert len(representative_sources(sources, clusters)) == 3
+    assert pd.read_csv(tmp_path / 'clusters.tsv', sep='\t')['genome'].tolist() == clusters['genome'].tolist()
+
+
+def test_jaccard_matches_set_arithmetic(monkeypatch):
+    rng = np.random.default_rng(4)
+    sketches = [np.unique(rng.integers(0, 500, rng.integers(0, 120)).astype(np.uint64)) for _ in range(8)]
+    monkeypatch.setattr(genome_redundancy, 'MAX_INCIDENCE_CELLS', 8 * 64)
+    jaccard = jaccard_matrix(sketches)
+    for i in range(8):
+        for j in range(8):
+            a, b = set(sketches[i].tolist()), set(sketches[j].tolist())
+            expected = 1.0 if i == j else (len(a & b) / len(a | b) if a | b else 0.0)
+            assert np.isclose(jaccard[i, j], expected)
+
+
+def test_hits_propagate_to_cluster_members():
+    clusters = pd.DataFrame({
+        'genome': ['G1', 'G2', 'G3', 'G4', 'G5'],
+        'representative': ['G1', 'G1', 'G1', 'G4', 'G5'],
+        'is_representative': [True, False, False, True, True],
+    })
+    hits = pd.DataFrame([('A', 'c1', 95.0, 100), ('A', 'c4', 50.0, 100), ('B', 'c4', 95.0, 100),
+                         ('B', 'c5', 95.0, 100), ('B', 'unknown', 95.0, 100)],
+                        columns=['qseqid', 'sseqid', 'pident', 'length'])
+    df = annotate_hits(hits, {'A': 100, 'B': 100}, {'c1': 'G1', 'c4': 'G4', 'c5': 'G5'})
+    propagated = propagate_hits(df, clusters)
+    assert len(propagated) == len(df) + 2
+    copies = propagated[propagated['propagated']]
+    assert sorted(copies['genome_accession'].tolist()) == ['G2', 'G3']
+    assert (copies['qseqid'] == 'A').all() and (copies['pident'] == 95.0).all()
+
+    stats = cluster_prevalence(propagated, ['A', 'B'], clusters, 60.0, 0.8)
+    assert stats['propagated_genomes'].tolist() == [2, 0]
+    assert stats['hit_clusters'].tolist() == [1, 2]
+    assert np.allclose(stats['cluster_prevalence_percent'], [100 / 3, 200 / 3])
@@ -0,0 +1,80 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aggregation import BLAST_COLUMNS, load_hits
+from hit_store import HitStore, find_store, write_hit_store
+
+
+def _write_hits(path, n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'qseqid': rng.choice(['HP0197|WP_277937340.1', 'SAO|WP_211840080.1'], n),
+        'sseqid': [f"NZ_CP{g:06d}.1" for g in rng.integers(0, 300, n)],
+        'pident': rng.uniform(30, 100, n).round(3),
+        'length': rng.integers(20, 680, n),
+        'mismatch': rng.integers(0, 200, n),
+        'gapopen': rng.integers(0, 10, n),
+        'qstart': rng.integers(1, 300, n),
+        'qend': rng.integers(300, 680, n),
+        'sstart': rng.integers(1, 2_500_000, n),
+        'send': rng.integers(1, 2_500_000, n),
+        'evalue': 10.0 ** -rng.uniform(0, 180, n),
+        'bitscore': rng.uniform(20, 1200, n).round(1),
+    })
+    df.to_csv(path, sep='\t', header=False, index=False)
+
+
+def test_store_round_trips_text_values(tmp_path):
+    blast_file = tmp_path / 'blast_results.tsv'
+    _write_hits(blast_file)
+    text = load_hits(blast_file)
+
+    store = write_hit_store(blast_file)
+    assert find_store(blast_file) == store
+    hits = load_hits(blast_file)
+    assert isinstance(hits['sseqid'].dtype, pd.CategoricalDtype)
+    assert hits['sstart'].dtype == np.int32 and hits['gapopen'].dtype == np.int8
+    for col in BLAST_COLUMNS:
+        assert hits[col].astype(text[col].dtype).equals(text[col]), col
+
+    # Predicate pushdown and column pruning give the same rows as filtering text
+    pruned = load_hits(store, columns=['qseqid', 'pident'], min_identity=92.5, max_evalue=1e-40)
+    expected = text[(text['pident'] >= 92.5) & (text['evalue'] <= 1e-40)]
+    assert list(pruned.columns) == ['qseqid', 'pident']
+    assert np.array_equal(pruned['pident'].to_numpy(), expected['pident'].to_numpy())
+
+    # A rewritten TSV makes the store stale; load_hits falls back to the text
+    os.utime(blast_file, ns=(0, 0))
+    assert find_store(blast_file) is None
+    assert load_hits(blast_file)['sseqid'].dtype != hits['sseqid'].dtype
+
+
+def test_empty_output_gives_empty_store(tmp_path):
+    blast_file = tmp_path / 'blast_results.tsv'
+    blast_file.write_text('')
+    store = write_hit_store(blast_file)
+    assert HitStore(store).rows == 0
+    assert load_hits(blast_file).empty
+    assert load_hits(blast_file, min_identity=70.0).empty
+
+
+def test_small_chunks_give_the_same_store(tmp_path):
+    blast_file = tmp_path / 'blast_results.tsv'
+    _write_hits(blast_file, n=1000)
+    # The last rows widen sstart past int32 and give bitscore more decimals than fixed point holds
+    with open(blast_file, 'a') as fh:
+        fh.write('SAO|WP_211840080.1\tNZ_CP999999.1\t99.5\t90\t0\t0\t1\t90\t3000000000\t279\t1e-50\t180.25\n')
+    text = load_hits(blast_file)
+
+    store = HitStore(write_hit_store(blast_file, chunksize=64))
+    hits = store.read()
+    assert store.rows == len(text) == 1001
+    assert hits['sstart'].dtype == np.int64 and hits['qstart'].dtype == np.int16
+    for col in BLAST_COLUMNS:
+        assert hits[col].astype(text[col].dtype).equals(text[col]), col
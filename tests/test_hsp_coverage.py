@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aggregation import annotate_hits, summarize_antigens
+from hsp_coverage import interval_union, merged_coverage
+
+
+def test_interval_union_matches_residue_sets():
+    rng = np.random.default_rng(1)
+    n, n_pairs = 5000, 300
+    pairs = rng.integers(0, n_pairs, n)
+    starts = rng.integers(1, 400, n)
+    ends = np.minimum(400, starts + rng.integers(0, 120, n))
+    flip = rng.random(n) < 0.3
+    starts, ends = np.where(flip, ends, starts), np.where(flip, starts, ends)
+
+    covered = interval_union(pairs, starts, ends, n_pairs)
+    expected = np.zeros(n_pairs, dtype=int)
+    for p in range(n_pairs):
+        residues = set()
+        for s, e in zip(starts[pairs == p], ends[pairs == p]):
+            residues.update(range(min(s, e), max(s, e) + 1))
+        expected[p] = len(residues)
+    assert np.array_equal(covered, expected)
+
+
+def _hits(rows):
+    df = pd.DataFrame(rows, columns=['qseqid', 'sseqid', 'pident', 'length', 'qstart', 'qend'])
+    return df
+
+
+def test_split_gene_passes_only_with_merged_coverage():
+    # G1: HP0197 split over two contigs; G2: overlapping HSPs; G3: one low-identity fragment
+    rows = [
+        ('HP0197', 'NZ_JA00000101000001.1', 98.0, 340, 1, 340),
+        ('HP0197', 'NZ_JA00000101000002.1', 97.5, 331, 341, 671),
+        ('HP0197', 'NZ_CP100001.1', 99.0, 400, 1, 400),
+        ('HP0197', 'NZ_CP100001.1', 99.0, 400, 201, 600),
+        ('HP0197', 'NZ_CP100002.1', 99.0, 300, 1, 300),
+        ('HP0197', 'NZ_CP100002.1', 40.0, 371, 301, 671),
+    ]
+    index = {'NZ_JA00000101000001.1': 'G1', 'NZ_JA00000101000002.1': 'G1',
+             'NZ_CP100001.1': 'G2', 'NZ_CP100002.1': 'G3'}
+    lengths = {'HP0197': 671}
+
+    per_hsp = summarize_antigens(annotate_hits(_hits(rows), lengths, index), lengths, 3, 70.0, 0.8)
+    assert per_hsp['hit_genomes'].tolist() == [0]
+
+    df = annotate_hits(_hits(rows), lengths, index, 'merged', 70.0)
+    merged = summarize_antigens(df, lengths, 3, 70.0, 0.8)
+    assert merged['hit_genomes'].tolist() == [2]
+    assert merged['mean_coverage_percent'].iloc[0] <= 100
+
+    pairs = merged_coverage(df, 70.0).set_index('genome_accession')
+    assert pairs.loc['G1', 'covered_residues'] == 671 and pairs.loc['G1', 'contigs'] == 2
+    assert pairs.loc['G2', 'covered_residues'] == 600
+    assert pairs.loc['G3', 'covered_residues'] == 300 and pairs.loc['G3', 'hsps'] == 1
+    assert np.isnan(df['coverage'].iloc[5])
@@ -0,0 +1,73 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from instrumentation import RunMetrics, count_rows, run_command
+from pipeline_dag import PipelineDAG, Stage
+
+BUSY_CHILD = [sys.executable, '-c', 'sum(i * i for i in range(2_000_000))']
+
+
+def test_stage_records_child_cpu_rows_and_failures(tmp_path):
+    metrics = RunMetrics('test', profile_dir=tmp_path / 'profiles', params={'threads': 2})
+    with metrics.stage('search') as stage:
+        subprocess.run(BUSY_CHILD, check=True)
+        stage['rows'] = 42
+    with pytest.raises(ValueError):
+        with metrics.stage('aggregate'):
+            raise ValueError('bad input')
+
+    path = metrics.write(tmp_path / 'run_metrics.json')
+    with open(path) as fh:
+        exported = json.load(fh)
+    search, aggregate = exported['stages']
+    assert search['status'] == 'ok' and search['rows'] == 42
+    assert search['children_user_s'] + search['children_system_s'] > 0
+    assert search['wall_s'] >= search['cpu_user_s']
+    assert search['peak_rss_mb'] > 0
+    assert Path(search['profile']).exists()
+    assert aggregate['status'] == 'failed'
+    assert exported['params'] == {'threads': 2}
+    assert len(metrics.summary_lines()) == 3
+
+
+def test_run_command_appends_stages(tmp_path):
+    hits = tmp_path / 'hits.tsv'
+    hits.write_text('a\tb\n' * 7)
+    metrics_file = tmp_path / 'run_metrics.json'
+    assert run_command(BUSY_CHILD, metrics_file, 'tblastn', rows_file=hits) == 0
+    assert run_command([sys.executable, '-c', 'raise SystemExit(3)'], metrics_file, 'parse') == 3
+
+    with open(metrics_file) as fh:
+        stages = json.load(fh)['stages']
+    assert [s['stage'] for s in stages] == ['tblastn', 'parse']
+    assert stages[0]['rows'] == 7 == count_rows(hits)
+    assert stages[0]['children_user_s'] > 0
+    assert stages[1]['status'] == 'failed' and stages[1]['returncode'] == 3
+
+    # Wrapping a command and counting a plain table does not import numpy/pandas
+    root = Path(__file__).resolve().parents[1]
+    probe = (f"import sys; sys.path.insert(0, {str(root)!r}); import instrumentation; "
+             f"instrumentation.count_rows({str(hits)!r}); "
+             "print(any(name in sys.modules for name in ('numpy', 'pandas')))")
+    assert subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True).stdout.strip() == 'False'
+
+
+def test_dag_records_stages_that_ran(tmp_path):
+    metrics = RunMetrics('dag')
+    dag = PipelineDAG(tmp_path, metrics)
+    dag.add(Stage('count', lambda _: 5, rows=int))
+    dag.add(Stage('report', lambda results: results['count'] * 2, deps=['count']))
+    dag.run()
+    assert [(s['stage'], s['rows']) for s in metrics.stages] == [('count', 5), ('report', None)]
+
+    metrics = RunMetrics('dag')
+    dag = PipelineDAG(tmp_path, metrics)
+    dag.add(Stage('count', lambda _: 5, rows=int))
+    dag.run()
+    assert metrics.stages == []
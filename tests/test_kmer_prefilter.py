@@ -0,0 +1,74 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from Bio.Seq import Seq
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from blast_search import read_query_records
+from genome_index import load_contig_index
+from genome_merge import discover_genomes, merge_genomes
+from kmer_prefilter import (AMINO_ACIDS, KmerIndex, PrefilteredSearch, ensure_kmer_index, genome_kmers,
+                            index_is_current, iter_genomes, protein_kmers, six_frames)
+from synthetic import SyntheticCollection
+
+
+def test_six_frames_match_biopython():
+    rng = np.random.default_rng(0)
+    dna = ''.join(rng.choice(list('ACGT'), 301))
+    frames = six_frames(dna.encode())
+    for frame, (strand, offset) in zip(frames, [(s, o) for s in (1, -1) for o in range(3)]):
+        seq = Seq(dna) if strand == 1 else Seq(dna).reverse_complement()
+        n = (len(seq) - offset) // 3 * 3
+        protein = str(seq[offset:offset + n].translate(table=11))
+        assert ''.join('*' if c == 255 else AMINO_ACIDS[c] for c in frame) == protein
+
+
+def _collection(tmp_path, n_genomes=12):
+    collection = SyntheticCollection.random(n_genomes, seed=4)
+    collection.write_query_fasta(tmp_path / 'query.fasta')
+    records = read_query_records(tmp_path / 'query.fasta')
+    collection.write_genomes(tmp_path / 'genomes', contig_bases=300, proteins=dict(records))
+    merged, index_path = tmp_path / 'merged.fna', tmp_path / 'contig_index.tsv'
+    merge_genomes(discover_genomes(tmp_path / 'genomes'), merged, index_path)
+    return collection, records, merged, index_path
+
+
+def test_candidates_are_the_carriers_and_counts_are_exact(tmp_path):
+    collection, records, merged, index_path = _collection(tmp_path)
+    index_dir = ensure_kmer_index(merged, tmp_path / 'kmer_index', index_path, k=5)
+    assert index_is_current(index_dir, merged, index_path, k=5)
+    assert not index_is_current(index_dir, merged, index_path, k=6)
+
+    index = KmerIndex(index_dir)
+    per_genome = {assembly: set(genome_kmers([seq for _, seq in contigs], 5))
+                  for assembly, contigs in iter_genomes(merged, load_contig_index(index_path))}
+    for (qseqid, _, _), carriers in zip(collection.antigens, collection.carriers):
+        sequence = dict(records)[qseqid]
+        query = set(protein_kmers(sequence, 5))
+        counts = index.seed_counts(sequence)
+        assert counts.tolist() == [len(query & per_genome[g]) for g in index.genomes]
+        # k=5 is noisy on purpose here; carriers must still all pass
+        assert {collection.assemblies[g] for g in carriers} <= {index.genomes[g] for g in index.candidates(sequence, 20)}
+
+
+def test_prefiltered_search_only_reaches_candidate_genomes(tmp_path, monkeypatch, fake_blast):
+    monkeypatch.setenv('SUIS_FAKE_HITS_PER_QUERY', '200')
+    collection, records, merged, index_path = _collection(tmp_path)
+    index_dir = ensure_kmer_index(merged, tmp_path / 'kmer_index', index_path)
+    os.system(f"makeblastdb -in {merged} -dbtype nucl -out {tmp_path / 'db'} > /dev/null")
+
+    search = PrefilteredSearch(index_dir)
+    report = search(tmp_path / 'query.fasta', tmp_path / 'db', tmp_path / 'hits.tsv', '1e-5', 1)
+    index = KmerIndex(index_dir)
+    allowed = {qseqid: set(index.contigs(index.candidates(sequence))) for qseqid, sequence in records}
+    with open(tmp_path / 'hits.tsv') as fh:
+        rows = [line.split('\t')[:2] for line in fh]
+    assert rows and all(sseqid in allowed[qseqid] for qseqid, sseqid in rows)
+    # HP0197 has no carriers: it is not searched at all
+    assert report['per_query']['HP0197|WP_277937340.1'] == 0
+    assert 0 < report['work_saved'] < 1
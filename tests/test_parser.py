@@ -1,6 +1,14 @@
+import random
 import subprocess
+import sys
 from pathlib import Path
 
+from Bio import SeqIO
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from parse_prevalence import can_use_fast_path, fast_parse_blast_output, fasta_lengths
+
 def test_toy_blast():
     root = Path(__file__).resolve().parents[1]
     blast_file = root / 'sample_data' / 'toy_blast.tsv'
@@ -21,3 +29,45 @@ def test_toy_blast():
         lines = f.readlines()
     # header + 3 lines expected
     assert len(lines) == 4, f"Expected 4 lines, got {len(lines)}"
+
+
+def _write_hits(path, n, antigens, seed):
+    rng = random.Random(seed)
+    with open(path, 'w') as fh:
+        for _ in range(n):
+            fh.write('\t'.join([rng.choice(antigens), f"NZ_CP{rng.randrange(40):06d}.1",
+                                f"{rng.uniform(50, 100):.3f}", str(rng.randrange(200, 420)),
+                                '0', '0', '1', '400', '1', '1200', '1e-50', '300']) + '\n')
+
+
+def _run(root, blast_file, query, out_tsv, *extra):
+    cmd = [sys.executable, str(root / 'parse_prevalence.py'), '-i', str(blast_file), '-t', '50',
+           '-q', str(query), '-o', str(out_tsv), '--min_identity', '60'] + list(extra)
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+    return out_tsv.read_bytes()
+
+
+def test_fast_path_output_is_identical(tmp_path):
+    root = Path(__file__).resolve().parents[1]
+    query = tmp_path / 'query.fasta'
+    query.write_text('>A first antigen\nMKV LLA\nQQ\r\n>B|x\n' + 'M' * 397 + '\n\n>C\n' + 'K' * 333 + '\n')
+    assert fasta_lengths(query) == [(r.id, len(r.seq)) for r in SeqIO.parse(str(query), 'fasta')]
+
+    blast_file = tmp_path / 'hits.tsv'
+    for antigens, seed in ((['B|x'], 1), (['A', 'B|x', 'C', 'D'], 2)):
+        _write_hits(blast_file, 3000, antigens, seed)
+        assert can_use_fast_path(str(blast_file))
+        fast = _run(root, blast_file, query, tmp_path / 'fast.tsv')
+        full = _run(root, blast_file, query, tmp_path / 'full.tsv', '--no_fast_path')
+        assert fast == full
+        assert fast.count(b'\n') > 10
+        # One schema per query FASTA, whichever antigens happen to pass
+        assert fast.startswith(b'antigen\tgenome_accession\t')
+        for extra in ((), ('--no_fast_path',)):
+            assert _run(root, blast_file, query, tmp_path / 'none.tsv', '--min_identity', '101', *extra) == \
+                b'antigen\tgenome_accession\thit_count\tmax_identity\tmean_coverage\n'
+
+    # Tables read_csv would type differently go through pandas
+    blast_file.write_text('A\t123\t99.000\t300\t0\t0\t1\t400\t1\t1200\t1e-50\t300\n')
+    assert fast_parse_blast_output(str(blast_file), 50, str(query), 60.0, 0.8) is None
+    assert not can_use_fast_path(str(blast_file), 'merged')
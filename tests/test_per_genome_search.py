@@ -0,0 +1,85 @@
+import gzip
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from genome_index import load_contig_index
+from per_genome_search import collection_bases, per_genome_tblastn
+from streaming_prevalence import PrevalenceAggregator
+
+# One full-length hit per query on every contig whose header says "carrier"
+FAKE_TBLASTN = """#!/usr/bin/env python3
+import gzip, sys
+args = sys.argv[1:]
+assert '-db' not in args
+query = args[args.index('-query') + 1]
+subject = args[args.index('-subject') + 1]
+out = args[args.index('-out') + 1]
+ids = [(line[1:].split()[0], 0) for line in open(query) if line.startswith('>')]
+contigs = [line[1:].split() for line in open(subject) if line.startswith('>')]
+with open(out, 'w') as fh:
+    for contig in contigs:
+        for qseqid, _ in ids:
+            carrier = len(contig) > 1 and contig[1] == 'carrier'
+            fh.write(f"{qseqid}\\t{contig[0]}\\t{99.0 if carrier else 40.0}\\t{100 if carrier else 30}\\t0\\t0\\t1\\t100\\t1\\t300\\t1e-50\\t200\\n")
+"""
+
+
+def test_per_genome_search_streams_into_the_aggregator(tmp_path, fake_tool):
+    fake_tool('tblastn', FAKE_TBLASTN)
+    query = tmp_path / 'q.fasta'
+    query.write_text('>A\n' + 'M' * 100 + '\n>B\n' + 'M' * 100 + '\n')
+    genomes = tmp_path / 'genomes'
+    genomes.mkdir()
+    (genomes / 'GCF_000000001.1_genomic.fna').write_text('>c1 carrier\nACGT\n>c2\nACGT\n')
+    (genomes / 'GCF_000000002.1_genomic.fna').write_text('>c3\nACGT\n')
+    with gzip.open(genomes / 'GCF_000000003.1_genomic.fna.gz', 'wt') as fh:
+        fh.write('>c4 carrier\nACGT\n')
+    assert collection_bases(genomes) == 16
+
+    aggregator = PrevalenceAggregator({'A': 100, 'B': 100}, 0, 60.0, 0.8)
+    summary = per_genome_tblastn(query, genomes, tmp_path / 'out.tsv', '1e-5', 2, aggregator,
+                                 poll_interval=0.05, progress=False)
+    assert (summary['genomes'], summary['contigs'], summary['hits']) == (3, 4, 8)
+    assert summary['first_result'] is not None
+
+    stats = aggregator.summary().set_index('antigen')
+    assert stats['hit_genomes'].tolist() == [2, 2]
+    assert stats['total_genomes'].tolist() == [3, 3]
+    assert load_contig_index(tmp_path / 'contig_index.tsv') == {
+        'c1': 'GCF_000000001.1', 'c2': 'GCF_000000001.1', 'c3': 'GCF_000000002.1', 'c4': 'GCF_000000003.1'}
+
+    # Deterministic output: query order, then genome order
+    rows = [line.split('\t')[:2] for line in open(tmp_path / 'out.tsv')]
+    assert [r[0] for r in rows] == ['A'] * 4 + ['B'] * 4
+    assert [r[1] for r in rows[:4]] == ['c1', 'c2', 'c3', 'c4']
+
+
+def test_genomes_added_during_the_run_are_searched(tmp_path, monkeypatch, fake_tool):
+    fake_tool('tblastn', FAKE_TBLASTN)
+    query = tmp_path / 'q.fasta'
+    query.write_text('>A\n' + 'M' * 100 + '\n')
+    genomes = tmp_path / 'genomes'
+    genomes.mkdir()
+    (genomes / 'GCF_000000001.1_genomic.fna').write_text('>c1 carrier\nACGT\n')
+
+    aggregator = PrevalenceAggregator({'A': 100}, 0, 60.0, 0.8)
+    added = []
+
+    def add_genome(line):
+        # Arrives once the first genome has finished
+        if not added:
+            late = genomes / 'GCF_000000002.1_genomic.fna'
+            late.write_text('>c2 carrier\nACGT\n')
+            os.utime(late, (0, 0))
+            added.append(late)
+        original(line)
+
+    original = aggregator.add_line
+    monkeypatch.setattr(aggregator, 'add_line', add_genome)
+    summary = per_genome_tblastn(query, genomes, tmp_path / 'out.tsv', '1e-5', 1, aggregator,
+                                 poll_interval=0.05, progress=False)
+    assert summary['genomes'] == 2
+    assert aggregator.summary()['hit_genomes'].tolist() == [2]
@@ -0,0 +1,89 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pipeline_dag import PipelineDAG, Stage
+
+
+def _build(tmp_path, calls, barrier=None, fail=False):
+    source = tmp_path / 'input.txt'
+    merged = tmp_path / 'merged.txt'
+
+    def merge(_):
+        calls.append('merge')
+        merged.write_text(source.read_text().upper())
+        return str(merged)
+
+    def search(name):
+        def run(results):
+            calls.append(name)
+            if barrier is not None:
+                barrier.wait(timeout=5)  # both searches must be running at once
+            out = tmp_path / f'{name}.txt'
+            out.write_text(Path(results['merge']).read_text() + name)
+            return str(out)
+        return run
+
+    def report(results):
+        calls.append('report')
+        if fail:
+            raise RuntimeError('report failed')
+        return sorted(results.values())
+
+    dag = PipelineDAG(tmp_path)
+    dag.add(Stage('merge', merge, inputs=[source], outputs=[merged]))
+    for name in ('full', 'highlight'):
+        dag.add(Stage(name, search(name), deps=['merge'], inputs=lambda r: [r['merge']],
+                      outputs=[tmp_path / f'{name}.txt'], params={'evalue': '1e-5'}))
+    dag.add(Stage('report', report, deps=['full', 'highlight']))
+    return dag, source
+
+
+def test_independent_stages_run_concurrently_and_rerun_is_skipped(tmp_path):
+    calls = []
+    dag, source = _build(tmp_path, calls, barrier=threading.Barrier(2))
+    source.write_text('acgt')
+    results = dag.run(max_workers=2)
+    assert sorted(calls) == ['full', 'highlight', 'merge', 'report']
+    assert results['report'] == sorted([str(tmp_path / 'full.txt'), str(tmp_path / 'highlight.txt')])
+
+    calls.clear()
+    dag, _ = _build(tmp_path, calls)
+    dag.run()
+    assert calls == [] and set(dag.status.values()) == {'skipped'}
+
+    # A changed input re-runs that stage and everything downstream of it
+    source.write_text('acgtt')
+    dag.run()
+    assert sorted(calls) == ['full', 'highlight', 'merge', 'report']
+
+
+def test_failed_run_resumes_from_last_good_stage(tmp_path):
+    calls = []
+    dag, source = _build(tmp_path, calls, fail=True)
+    source.write_text('acgt')
+    with pytest.raises(RuntimeError, match='report failed'):
+        dag.run()
+
+    calls.clear()
+    dag, _ = _build(tmp_path, calls)
+    dag.run()
+    assert calls == ['report']
+
+    # A deleted output forces its stage (and dependants) to run again
+    calls.clear()
+    (tmp_path / 'full.txt').unlink()
+    dag.run()
+    assert calls == ['full', 'report']
+
+
+def test_cycles_are_rejected(tmp_path):
+    dag = PipelineDAG(tmp_path)
+    dag.add(Stage('a', lambda r: None, deps=['b']))
+    dag.add(Stage('b', lambda r: None, deps=['a']))
+    with pytest.raises(ValueError, match='cycle'):
+        dag.run()
@@ -0,0 +1,63 @@
+import itertools
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from presence_matrix import PresenceMatrix, count_bits, popcount, write_presence_matrix
+
+
+def _matrix(tmp_path, n_antigens=9, n_genomes=150, total_genomes=160):
+    rng = np.random.default_rng(5)
+    carriage = rng.random(n_antigens) * 0.6
+    truth = rng.random((n_antigens, n_genomes)) < carriage[:, None]
+    antigens = [f'A{i}' for i in range(n_antigens)]
+    genomes = [f'GCF_{i:06d}' for i in range(n_genomes)]
+    a, g = np.nonzero(truth)
+    passing = pd.DataFrame({'qseqid': [antigens[i] for i in a], 'genome_accession': [genomes[j] for j in g],
+                            'pident': 90.0, 'coverage': 0.95})
+    failing = passing.sample(frac=0.5, random_state=0).assign(pident=40.0)
+    df = pd.concat([passing, failing], ignore_index=True)
+    # The last genomes have no hit: named by the contig index, or only counted
+    contig_index = {f'contig_{j}': genomes[j] for j in range(n_genomes)}
+    write_presence_matrix(tmp_path / 'pm', df, antigens, total_genomes, 60.0, 0.8, contig_index)
+    return PresenceMatrix(tmp_path / 'pm'), truth
+
+
+def test_matrix_and_k_of_n_match_dense(tmp_path):
+    matrix, truth = _matrix(tmp_path)
+    assert matrix.total_genomes == 160 and len(matrix.genomes) == 150
+    dense = matrix.dense()
+    assert np.array_equal(dense[:, :150], truth) and not dense[:, 150:].any()
+    assert np.array_equal(matrix.genome_counts()[:150], truth.sum(axis=0))
+
+    kofn = matrix.k_of_n()
+    counts = truth.sum(axis=0)
+    assert kofn['genomes'].tolist() == [int((counts >= k).sum()) for k in range(1, 10)]
+    words = np.array([2**64 - 1, 5, 0], dtype=np.uint64)
+    assert popcount(words).tolist() == [64, 2, 0] and count_bits(words) == 66
+
+
+def test_panels_match_brute_force(tmp_path):
+    matrix, truth = _matrix(tmp_path)
+    for k in (1, 2):
+        combos = matrix.combinations(3, k=k, top=None)
+        brute = {tuple(f'A{i}' for i in panel): int((truth[list(panel)].sum(axis=0) >= k).sum())
+                 for panel in itertools.combinations(range(9), 3)}
+        assert dict(zip(combos['antigens'], combos['genomes'])) == brute
+        assert combos['genomes'].iloc[0] == max(brute.values())
+        assert matrix.coverage(combos['antigens'].iloc[0], k) == max(brute.values())
+
+    for size in (2, 4):
+        best = max(int(truth[list(panel)].any(axis=0).sum()) for panel in itertools.combinations(range(9), size))
+        exact = matrix.exact_panel(size)
+        assert exact['optimal'] and exact['genomes'] == best
+        assert matrix.coverage(exact['antigens']) == best
+        greedy = matrix.greedy_panel(size)
+        assert greedy['genomes'].is_monotonic_increasing and greedy['genomes'].iloc[-1] <= best
+
+    two_of = matrix.greedy_panel(4, k=2)
+    assert two_of['genomes'].iloc[-1] == matrix.coverage(two_of['antigen'], k=2)
@@ -0,0 +1,110 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from blast_search import read_query_records
+from prevalence_service import PrevalenceService, make_server, parse_sequences, request
+from synthetic import SyntheticCollection
+
+
+@pytest.fixture
+def service_config(tmp_path, monkeypatch, fake_blast):
+    monkeypatch.setenv('SUIS_FAKE_HITS_PER_QUERY', '300')
+    collection = SyntheticCollection.random(20, seed=3)
+    collection.write_query_fasta(tmp_path / 'query.fasta')
+    collection.write_genomes(tmp_path / 'genomes')
+    config = {'genome_dir': str(tmp_path / 'genomes'), 'output_dir': str(tmp_path / 'out'),
+              'evalue': '1e-5', 'min_identity': 60.0, 'min_coverage': 0.8, 'threads': 1}
+    return config, dict(read_query_records(tmp_path / 'query.fasta'))
+
+
+def test_concurrent_requests_share_one_search(service_config):
+    config, sequences = service_config
+    service = PrevalenceService(config, batch_window=0.3).start()
+    names = list(sequences)
+    requests = [{n: sequences[n] for n in names[:3]}, {n: sequences[n] for n in names[2:]},
+                {'copy': sequences[names[0]]}]
+    responses = [None] * len(requests)
+
+    def ask(i):
+        responses[i] = service.prevalence(requests[i], per_genome=True)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.batcher.batches == 1
+    assert service.searched == len(sequences)
+    first = responses[0]['antigens'][0]
+    assert responses[2]['antigens'][0]['hit_genomes'] == first['hit_genomes']
+    assert first['total_genomes'] == 20
+    assert len(responses[0]['per_genome'][names[0]]) == first['hit_genomes']
+
+    strict = service.prevalence({names[0]: sequences[names[0]]}, min_identity=95.0)
+    assert strict['cache'] == {'memory': 1, 'disk': 0, 'searched': 0}
+    assert strict['antigens'][0]['hit_genomes'] <= first['hit_genomes']
+    service.close()
+
+    restarted = PrevalenceService(config).start()
+    assert restarted.prevalence(sequences)['cache']['disk'] == len(sequences)
+    restarted.close()
+
+
+def test_unix_socket_api(service_config, tmp_path):
+    config, sequences = service_config
+    service = PrevalenceService(config, batch_window=0).start()
+    socket_path = tmp_path / 'service.sock'
+    server = make_server(service, socket_path=socket_path, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        fasta = ''.join(f">{name}\n{seq}\n" for name, seq in sequences.items())
+        status, body = request('POST', '/prevalence', {'fasta': fasta, 'coverage_mode': 'merged'},
+                               socket_path=socket_path)
+        assert status == 200 and [row['antigen'] for row in body['antigens']] == list(sequences)
+        status, body = request('POST', '/prevalence', {'sequences': {'x': 'MK1'}}, socket_path=socket_path)
+        assert status == 400 and 'x' in body['error']
+        status, body = request('GET', '/health', socket_path=socket_path)
+        assert body['cached_sequences'] == len(sequences) and body['genomes'] == 20
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_parse_sequences_rejects_duplicates():
+    assert parse_sequences({'fasta': '>a\nmk t\nLL\n'}) == {'a': 'MKTLL'}
+    with pytest.raises(ValueError):
+        parse_sequences({'fasta': '>a\nMK\n>a\nLL\n'})
+
+
+def test_dedup_service_counts_every_genome(service_config, tmp_path):
+    config, sequences = service_config
+    genome_dir = Path(config['genome_dir'])
+    # Exact copies (renamed contigs) of four genomes cluster with their originals
+    for i, source in enumerate(sorted(genome_dir.glob('*.fna'))[:4]):
+        text = source.read_text().replace('>', f'>dup{i}_')
+        (genome_dir / f'GCF_{800000000 + i}.1_ASMdup{i}_genomic.fna').write_text(text)
+    config = {**config, 'dedup': True, 'sketch_k': 15, 'sketch_scaled': 1}
+    service = PrevalenceService(config, batch_window=0).start()
+    calls = []
+    runner = service.runner
+    service.runner = lambda *args: calls.append(args[5]) or runner(*args)
+
+    assert service.clusters['is_representative'].sum() == 20 and service.total_genomes == 24
+    response = service.prevalence(sequences, per_genome=True)
+    assert calls == [['-dbsize', str(int(service.clusters['bases'].sum()))]]
+    members = service.clusters.set_index('genome')['representative']
+    for row in response['antigens']:
+        assert row['total_genomes'] == 24
+        passing = {stat['genome_accession'] for stat in response['per_genome'][row['antigen']]}
+        # A passing representative brings its copy along, and vice versa
+        assert passing == set(members[members.isin(passing)].index) and len(passing) == row['hit_genomes']
+    service.close()
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sharded_search import hit_sort_key, sharded_tblastn, split_queries
+
+FAKE_TBLASTN = """#!/usr/bin/env python3
+import hashlib, sys
+args = sys.argv[1:]
+query = args[args.index('-query') + 1]
+out = args[args.index('-out') + 1]
+ids = [line[1:].split()[0] for line in open(query) if line.startswith('>')]
+with open(out, 'w') as fh:
+    for qseqid in ids:
+        for g in range(6):
+            h = int(hashlib.md5(f"{qseqid}{g}".encode()).hexdigest(), 16)
+            fh.write(f"{qseqid}\\tNZ_CP{g:06d}.1\\t{60 + h % 40}.000\\t{100 + h % 300}\\t0\\t0\\t1\\t100\\t{h % 999 + 1}\\t{h % 999 + 300}\\t{h % 9 + 1}e-{h % 90 + 5}\\t{h % 500 + 50}\\n")
+"""
+
+
+def test_sharded_output_matches_single_run(tmp_path, fake_tool):
+    fake_tool('tblastn', FAKE_TBLASTN)
+
+    query = tmp_path / 'q.fasta'
+    query.write_text(''.join(f">Q{i}\n{'M' * (50 + i * 10)}\n" for i in range(5)))
+    single = tmp_path / 'single.tsv'
+    sharded = tmp_path / 'sharded.tsv'
+
+    sharded_tblastn(query, tmp_path / 'db', single, '1e-5', 1, query_shards=1)
+    summary = sharded_tblastn(query, tmp_path / 'db', sharded, '1e-5', 3, query_shards=3)
+
+    assert summary == {'shards': 3, 'retries': 0}
+    rank = {f'Q{i}': i for i in range(5)}
+    lines = sharded.read_text().splitlines(keepends=True)
+    assert lines == sorted(single.read_text().splitlines(keepends=True), key=lambda l: hit_sort_key(l, rank))
+    assert len(lines) == 30
+
+
+def test_split_queries_balances_length():
+    records = [('a', 'M' * 100), ('b', 'M' * 60), ('c', 'M' * 50), ('d', 'M' * 10)]
+    shards = split_queries(records, 2)
+    assert sorted(sum(len(seq) for _, seq in shard) for shard in shards) == [110, 110]
@@ -0,0 +1,96 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from presence_matrix import PresenceMatrix, write_presence_matrix
+from stratified_prevalence import read_metadata, stratified_prevalence
+
+
+def _matrix(tmp_path, presence, total_genomes=None):
+    a, g = np.nonzero(presence)
+    genomes = [f'GCF_{j:06d}.1' for j in range(presence.shape[1])]
+    df = pd.DataFrame({'qseqid': [f'A{i}' for i in a], 'genome_accession': [genomes[j] for j in g],
+                       'pident': 90.0, 'coverage': 0.95})
+    antigens = [f'A{i}' for i in range(presence.shape[0])]
+    write_presence_matrix(tmp_path / 'pm', df, antigens, total_genomes or presence.shape[1], 60.0, 0.8,
+                          {f'c{j}': genome for j, genome in enumerate(genomes)})
+    return PresenceMatrix(tmp_path / 'pm'), genomes
+
+
+def test_every_stratum_matches_a_filter(tmp_path):
+    rng = np.random.default_rng(4)
+    presence = rng.random((3, 600)) < np.array([[0.8], [0.4], [0.1]])
+    # 10 unnamed padding columns without hits or metadata
+    matrix, genomes = _matrix(tmp_path, presence, total_genomes=610)
+    metadata = pd.DataFrame({
+        'serotype': rng.choice(['2', '9', '14', None], 600),
+        'country': rng.choice(['CN', 'NL', 'CA'], 600),
+        'host': rng.choice(['pig', 'human'], 600),
+    }, index=pd.Index(genomes, name='accession')).iloc[:550]
+
+    result = stratified_prevalence(matrix, metadata, ['serotype', 'country', 'host'], max_order=2)
+    assert set(result['strata']) == {'all', 'serotype', 'country', 'host', 'serotype+country',
+                                     'serotype+host', 'country+host'}
+    dense = np.hstack([presence, np.zeros((3, 10), dtype=bool)])
+    counts = dense.sum(axis=0)
+    aligned = metadata.reindex(genomes + [None] * 10).fillna('unknown').reset_index(drop=True)
+
+    for strata, stratum in result.groupby('strata', sort=False):
+        columns = [] if strata == 'all' else strata.split('+')
+        # Every stratification covers the whole collection
+        assert stratum.drop_duplicates(columns or ['strata'])['genomes'].sum() == 610
+        for levels, rows in stratum.groupby(columns, sort=False) if columns else [((), stratum)]:
+            levels = levels if isinstance(levels, tuple) else (levels,)
+            mask = np.ones(610, dtype=bool)
+            for column, level in zip(columns, levels):
+                mask &= (aligned[column] == level).to_numpy()
+            expected = list(dense[:, mask].sum(axis=1)) + [int((counts[mask] >= k).sum()) for k in (1, 2, 3)]
+            assert rows['genomes'].iloc[0] == mask.sum()
+            assert rows['hit_genomes'].tolist() == expected
+            assert np.allclose(rows['percent'], np.array(expected) / mask.sum() * 100)
+
+    assert (result[result['strata'] == 'serotype']['serotype'] == 'unknown').any()
+    large = stratified_prevalence(matrix, metadata, ['serotype', 'country'], min_genomes=60)
+    assert (large['genomes'] >= 60).all() and len(large) < len(result)
+
+    # Many antigens: nearly every genome has its own presence pattern, so strata are summed directly
+    (tmp_path / 'many').mkdir()
+    many = rng.random((40, 600)) < 0.5
+    wide_matrix, _ = _matrix(tmp_path / 'many', many)
+    wide = stratified_prevalence(wide_matrix, metadata, ['serotype', 'country'])
+    antigens = wide[(wide['strata'] == 'serotype+country') & (wide['kind'] == 'antigen')]
+    aligned = aligned.iloc[:600]
+    for (serotype, country), rows in antigens.groupby(['serotype', 'country'], sort=False):
+        mask = ((aligned['serotype'] == serotype) & (aligned['country'] == country)).to_numpy()
+        assert rows['hit_genomes'].tolist() == list(many[:, mask].sum(axis=1))
+
+
+def test_metadata_file_and_cli(tmp_path):
+    presence = np.array([[1, 1, 0, 1], [0, 1, 0, 1]], dtype=bool)
+    matrix, genomes = _matrix(tmp_path, presence)
+    metadata_file = tmp_path / 'genome_metadata.csv'
+    metadata_file.write_text('accession,serotype,year\n'
+                             f'{genomes[0]},2,2019\n{genomes[1]},2,2020\n{genomes[3]},9,2020\nGCF_999.1,9,2021\n')
+    metadata = read_metadata(metadata_file)
+    assert metadata.loc[genomes[1], 'year'] == '2020'
+    with pytest.raises(ValueError, match='Stratifying columns not in the metadata: host'):
+        stratified_prevalence(matrix, metadata, ['host'])
+
+    output = tmp_path / 'strata.tsv'
+    subprocess.check_call([sys.executable, str(Path(__file__).resolve().parents[1] / 'stratified_prevalence.py'),
+                           '-m', str(tmp_path / 'pm'), '--metadata', str(metadata_file), '--strata', 'serotype',
+                           '-o', str(output)], stdout=subprocess.DEVNULL)
+    table = pd.read_csv(output, sep='\t', dtype={'serotype': str})
+    both = table[(table['strata'] == 'serotype') & (table['measure'] == '>=2 antigens')]
+    assert dict(zip(both['serotype'], both['hit_genomes'])) == {'2': 1, '9': 1, 'unknown': 0}
+    assert dict(zip(both['serotype'], both['genomes'])) == {'2': 2, '9': 1, 'unknown': 1}
+
+    metadata_file.write_text(f'accession,serotype\n{genomes[0]},2\n{genomes[0]},9\n')
+    with pytest.raises(ValueError, match='listed more than once'):
+        read_metadata(metadata_file)
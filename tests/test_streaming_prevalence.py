@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from parse_prevalence import parse_blast_output
+from presence_matrix import PresenceMatrix, write_presence_matrix
+from streaming_prevalence import PrevalenceAggregator, stream_tblastn
+
+
+def test_aggregator_matches_batch_parser():
+    root = Path(__file__).resolve().parents[1]
+    aggregator = PrevalenceAggregator({'HP0197|WP_277937340.1': 671}, 3, 70.0, 0.8)
+    with open(root / 'sample_data' / 'toy_blast.tsv') as fh:
+        for line in fh:
+            aggregator.add_line(line)
+
+    summary = aggregator.summary().iloc[0]
+    assert summary['raw_hits'] == 3
+    assert summary['hit_genomes'] == 3
+    assert summary['prevalence_percent'] == 100.0
+    assert summary['max_identity'] == 95.0
+
+    _, expected = parse_blast_output(str(root / 'sample_data' / 'toy_blast.tsv'), 3,
+                                     str(root / 'query_antigens.fasta'), 70.0, 0.8)
+    stats = aggregator.genome_table()
+    # Only HP0197 hits: the per-antigen rows of the multi-record query FASTA are the pooled ones
+    assert set(expected['antigen']) == {'HP0197|WP_277937340.1'}
+    assert stats.to_dict('list') == expected.drop(columns='antigen').to_dict('list')
+
+
+def test_aggregator_applies_filters(tmp_path):
+    aggregator = PrevalenceAggregator({'A': 100}, 4, 70.0, 0.8)
+    aggregator.add('A', 'NZ_CP000001.1', 95.0, 90)
+    aggregator.add('A', 'NZ_CP000001.1', 99.0, 85)
+    aggregator.add('A', 'NZ_CP000002.1', 65.0, 100)   # identity too low
+    aggregator.add('A', 'NZ_CP000003.1', 90.0, 50)    # coverage too low
+
+    summary = aggregator.summary().iloc[0]
+    assert summary['raw_hits'] == 4
+    assert summary['filtered_hits'] == 2
+    assert summary['hit_genomes'] == 1
+    assert summary['prevalence_percent'] == 25.0
+    assert summary['mean_identity'] == 97.0
+
+    # The passing pairs are all a presence matrix needs
+    matrix = PresenceMatrix(write_presence_matrix(tmp_path / 'matrix', aggregator.passing_hits(), ['A', 'B'],
+                                                  4, 70.0, 0.8))
+    assert matrix.genomes == ['NZ_CP000001.1'] and matrix.total_genomes == 4
+    assert matrix.genome_counts().tolist() == [1, 0, 0, 0]
+
+
+def test_stream_survives_a_full_stderr_pipe(tmp_path, fake_tool):
+    # tblastn stand-in writing far more warnings than a pipe buffer before any hit
+    fake_tool('tblastn', f"#!{sys.executable}\nimport sys\n"
+                         "sys.stderr.write('Warning: low complexity masked\\n' * 20000)\n"
+                         "sys.stdout.write('A\\tNZ_CP000001.1\\t95.0\\t90\\t0\\t0\\t1\\t90\\t1\\t270\\t1e-40\\t180\\n')\n")
+    (tmp_path / 'q.fasta').write_text('>A\n' + 'M' * 100 + '\n')
+
+    aggregator = PrevalenceAggregator({'A': 100}, 1, 70.0, 0.8)
+    stream_tblastn(tmp_path / 'q.fasta', tmp_path / 'db', '1e-5', 1, aggregator, progress_every=0)
+    assert aggregator.summary().iloc[0]['hit_genomes'] == 1
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from threshold_sweep import SweepResult, parse_grid, sweep_prevalence
+
+
+def test_sweep_matches_refiltering(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 3000
+    df = pd.DataFrame({
+        'qseqid': rng.choice(['A', 'B', 'C'], n),
+        'genome_accession': rng.choice([f"G{g}" for g in range(40)], n),
+        'pident': rng.uniform(40, 100, n).round(1),
+        'coverage': rng.uniform(0.1, 1.1, n),
+        'evalue': 10.0 ** -rng.integers(1, 60, n),
+    })
+    identity_grid = parse_grid('50:95:5')
+    coverage_grid = parse_grid('0.3,0.5,0.8,1.0')
+    evalue_grid = [1e-30, 1e-5]
+    result = sweep_prevalence(df, 40, identity_grid, coverage_grid, evalue_grid, antigens=['A', 'B', 'C', 'D'])
+
+    for a, antigen in enumerate(['A', 'B', 'C', 'D']):
+        for e, max_evalue in enumerate(evalue_grid):
+            for i, min_identity in enumerate(identity_grid):
+                for c, min_coverage in enumerate(coverage_grid):
+                    hits = df[(df['qseqid'] == antigen) & (df['pident'] >= min_identity)
+                              & (df['coverage'] >= min_coverage) & (df['evalue'] <= max_evalue)]
+                    assert result.counts[a, e, i, c] == hits['genome_accession'].nunique()
+
+    result.save(tmp_path / 'sweep.npz')
+    loaded = SweepResult.load(tmp_path / 'sweep.npz')
+    assert np.array_equal(loaded.counts, result.counts)
+    assert len(result.to_frame()) == 4 * 2 * len(identity_grid) * 4
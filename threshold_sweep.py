@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+S. suis Identity x Coverage (x E-value) Threshold Sweep
+=======================================================
+
+Computes prevalence of every antigen at every point of a threshold grid
+without re-filtering the hit table once per grid cell.
+
+Each hit is reduced to its grid bin (how many identity / coverage thresholds
+it passes).  For every (antigen, genome) pair and identity bin the best
+coverage bin is kept, a reverse running maximum over the identity axis turns
+that into "best coverage reachable at identity >= t", and one bincount per
+e-value threshold then yields genome counts for the whole grid.  A 100 x 100
+grid for hundreds of antigens only costs a few passes over the hits.
+"""
+
+import numpy as np
+import pandas as pd
+
+PAIR_CHUNK = 200000
+
+
+def parse_grid(spec):
+    """
+    Parse a threshold grid specification.
+
+    Accepts ``start:stop:step`` (inclusive of stop) or a comma-separated list.
+    """
+    if ':' in spec:
+        start, stop, step = (float(x) for x in spec.split(':'))
+        grid = np.arange(start, stop + step / 2, step)
+    else:
+        grid = np.array([float(x) for x in spec.split(',')])
+    return np.unique(np.round(grid, 10))
+
+
+class SweepResult:
+    """Genome counts for every antigen at every grid point"""
+
+    def __init__(self, counts, antigens, identity_grid, coverage_grid, evalue_grid, total_genomes):
+        self.counts = counts  # uint32 [antigen, evalue, identity, coverage]
+        self.antigens = list(antigens)
+        self.identity_grid = np.asarray(identity_grid, dtype=float)
+        self.coverage_grid = np.asarray(coverage_grid, dtype=float)
+        self.evalue_grid = np.asarray(evalue_grid, dtype=float)
+        self.total_genomes = total_genomes
+
+    @property
+    def prevalence(self):
+        """Prevalence (%) array with the same shape as counts"""
+        if not self.total_genomes:
+            return np.zeros(self.counts.shape)
+        return self.counts / self.total_genomes * 100
+
+    def to_frame(self):
+        """Tidy table with one row per antigen x grid point"""
+        a, e, i, c = np.indices(self.counts.shape).reshape(4, -1)
+        return pd.DataFrame({
+            'antigen': np.asarray(self.antigens, dtype=object)[a],
+            'evalue': self.evalue_grid[e],
+            'min_identity': self.identity_grid[i],
+            'min_coverage': self.coverage_grid[c],
+            'hit_genomes': self.counts.reshape(-1),
+            'total_genomes': self.total_genomes,
+            'prevalence_percent': self.prevalence.reshape(-1)
+        })
+
+    def save(self, path):
+        """Write the counts and axes to a compressed .npz file"""
+        np.savez_compressed(path, counts=self.counts,
+                            antigens=np.asarray(self.antigens, dtype=str),
+                            identity_grid=self.identity_grid,
+                            coverage_grid=self.coverage_grid,
+                            evalue_grid=self.evalue_grid,
+                            total_genomes=np.int64(self.total_genomes))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['counts'], data['antigens'].tolist(), data['identity_grid'],
+                       data['coverage_grid'], data['evalue_grid'], int(data['total_genomes']))
+
+
+def sweep_prevalence(df, total_genomes, identity_grid, coverage_grid, evalue_grid=None,
+                     antigens=None):
+    """
+    Prevalence of every antigen over an identity x coverage (x e-value) grid.
+
+    Args:
+        df (pd.DataFrame): Hits annotated by aggregation.annotate_hits()
+            (needs qseqid, genome_accession, pident, coverage, evalue).
+        total_genomes (int): Denominator for prevalence.
+        identity_grid (array): Minimum identity thresholds (%).
+        coverage_grid (array): Minimum coverage thresholds (fraction).
+        evalue_grid (array): Maximum e-value thresholds (default: no e-value axis).
+        antigens (list): Antigen order (default: order of first appearance).
+
+    Returns:
+        SweepResult: counts[antigen, evalue, identity, coverage].
+    """
+    identity_grid = np.sort(np.asarray(identity_grid, dtype=float))
+    coverage_grid = np.sort(np.asarray(coverage_grid, dtype=float))
+    evalue_grid = np.sort(np.asarray([np.inf] if evalue_grid is None else evalue_grid, dtype=float))
+    if antigens is None:
+        antigens = list(pd.unique(df['qseqid']))
+    n_ant, n_ev, n_id, n_cov = len(antigens), len(evalue_grid), len(identity_grid), len(coverage_grid)
+    counts = np.zeros((n_ant, n_ev, n_id, n_cov), dtype=np.uint32)
+
+    # Grid bins: number of thresholds each hit passes (pident >= t, coverage >= t)
+    antigen_code = pd.Categorical(df['qseqid'], categories=antigens).codes
+    id_bin = np.searchsorted(identity_grid, np.nan_to_num(df['pident'].to_numpy(dtype=float), nan=-1.0),
+                             side='right')
+    cov_bin = np.searchsorted(coverage_grid, np.nan_to_num(df['coverage'].to_numpy(dtype=float), nan=-1.0),
+                              side='right')
+    evalues = df['evalue'].to_numpy(dtype=float)
+    keep = (antigen_code >= 0) & (id_bin > 0) & (cov_bin > 0) & (evalues <= evalue_grid[-1])
+    if not keep.any():
+        return SweepResult(counts, antigens, identity_grid, coverage_grid, evalue_grid, total_genomes)
+
+    genome_code = pd.factorize(df['genome_accession'].to_numpy()[keep])[0]
+    antigen_code, id_bin, cov_bin, evalues = antigen_code[keep], id_bin[keep], cov_bin[keep], evalues[keep]
+
+    # Sort hits by (antigen, genome) pair so pairs can be processed in bounded chunks
+    n_genomes = genome_code.max() + 1
+    pair_key = antigen_code.astype(np.int64) * n_genomes + genome_code
+    order = np.argsort(pair_key, kind='stable')
+    pair_key, id_bin, cov_bin, evalues = pair_key[order], id_bin[order], cov_bin[order], evalues[order]
+    pair_ids, pair_start = np.unique(pair_key, return_index=True)
+    pair_antigen = (pair_ids // n_genomes).astype(np.int64)
+    pair_of_hit = np.repeat(np.arange(len(pair_ids)), np.diff(np.append(pair_start, len(pair_key))))
+
+    flat = counts.reshape(n_ant, n_ev, -1)
+    for e, max_evalue in enumerate(evalue_grid):
+        for lo in range(0, len(pair_ids), PAIR_CHUNK):
+            hi = min(lo + PAIR_CHUNK, len(pair_ids))
+            h_lo, h_hi = pair_start[lo], pair_start[hi] if hi < len(pair_ids) else len(pair_key)
+            sel = evalues[h_lo:h_hi] <= max_evalue
+            local_pair = pair_of_hit[h_lo:h_hi][sel] - lo
+
+            # best[p, i-1]: best coverage bin among hits of pair p in identity bin i
+            best = np.zeros((hi - lo, n_id), dtype=np.int32)
+            np.maximum.at(best, (local_pair, id_bin[h_lo:h_hi][sel] - 1), cov_bin[h_lo:h_hi][sel])
+            # reach[p, a]: best coverage bin among hits passing identity threshold a
+            reach = np.maximum.accumulate(best[:, ::-1], axis=1)[:, ::-1]
+
+            index = (pair_antigen[lo:hi, None] * n_id + np.arange(n_id)) * (n_cov + 1) + reach
+            hist = np.bincount(index.ravel(), minlength=n_ant * n_id * (n_cov + 1))
+            hist = hist.reshape(n_ant, n_id, n_cov + 1)
+            # Genomes present at coverage threshold b are those with reach >= b + 1
+            present = np.cumsum(hist[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+            flat[:, e, :] += present.reshape(n_ant, -1).astype(np.uint32)
+
+    return SweepResult(counts, antigens, identity_grid, coverage_grid, evalue_grid, total_genomes)
+
+
+def write_sweep(result, output_prefix):
+    """Write <prefix>.tsv (tidy table) and <prefix>.npz (count array)"""
+    tsv_path = f"{output_prefix}.tsv"
+    npz_path = f"{output_prefix}.npz"
+    result.to_frame().to_csv(tsv_path, sep='\t', index=False)
+    result.save(npz_path)
+    return tsv_path, npz_path